@@ -0,0 +1,113 @@
+"""Benchmark the time to first token after a restart with the disk tier of
+prefix caching.
+
+Every run starts a fresh engine in its own process and sends requests that
+share a long system prompt, one at a time. The first run starts from an
+empty disk tier, the next ones restart on the disk tier written by the runs
+before, so their first request loads the system prompt from disk instead of
+computing it. Without `--disk-prefix-cache-dir` every run starts cold.
+"""
+import multiprocessing
+import random
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+
+from vllm import LLM, SamplingParams
+from vllm.utils import FlexibleArgumentParser
+
+
+def make_system_prompt(num_words: int, seed: int) -> str:
+    rng = random.Random(seed)
+    words = [
+        "table", "cell", "row", "column", "value", "header", "film", "cast",
+        "director", "music", "notes", "opening"
+    ]
+    return ("You are a helpful assistant. Answer the questions about the "
+            "following document.\n" +
+            " ".join(rng.choice(words) for _ in range(num_words)) + "\n")
+
+
+def run_engine(args, disk_prefix_cache_dir: str, result_queue) -> None:
+    llm = LLM(model=args.model,
+              tokenizer_mode="auto",
+              trust_remote_code=True,
+              enforce_eager=True,
+              tensor_parallel_size=args.tensor_parallel_size,
+              enable_prefix_caching=True,
+              enable_cpu_prefix_cache=disk_prefix_cache_dir is not None,
+              disk_prefix_cache_dir=disk_prefix_cache_dir,
+              disk_prefix_cache_space=args.disk_prefix_cache_space)
+    system_prompt = make_system_prompt(args.system_prompt_words, args.seed)
+    sampling_params = SamplingParams(temperature=0, max_tokens=1)
+
+    ttfts: List[float] = []
+    for i in range(args.num_requests):
+        prompt = system_prompt + f"Question {i}: what is in row {i}?\n"
+        output = llm.generate(prompt, sampling_params, use_tqdm=False)[0]
+        metrics = output.metrics
+        assert metrics is not None and metrics.first_token_time is not None
+        ttfts.append(metrics.first_token_time - metrics.arrival_time)
+    result_queue.put(ttfts)
+
+
+def main(args):
+    disk_prefix_cache_dir = None
+    if args.disk_prefix_cache_dir is not None:
+        disk_prefix_cache_dir = (args.disk_prefix_cache_dir
+                                 or tempfile.mkdtemp(prefix="vllm_disk_kv_"))
+        print(f"Disk prefix cache: {disk_prefix_cache_dir}")
+
+    # A process per run, so that nothing survives a restart but the disk.
+    context = multiprocessing.get_context("spawn")
+    for run in range(args.num_runs):
+        result_queue = context.Queue()
+        start = time.perf_counter()
+        process = context.Process(target=run_engine,
+                                  args=(args, disk_prefix_cache_dir,
+                                        result_queue))
+        process.start()
+        ttfts = result_queue.get()
+        process.join()
+        elapsed = time.perf_counter() - start
+        label = "cold" if run == 0 or disk_prefix_cache_dir is None else (
+            "restart")
+        print(f"run {run} ({label}): first request TTFT "
+              f"{ttfts[0] * 1000:.1f} ms, mean TTFT "
+              f"{np.mean(ttfts) * 1000:.1f} ms, p99 TTFT "
+              f"{np.percentile(ttfts, 99) * 1000:.1f} ms "
+              f"(run {elapsed:.1f} s with startup)")
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description="Benchmark the time to first token after a restart with "
+        "the disk tier of prefix caching.")
+    parser.add_argument("--model", type=str, default="facebook/opt-125m")
+    parser.add_argument("--tensor-parallel-size", "-tp", type=int, default=1)
+    parser.add_argument("--system-prompt-words",
+                        type=int,
+                        default=1500,
+                        help="Length of the shared system prompt in words.")
+    parser.add_argument("--num-requests", type=int, default=16)
+    parser.add_argument("--num-runs",
+                        type=int,
+                        default=2,
+                        help="Number of engine runs, the first one is cold.")
+    parser.add_argument(
+        "--disk-prefix-cache-dir",
+        type=str,
+        nargs="?",
+        const="",
+        default=None,
+        help="Directory of the disk tier, a temporary one if given without "
+        "a value. Disables the disk tier if not given.")
+    parser.add_argument("--disk-prefix-cache-space",
+                        type=float,
+                        default=4,
+                        help="Size of the disk tier in GiB.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args)
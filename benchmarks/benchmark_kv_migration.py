@@ -0,0 +1,133 @@
+"""Benchmark the KV superblock migration and recall transfers on CPU.
+
+Spawns one master worker and `--num-sp-ranks` SP workers as
+`SimulatedSPWorker`s over gloo, so no GPU or model is needed. Every
+iteration the master migrates `--block-migrate-budget` staged superblocks,
+spread over the SP ranks, and recalls as many back. The benchmark reports
+the migrated bytes per second, which bounds how fast long sequences can be
+offloaded to the SP ranks on this transport.
+"""
+import multiprocessing
+import time
+from typing import List
+
+from vllm.config import CacheConfig, ParallelConfig
+from vllm.distributed.parallel_state import get_world_group
+from vllm.utils import FlexibleArgumentParser, get_open_port
+from vllm.worker.simulated_sp_worker import (SimulatedCacheEngine,
+                                             SimulatedSPWorker)
+
+
+def run_rank(args, rank: int, port: int, result_queue) -> None:
+    superblock_blocks = args.block_migrate_size // args.block_size
+    cache_config = CacheConfig(args.block_size,
+                               1.0,
+                               1,
+                               "auto",
+                               block_migrate_size=args.block_migrate_size,
+                               block_migrate_budget=args.block_migrate_budget)
+    # The SP group counts the master worker.
+    sp_size = args.num_sp_ranks + 1
+    parallel_config = ParallelConfig(1,
+                                     1,
+                                     sequence_parallel_size=sp_size,
+                                     distributed_executor_backend="mp")
+    worker = SimulatedSPWorker(cache_config,
+                               parallel_config,
+                               rank,
+                               f"tcp://127.0.0.1:{port}",
+                               num_layers=args.num_layers,
+                               block_numel=args.block_numel,
+                               is_driver_worker=rank == 0,
+                               is_sp_worker=rank > 0)
+    worker.init_device()
+    num_remote_blocks = args.num_remote_superblocks * superblock_blocks
+    worker.initialize_cache(
+        num_remote_blocks + args.block_migrate_budget * superblock_blocks, 0,
+        num_remote_blocks, 0)
+    migrator = worker.kv_migrator
+
+    # Superblocks go round robin over the SP ranks, grouped by rank like the
+    # scheduler does.
+    superblocks: List[List[int]] = sorted(
+        ([i // args.num_sp_ranks, i % args.num_sp_ranks + 1]
+         for i in range(args.block_migrate_budget)),
+        key=lambda x: x[1])
+    blocks_to_recall = list(range(len(superblocks) * superblock_blocks))
+
+    def step(i: int) -> None:
+        offset = (i * args.block_migrate_budget // args.num_sp_ranks) % (
+            args.num_remote_superblocks - args.block_migrate_budget)
+        moved = [[chunk + offset, rank] for chunk, rank in superblocks]
+        migrator.migrate_chunks(moved)
+        migrator.wait()
+        if args.recall:
+            migrator.recall_chunks(moved, blocks_to_recall)
+            migrator.wait()
+
+    world_group = get_world_group()
+    for i in range(args.num_iters_warmup):
+        step(i)
+    world_group.barrier()
+    start = time.perf_counter()
+    for i in range(args.num_iters):
+        step(i)
+    world_group.barrier()
+    elapsed = time.perf_counter() - start
+    if rank == 0:
+        result_queue.put(elapsed)
+
+
+def main(args):
+    assert args.num_remote_superblocks > args.block_migrate_budget
+    port = get_open_port()
+    result_queue: multiprocessing.Queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=run_rank,
+                                args=(args, rank, port, result_queue))
+        for rank in range(args.num_sp_ranks + 1)
+    ]
+    for p in processes:
+        p.start()
+    elapsed = result_queue.get()
+    for p in processes:
+        p.join()
+
+    block_bytes = SimulatedCacheEngine.get_cache_block_size(
+        args.num_layers, args.block_numel)
+    superblock_bytes = (args.block_migrate_size // args.block_size *
+                        block_bytes)
+    num_transfers = args.num_iters * args.block_migrate_budget
+    if args.recall:
+        num_transfers *= 2
+    total_bytes = num_transfers * superblock_bytes
+    print(f"{args.num_sp_ranks} SP ranks, superblock of "
+          f"{superblock_bytes / 2**20:.2f} MiB, "
+          f"{args.block_migrate_budget} superblocks per step")
+    print(f"Avg step time: {elapsed / args.num_iters * 1000:.3f} ms")
+    print(f"Throughput: {total_bytes / elapsed / 2**30:.3f} GiB/s "
+          f"({num_transfers / elapsed:.1f} superblocks/s)")
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description='Benchmark the KV superblock migration between master '
+        'and SP workers over gloo on CPU.')
+    parser.add_argument('--num-sp-ranks', type=int, default=1)
+    parser.add_argument('--num-layers', type=int, default=32)
+    parser.add_argument('--block-size', type=int, default=16)
+    parser.add_argument('--block-numel',
+                        type=int,
+                        default=16 * 8 * 128,
+                        help='Elements of the keys (or values) of one block '
+                        'in one layer: block_size * num_kv_heads * head_size.')
+    parser.add_argument('--block-migrate-size', type=int, default=64)
+    parser.add_argument('--block-migrate-budget', type=int, default=4)
+    parser.add_argument('--num-remote-superblocks', type=int, default=16)
+    parser.add_argument('--recall',
+                        action='store_true',
+                        help='Recall the superblocks after migrating them.')
+    parser.add_argument('--num-iters-warmup', type=int, default=3)
+    parser.add_argument('--num-iters', type=int, default=20)
+    args = parser.parse_args()
+    main(args)
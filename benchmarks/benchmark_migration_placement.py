@@ -0,0 +1,162 @@
+"""Simulate superblock migration to sequence parallel ranks and compare the
+placement policies of the RemoteAllocator.
+
+No GPU or model is needed. Request lengths are replayed from a JSONL file
+(one request per line with `prompt_len`/`output_len` or
+`input_len`/`output_len` fields) or sampled from a log-normal distribution.
+For every policy the simulator reports the remote-rank imbalance, the
+number of failed migrations and the average number of SP ranks a sequence
+fans out to.
+"""
+import json
+import random
+from dataclasses import dataclass, field
+from typing import Dict, List, Set, Tuple
+
+from vllm.block import PhysicalTokenBlock
+from vllm.core.block_manager_v1 import RemoteAllocator
+from vllm.core.placement import SelectionPolicy
+from vllm.utils import FlexibleArgumentParser
+
+
+@dataclass
+class SimRequest:
+    seq_id: int
+    prompt_len: int
+    output_len: int
+    seq_len: int = 0
+    num_migrated: int = 0
+    remote_blocks: List[PhysicalTokenBlock] = field(default_factory=list)
+    remote_ranks: Set[int] = field(default_factory=set)
+
+
+def load_lengths(args) -> List[Tuple[int, int]]:
+    if args.dataset is not None:
+        lengths: List[Tuple[int, int]] = []
+        with open(args.dataset) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                prompt_len = data.get("prompt_len", data.get("input_len"))
+                lengths.append((int(prompt_len), int(data["output_len"])))
+                if len(lengths) == args.num_requests:
+                    break
+        return lengths
+    rng = random.Random(args.seed)
+    return [(int(rng.lognormvariate(args.prompt_mu, args.prompt_sigma)),
+             int(rng.lognormvariate(args.output_mu, args.output_sigma)))
+            for _ in range(args.num_requests)]
+
+
+def simulate(args, policy: SelectionPolicy,
+             lengths: List[Tuple[int, int]]) -> Dict[str, float]:
+    allocator = RemoteAllocator(args.block_size, args.num_blocks_per_rank,
+                                args.num_sp_ranks, policy)
+    superblock_blocks = args.block_migrate_size // args.block_size
+    waiting = [
+        SimRequest(i, max(prompt_len, 1), max(output_len, 1))
+        for i, (prompt_len, output_len) in enumerate(lengths)
+    ]
+    waiting.reverse()
+    running: List[SimRequest] = []
+    num_migrated = num_failed = num_steps = 0
+    imbalance_sum = 0.0
+    fan_outs: List[int] = []
+
+    while waiting or running:
+        while waiting and len(running) < args.max_num_seqs:
+            request = waiting.pop()
+            request.seq_len = request.prompt_len
+            running.append(request)
+
+        for request in running:
+            # Queue every full superblock past the threshold, like
+            # BlockSpaceManagerV1.add_kvcache_migrate_block does.
+            target = 0
+            if request.seq_len >= args.block_migrate_threshold:
+                target = max(0, (request.seq_len - args.block_migrate_start) //
+                             args.block_migrate_size)
+            while request.num_migrated < target:
+                request.num_migrated += 1
+                if not allocator.can_allocate(superblock_blocks,
+                                              request.seq_id):
+                    num_failed += 1
+                    continue
+                blocks = allocator.allocate(superblock_blocks, request.seq_id)
+                request.remote_blocks.extend(blocks)
+                request.remote_ranks.add(blocks[0].remote_rank)
+                num_migrated += 1
+            request.seq_len += 1
+
+        used = [
+            args.num_blocks_per_rank - allocator.get_num_free_blocks(rank)
+            for rank in range(1, args.num_sp_ranks + 1)
+        ]
+        mean_used = sum(used) / len(used)
+        if mean_used > 0:
+            imbalance_sum += max(used) / mean_used
+            num_steps += 1
+
+        finished = [
+            r for r in running if r.seq_len >= r.prompt_len + r.output_len
+        ]
+        for request in finished:
+            for block in request.remote_blocks:
+                allocator.free(block)
+            allocator.free_seq(request.seq_id)
+            if request.remote_ranks:
+                fan_outs.append(len(request.remote_ranks))
+            running.remove(request)
+
+    return {
+        "policy": policy.name.lower(),
+        "migrated": num_migrated,
+        "failed": num_failed,
+        "imbalance": imbalance_sum / num_steps if num_steps else 0.0,
+        "fan_out": sum(fan_outs) / len(fan_outs) if fan_outs else 0.0,
+    }
+
+
+def main(args):
+    lengths = load_lengths(args)
+    policies = ([SelectionPolicy[p.upper()] for p in args.policies]
+                if args.policies else list(SelectionPolicy))
+    print(f"{len(lengths)} requests, {args.num_sp_ranks} SP ranks x "
+          f"{args.num_blocks_per_rank} blocks")
+    print(f"{'policy':<12}{'migrated':>10}{'failed':>10}"
+          f"{'imbalance':>12}{'fan-out':>10}")
+    for policy in policies:
+        result = simulate(args, policy, lengths)
+        print(f"{result['policy']:<12}{result['migrated']:>10}"
+              f"{result['failed']:>10}{result['imbalance']:>12.3f}"
+              f"{result['fan_out']:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description='Benchmark the placement policies of superblock '
+        'migration with a request length simulator.')
+    parser.add_argument('--dataset',
+                        type=str,
+                        default=None,
+                        help='JSONL file with prompt_len/output_len fields.')
+    parser.add_argument('--num-requests', type=int, default=1000)
+    parser.add_argument('--prompt-mu', type=float, default=8.5)
+    parser.add_argument('--prompt-sigma', type=float, default=1.0)
+    parser.add_argument('--output-mu', type=float, default=6.0)
+    parser.add_argument('--output-sigma', type=float, default=0.8)
+    parser.add_argument('--max-num-seqs', type=int, default=64)
+    parser.add_argument('--block-size', type=int, default=16)
+    parser.add_argument('--num-sp-ranks', type=int, default=4)
+    parser.add_argument('--num-blocks-per-rank', type=int, default=8192)
+    parser.add_argument('--block-migrate-size', type=int, default=1024)
+    parser.add_argument('--block-migrate-threshold', type=int, default=6144)
+    parser.add_argument('--block-migrate-start', type=int, default=4096)
+    parser.add_argument('--policies',
+                        nargs='+',
+                        default=None,
+                        choices=[p.name.lower() for p in SelectionPolicy])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    main(args)
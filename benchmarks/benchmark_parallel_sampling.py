@@ -0,0 +1,159 @@
+"""Benchmark parallel sampling (n > 1) and beam search over a sweep of widths.
+
+Forked sequences share the blocks of their common tokens through block table
+segments and only copy the block of their last token on write. The default
+mode measures the offline throughput for every width, `--synthetic` measures
+the fork, copy on write and free bookkeeping of the block manager alone,
+without a model.
+"""
+import random
+import time
+from typing import List
+
+from vllm.utils import FlexibleArgumentParser
+
+
+def make_prompts(num_prompts: int, input_len: int) -> List[List[int]]:
+    return [[random.randint(0, 10000) for _ in range(input_len)]
+            for _ in range(num_prompts)]
+
+
+def run_vllm(args, width: int, use_beam_search: bool) -> float:
+    from vllm import LLM, SamplingParams
+    llm = LLM(model=args.model,
+              tokenizer=args.tokenizer,
+              tensor_parallel_size=args.tensor_parallel_size,
+              seed=args.seed,
+              trust_remote_code=args.trust_remote_code,
+              dtype=args.dtype,
+              enforce_eager=args.enforce_eager,
+              enable_prefix_caching=args.enable_prefix_caching,
+              gpu_memory_utilization=args.gpu_memory_utilization)
+    prompts = make_prompts(args.num_prompts, args.input_len)
+    sampling_params = SamplingParams(
+        n=width,
+        temperature=0.0 if use_beam_search else 1.0,
+        top_p=1.0,
+        use_beam_search=use_beam_search,
+        ignore_eos=True,
+        max_tokens=args.output_len)
+
+    start = time.perf_counter()
+    llm.generate(prompt_token_ids=prompts,
+                 sampling_params=sampling_params,
+                 use_tqdm=False)
+    elapsed = time.perf_counter() - start
+    del llm
+    return elapsed
+
+
+def run_synthetic(args, width: int, use_beam_search: bool) -> float:
+    """Forks, appends and frees sequences like the output processor: every
+    step, the sequences of a request fork into `width` children for beam
+    search, or once after the prompt for parallel sampling."""
+    from vllm import SamplingParams
+    from vllm.core.block_manager_v1 import BlockSpaceManagerV1
+    from vllm.sequence import Logprob, Sequence, SequenceGroup, SequenceStatus
+
+    max_len = args.input_len + args.output_len
+    num_blocks = (args.num_prompts * width * (max_len // args.block_size + 2))
+    block_manager = BlockSpaceManagerV1(args.block_size,
+                                        num_gpu_blocks=num_blocks,
+                                        num_cpu_blocks=0,
+                                        watermark=0)
+    seq_id = 0
+    groups: List[List[Sequence]] = []
+    for i, prompt in enumerate(make_prompts(args.num_prompts, args.input_len)):
+        seq = Sequence(seq_id, {"prompt_token_ids": prompt}, args.block_size)
+        seq_id += 1
+        block_manager.allocate(
+            SequenceGroup(str(i), [seq], time.time(), SamplingParams()))
+        seq.status = SequenceStatus.RUNNING
+        groups.append([seq])
+
+    start = time.perf_counter()
+    for step in range(args.output_len):
+        for i, seqs in enumerate(groups):
+            if use_beam_search or step == 0:
+                # Every sequence proposes `width` children, the first
+                # `width` of them are kept, like the beam search of the
+                # output processor.
+                children = []
+                for parent in seqs:
+                    for _ in range(width - 1):
+                        child = parent.fork(seq_id)
+                        seq_id += 1
+                        child.append_token_id(1, {1: Logprob(0.0)})
+                        children.append((child, parent))
+                    parent.append_token_id(1, {1: Logprob(0.0)})
+                    children.append((parent, parent))
+                kept = children[:width]
+                for child, parent in kept:
+                    if child is not parent:
+                        block_manager.fork(parent, child)
+                kept_seqs = {id(child) for child, _ in kept}
+                for parent in seqs:
+                    if id(parent) not in kept_seqs:
+                        block_manager.free(parent)
+                seqs = [child for child, _ in kept]
+                groups[i] = seqs
+            else:
+                for seq in seqs:
+                    seq.append_token_id(1, {1: Logprob(0.0)})
+            for seq in seqs:
+                block_manager.append_slots(seq)
+    for seqs in groups:
+        for seq in seqs:
+            block_manager.free(seq)
+    return time.perf_counter() - start
+
+
+def main(args):
+    random.seed(args.seed)
+    sweeps = [(n, False) for n in args.n] + [(beam_width, True)
+                                             for beam_width in args.beam_width]
+    print(f"{'mode':>8}{'width':>8}{'time (s)':>12}{'requests/s':>14}"
+          f"{'output tokens/s':>18}")
+    for width, use_beam_search in sweeps:
+        run = run_synthetic if args.synthetic else run_vllm
+        elapsed = run(args, width, use_beam_search)
+        num_output_tokens = args.num_prompts * width * args.output_len
+        print(f"{'beam' if use_beam_search else 'n':>8}{width:>8}"
+              f"{elapsed:>12.3f}{args.num_prompts / elapsed:>14.2f}"
+              f"{num_output_tokens / elapsed:>18.1f}")
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description="Benchmark parallel sampling and beam search.")
+    parser.add_argument("--model", type=str, default="facebook/opt-125m")
+    parser.add_argument("--tokenizer", type=str, default=None)
+    parser.add_argument("--tensor-parallel-size", "-tp", type=int, default=1)
+    parser.add_argument("--input-len", type=int, default=1024)
+    parser.add_argument("--output-len", type=int, default=128)
+    parser.add_argument("--num-prompts", type=int, default=64)
+    parser.add_argument("--n",
+                        type=int,
+                        nargs="*",
+                        default=[1, 4, 16],
+                        help="The numbers of parallel samples to sweep.")
+    parser.add_argument("--beam-width",
+                        type=int,
+                        nargs="*",
+                        default=[2, 4, 8],
+                        help="The beam widths to sweep.")
+    parser.add_argument("--block-size", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dtype", type=str, default="auto")
+    parser.add_argument("--trust-remote-code", action="store_true")
+    parser.add_argument("--enforce-eager", action="store_true")
+    parser.add_argument("--enable-prefix-caching", action="store_true")
+    parser.add_argument("--gpu-memory-utilization", type=float, default=0.9)
+    parser.add_argument("--synthetic",
+                        action="store_true",
+                        help="Only measure the bookkeeping of the block "
+                        "manager, without a model.")
+    args = parser.parse_args()
+    if args.tokenizer is None:
+        args.tokenizer = args.model
+    main(args)
@@ -0,0 +1,146 @@
+"""Simulate the scheduler on CPU and compare the TTFT of the policies.
+
+No GPU or model is needed. A mix of short interactive requests (high
+priority, with a deadline) and long batch requests arrives as a Poisson
+process and runs through the real `Scheduler`; a step takes
+`--step-base-ms` plus `--step-token-ms` per batched token of simulated time.
+The benchmark reports the p50/p99 time to first token of every request
+class, and how many interactive requests miss their deadline, for every
+scheduling policy.
+"""
+import random
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from vllm.config import CacheConfig, SchedulerConfig
+from vllm.core.scheduler import Scheduler
+from vllm.sampling_params import SamplingParams
+from vllm.sequence import Logprob, Sequence, SequenceGroup, SequenceStatus
+from vllm.utils import FlexibleArgumentParser
+
+POLICIES = ["fcfs", "priority", "deadline", "sjf"]
+
+
+def make_requests(args) -> List[Tuple[float, str, int, SamplingParams]]:
+    rng = random.Random(args.seed)
+    requests = []
+    now = 0.0
+    for _ in range(args.num_requests):
+        now += rng.expovariate(args.request_rate)
+        if rng.random() < args.interactive_fraction:
+            prompt_len = rng.randint(64, 512)
+            params = SamplingParams(max_tokens=rng.randint(16, 128),
+                                    priority=0,
+                                    deadline=args.interactive_deadline)
+            requests.append((now, "interactive", prompt_len, params))
+        else:
+            prompt_len = rng.randint(1024, 4096)
+            params = SamplingParams(max_tokens=rng.randint(128, 1024),
+                                    priority=1)
+            requests.append((now, "batch", prompt_len, params))
+    return requests
+
+
+def simulate(args, policy: str) -> Dict[str, List[float]]:
+    scheduler_config = SchedulerConfig(args.max_num_batched_tokens,
+                                       args.max_num_seqs,
+                                       args.max_model_len,
+                                       enable_chunked_prefill=args.chunked,
+                                       policy=policy)
+    cache_config = CacheConfig(args.block_size, 1.0, 1, "auto")
+    cache_config.num_gpu_blocks = args.num_gpu_blocks
+    cache_config.num_cpu_blocks = args.num_gpu_blocks
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+
+    requests = make_requests(args)
+    request_class: Dict[str, str] = {}
+    ttft: Dict[str, List[float]] = {"interactive": [], "batch": []}
+    num_missed = 0
+    now = 0.0
+    next_request = 0
+    while next_request < len(requests) or scheduler.has_unfinished_seqs():
+        while (next_request < len(requests)
+               and requests[next_request][0] <= now):
+            arrival, cls, prompt_len, params = requests[next_request]
+            request_id = str(next_request)
+            seq = Sequence(next_request, {
+                "prompt": None,
+                "prompt_token_ids": list(range(prompt_len)),
+            }, args.block_size)
+            scheduler.add_seq_group(
+                SequenceGroup(request_id, [seq], arrival, params))
+            request_class[request_id] = cls
+            next_request += 1
+
+        metas, out = scheduler.schedule()
+        if not out.scheduled_seq_groups:
+            # Idle until the next arrival.
+            now = max(now, requests[next_request][0])
+            continue
+        now += (args.step_base_ms +
+                args.step_token_ms * out.num_batched_tokens) / 1000
+        for scheduled, meta in zip(out.scheduled_seq_groups, metas):
+            seq_group = scheduled.seq_group
+            seq_group.update_num_computed_tokens(scheduled.token_chunk_size)
+            if seq_group.is_prefill():
+                continue
+            seq = seq_group.get_seqs()[0]
+            if seq.get_output_len() == 0:
+                arrival = seq_group.metrics.arrival_time
+                ttft[request_class[seq_group.request_id]].append(now - arrival)
+                if now > seq_group.deadline:
+                    num_missed += 1
+            seq.append_token_id(1, {1: Logprob(0.0)})
+            if seq.get_output_len() >= seq_group.sampling_params.max_tokens:
+                seq.status = SequenceStatus.FINISHED_LENGTH_CAPPED
+                scheduler.free_seq(seq)
+        scheduler.free_finished_seq_groups()
+    ttft["missed"] = [num_missed]
+    return ttft
+
+
+def main(args):
+    print(f"{'policy':>10}{'int p50':>10}{'int p99':>10}{'batch p50':>11}"
+          f"{'batch p99':>11}{'missed':>8}  (TTFT in s)")
+    for policy in args.policies:
+        ttft = simulate(args, policy)
+        row = [
+            np.percentile(ttft[cls], p) for cls in ("interactive", "batch")
+            for p in (50, 99)
+        ]
+        print(f"{policy:>10}{row[0]:>10.3f}{row[1]:>10.3f}{row[2]:>11.3f}"
+              f"{row[3]:>11.3f}{ttft['missed'][0]:>8}")
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description='Simulate the scheduling policies on CPU and report '
+        'the TTFT of interactive and batch requests.')
+    parser.add_argument('--policies',
+                        nargs='+',
+                        choices=POLICIES,
+                        default=POLICIES)
+    parser.add_argument('--num-requests', type=int, default=300)
+    parser.add_argument('--request-rate',
+                        type=float,
+                        default=4.0,
+                        help='Requests per second of simulated time.')
+    parser.add_argument('--interactive-fraction', type=float, default=0.5)
+    parser.add_argument('--interactive-deadline',
+                        type=float,
+                        default=2.0,
+                        help='Deadline of interactive requests in seconds.')
+    parser.add_argument('--max-num-batched-tokens', type=int, default=4096)
+    parser.add_argument('--max-num-seqs', type=int, default=32)
+    parser.add_argument('--max-model-len', type=int, default=4096)
+    parser.add_argument('--chunked',
+                        action='store_true',
+                        help='Enable chunked prefill.')
+    parser.add_argument('--block-size', type=int, default=16)
+    parser.add_argument('--num-gpu-blocks', type=int, default=2048)
+    parser.add_argument('--step-base-ms', type=float, default=10.0)
+    parser.add_argument('--step-token-ms', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    main(args)
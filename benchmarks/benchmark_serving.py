@@ -271,6 +271,7 @@ async def benchmark(
     use_beam_search: bool,
     request_rate: float,
     disable_tqdm: bool,
+    max_concurrency: Optional[int] = None,
 ):
     if backend in ASYNC_REQUEST_FUNCS:
         request_func = ASYNC_REQUEST_FUNCS[backend]
@@ -296,9 +297,24 @@ async def benchmark(
     else:
         print("Initial test run completed. Starting main benchmark run...")
     print(f"Traffic request rate: {request_rate}")
+    if max_concurrency is not None:
+        print(f"Maximum request concurrency: {max_concurrency}")
 
     pbar = None if disable_tqdm else tqdm(total=len(input_requests))
 
+    # At most `max_concurrency` requests are in flight, the others wait for
+    # one of them to finish.
+    semaphore = (asyncio.Semaphore(max_concurrency)
+                 if max_concurrency is not None else None)
+
+    async def limited_request_func(request_func_input, pbar):
+        if semaphore is None:
+            return await request_func(request_func_input=request_func_input,
+                                      pbar=pbar)
+        async with semaphore:
+            return await request_func(request_func_input=request_func_input,
+                                      pbar=pbar)
+
     benchmark_start_time = time.perf_counter()
     tasks: List[asyncio.Task] = []
     async for request in get_request(input_requests, request_rate):
@@ -314,8 +330,8 @@ async def benchmark(
         )
         tasks.append(
             asyncio.create_task(
-                request_func(request_func_input=request_func_input,
-                             pbar=pbar)))
+                limited_request_func(request_func_input=request_func_input,
+                                     pbar=pbar)))
     outputs: List[RequestFuncOutput] = await asyncio.gather(*tasks)
 
     if pbar is not None:
@@ -470,6 +486,7 @@ def main(args: argparse.Namespace):
             use_beam_search=args.use_beam_search,
             request_rate=args.request_rate,
             disable_tqdm=args.disable_tqdm,
+            max_concurrency=args.max_concurrency,
         ))
 
     # Save config and results to json
@@ -500,6 +517,7 @@ def main(args: argparse.Namespace):
         # Traffic
         result_json["request_rate"] = (
             args.request_rate if args.request_rate < float("inf") else "inf")
+        result_json["max_concurrency"] = args.max_concurrency
 
         # Merge with benchmark result
         result_json = {**result_json, **benchmark_result}
@@ -618,6 +636,14 @@ if __name__ == "__main__":
         "Otherwise, we use Poisson process to synthesize "
         "the request arrival times.",
     )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=None,
+        help="Maximum number of concurrent requests. The requests still "
+        "arrive at --request-rate, but wait while this many are in flight. "
+        "Used to compare engine configurations at a fixed, high "
+        "concurrency, e.g. with and without --enable-step-pipelining.")
     parser.add_argument("--seed", type=int, default=0)
     parser.add_argument(
         "--trust-remote-code",
@@ -0,0 +1,127 @@
+"""Benchmark decoding a long sequence whose KV cache is split over SP ranks.
+
+Compares gathering the KV blocks of all ranks and attending to them at once
+with attending to the blocks of every rank separately and merging the
+partial results with `merge_attn_states`. Runs the reference PyTorch ops, so
+it also works without a GPU. Also prints the bytes every rank sends to the
+master with either approach.
+"""
+import time
+
+import torch
+
+from vllm.attention.ops.partial_attention import (merge_attn_states,
+                                                  paged_partial_attention)
+from vllm.utils import STR_DTYPE_TO_TORCH_DTYPE, FlexibleArgumentParser
+
+
+@torch.inference_mode()
+def main(args) -> None:
+    torch.manual_seed(args.seed)
+    device = torch.device(args.device)
+    dtype = STR_DTYPE_TO_TORCH_DTYPE[args.dtype]
+    num_blocks_per_seq = (args.seq_len + args.block_size - 1) // \
+        args.block_size
+    num_blocks = args.num_seqs * num_blocks_per_seq
+    scale = args.head_size**-0.5
+
+    query = torch.randn(args.num_seqs,
+                        args.num_query_heads,
+                        args.head_size,
+                        dtype=dtype,
+                        device=device)
+    key_cache = torch.randn(num_blocks,
+                            args.block_size,
+                            args.num_kv_heads,
+                            args.head_size,
+                            dtype=dtype,
+                            device=device)
+    value_cache = torch.randn_like(key_cache)
+    block_tables = torch.arange(num_blocks, dtype=torch.int,
+                                device=device).view(args.num_seqs, -1)
+    # Every rank holds a contiguous run of the blocks of every sequence.
+    rank_blocks = block_tables.chunk(args.num_ranks, dim=1)
+    rank_seq_lens = []
+    num_tokens = 0
+    for blocks in rank_blocks:
+        rank_seq_len = min(blocks.shape[1] * args.block_size,
+                           args.seq_len - num_tokens)
+        num_tokens += rank_seq_len
+        rank_seq_lens.append(
+            torch.full((args.num_seqs, ),
+                       rank_seq_len,
+                       dtype=torch.int,
+                       device=device))
+    seq_lens = torch.full((args.num_seqs, ),
+                          args.seq_len,
+                          dtype=torch.int,
+                          device=device)
+
+    def run_gather() -> torch.Tensor:
+        # Stand-in for shipping the KV of every rank to the master.
+        keys = key_cache[block_tables.flatten().long()].clone()
+        values = value_cache[block_tables.flatten().long()].clone()
+        local_tables = torch.arange(num_blocks, dtype=torch.int,
+                                    device=device).view(args.num_seqs, -1)
+        out, _, _ = paged_partial_attention(query, keys, values, local_tables,
+                                            seq_lens, scale)
+        return out
+
+    def run_merge() -> torch.Tensor:
+        states = [
+            paged_partial_attention(query, key_cache, value_cache, blocks,
+                                    lens, scale)
+            for blocks, lens in zip(rank_blocks, rank_seq_lens)
+        ]
+        out, _, _ = merge_attn_states(
+            torch.stack([s[0] for s in states], dim=2),
+            torch.stack([s[1] for s in states], dim=2),
+            torch.stack([s[2] for s in states], dim=2))
+        return out
+
+    def benchmark(fn) -> float:
+        for _ in range(args.num_iters_warmup):
+            fn()
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        for _ in range(args.num_iters):
+            fn()
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        return (time.perf_counter() - start) / args.num_iters
+
+    torch.testing.assert_close(run_merge(), run_gather(), atol=2e-2, rtol=2e-2)
+    element_size = torch.tensor([], dtype=dtype).element_size()
+    kv_bytes = (2 * args.seq_len * args.num_kv_heads * args.head_size *
+                element_size * args.num_seqs)
+    state_bytes = (args.num_ranks * args.num_seqs * args.num_query_heads *
+                   (args.head_size * element_size + 2 * 4))
+    print(f"{args.num_seqs} seqs of {args.seq_len} tokens over "
+          f"{args.num_ranks} ranks")
+    print(f"gather KV:  {benchmark(run_gather) * 1000:.3f} ms, "
+          f"{kv_bytes / 2**20:.2f} MiB to the master")
+    print(f"merge LSE:  {benchmark(run_merge) * 1000:.3f} ms, "
+          f"{state_bytes / 2**20:.4f} MiB to the master")
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description="Benchmark the partial attention merge of SP decoding.")
+    parser.add_argument("--num-seqs", type=int, default=1)
+    parser.add_argument("--seq-len", type=int, default=128 * 1024)
+    parser.add_argument("--num-ranks", type=int, default=4)
+    parser.add_argument("--num-query-heads", type=int, default=32)
+    parser.add_argument("--num-kv-heads", type=int, default=8)
+    parser.add_argument("--head-size", type=int, default=128)
+    parser.add_argument("--block-size", type=int, default=16)
+    parser.add_argument("--dtype",
+                        type=str,
+                        choices=["half", "bfloat16", "float"],
+                        default="float")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--num-iters-warmup", type=int, default=2)
+    parser.add_argument("--num-iters", type=int, default=5)
+    args = parser.parse_args()
+    main(args)
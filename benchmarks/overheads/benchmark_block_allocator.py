@@ -0,0 +1,66 @@
+"""Benchmark the block allocators of BlockSpaceManagerV1.
+
+No GPU is needed. Builds the GPU, CPU and remote SP rank allocators of a
+block manager with `--num-blocks` blocks each, then times allocating and
+freeing blocks the way decoding sequences do: the pool is filled, and every
+step a random fraction of the allocated blocks is freed and allocated again.
+"""
+import random
+import time
+
+from vllm.core.block_manager_v1 import BlockSpaceManagerV1
+from vllm.utils import FlexibleArgumentParser
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    block_manager = BlockSpaceManagerV1(
+        block_size=args.block_size,
+        num_gpu_blocks=args.num_blocks,
+        num_cpu_blocks=args.num_blocks,
+        num_remote_blocks=args.num_blocks,
+        remote_allocator_number=args.num_remote_ranks,
+        num_remote_cpu_blocks=args.num_blocks,
+        watermark=0)
+    init_time = time.perf_counter() - start
+    allocator = block_manager.gpu_allocator
+
+    start = time.perf_counter()
+    blocks = [allocator.allocate() for _ in range(args.num_blocks)]
+    fill_time = time.perf_counter() - start
+
+    num_churn = int(args.num_blocks * args.churn)
+    churn_time = 0.0
+    for _ in range(args.num_steps):
+        rng.shuffle(blocks)
+        start = time.perf_counter()
+        for block in blocks[:num_churn]:
+            allocator.free(block)
+        blocks[:num_churn] = [allocator.allocate() for _ in range(num_churn)]
+        churn_time += time.perf_counter() - start
+
+    print(f"{args.num_blocks} blocks per pool, "
+          f"{args.num_remote_ranks} remote ranks: "
+          f"init {init_time * 1000:.1f} ms, "
+          f"fill {fill_time * 1000:.1f} ms, "
+          f"{num_churn} frees and allocations "
+          f"{churn_time / args.num_steps * 1000:.3f} ms/step")
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description='Benchmark the startup and allocation cost of the '
+        'block allocators.')
+    parser.add_argument('--num-blocks', type=int, default=200000)
+    parser.add_argument('--num-remote-ranks', type=int, default=3)
+    parser.add_argument('--block-size', type=int, default=16)
+    parser.add_argument('--churn',
+                        type=float,
+                        default=0.05,
+                        help='Fraction of the blocks freed and allocated '
+                        'again every step.')
+    parser.add_argument('--num-steps', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,124 @@
+"""Benchmark the eviction throughput of the prefix caching evictors.
+
+No GPU is needed. Fills an evictor with `--num-blocks` cached blocks, then
+churns it the way a full prefix cache is: blocks are evicted to make room
+for the prefix of a new request, whose blocks are added back together when
+it finishes. All blocks of a request share its last access time, and
+requests finish up to `--access-jitter` seconds out of the order they last
+ran. Prints the evictions per second of every policy of the block manager
+v1 evictor, and of the LRU evictor of the block manager v2.
+"""
+import random
+import time
+from typing import Callable, List, Tuple
+
+from vllm.block import PhysicalTokenBlock
+from vllm.core import evictor_v1, evictor_v2
+from vllm.utils import Device, FlexibleArgumentParser
+
+# A request: its last access time and number of blocks.
+Request = Tuple[float, int]
+
+
+def make_requests(args, num_blocks: int, now: float,
+                  rng: random.Random) -> List[Request]:
+    requests = []
+    while num_blocks > 0:
+        num_request_blocks = min(num_blocks,
+                                 rng.randint(1, 2 * args.blocks_per_request))
+        requests.append(
+            (now - rng.random() * args.access_jitter, num_request_blocks))
+        num_blocks -= num_request_blocks
+    return requests
+
+
+def run(args, add: Callable[[int, int, float], None],
+        evict: Callable[[], None]) -> float:
+    rng = random.Random(args.seed)
+    next_hash = 0
+
+    def add_request(request: Request) -> None:
+        nonlocal next_hash
+        last_accessed, num_blocks = request
+        for i in range(num_blocks):
+            add(next_hash, args.block_size * (i + 1), last_accessed)
+            next_hash += 1
+
+    now = args.access_jitter
+    for request in make_requests(args, args.num_blocks, now, rng):
+        add_request(request)
+
+    num_evictions = 0
+    elapsed = 0.0
+    while num_evictions < args.num_evictions:
+        now += 1.0
+        requests = make_requests(args, args.blocks_per_request, now, rng)
+        start = time.perf_counter()
+        for _, num_blocks in requests:
+            for _ in range(num_blocks):
+                evict()
+        for request in requests:
+            add_request(request)
+        elapsed += time.perf_counter() - start
+        num_evictions += args.blocks_per_request
+    return num_evictions / elapsed
+
+
+def run_v1(args, policy: str) -> float:
+    evictor = evictor_v1.make_evictor(
+        evictor_v1.EvictionPolicy[policy.upper()])
+
+    def add(block_hash: int, num_hashed_tokens: int,
+            last_accessed: float) -> None:
+        block = PhysicalTokenBlock(device=Device.GPU,
+                                   block_number=block_hash,
+                                   block_size=args.block_size,
+                                   block_hash=block_hash,
+                                   num_hashed_tokens=num_hashed_tokens)
+        block.last_accessed = last_accessed
+        evictor.add(block)
+
+    return run(args, add, evictor.evict)
+
+
+def run_v2(args) -> float:
+    evictor = evictor_v2.make_evictor(evictor_v2.EvictionPolicy.LRU)
+
+    def add(block_hash: int, num_hashed_tokens: int,
+            last_accessed: float) -> None:
+        evictor.add(block_hash, block_hash, num_hashed_tokens, last_accessed)
+
+    return run(args, add, evictor.evict)
+
+
+def main(args):
+    for policy in args.eviction_policy:
+        print(f"v1 {policy:>10}: {run_v1(args, policy):>12,.0f} evictions/s "
+              f"with {args.num_blocks} cached blocks")
+    if not args.skip_v2:
+        print(f"v2 {'lru':>10}: {run_v2(args):>12,.0f} evictions/s "
+              f"with {args.num_blocks} cached blocks")
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description='Benchmark the eviction throughput of the prefix caching '
+        'evictors.')
+    parser.add_argument('--eviction-policy',
+                        nargs='+',
+                        choices=['lru', 'lfu', 'cost_aware'],
+                        default=['lru', 'lfu', 'cost_aware'])
+    parser.add_argument('--skip-v2',
+                        action='store_true',
+                        help='Skip the evictor of the block manager v2.')
+    parser.add_argument('--num-blocks', type=int, default=100000)
+    parser.add_argument('--num-evictions', type=int, default=20000)
+    parser.add_argument('--block-size', type=int, default=16)
+    parser.add_argument('--blocks-per-request',
+                        type=int,
+                        default=64,
+                        help='The mean number of blocks of a request.')
+    parser.add_argument('--access-jitter', type=float, default=10.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    main(args)
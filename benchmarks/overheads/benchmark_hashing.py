@@ -1,7 +1,10 @@
 import cProfile
 import pstats
+import random
+import time
 
 from vllm import LLM, SamplingParams
+from vllm.sequence import Logprob, Sequence
 from vllm.utils import FlexibleArgumentParser
 
 # A very long prompt, total number of tokens is about 15k.
@@ -10,7 +13,49 @@ LONG_PROMPT = ["You are an expert in large language models, aren't you?"
 LONG_PROMPT = ' '.join(LONG_PROMPT)
 
 
+def prefix_hash_of_block(seq: Sequence, logical_idx: int) -> int:
+    # The hashing of the whole prefix for every block, before the chained
+    # block hashes, kept as the baseline.
+    num_tokens = seq.num_hashed_tokens_of_block(logical_idx)
+    hashed_tokens = seq.data.get_prefix_token_ids(num_tokens)
+    return hash((hashed_tokens, seq.lora_int_id))
+
+
+def time_block_hashing(prompt_len: int, output_len: int, block_size: int,
+                       chained: bool) -> float:
+    """Hashes the prompt blocks, like the allocation of a prompt, then the
+    block filled by every output token, like the promotion of the last
+    block."""
+    token_ids = [random.randint(0, 32000) for _ in range(prompt_len)]
+    seq = Sequence(0, {"prompt_token_ids": token_ids}, block_size)
+    hash_of_block = (seq.hash_of_block if chained else
+                     lambda idx: prefix_hash_of_block(seq, idx))
+    start = time.perf_counter()
+    for idx in range(seq.n_blocks):
+        hash_of_block(idx)
+    for _ in range(output_len):
+        seq.append_token_id(1, {1: Logprob(0.0)})
+        if seq.get_len() % block_size == 0:
+            hash_of_block(seq.n_blocks - 1)
+    return time.perf_counter() - start
+
+
+def main_synthetic(args):
+    print(f"{'prompt len':>12}{'prefix hash (ms)':>20}"
+          f"{'chained hash (ms)':>20}")
+    for prompt_len in args.prompt_lens:
+        prefix_time = time_block_hashing(prompt_len, args.output_len,
+                                         args.block_size, False)
+        chained_time = time_block_hashing(prompt_len, args.output_len,
+                                          args.block_size, True)
+        print(f"{prompt_len:>12}{prefix_time * 1000:>20.3f}"
+              f"{chained_time * 1000:>20.3f}")
+
+
 def main(args):
+    if args.synthetic:
+        main_synthetic(args)
+        return
     llm = LLM(
         model=args.model,
         enforce_eager=True,
@@ -59,5 +104,14 @@ if __name__ == "__main__":
     parser.add_argument('--use-v2-block-manager',
                         action='store_true',
                         help='Use BlockSpaceMangerV2')
+    parser.add_argument('--synthetic',
+                        action='store_true',
+                        help='Time the block hashing of sequences of '
+                        '--prompt-lens tokens without running a model.')
+    parser.add_argument('--prompt-lens',
+                        type=int,
+                        nargs='+',
+                        default=[1024, 2048, 4096, 8192, 16384, 32768])
+    parser.add_argument('--block-size', type=int, default=16)
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,115 @@
+"""Benchmark the per-step Python overhead of scheduling a decode batch.
+
+Runs `--num-seqs` decoding requests of `--context-len` tokens through the
+real `Scheduler` and times `Scheduler.schedule()` and the input preparation
+of the GPU model runner, `ModelRunner._prepare_model_input_tensors`, on CPU.
+No GPU or model is needed: the model runner is a dummy with just the configs
+the input preparation reads, and the attention metadata is not built.
+"""
+import time
+from types import SimpleNamespace
+
+import torch
+
+from vllm.config import CacheConfig, SchedulerConfig
+from vllm.core.scheduler import Scheduler
+from vllm.sampling_params import SamplingParams
+from vllm.sequence import Logprob, Sequence, SequenceGroup
+from vllm.utils import FlexibleArgumentParser
+from vllm.worker.model_runner import ModelRunner
+
+
+class _DummyAttnBackend:
+
+    @staticmethod
+    def get_name() -> str:
+        return "dummy"
+
+    @staticmethod
+    def make_metadata(**kwargs) -> SimpleNamespace:
+        return SimpleNamespace(**kwargs)
+
+
+def make_dummy_model_runner(scheduler_config: SchedulerConfig,
+                            cache_config: CacheConfig,
+                            max_model_len: int) -> ModelRunner:
+    runner = object.__new__(ModelRunner)
+    runner.model_config = SimpleNamespace(max_model_len=max_model_len,
+                                          enforce_eager=True)
+    # No sequence parallel ranks.
+    runner.parallel_config = SimpleNamespace(sequece_parallel_size=0)
+    runner.scheduler_config = scheduler_config
+    runner.cache_config = cache_config
+    runner.lora_config = None
+    runner.block_size = cache_config.block_size
+    runner.sliding_window = None
+    runner.max_seq_len_to_capture = max_model_len
+    runner.attn_backend = _DummyAttnBackend()
+    runner.device = torch.device("cpu")
+    runner._model_input_cls = SimpleNamespace
+    return runner
+
+
+def make_scheduler(args) -> Scheduler:
+    scheduler_config = SchedulerConfig(args.num_seqs * args.context_len,
+                                       args.num_seqs, args.max_model_len)
+    cache_config = CacheConfig(args.block_size, 1.0, 1, "auto")
+    num_blocks = args.num_seqs * (args.max_model_len // args.block_size + 1)
+    cache_config.num_gpu_blocks = num_blocks
+    cache_config.num_cpu_blocks = 0
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+    for i in range(args.num_seqs):
+        seq = Sequence(i, {
+            "prompt": None,
+            "prompt_token_ids": list(range(args.context_len)),
+        }, args.block_size)
+        scheduler.add_seq_group(
+            SequenceGroup(str(i), [seq], time.time(),
+                          SamplingParams(max_tokens=args.num_steps + 1)))
+    return scheduler
+
+
+def step(scheduler: Scheduler, runner: ModelRunner):
+    start = time.perf_counter()
+    metas, out = scheduler.schedule()
+    scheduled = time.perf_counter()
+    runner._prepare_model_input_tensors(metas)
+    prepared = time.perf_counter()
+    for scheduled_seq_group in out.scheduled_seq_groups:
+        seq_group = scheduled_seq_group.seq_group
+        seq_group.update_num_computed_tokens(
+            scheduled_seq_group.token_chunk_size)
+        for seq in seq_group.get_seqs():
+            seq.append_token_id(1, {1: Logprob(0.0)})
+    return scheduled - start, prepared - scheduled
+
+
+def main(args):
+    scheduler = make_scheduler(args)
+    runner = make_dummy_model_runner(scheduler.scheduler_config,
+                                     scheduler.cache_config,
+                                     args.max_model_len)
+    # The prefill step.
+    step(scheduler, runner)
+    schedule_time = prepare_time = 0.0
+    for _ in range(args.num_steps):
+        schedule, prepare = step(scheduler, runner)
+        schedule_time += schedule
+        prepare_time += prepare
+    print(f"{args.num_seqs} decodes of {args.context_len} tokens: "
+          f"schedule {schedule_time / args.num_steps * 1000:.3f} ms/step, "
+          f"prepare input {prepare_time / args.num_steps * 1000:.3f} "
+          "ms/step")
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description='Benchmark the Python overhead of scheduling and '
+        'preparing the inputs of a decode batch.')
+    parser.add_argument('--num-seqs', type=int, default=512)
+    parser.add_argument('--context-len', type=int, default=2048)
+    parser.add_argument('--max-model-len', type=int, default=4096)
+    parser.add_argument('--num-steps', type=int, default=32)
+    parser.add_argument('--block-size', type=int, default=16)
+    args = parser.parse_args()
+    main(args)
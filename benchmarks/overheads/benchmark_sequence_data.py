@@ -0,0 +1,67 @@
+"""Benchmark the per-step token id accesses of long sequences.
+
+Decodes `--output-len` tokens on top of prompts of `--prompt-lens` tokens.
+Every step does what the hot callers do on every decode step: the ngram
+proposer reads all token ids into a tensor, the model runner and the
+detokenizer read the last token, and prefix caching reads the tokens of the
+last block. The list approach concatenates the prompt and output lists like
+`SequenceData` used to, the buffer approach uses its token id buffer.
+"""
+import time
+
+import torch
+
+from vllm.sequence import SequenceData
+from vllm.utils import FlexibleArgumentParser
+
+
+def time_list(prompt_len: int, output_len: int, block_size: int) -> float:
+    prompt_token_ids = list(range(prompt_len))
+    output_token_ids = []
+    start = time.perf_counter()
+    for i in range(output_len):
+        output_token_ids.append(i)
+        token_ids = prompt_token_ids + output_token_ids
+        torch.as_tensor(token_ids, dtype=torch.long)
+        token_ids = prompt_token_ids + output_token_ids
+        _ = token_ids[-1]
+        seq_len = len(token_ids)
+        token_ids = prompt_token_ids + output_token_ids
+        _ = token_ids[seq_len - seq_len % block_size:seq_len]
+    return time.perf_counter() - start
+
+
+def time_buffer(prompt_len: int, output_len: int, block_size: int) -> float:
+    seq_data = SequenceData(list(range(prompt_len)))
+    start = time.perf_counter()
+    for i in range(output_len):
+        seq_data.append_token_id(i, 0.0)
+        torch.from_numpy(seq_data.get_token_ids_view())
+        _ = seq_data.get_last_token_id()
+        seq_len = seq_data.get_len()
+        _ = seq_data.get_token_ids_in_range(seq_len - seq_len % block_size,
+                                            seq_len)
+    return time.perf_counter() - start
+
+
+def main(args):
+    print(f"{'prompt len':>12}{'list (ms/step)':>18}{'buffer (ms/step)':>18}")
+    for prompt_len in args.prompt_lens:
+        list_time = time_list(prompt_len, args.output_len, args.block_size)
+        buffer_time = time_buffer(prompt_len, args.output_len, args.block_size)
+        print(f"{prompt_len:>12}"
+              f"{list_time / args.output_len * 1000:>18.4f}"
+              f"{buffer_time / args.output_len * 1000:>18.4f}")
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description='Benchmark the token id accesses of SequenceData.')
+    parser.add_argument('--prompt-lens',
+                        type=int,
+                        nargs='+',
+                        default=[1024, 8192, 32768])
+    parser.add_argument('--output-len', type=int, default=256)
+    parser.add_argument('--block-size', type=int, default=16)
+    args = parser.parse_args()
+    main(args)
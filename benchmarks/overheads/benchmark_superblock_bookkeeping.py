@@ -0,0 +1,133 @@
+"""Benchmark the per-step scheduler overhead of the superblock migration
+bookkeeping in BlockSpaceManagerV1 with thousands of long sequences.
+
+No GPU or model is needed. Every step each running sequence grows by one
+token and is offered to `add_kvcache_migrate_block`, one batch of
+superblocks is migrated and committed, and the finished sequences are
+freed (which drops their queued superblocks) and replaced by new ones.
+"""
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, List
+
+from vllm.block import PhysicalTokenBlock
+from vllm.core.block_manager_v1 import BlockSpaceManagerV1
+from vllm.sequence import SequenceStatus
+from vllm.utils import Device, FlexibleArgumentParser
+
+
+@dataclass
+class SimSequence:
+    seq_id: int
+    seq_len: int
+    max_len: int
+    status: SequenceStatus = SequenceStatus.RUNNING
+
+    def get_len(self) -> int:
+        return self.seq_len
+
+
+def _new_sequence(args, rng: random.Random, seq_id: int,
+                  block_manager: BlockSpaceManagerV1) -> SimSequence:
+    seq_len = rng.randrange(args.block_migrate_threshold, args.max_len // 2)
+    seq = SimSequence(seq_id, seq_len, rng.randrange(seq_len + 1,
+                                                     args.max_len))
+    # Build the block table of the whole sequence upfront, only the
+    # migration bookkeeping is measured.
+    num_blocks = -(-seq.max_len // args.block_size)
+    block_table = []
+    for i in range(num_blocks):
+        block = PhysicalTokenBlock(device=Device.GPU,
+                                   block_number=seq_id * num_blocks + i,
+                                   block_size=args.block_size,
+                                   block_hash=-1,
+                                   num_hashed_tokens=0)
+        block.ref_count = 1
+        block_table.append(block)
+    block_manager.block_tables[seq_id] = block_table
+    return seq
+
+
+def run(args, num_seqs: int) -> Dict[str, float]:
+    rng = random.Random(args.seed)
+    superblock_blocks = args.block_migrate_size // args.block_size
+    block_manager = BlockSpaceManagerV1(
+        block_size=args.block_size,
+        num_gpu_blocks=args.block_migrate_budget * superblock_blocks,
+        num_cpu_blocks=0,
+        num_remote_blocks=args.num_blocks_per_rank,
+        watermark=0,
+        remote_allocator_number=args.num_sp_ranks,
+        block_migrate_size=args.block_migrate_size,
+        block_migrate_threshold=args.block_migrate_threshold,
+        block_migrate_start=args.block_migrate_start,
+        block_migrate_budget=args.block_migrate_budget)
+    next_seq_id = 0
+    running: List[SimSequence] = []
+    for _ in range(num_seqs):
+        running.append(_new_sequence(args, rng, next_seq_id, block_manager))
+        next_seq_id += 1
+
+    times = {"add": 0.0, "migrate": 0.0, "free": 0.0}
+    for _ in range(args.num_steps):
+        start = time.perf_counter()
+        for seq in running:
+            seq.seq_len += 1
+            block_manager.add_kvcache_migrate_block(seq)
+        times["add"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        block_manager.commit_kvcache_migrate_blocks()
+        block_manager.get_kvcache_migrate_block([])
+        times["migrate"] += time.perf_counter() - start
+
+        finished = [seq for seq in running if seq.seq_len >= seq.max_len]
+        start = time.perf_counter()
+        for seq in finished:
+            block_manager.free(seq)
+        times["free"] += time.perf_counter() - start
+        for seq in finished:
+            running.remove(seq)
+            running.append(_new_sequence(args, rng, next_seq_id,
+                                         block_manager))
+            next_seq_id += 1
+
+    result = {
+        key: value * 1000 / args.num_steps
+        for key, value in times.items()
+    }
+    result["queued"] = len(block_manager.migrate_list)
+    return result
+
+
+def main(args):
+    print(f"{'seqs':>8}{'add (ms)':>12}{'migrate (ms)':>14}"
+          f"{'free (ms)':>12}{'total (ms)':>12}{'queued':>10}")
+    for num_seqs in args.num_seqs:
+        result = run(args, num_seqs)
+        total = result["add"] + result["migrate"] + result["free"]
+        print(f"{num_seqs:>8}{result['add']:>12.3f}{result['migrate']:>14.3f}"
+              f"{result['free']:>12.3f}{total:>12.3f}{result['queued']:>10}")
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description='Benchmark the per-step overhead of the superblock '
+        'migration bookkeeping of BlockSpaceManagerV1.')
+    parser.add_argument('--num-seqs',
+                        type=int,
+                        nargs='+',
+                        default=[1000, 5000, 10000])
+    parser.add_argument('--num-steps', type=int, default=256)
+    parser.add_argument('--max-len', type=int, default=8192)
+    parser.add_argument('--block-size', type=int, default=128)
+    parser.add_argument('--block-migrate-size', type=int, default=512)
+    parser.add_argument('--block-migrate-threshold', type=int, default=2048)
+    parser.add_argument('--block-migrate-start', type=int, default=1024)
+    parser.add_argument('--block-migrate-budget', type=int, default=1)
+    parser.add_argument('--num-sp-ranks', type=int, default=4)
+    parser.add_argument('--num-blocks-per-rank', type=int, default=65536)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,175 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+
+import pytest
+
+from vllm.config import CacheConfig, SchedulerConfig
+from vllm.core.scheduler import Scheduler
+from vllm.engine.async_llm_engine import _AsyncLLMEngine
+from vllm.engine.output_processor.single_step import SingleStepOutputProcessor
+from vllm.engine.output_processor.stop_checker import StopChecker
+from vllm.sampling_params import SamplingParams
+from vllm.sequence import (CompletionSequenceGroupOutput, ExecuteModelRequest,
+                           Logprob, SamplerOutput, Sequence, SequenceGroup,
+                           SequenceOutput)
+from vllm.utils import Counter
+
+EOS_TOKEN_ID = 9
+
+
+class FakeDetokenizer:
+    """Decodes every token to its id followed by a space."""
+
+    def decode_sequence_inplace(self, seq, sampling_params) -> int:
+        text = f"{seq.get_last_token_id()} "
+        seq.output_text += text
+        return len(text)
+
+
+class FakeExecutor:
+    """Samples the length of the sequence modulo 10. Checks
+    that the inputs it read when the step started do not change while the
+    step runs, which is when the pipelined loop processes the outputs of the
+    step before."""
+
+    def __init__(self) -> None:
+        self.num_steps = 0
+
+    @staticmethod
+    def _read_inputs(execute_model_req: ExecuteModelRequest) -> List[Tuple]:
+        return [(seq_id, list(metadata.block_tables[seq_id]),
+                 seq_data.get_token_ids(), metadata.token_chunk_size)
+                for metadata in execute_model_req.seq_group_metadata_list
+                for seq_id, seq_data in metadata.seq_data.items()]
+
+    async def execute_model_async(
+            self,
+            execute_model_req: ExecuteModelRequest) -> List[SamplerOutput]:
+        self.num_steps += 1
+        inputs = self._read_inputs(execute_model_req)
+        for _ in range(4):
+            await asyncio.sleep(0)
+        assert self._read_inputs(execute_model_req) == inputs
+
+        outputs = []
+        for metadata in execute_model_req.seq_group_metadata_list:
+            samples = []
+            if metadata.do_sample:
+                # The prompt forks into `best_of` sequences.
+                num_samples = (metadata.sampling_params.best_of
+                               if metadata.is_prompt else 1)
+                for seq_id, seq_data in metadata.seq_data.items():
+                    for i in range(num_samples):
+                        token_id = (seq_data.get_len() + 3 * i) % 10
+                        samples.append(
+                            SequenceOutput(seq_id, token_id,
+                                           {token_id: Logprob(0.0)}))
+            outputs.append(
+                CompletionSequenceGroupOutput(samples=samples,
+                                              prompt_logprobs=None))
+        return [SamplerOutput(outputs=outputs)]
+
+    async def stop_remote_worker_execution_loop_async(self) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        pass
+
+
+def create_engine(pipeline_steps: bool, **scheduler_kwargs) -> _AsyncLLMEngine:
+    # Only the parts of the engine that the step loops use.
+    engine = _AsyncLLMEngine.__new__(_AsyncLLMEngine)
+    scheduler_config = SchedulerConfig(256, 16, 256, **scheduler_kwargs)
+    cache_config = CacheConfig(4, 1.0, 1, "auto")
+    cache_config.num_gpu_blocks = 128
+    cache_config.num_cpu_blocks = 0
+    engine.scheduler = Scheduler(scheduler_config, cache_config, None)
+    engine.output_processor = SingleStepOutputProcessor(
+        scheduler_config, FakeDetokenizer(), engine.scheduler, Counter(),
+        StopChecker(256, lambda _: None))
+    engine.model_executor = FakeExecutor()
+    engine.model_config = SimpleNamespace(embedding_mode=False)
+    engine.log_stats = False
+    engine.tracer = None
+    engine.pipeline_steps = pipeline_steps
+    engine._deferred_outputs = None
+    return engine
+
+
+def add_requests(engine: _AsyncLLMEngine) -> None:
+    all_params = [
+        # Stops on a stop string, found one step late when pipelined.
+        SamplingParams(max_tokens=32, stop=["4 "]),
+        # Stops on the eos token.
+        SamplingParams(max_tokens=32),
+        # Stops on the max tokens.
+        SamplingParams(max_tokens=5, ignore_eos=True),
+        # A stop string right at the max tokens.
+        SamplingParams(max_tokens=3, stop=["9 "], ignore_eos=True),
+        # Parallel sampling with a stop string.
+        SamplingParams(n=2, max_tokens=16, stop=["6 "], ignore_eos=True),
+    ]
+    seq_id = 0
+    for i, sampling_params in enumerate(all_params):
+        seqs = [
+            Sequence(seq_id, {"prompt_token_ids": [1] * (4 + i)},
+                     block_size=4,
+                     eos_token_id=EOS_TOKEN_ID)
+        ]
+        seq_id += 1
+        engine.scheduler.add_seq_group(
+            SequenceGroup(str(i), seqs, time.time(), sampling_params))
+    engine.output_processor.seq_counter = Counter(seq_id)
+
+
+async def run_to_completion(engine: _AsyncLLMEngine) -> Dict[str, List]:
+    final_outputs: Dict[str, List] = {}
+    while (engine.scheduler.has_unfinished_seqs()
+           or engine.has_deferred_outputs()):
+        for request_output in await engine.step_async():
+            assert request_output.request_id not in final_outputs
+            if request_output.finished:
+                final_outputs[request_output.request_id] = sorted(
+                    (output.token_ids, output.text, output.finish_reason,
+                     output.stop_reason) for output in request_output.outputs)
+    return final_outputs
+
+
+@pytest.mark.asyncio
+async def test_pipelined_step_matches_sequential_steps():
+    sequential_engine = create_engine(pipeline_steps=False)
+    add_requests(sequential_engine)
+    expected = await run_to_completion(sequential_engine)
+
+    pipelined_engine = create_engine(pipeline_steps=True)
+    add_requests(pipelined_engine)
+    outputs = await run_to_completion(pipelined_engine)
+
+    assert len(expected) == 5
+    assert outputs == expected
+    # All the blocks are freed, with the ones of the dropped tokens.
+    assert pipelined_engine.scheduler.block_manager.get_num_free_gpu_blocks(
+    ) == 128
+    # The sequences stopped by stop strings run one step more.
+    assert (pipelined_engine.model_executor.num_steps <=
+            sequential_engine.model_executor.num_steps + 1)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("pipeline_steps", [False, True])
+async def test_pipelined_steps_are_not_measured(pipeline_steps: bool):
+    engine = create_engine(pipeline_steps,
+                           enable_chunked_prefill=True,
+                           target_step_latency_ms=100)
+    add_requests(engine)
+    await run_to_completion(engine)
+
+    # The outputs of the step before are processed while a pipelined step
+    # runs, which would count towards its time.
+    num_samples = engine.scheduler.step_cost_model.num_samples
+    if pipeline_steps:
+        assert num_samples == 0
+    else:
+        assert num_samples == engine.model_executor.num_steps
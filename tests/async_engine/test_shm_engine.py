@@ -0,0 +1,153 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from vllm.distributed.device_communicators.shm_broadcast import ShmRingBuffer
+from vllm.engine.shm_engine import ShmChannel, ShmEngineClient, ShmEngineServer
+from vllm.outputs import CompletionOutput, RequestOutput
+from vllm.sampling_params import SamplingParams
+from vllm.sequence import Logprob
+
+
+class FakeEngine:
+    """Generates the token ids `1, 2, ...` of `n` outputs, each decoded to
+    its id followed by a space."""
+
+    def __init__(self) -> None:
+        self.aborted: List[str] = []
+
+    async def generate(self,
+                       inputs,
+                       sampling_params,
+                       request_id,
+                       lora_request=None,
+                       trace_headers=None):
+        if isinstance(inputs, str):
+            inputs = {"prompt": inputs, "prompt_token_ids": [7, 7, 7]}
+        if inputs["prompt_token_ids"] == [0]:
+            raise ValueError("The prompt is invalid.")
+        token_ids: List[int] = []
+        try:
+            for token_id in range(1, sampling_params.max_tokens + 1):
+                await asyncio.sleep(0)
+                token_ids.append(token_id)
+                finished = token_id == sampling_params.max_tokens
+                outputs = [
+                    CompletionOutput(
+                        index=i,
+                        text="".join(f"{t + i} " for t in token_ids),
+                        token_ids=[t + i for t in token_ids],
+                        cumulative_logprob=-float(len(token_ids)),
+                        logprobs=[{
+                            t + i: Logprob(-1.0)
+                        } for t in token_ids],
+                        finish_reason="length" if finished else None)
+                    for i in range(sampling_params.n)
+                ]
+                yield RequestOutput(request_id, inputs.get("prompt"),
+                                    inputs["prompt_token_ids"], None, outputs,
+                                    finished)
+        except asyncio.CancelledError:
+            self.aborted.append(request_id)
+            raise
+
+    async def check_health(self):
+        pass
+
+
+def create_client_and_server(engine: FakeEngine):
+    server = ShmEngineServer(engine, num_clients=1)
+    request_buffer, output_buffer = server.client_buffers[0]
+    client = ShmEngineClient(request_buffer, output_buffer, None, None, None,
+                             False)
+    return client, asyncio.create_task(server.serve())
+
+
+async def collect(results) -> List[RequestOutput]:
+    # The client extends the outputs it yielded before in place.
+    return [(request_output.prompt_token_ids, [
+        (output.index, output.text, list(output.token_ids),
+         list(output.logprobs), output.finish_reason)
+        for output in request_output.outputs
+    ], request_output.finished) async for request_output in results]
+
+
+@pytest.mark.asyncio
+async def test_channel_writes_messages_together():
+    channel = ShmChannel(send_buffer=ShmRingBuffer(1, 1024, 2),
+                         recv_buffer=ShmRingBuffer(1, 1024, 2))
+    peer = ShmChannel(send_buffer=channel._reader.buffer,
+                      recv_buffer=channel._writer.buffer)
+    sender = asyncio.create_task(channel.run_sender())
+
+    for i in range(100):
+        channel.send(("message", i))
+    messages = []
+    while len(messages) < 100:
+        messages.extend(await peer.recv())
+    assert messages == [("message", i) for i in range(100)]
+
+    with pytest.raises(ValueError):
+        channel.send(b"x" * 1024)
+    sender.cancel()
+
+
+@pytest.mark.asyncio
+async def test_client_outputs_match_engine_outputs():
+    engine = FakeEngine()
+    client, server_task = create_client_and_server(engine)
+
+    sampling_params = SamplingParams(n=2, max_tokens=5, logprobs=1)
+    inputs = {"prompt": "prompt", "prompt_token_ids": [1, 2, 3]}
+    expected = await collect(
+        engine.generate(inputs, sampling_params, "expected"))
+    outputs, text_prompt_outputs = await asyncio.gather(
+        collect(client.generate(inputs, sampling_params, "0")),
+        # The engine sends back the token ids of a prompt without them.
+        collect(client.generate("prompt", sampling_params, "1")))
+    assert outputs == expected
+    assert [output[0] for output in text_prompt_outputs] == [[7, 7, 7]] * 5
+    server_task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_client_abort_and_error():
+    engine = FakeEngine()
+    client, server_task = create_client_and_server(engine)
+
+    results = client.generate({"prompt_token_ids": [1]},
+                              SamplingParams(max_tokens=1000), "aborted")
+    await results.__anext__()
+    await client.abort("aborted")
+    while not engine.aborted:
+        await asyncio.sleep(0.01)
+    assert engine.aborted == ["aborted"]
+
+    with pytest.raises(ValueError, match="The prompt is invalid."):
+        await collect(
+            client.generate({"prompt_token_ids": [0]}, SamplingParams(),
+                            "invalid"))
+
+    await client.check_health()
+    server_task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_client_rejects_logits_processors():
+    engine = FakeEngine()
+    client, server_task = create_client_and_server(engine)
+
+    # A guide of guided decoding holds state that is not picklable.
+    guide = lambda token_ids, logits: logits  # noqa: E731
+    with pytest.raises(ValueError, match="guided decoding"):
+        await collect(
+            client.generate({"prompt_token_ids": [1]},
+                            SamplingParams(logits_processors=[guide]),
+                            "guided"))
+
+    # The client keeps serving the other requests.
+    assert len(await collect(
+        client.generate({"prompt_token_ids": [1]},
+                        SamplingParams(max_tokens=2), "0"))) == 2
+    server_task.cancel()
@@ -1,6 +1,6 @@
 import time
 from collections import defaultdict
-from typing import List
+from typing import List, Optional
 
 import pytest
 
@@ -9,6 +9,8 @@ from vllm.block import PhysicalTokenBlock
 from vllm.core.block.utils import (STR_NOT_IMPL_ENC_DEC_PREFIX_CACHE,
                                    STR_NOT_IMPL_ENC_DEC_SWA)
 from vllm.core.block_manager_v1 import (BlockSpaceManagerV1,
+                                        SequenceSuperBlock,
+                                        SuperBlockAllocator, SuperBlockQueue,
                                         UncachedBlockAllocator)
 from vllm.core.interfaces import AllocStatus
 from vllm.sequence import Logprob, Sequence, SequenceGroup, SequenceStatus
@@ -63,6 +65,31 @@ def test_block_allocator_free():
             cpu_allocator.free(block)
 
 
+def test_block_allocator_order():
+    block_size = 4
+    num_gpu_blocks = 4
+    gpu_allocator = UncachedBlockAllocator(Device.GPU, block_size,
+                                           num_gpu_blocks)
+
+    # The block freed last is reused first, then the blocks never allocated
+    # go by block number. A block number always maps to the same block.
+    blocks = [gpu_allocator.allocate() for _ in range(3)]
+    assert [block.block_number for block in blocks] == [0, 1, 2]
+    gpu_allocator.free(blocks[1])
+    gpu_allocator.free(blocks[0])
+    assert gpu_allocator.get_num_free_blocks() == 3
+    assert gpu_allocator.allocate() is blocks[0]
+    assert gpu_allocator.allocate() is blocks[1]
+    assert gpu_allocator.allocate().block_number == 3
+
+    # A batch allocation that does not fit allocates nothing.
+    gpu_allocator.free(blocks[2])
+    with pytest.raises(ValueError):
+        gpu_allocator.allocate_blocks(2)
+    assert gpu_allocator.get_num_free_blocks() == 1
+    assert gpu_allocator.allocate_blocks(1) == [blocks[2]]
+
+
 def test_allocate():
     block_size = 4
     num_cpu_blocks = 4
@@ -295,6 +322,121 @@ def test_fork():
         prompt) != block_manager.get_block_table(child)
 
 
+def test_fork_shares_segments():
+    block_size = 4
+    num_cpu_blocks = 16
+    num_gpu_blocks = 16
+    block_manager = BlockSpaceManagerV1(block_size,
+                                        num_cpu_blocks,
+                                        num_gpu_blocks,
+                                        watermark=0)
+
+    def append_token(seq: Sequence) -> None:
+        seq.append_token_id(1, {1: Logprob(0.0)})
+        block_manager.append_slots(seq)
+
+    # 2 full blocks and a partial one.
+    prompt, seq_group = create_dummy_prompt("1", 10, block_size=block_size)
+    block_manager.allocate(seq_group)
+    child = prompt.fork(2)
+    block_manager.fork(prompt, child)
+    assert block_manager.get_block_table(
+        child) == block_manager.get_block_table(prompt)
+    # The full blocks are referenced once by their segment, the last block
+    # by both sequences.
+    assert [
+        block.ref_count for block in block_manager.block_tables[prompt.seq_id]
+    ] == [1, 1, 2]
+
+    # The child fills its last block and forks again, the new segment
+    # chains to the first one.
+    for _ in range(3):
+        append_token(child)
+    grandchild = child.fork(3)
+    block_manager.fork(child, grandchild)
+    assert block_manager.get_block_table(
+        grandchild) == block_manager.get_block_table(child)
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 5
+
+    for seq in (grandchild, child):
+        seq.status = SequenceStatus.RUNNING
+        seq_group.add(seq)
+    prompt.status = SequenceStatus.RUNNING
+    # Swapping out unshares the segments.
+    assert len(block_manager._get_physical_blocks(seq_group)) == 5
+    mapping = block_manager.swap_out(seq_group)
+    assert len(mapping) == 5
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks
+    assert not block_manager._seq_segments
+
+    for seq in seq_group.get_seqs():
+        seq.status = SequenceStatus.SWAPPED
+    block_manager.swap_in(seq_group)
+    child.status = grandchild.status = prompt.status = SequenceStatus.RUNNING
+    great_grandchild = grandchild.fork(4)
+    block_manager.fork(grandchild, great_grandchild)
+    for seq in (prompt, grandchild, child, great_grandchild):
+        block_manager.free(seq)
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks
+    assert block_manager.get_num_free_cpu_blocks() == num_cpu_blocks
+    assert not block_manager._seq_segments
+
+
+def test_block_table_updated_in_place():
+    block_size = 4
+    num_cpu_blocks = 8
+    num_gpu_blocks = 8
+    block_manager = BlockSpaceManagerV1(block_size,
+                                        num_cpu_blocks,
+                                        num_gpu_blocks,
+                                        watermark=0)
+
+    def expected_block_ids(seq: Sequence) -> List[int]:
+        return [
+            block.block_number
+            for block in block_manager.block_tables[seq.seq_id]
+        ]
+
+    prompt, seq_group = create_dummy_prompt("1",
+                                            block_size - 1,
+                                            block_size=block_size)
+    block_manager.allocate(seq_group)
+    block_ids = block_manager.get_block_table(prompt)
+    assert block_ids == expected_block_ids(prompt)
+
+    # Appending a block extends the same list.
+    for token_id in range(2):
+        prompt.append_token_id(token_id, {token_id: Logprob(0.0)})
+        block_manager.append_slots(prompt)
+    assert block_manager.get_block_table(prompt) is block_ids
+    assert block_ids == expected_block_ids(prompt)
+    assert len(block_ids) == 2
+
+    # Copy on write replaces the last block id.
+    child = prompt.fork(2)
+    block_manager.fork(prompt, child)
+    child_block_ids = block_manager.get_block_table(child)
+    assert child_block_ids == block_ids
+    child.append_token_id(4, {4: Logprob(0.0)})
+    block_manager.append_slots(child)
+    assert block_manager.get_block_table(child) is child_block_ids
+    assert child_block_ids == expected_block_ids(child)
+    assert child_block_ids[-1] != block_ids[-1]
+    block_manager.free(child)
+
+    # Swapping gives a new block table.
+    prompt.status = SequenceStatus.RUNNING
+    block_manager.swap_out(seq_group)
+    assert block_manager.get_block_table(prompt) == expected_block_ids(prompt)
+    prompt.status = SequenceStatus.SWAPPED
+    block_manager.swap_in(seq_group)
+    assert block_manager.get_block_table(prompt) == expected_block_ids(prompt)
+    assert block_manager.get_block_table_remote_rank(prompt) == [0, 0]
+
+    block_manager.free(prompt)
+    assert prompt.seq_id not in block_manager._block_ids
+
+
 def test_swap():
     block_size = 4
     num_cpu_blocks = 4
@@ -397,6 +539,123 @@ def test_swap_encoder_decoder():
     assert before_gpu_blocks == after_gpu_blocks + len(cpu_blocks)
 
 
+def test_cpu_prefix_cache():
+    block_size = 4
+    block_manager = BlockSpaceManagerV1(block_size,
+                                        num_gpu_blocks=4,
+                                        num_cpu_blocks=4,
+                                        watermark=0,
+                                        enable_caching=True,
+                                        enable_cpu_prefix_cache=True)
+
+    def create_prompt(request_id: str, prompt_tokens: List[int]):
+        prompt = Sequence(int(request_id),
+                          inputs={"prompt_token_ids": prompt_tokens},
+                          block_size=block_size)
+        seq_group = SequenceGroup(request_id=request_id,
+                                  seqs=[prompt],
+                                  arrival_time=time.time(),
+                                  sampling_params=SamplingParams())
+        return prompt, seq_group
+
+    # The first two of the three full blocks are marked computed.
+    prompt, seq_group = create_prompt("1", list(range(13)))
+    block_manager.allocate(seq_group)
+    block_manager.mark_blocks_as_computed(seq_group)
+    evicted_block_ids = block_manager.get_block_table(prompt)
+    block_manager.free(prompt)
+    assert block_manager.get_prefix_cache_swaps() == ([], [])
+
+    # Another prompt evicts the GPU blocks, the computed ones are demoted.
+    prompt, seq_group = create_prompt("2", list(range(100, 113)))
+    block_manager.allocate(seq_group)
+    assert not any(block.computed
+                   for block in block_manager.block_tables[prompt.seq_id])
+    block_manager.free(prompt)
+    promoted, demoted = block_manager.get_prefix_cache_swaps()
+    assert promoted == []
+    # The deeper block is evicted first.
+    cpu_block_ids = dict(demoted)
+    assert list(cpu_block_ids) == evicted_block_ids[1::-1]
+
+    # The first prompt hits the CPU tier and is promoted back.
+    prompt, seq_group = create_prompt("3", list(range(13)))
+    block_manager.allocate(seq_group)
+    block_ids = block_manager.get_block_table(prompt)
+    assert block_manager.get_all_computed_blocks(prompt) == block_ids[:2]
+    promoted, demoted = block_manager.get_prefix_cache_swaps()
+    assert promoted == [
+        (cpu_block_ids[evicted_block], block)
+        for evicted_block, block in zip(evicted_block_ids[:2], block_ids)
+    ]
+    # The blocks of the second prompt were not computed.
+    assert demoted == []
+    assert block_manager.get_prefix_cache_stats() == (9, {"gpu": 0, "cpu": 2})
+
+    # The CPU blocks are held until the swaps of their step ran.
+    assert block_manager.get_num_free_cpu_blocks() == 2
+    block_manager.get_prefix_cache_swaps()
+    assert block_manager.get_num_free_cpu_blocks() == 4
+
+
+def test_disk_prefix_cache(tmp_path):
+    block_size = 4
+
+    def create_block_manager() -> BlockSpaceManagerV1:
+        return BlockSpaceManagerV1(block_size,
+                                   num_gpu_blocks=8,
+                                   num_cpu_blocks=4,
+                                   watermark=0,
+                                   enable_caching=True,
+                                   enable_cpu_prefix_cache=True,
+                                   disk_prefix_cache_path=str(tmp_path),
+                                   num_disk_blocks=4)
+
+    def end_step(block_manager: BlockSpaceManagerV1):
+        promoted, demoted = block_manager.get_prefix_cache_swaps()
+        loaded, spilled = block_manager.get_disk_prefix_cache_transfers()
+        return promoted, demoted, loaded, spilled
+
+    # The first two of the three full blocks are marked computed.
+    block_manager = create_block_manager()
+    prompt, seq_group = create_dummy_prompt("1", 13, block_size)
+    block_manager.allocate(seq_group)
+    block_manager.mark_blocks_as_computed(seq_group)
+    assert end_step(block_manager) == ([], [], [], [])
+
+    # The reused blocks are written through to disk.
+    prompt, seq_group = create_dummy_prompt("2", 13, block_size)
+    block_manager.allocate(seq_group)
+    block_ids = block_manager.get_block_table(prompt)
+    promoted, demoted, loaded, spilled = end_step(block_manager)
+    assert promoted == [] and loaded == []
+    assert [gpu_block for gpu_block, _ in demoted] == block_ids[:2]
+    assert [cpu_block for cpu_block, _ in spilled
+            ] == [cpu_block for _, cpu_block in demoted]
+    slots = [slot for _, slot in spilled]
+    # Written in the next step, persisted after it.
+    end_step(block_manager)
+    end_step(block_manager)
+
+    # After a restart the blocks are loaded back through the CPU tier.
+    block_manager = create_block_manager()
+    prompt, seq_group = create_dummy_prompt("3", 13, block_size)
+    block_manager.allocate(seq_group)
+    block_ids = block_manager.get_block_table(prompt)
+    assert block_manager.get_all_computed_blocks(prompt) == block_ids[:2]
+    promoted, demoted, loaded, spilled = end_step(block_manager)
+    assert [slot for slot, _ in loaded] == slots
+    assert promoted == [(cpu_block, gpu_block)
+                        for (_,
+                             cpu_block), gpu_block in zip(loaded, block_ids)]
+    assert demoted == [] and spilled == []
+    assert block_manager.get_prefix_cache_stats() == (3, {
+        "gpu": 0,
+        "cpu": 0,
+        "disk": 2
+    })
+
+
 def test_free():
     block_size = 4
     num_cpu_blocks = 4
@@ -595,3 +854,428 @@ def test_sliding_window_multi_seq():
 
     # assert all blocks are free now
     assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks
+
+
+def _migration_block_manager(block_migrate_budget: int,
+                             num_remote_blocks: int = 8,
+                             block_recall_watermark: Optional[float] = None,
+                             num_remote_cpu_blocks: int = 0):
+    # 2 blocks per superblock, migrate from token 8 once a sequence reaches
+    # 16 tokens.
+    return BlockSpaceManagerV1(block_size=4,
+                               num_gpu_blocks=32,
+                               num_cpu_blocks=8,
+                               num_remote_blocks=num_remote_blocks,
+                               watermark=0,
+                               remote_allocator_number=2,
+                               block_migrate_size=8,
+                               block_migrate_threshold=16,
+                               block_migrate_start=8,
+                               block_migrate_policy="leastloaded",
+                               block_migrate_budget=block_migrate_budget,
+                               block_recall_watermark=block_recall_watermark,
+                               num_remote_cpu_blocks=num_remote_cpu_blocks)
+
+
+def _allocate_running(block_manager: BlockSpaceManagerV1, request_id: str,
+                      prompt_length: int) -> Sequence:
+    prompt, seq_group = create_dummy_prompt(request_id, prompt_length, 4)
+    block_manager.allocate(seq_group)
+    prompt.status = SequenceStatus.RUNNING
+    return prompt
+
+
+def test_migrate_reserves_staging_area():
+    block_manager = _migration_block_manager(block_migrate_budget=3)
+    # 3 superblocks of 2 blocks are staged at the end of the GPU pool.
+    assert block_manager.get_num_free_gpu_blocks() == 32 - 6
+    assert block_manager.gpu_allocator.get_migrate_blocks() == list(
+        range(26, 32))
+
+
+def test_migrate_multiple_superblocks_per_step():
+    block_manager = _migration_block_manager(block_migrate_budget=3)
+    seq_a = _allocate_running(block_manager, "0", 32)
+    seq_b = _allocate_running(block_manager, "1", 32)
+    for seq in (seq_a, seq_b):
+        block_manager.add_kvcache_migrate_block(seq)
+    # Superblocks at tokens 8 and 16. The one at token 24 holds the last
+    # token, whose KV is not computed yet.
+    assert [(sb.seq_id, sb.start)
+            for sb in block_manager.migrate_list] == [(0, 8), (0, 16), (1, 8),
+                                                      (1, 16)]
+    free_gpu_blocks = block_manager.get_num_free_gpu_blocks()
+
+    blocks_to_migrate: List = []
+    superblocks = block_manager.get_kvcache_migrate_block(blocks_to_migrate)
+    # The budget caps the step at 3 superblocks, grouped by dst rank.
+    assert superblocks == [(0, 1), (1, 1), (0, 2)]
+    assert len(blocks_to_migrate) == 6
+    assert [rank for _, rank, _ in blocks_to_migrate] == [1, 1, 1, 1, 2, 2]
+    # The block tables only switch to the remote blocks once the migration
+    # of this step is committed.
+    assert block_manager.get_num_free_gpu_blocks() == free_gpu_blocks
+    assert block_manager.get_block_table_remote_rank(seq_a) == [0] * 8
+    block_manager.commit_kvcache_migrate_blocks()
+    assert block_manager.get_num_free_gpu_blocks() == free_gpu_blocks + 6
+    assert block_manager.get_block_table_remote_rank(seq_a) == [
+        0, 0, 1, 1, 2, 2, 0, 0
+    ]
+
+    blocks_to_copy: List = []
+    block_manager.format_kvcache_migrate_blocks(blocks_to_migrate,
+                                                blocks_to_copy)
+    assert [dst for _, dst in blocks_to_copy] == list(range(26, 32))
+
+    blocks_to_migrate = []
+    superblocks = block_manager.get_kvcache_migrate_block(blocks_to_migrate)
+    assert superblocks == [(1, 2)]
+    assert not block_manager.migrate_list
+
+    # Freeing the sequences returns the remote blocks, including the ones of
+    # the migration still in flight.
+    block_manager.free(seq_a)
+    block_manager.free(seq_b)
+    assert block_manager.remote_allocator.get_total_free_blocks() == 16
+    assert block_manager.get_num_free_gpu_blocks() == 26
+
+
+def test_migrate_keeps_superblocks_without_room_queued():
+    block_manager = _migration_block_manager(block_migrate_budget=4,
+                                             num_remote_blocks=2)
+    seq = _allocate_running(block_manager, "0", 40)
+    block_manager.add_kvcache_migrate_block(seq)
+    assert len(block_manager.migrate_list) == 3
+
+    blocks_to_migrate: List = []
+    superblocks = block_manager.get_kvcache_migrate_block(blocks_to_migrate)
+    # Each rank only has room for a single superblock.
+    assert superblocks == [(0, 1), (0, 2)]
+    assert [sb.start for sb in block_manager.migrate_list] == [24]
+
+    # Queueing again does not duplicate the superblocks, in flight or not.
+    block_manager.add_kvcache_migrate_block(seq)
+    assert [sb.start for sb in block_manager.migrate_list] == [24]
+    block_manager.commit_kvcache_migrate_blocks()
+    block_manager.add_kvcache_migrate_block(seq)
+    assert [sb.start for sb in block_manager.migrate_list] == [24]
+
+
+def test_migrate_inflight_dropped_on_swap_out():
+    block_manager = _migration_block_manager(block_migrate_budget=2)
+    prompt, seq_group = create_dummy_prompt("0", 32, 4)
+    block_manager.allocate(seq_group)
+    prompt.status = SequenceStatus.RUNNING
+    block_manager.add_kvcache_migrate_block(prompt)
+    block_manager.get_kvcache_migrate_block([])
+    assert block_manager.remote_allocator.get_total_free_blocks() == 12
+
+    # The local blocks still hold the KV, so they are the ones swapped out.
+    mapping = block_manager.swap_out(seq_group)
+    assert len(mapping) == 8
+    prompt.status = SequenceStatus.SWAPPED
+    assert block_manager.remote_allocator.get_total_free_blocks() == 16
+    assert not block_manager.migrate_list
+
+    block_manager.commit_kvcache_migrate_blocks()
+    assert block_manager.get_block_table_remote_rank(prompt) == [0] * 8
+
+
+def test_recall_superblocks():
+    block_manager = _migration_block_manager(block_migrate_budget=2,
+                                             block_recall_watermark=0.5)
+    prompt = _allocate_running(block_manager, "0", 28)
+    block_manager.add_kvcache_migrate_block(prompt)
+    block_manager.get_kvcache_migrate_block([])
+    # Nothing is recalled in the step the superblocks are migrated.
+    assert block_manager.get_kvcache_recall_block([]) == []
+    block_manager.commit_kvcache_migrate_blocks()
+    remote_table = list(block_manager.block_tables[prompt.seq_id])
+    assert [block.remote_rank != 0
+            for block in remote_table] == [False] * 2 + [True] * 4 + [False]
+
+    blocks_to_recall: List = []
+    superblocks = block_manager.get_kvcache_recall_block(blocks_to_recall)
+    # The last migrated superblock is recalled first, then sorted by rank.
+    expected = [(remote_table[i].block_number // 2,
+                 remote_table[i].remote_rank) for i in (4, 2)]
+    assert superblocks == sorted(expected, key=lambda item: item[1])
+    assert len(blocks_to_recall) == 4
+    # The forward of this step still reads the remote blocks.
+    assert block_manager.block_tables[prompt.seq_id] == remote_table
+
+    block_manager.commit_kvcache_migrate_blocks()
+    assert block_manager.get_block_table_remote_rank(prompt) == [0] * 7
+    assert block_manager.remote_allocator.get_total_free_blocks() == 16
+    recalled = {(remote_table[i].block_number // 2,
+                 remote_table[i].remote_rank): i
+                for i in (2, 4)}
+    block_table = block_manager.get_block_table(prompt)
+    for j, superblock in enumerate(superblocks):
+        start = recalled[superblock]
+        assert block_table[start:start + 2] == blocks_to_recall[2 * j:2 * j +
+                                                                2]
+    assert block_manager.get_kvcache_recall_block([]) == []
+
+    block_manager.free(prompt)
+    assert block_manager.get_num_free_gpu_blocks() == 28
+
+
+def test_recall_only_when_idle():
+    block_manager = _migration_block_manager(block_migrate_budget=1,
+                                             block_recall_watermark=0.5)
+    prompt = _allocate_running(block_manager, "0", 28)
+    block_manager.add_kvcache_migrate_block(prompt)
+    block_manager.get_kvcache_migrate_block([])
+    block_manager.commit_kvcache_migrate_blocks()
+    # The second superblock still waits to be migrated.
+    assert len(block_manager.migrate_list) == 1
+    assert block_manager.get_kvcache_recall_block([]) == []
+
+    # Fewer free local blocks than the watermark of 15 blocks.
+    block_manager.migrate_list.pop()
+    _allocate_running(block_manager, "1", 48)
+    assert block_manager.get_num_free_gpu_blocks() == 13
+    assert block_manager.get_kvcache_recall_block([]) == []
+    assert block_manager.migrated_superblocks[prompt.seq_id]
+
+
+def _assert_mapping_matches_chunks(superblocks: List,
+                                   blocks_to_migrate: List) -> None:
+    # The workers write superblock i of the step to the blocks of its chunk,
+    # in ascending order.
+    expected = [(rank, 2 * chunk + offset) for chunk, rank in superblocks
+                for offset in range(2)]
+    assert [(dst_rank, dst_block)
+            for _, dst_rank, dst_block in blocks_to_migrate] == expected
+
+
+def test_migrate_reuses_freed_remote_chunks():
+    block_manager = _migration_block_manager(block_migrate_budget=2,
+                                             num_remote_blocks=2)
+    for request_id in ("0", "1"):
+        # Two superblocks, which fill the single chunk of both ranks.
+        seq = _allocate_running(block_manager, request_id, 28)
+        block_manager.add_kvcache_migrate_block(seq)
+        blocks_to_migrate: List = []
+        superblocks = block_manager.get_kvcache_migrate_block(
+            blocks_to_migrate)
+        assert sorted(superblocks) == [(0, 1), (0, 2)]
+        _assert_mapping_matches_chunks(superblocks, blocks_to_migrate)
+        block_manager.commit_kvcache_migrate_blocks()
+        assert block_manager.remote_allocator.get_total_free_blocks() == 0
+        block_manager.free(seq)
+        assert block_manager.remote_allocator.get_total_free_blocks() == 4
+
+
+def test_recall_after_remote_reuse():
+    block_manager = _migration_block_manager(block_migrate_budget=2,
+                                             num_remote_blocks=2,
+                                             block_recall_watermark=0.5)
+    seq = _allocate_running(block_manager, "0", 28)
+    block_manager.add_kvcache_migrate_block(seq)
+    block_manager.get_kvcache_migrate_block([])
+    block_manager.commit_kvcache_migrate_blocks()
+    block_manager.free(seq)
+
+    seq = _allocate_running(block_manager, "1", 28)
+    block_manager.add_kvcache_migrate_block(seq)
+    block_manager.get_kvcache_migrate_block([])
+    block_manager.commit_kvcache_migrate_blocks()
+    remote_table = list(block_manager.block_tables[seq.seq_id])
+
+    blocks_to_recall: List = []
+    superblocks = block_manager.get_kvcache_recall_block(blocks_to_recall)
+    # The superblocks on the reused chunks are whole chunks, so both are
+    # recalled.
+    assert sorted(superblocks) == sorted(
+        (remote_table[i].block_number // 2, remote_table[i].remote_rank)
+        for i in (2, 4))
+    assert len(blocks_to_recall) == 4
+
+
+def test_superblock_allocator_keeps_chunks_whole():
+    allocator = SuperBlockAllocator(Device.GPU,
+                                    block_size=4,
+                                    num_blocks=9,
+                                    remote_rank=1,
+                                    chunk_blocks=4)
+    # The block after the last whole chunk is not used.
+    assert allocator.get_num_free_blocks() == 8
+    first = allocator.allocate_blocks(4)
+    second = allocator.allocate_blocks(4)
+    assert [block.block_number for block in first + second] == list(range(8))
+
+    # Freed in any order, a chunk is allocated again in ascending order.
+    for block in reversed(first):
+        allocator.free(block)
+    assert [block.block_number
+            for block in allocator.allocate_blocks(4)] == [0, 1, 2, 3]
+
+    # A swap in takes a single block from a chunk that is already partly
+    # used, so the whole chunks stay free.
+    allocator.free(second[0])
+    allocator.free(second[1])
+    assert allocator.allocate().block_number in (4, 5)
+    assert allocator.get_num_free_chunks() == 0
+    with pytest.raises(ValueError):
+        allocator.allocate_blocks(4)
+
+
+def test_superblock_queue():
+    queue = SuperBlockQueue()
+    for seq_id, start in [(0, 8), (1, 8), (0, 16), (2, 8), (1, 16)]:
+        queue.push(SequenceSuperBlock(seq_id, 8, start))
+    # Pushing a queued superblock again is a no-op.
+    queue.push(SequenceSuperBlock(0, 8, 8))
+    assert len(queue) == 5
+
+    queue.remove_seq(1)
+    assert [(sb.seq_id, sb.start) for sb in queue] == [(0, 8), (0, 16), (2, 8)]
+    assert (1, 8) not in queue
+
+    assert queue.peek().start == 8
+    superblock = queue.pop()
+    assert (superblock.seq_id, superblock.start) == (0, 8)
+    queue.remove_seq(0)
+    assert [(sb.seq_id, sb.start) for sb in queue] == [(2, 8)]
+    queue.remove_seq(3)
+    assert len(queue) == 1
+
+
+def _migrated_group(block_manager: BlockSpaceManagerV1) -> SequenceGroup:
+    # Blocks 2-5 of the 7 blocks of the prompt are migrated to the SP ranks.
+    prompt, seq_group = create_dummy_prompt("0", 28, 4)
+    block_manager.allocate(seq_group)
+    prompt.status = SequenceStatus.RUNNING
+    block_manager.add_kvcache_migrate_block(prompt)
+    block_manager.get_kvcache_migrate_block([])
+    block_manager.commit_kvcache_migrate_blocks()
+    assert block_manager.has_remote_blocks(seq_group)
+    return seq_group
+
+
+def test_swap_keeps_remote_blocks():
+    block_manager = _migration_block_manager(block_migrate_budget=2)
+    seq_group = _migrated_group(block_manager)
+    prompt = seq_group.get_seqs()[0]
+    remote_blocks = block_manager.block_tables[prompt.seq_id][2:6]
+
+    assert block_manager.can_swap_out(seq_group)
+    mapping = block_manager.swap_out(seq_group)
+    # Only the 3 master-resident blocks are swapped out.
+    assert len(mapping) == 3
+    assert block_manager.get_num_free_cpu_blocks() == 8 - 3
+    block_table = block_manager.block_tables[prompt.seq_id]
+    assert block_table[2:6] == remote_blocks
+    assert all(block.device == Device.GPU for block in remote_blocks)
+    assert block_manager.remote_allocator.get_total_free_blocks() == 12
+
+    prompt.status = SequenceStatus.SWAPPED
+    assert block_manager.can_swap_in(seq_group) == AllocStatus.OK
+    assert len(block_manager.swap_in(seq_group)) == 3
+    assert block_manager.block_tables[prompt.seq_id][2:6] == remote_blocks
+    assert block_manager.get_num_free_cpu_blocks() == 8
+
+    prompt.status = SequenceStatus.RUNNING
+    block_manager.free(prompt)
+    assert block_manager.remote_allocator.get_total_free_blocks() == 16
+
+
+def test_swap_remote_blocks_roundtrip():
+    block_manager = _migration_block_manager(block_migrate_budget=2,
+                                             num_remote_cpu_blocks=4)
+    seq_group = _migrated_group(block_manager)
+    prompt = seq_group.get_seqs()[0]
+    remote_ranks = block_manager.get_block_table_remote_rank(prompt)
+    remote_blocks = block_manager.block_tables[prompt.seq_id][2:6]
+
+    assert block_manager.can_swap_out_remote(seq_group)
+    remote_mapping: List = []
+    block_manager.swap_out(seq_group, remote_mapping)
+    # The remote blocks move to the CPU swap space of their own rank.
+    assert sorted((rank, gpu) for rank, gpu, _ in remote_mapping) == sorted(
+        (block.remote_rank, block.block_number) for block in remote_blocks)
+    assert block_manager.remote_allocator.get_total_free_blocks() == 16
+    for rank in (1, 2):
+        assert block_manager.remote_allocator.get_num_free_cpu_blocks(
+            rank) == 4 - remote_ranks.count(rank)
+    assert all(block.device == Device.CPU
+               for block in block_manager.block_tables[prompt.seq_id])
+
+    prompt.status = SequenceStatus.SWAPPED
+    assert block_manager.can_swap_in(seq_group) == AllocStatus.OK
+    with pytest.raises(AssertionError):
+        block_manager.swap_in(seq_group)
+
+    block_manager = _migration_block_manager(block_migrate_budget=2,
+                                             num_remote_cpu_blocks=4)
+    seq_group = _migrated_group(block_manager)
+    prompt = seq_group.get_seqs()[0]
+    block_manager.swap_out(seq_group, [])
+    prompt.status = SequenceStatus.SWAPPED
+    remote_mapping = []
+    assert len(block_manager.swap_in(seq_group, remote_mapping)) == 3
+    assert len(remote_mapping) == 4
+    assert block_manager.get_block_table_remote_rank(prompt) == remote_ranks
+    for rank in (1, 2):
+        assert block_manager.remote_allocator.get_num_free_cpu_blocks(
+            rank) == 4
+
+    prompt.status = SequenceStatus.RUNNING
+    block_manager.free(prompt)
+    assert block_manager.remote_allocator.get_total_free_blocks() == 16
+    assert block_manager.get_num_free_gpu_blocks() == 28
+
+
+@pytest.mark.parametrize("num_remote_cpu_blocks", [0, 4])
+def test_recall_after_swap(num_remote_cpu_blocks: int):
+    block_manager = _migration_block_manager(
+        block_migrate_budget=2,
+        block_recall_watermark=0.5,
+        num_remote_cpu_blocks=num_remote_cpu_blocks)
+    seq_group = _migrated_group(block_manager)
+    prompt = seq_group.get_seqs()[0]
+
+    # The remote blocks stay on the SP ranks, or are swapped out with the
+    # local blocks if the ranks have swap space.
+    remote_mapping: Optional[List] = ([] if num_remote_cpu_blocks else None)
+    block_manager.swap_out(seq_group, remote_mapping)
+    prompt.status = SequenceStatus.SWAPPED
+    # Nothing is recalled while the sequence is swapped out.
+    assert block_manager.get_kvcache_recall_block([]) == []
+    block_manager.swap_in(seq_group, [])
+    prompt.status = SequenceStatus.RUNNING
+
+    blocks_to_recall: List = []
+    assert len(block_manager.get_kvcache_recall_block(blocks_to_recall)) == 2
+    block_manager.commit_kvcache_migrate_blocks()
+    assert block_manager.get_block_table_remote_rank(prompt) == [0] * 7
+    assert block_manager.remote_allocator.get_total_free_blocks() == 16
+
+
+def test_swap_remote_blocks_without_swap_space():
+    block_manager = _migration_block_manager(block_migrate_budget=2,
+                                             num_remote_cpu_blocks=1)
+    seq_group = _migrated_group(block_manager)
+    # Every rank holds a superblock of 2 blocks.
+    assert not block_manager.can_swap_out_remote(seq_group)
+
+
+def test_remote_occupancy():
+    block_manager = _migration_block_manager(block_migrate_budget=1)
+    assert block_manager.get_num_free_remote_blocks() == [8, 8]
+
+    prompt, seq_group = create_dummy_prompt("0", 28, 4)
+    block_manager.allocate(seq_group)
+    prompt.status = SequenceStatus.RUNNING
+    block_manager.add_kvcache_migrate_block(prompt)
+    assert block_manager.get_num_queued_superblocks() == 2
+
+    assert len(block_manager.get_kvcache_migrate_block([])) == 1
+    assert block_manager.get_num_queued_superblocks() == 1
+    assert sorted(block_manager.get_num_free_remote_blocks()) == [6, 8]
+
+    block_manager.free(prompt)
+    assert block_manager.get_num_queued_superblocks() == 0
+    assert block_manager.get_num_free_remote_blocks() == [8, 8]
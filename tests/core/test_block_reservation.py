@@ -0,0 +1,85 @@
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+from vllm.config import CacheConfig, SchedulerConfig
+from vllm.core.block_reservation import OutputLengthEstimator
+from vllm.core.scheduler import Scheduler
+from vllm.sequence import Logprob
+
+from .utils import create_dummy_prompt
+
+
+def test_output_length_estimator():
+    estimator = OutputLengthEstimator(min_samples=32)
+    for _ in range(16):
+        estimator.observe(10, capped=False)
+        estimator.observe(30, capped=False)
+    assert estimator.ready
+
+    output_lens = np.array([0, 0, 10, 40])
+    max_tokens = np.array([100, 20, 100, 100])
+    expected = estimator.get_expected_output_lens(output_lens, max_tokens)
+    # All samples, bounded by the max tokens of the second sequence. Only
+    # the samples longer than 10 for the third one, none for the last one.
+    assert expected.tolist() == [20.0, 15.0, 30.0, 100.0]
+
+    # A capped sample runs until the max tokens of the sequence.
+    estimator.observe(50, capped=True)
+    expected = estimator.get_expected_output_lens(np.array([40]),
+                                                  np.array([100]))
+    assert expected.tolist() == [100.0]
+
+
+def test_output_length_estimator_not_ready():
+    estimator = OutputLengthEstimator(min_samples=4)
+    estimator.observe(1, capped=False)
+    expected = estimator.get_expected_output_lens(np.array([0]),
+                                                  np.array([64]))
+    assert expected.tolist() == [64.0]
+
+
+def initialize_scheduler(block_reservation_policy: str) -> Scheduler:
+    scheduler_config = SchedulerConfig(
+        64, 16, 64, block_reservation_policy=block_reservation_policy)
+    cache_config = CacheConfig(4, 1.0, 1, "auto")
+    cache_config.num_cpu_blocks = 16
+    cache_config.num_gpu_blocks = 16
+    return Scheduler(scheduler_config, cache_config, None)
+
+
+@pytest.mark.parametrize("block_reservation_policy,expected_num_prefills",
+                         [("none", 3), ("max_tokens", 2)])
+def test_scheduler_block_reservation(block_reservation_policy: str,
+                                     expected_num_prefills: int):
+    scheduler = initialize_scheduler(block_reservation_policy)
+    for i in range(3):
+        # 2 blocks of prompt and up to 16 output tokens, 6 blocks in all.
+        _, seq_group = create_dummy_prompt(str(i), prompt_length=8)
+        scheduler.add_seq_group(seq_group)
+
+    _, out = scheduler.schedule()
+    assert out.num_prefill_groups == expected_num_prefills
+    assert len(scheduler.waiting) == 3 - expected_num_prefills
+
+
+def test_scheduler_recompute_tokens():
+    scheduler = initialize_scheduler("none")
+    for i in range(2):
+        _, seq_group = create_dummy_prompt(str(i), prompt_length=8)
+        scheduler.add_seq_group(seq_group)
+    metas, out = scheduler.schedule()
+    for scheduled, meta in zip(out.scheduled_seq_groups, metas):
+        scheduled.seq_group.update_num_computed_tokens(meta.token_chunk_size)
+        for seq in scheduled.seq_group.get_seqs():
+            seq.append_token_id(1, {1: Logprob(1)})
+    assert out.num_recompute_tokens == 0
+
+    scheduler.block_manager.can_append_slots = MagicMock()
+    scheduler.block_manager.can_append_slots.side_effect = (
+        lambda seq_group, num_lookahead_slots: seq_group.request_id != "1")
+    _, out = scheduler.schedule()
+    assert out.preempted == 1
+    # The computed prompt of the preempted request is computed again.
+    assert out.num_recompute_tokens == 8
@@ -6,6 +6,7 @@ import pytest  # noqa
 from vllm.config import CacheConfig, SchedulerConfig
 from vllm.core.interfaces import AllocStatus
 from vllm.core.scheduler import Scheduler
+from vllm.core.step_cost_model import StepFeatures
 from vllm.sequence import Logprob, SequenceGroup
 
 from .utils import create_dummy_prompt
@@ -562,3 +563,59 @@ def test_chunked_prefill_max_seqs():
     assert len(get_sequence_groups(out)) == max_seqs
     assert not running[0].is_prefill()
     assert not running[1].is_prefill()
+
+
+def test_target_step_latency():
+    """Verify the prefill chunks are sized to the target step latency."""
+    block_size = 4
+    max_num_batched_tokens = 64
+    scheduler_config = SchedulerConfig(max_num_batched_tokens,
+                                       4,
+                                       80,
+                                       enable_chunked_prefill=True,
+                                       target_step_latency_ms=10.1)
+    cache_config = CacheConfig(block_size, 1.0, 1, "auto")
+    cache_config.num_cpu_blocks = 64
+    cache_config.num_gpu_blocks = 64
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+    model = scheduler.step_cost_model
+    assert model is not None
+
+    # Steps take 2 ms, plus 0.2 ms per prefill token and 1 ms per decode.
+    def step_time(num_prefill_tokens: int, num_decode_seqs: int) -> float:
+        return 0.002 + 2e-4 * num_prefill_tokens + 1e-3 * num_decode_seqs
+
+    _, seq_group = create_dummy_prompt("0", prompt_length=60)
+    scheduler.add_seq_group(seq_group)
+    # Until the model has seen enough steps, prefills fill the budget.
+    _, out = scheduler.schedule()
+    assert out.scheduled_seq_groups[0].token_chunk_size == 60
+    assert out.step_features.num_prefill_tokens == 60
+    scheduler.observe_step_time(out, step_time(60, 0))
+    assert model.num_samples == 1
+    scheduler.abort_seq_group("0")
+
+    for i in range(model.min_samples * 4):
+        model.update(
+            StepFeatures(num_prefill_tokens=i % 64,
+                         num_decode_seqs=i % 3,
+                         num_decode_context_tokens=0),
+            step_time(i % 64, i % 3))
+
+    # (10.1 ms - 2 ms) / 0.2 ms fits 40 prefill tokens.
+    _, seq_group = create_dummy_prompt("1", prompt_length=60)
+    scheduler.add_seq_group(seq_group)
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert out.scheduled_seq_groups[0].token_chunk_size == 40
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert out.scheduled_seq_groups[0].token_chunk_size == 20
+    append_new_token(seq_group, 1)
+
+    # One running decode takes 1 ms of the target.
+    _, seq_group = create_dummy_prompt("2", prompt_length=60)
+    scheduler.add_seq_group(seq_group)
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert [s.token_chunk_size for s in out.scheduled_seq_groups] == [35, 1]
+    assert out.step_features == StepFeatures(num_prefill_tokens=35,
+                                             num_decode_seqs=1,
+                                             num_decode_context_tokens=61)
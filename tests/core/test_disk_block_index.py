@@ -0,0 +1,43 @@
+import pytest
+
+from vllm.core.disk_block_index import DiskBlockIndex
+
+
+def test_disk_block_index_evicts_lru(tmp_path):
+    index = DiskBlockIndex(str(tmp_path), num_blocks=2)
+    assert index.allocate(10, 4) == 0
+    assert index.allocate(11, 8) == 1
+    index.end_step()
+    # Reading a block makes it the most recently used one.
+    assert index.pin(10) == 0
+    # The pinned block is not evicted in its step.
+    assert index.allocate(12, 12) == 1
+    assert index.allocate(13, 16) is None
+    index.end_step()
+    assert 11 not in index
+    assert index.allocate(13, 16) == 0
+    assert 10 not in index
+    assert index.get_num_hashed_tokens(13) == 16
+    assert len(index) == 2
+
+
+def test_disk_block_index_persists_written_blocks(tmp_path):
+    index = DiskBlockIndex(str(tmp_path), num_blocks=4)
+    index.allocate(10, 4)
+    index.allocate(11, 8)
+    # The blocks are persisted once the step that writes them ran.
+    index.end_step()
+    assert len(DiskBlockIndex(str(tmp_path), num_blocks=4)) == 0
+    index.end_step()
+    index.allocate(12, 12)
+    restarted = DiskBlockIndex(str(tmp_path), num_blocks=4)
+    assert 10 in restarted and 11 in restarted and 12 not in restarted
+    assert restarted.get_num_hashed_tokens(11) == 8
+    # The new blocks go to the free slots.
+    assert restarted.allocate(12,
+                              12) not in (restarted.pin(10), restarted.pin(11))
+
+    # An index of another size starts empty.
+    assert len(DiskBlockIndex(str(tmp_path), num_blocks=2)) == 0
+    with pytest.raises(ValueError):
+        DiskBlockIndex(str(tmp_path), num_blocks=0)
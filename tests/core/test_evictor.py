@@ -0,0 +1,107 @@
+import pytest
+
+from vllm.block import PhysicalTokenBlock
+from vllm.core import evictor_v2
+from vllm.core.evictor_v1 import (CostAwareEvictor, EvictionPolicy, LFUEvictor,
+                                  LRUEvictor, make_evictor)
+from vllm.utils import Device
+
+BLOCK_SIZE = 4
+
+
+def make_block(block_hash: int,
+               last_accessed: float,
+               num_hashed_blocks: int = 1) -> PhysicalTokenBlock:
+    block = PhysicalTokenBlock(device=Device.GPU,
+                               block_number=block_hash,
+                               block_size=BLOCK_SIZE,
+                               block_hash=block_hash,
+                               num_hashed_tokens=BLOCK_SIZE *
+                               num_hashed_blocks)
+    block.last_accessed = last_accessed
+    return block
+
+
+@pytest.mark.parametrize("policy", list(EvictionPolicy))
+def test_make_evictor(policy: EvictionPolicy):
+    evictor = make_evictor(policy)
+    with pytest.raises(ValueError):
+        evictor.evict()
+    block = make_block(0, 1.0)
+    evictor.add(block)
+    assert 0 in evictor
+    assert evictor.num_blocks == 1
+    assert evictor.evict() is block
+    assert evictor.num_blocks == 0
+
+
+def test_lru_evictor():
+    evictor = LRUEvictor()
+    # Added out of the order of their access times.
+    for block_hash, last_accessed in [(0, 3.0), (1, 1.0), (2, 2.0), (3, 1.0)]:
+        evictor.add(make_block(block_hash, last_accessed))
+    # The deepest of the least recently used blocks goes first.
+    evictor.add(make_block(4, 1.0, num_hashed_blocks=2))
+
+    # A block removed and added again is placed by its new access time.
+    block = evictor.remove(1)
+    block.last_accessed = 4.0
+    evictor.add(block)
+    with pytest.raises(ValueError):
+        evictor.remove(5)
+
+    assert [evictor.evict().block_hash for _ in range(5)] == [4, 3, 2, 0, 1]
+
+
+def test_lru_evictor_compacts_stale_entries():
+    evictor = LRUEvictor()
+    for i in range(1000):
+        evictor.add(make_block(i % 10, float(i)))
+        if i % 10 != 9:
+            evictor.remove(i % 10)
+    assert evictor.num_blocks == 1
+    assert len(evictor._heap) <= 2 * evictor.num_blocks + 64
+    assert evictor.evict().last_accessed == 999.0
+
+
+def test_lfu_evictor():
+    evictor = LFUEvictor()
+    for block_hash in range(3):
+        evictor.add(make_block(block_hash, float(block_hash)))
+    # Block 0 is reused twice, block 1 once.
+    for block_hash in [0, 0, 1]:
+        evictor.add(evictor.remove(block_hash))
+    assert evictor.evict().block_hash == 2
+
+    # Aging: a new block reused as often as block 0 outlives it.
+    evictor.add(make_block(3, 3.0))
+    for _ in range(2):
+        evictor.add(evictor.remove(3))
+    assert [evictor.evict().block_hash for _ in range(3)] == [1, 0, 3]
+
+
+def test_cost_aware_evictor():
+    evictor = CostAwareEvictor()
+    # The deeper a block is in its prefix, the cheaper it is to lose.
+    evictor.add(make_block(0, 1.0, num_hashed_blocks=1))
+    evictor.add(make_block(1, 1.0, num_hashed_blocks=4))
+    # Reuses make a deep block worth keeping.
+    evictor.add(make_block(3, 1.0, num_hashed_blocks=2))
+    for _ in range(3):
+        evictor.add(evictor.remove(3))
+    assert [evictor.evict().block_hash for _ in range(3)] == [1, 0, 3]
+
+
+def test_lru_evictor_v2():
+    evictor = evictor_v2.LRUEvictor()
+    evictor.add(0, 100, BLOCK_SIZE, 3.0)
+    evictor.add(1, 101, BLOCK_SIZE, 1.0)
+    evictor.add(2, 102, 2 * BLOCK_SIZE, 1.0)
+    evictor.add(3, 103, BLOCK_SIZE, 2.0)
+    evictor.update(1, 4.0)
+    evictor.remove(3)
+    assert list(evictor.free_table) == [0, 1, 2]
+    assert [evictor.evict() for _ in range(3)] == [(2, 102), (0, 100),
+                                                   (1, 101)]
+    with pytest.raises(ValueError):
+        evictor.evict()
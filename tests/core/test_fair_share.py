@@ -0,0 +1,82 @@
+import pytest
+
+from vllm.config import SchedulerConfig
+from vllm.core.fair_share import TenantManager, TenantQuota
+
+
+def test_tenant_limits_by_weight():
+    manager = TenantManager({
+        "a": TenantQuota(weight=3.0),
+        "b": TenantQuota(max_num_seqs=1),
+    })
+    manager.add_request("a")
+    manager.add_request("b")
+    manager.add_request("b")
+    limits = manager.get_limits(100, 8, now=0.0)
+    assert limits.token_budgets == {"a": 75, "b": 25}
+    assert limits.max_num_seqs == {"a": 6, "b": 1}
+    assert limits.hard_token_budgets == {}
+    assert limits.hard_max_num_seqs == {"b": 1}
+
+    # Tenants without unfinished requests get no share.
+    manager.remove_request("a")
+    limits = manager.get_limits(100, 8, now=0.0)
+    assert limits.token_budgets == {"b": 100}
+    lifted = limits.lift_shares()
+    assert lifted.shares_lifted and not limits.shares_lifted
+    assert lifted.token_budgets == {}
+    assert lifted.max_num_seqs == {"b": 1}
+
+
+def test_token_bucket():
+    manager = TenantManager({"*": TenantQuota(token_rate=10.0)})
+    manager.add_request("a")
+    assert manager.get_limits(100, 8, now=0.0).token_budgets == {"*": 100}
+    # The tokens of a step are taken even if they overdraw the bucket.
+    manager.commit_usage({"*": 30})
+    limits = manager.get_limits(100, 8, now=1.0)
+    assert limits.token_budgets == {"*": 0}
+    assert limits.hard_token_budgets == {"*": 0}
+    # Until the debt is paid back.
+    assert manager.get_limits(100, 8, now=3.5).token_budgets == {"*": 100}
+
+    stats = manager.get_stats()
+    # Tenants without a quota of their own are aggregated.
+    assert stats["num_requests"] == {"*": 1}
+    assert stats["num_scheduled_tokens"] == {"*": 30}
+    assert manager.get_stats()["num_scheduled_tokens"] == {}
+
+
+def test_unknown_tenants_share_one_quota():
+    """A client making up tenant ids gets the share and the token bucket of
+    one tenant, however many ids it uses."""
+    manager = TenantManager({
+        "a": TenantQuota(),
+        "*": TenantQuota(token_rate=10.0),
+    })
+    manager.add_request("a")
+    for i in range(1000):
+        manager.add_request(f"tenant-{i}")
+    limits = manager.get_limits(100, 8, now=0.0)
+    assert limits.token_budgets == {"a": 50, "*": 50}
+    assert limits.get_group("tenant-7") == "*"
+    manager.commit_usage({"*": 30})
+    assert manager.get_limits(100, 8, now=1.0).token_budgets == {
+        "a": 50,
+        "*": 0
+    }
+    assert len(manager._buckets) == 1
+
+    for i in range(1000):
+        manager.remove_request(f"tenant-{i}")
+    stats = manager.get_stats()
+    assert stats["num_requests"] == {"a": 1, "*": 0}
+
+
+def test_tenant_quota_validation():
+    with pytest.raises(ValueError):
+        TenantQuota(weight=0.0)
+    with pytest.raises(ValueError):
+        TenantQuota(burst_tokens=8)
+    with pytest.raises(ValueError):
+        SchedulerConfig(64, 4, 64, tenant_quotas={"a": {"rate": 1.0}})
@@ -0,0 +1,119 @@
+import pytest
+
+from vllm.config import CacheConfig, SchedulerConfig
+from vllm.core.block_manager_v1 import BlockSpaceManagerV1
+from vllm.core.migration_controller import (AdaptiveMigrationController,
+                                            MigrationControllerPolicy,
+                                            MigrationDecision,
+                                            StaticMigrationController,
+                                            make_migration_controller)
+from vllm.core.scheduler import Scheduler
+from vllm.sequence import Logprob, SequenceStatus
+
+from .utils import create_dummy_prompt
+
+# (free blocks, total blocks, waiting tokens) seen by the scheduler, and the
+# decision expected for every step.
+TRACE = [
+    ((100, 100, 0), MigrationDecision(12288, 8192, 0.0)),
+    ((20, 100, 0), MigrationDecision(12288, 8192, 0.4)),
+    ((20, 100, 160), MigrationDecision(8256, 5504, 0.65)),
+    ((0, 100, 1600), MigrationDecision(3552, 2368, 0.825)),
+    ((0, 100, 0), MigrationDecision(2048, 1024, 0.9125)),
+    ((100, 100, 0), MigrationDecision(12288, 8192, 0.45625)),
+]
+
+
+def test_static_controller():
+    controller = make_migration_controller(MigrationControllerPolicy.STATIC,
+                                           16, 1024, 6144, 4096)
+    assert isinstance(controller, StaticMigrationController)
+    for inputs, _ in TRACE:
+        assert controller.step(*inputs) == MigrationDecision(6144, 4096, 0.0)
+
+
+def test_adaptive_controller_trace():
+    controller = make_migration_controller(MigrationControllerPolicy.ADAPTIVE,
+                                           16, 1024, 6144, 4096)
+    assert isinstance(controller, AdaptiveMigrationController)
+    for inputs, expected in TRACE:
+        decision = controller.step(*inputs)
+        assert decision.threshold == expected.threshold
+        assert decision.start == expected.start
+        assert decision.pressure == pytest.approx(expected.pressure)
+        assert controller.last_decision is decision
+
+
+@pytest.mark.parametrize("num_free_blocks", [0, 10, 50, 90, 100])
+def test_adaptive_controller_keeps_superblock_past_start(num_free_blocks):
+    controller = AdaptiveMigrationController(16,
+                                             1024,
+                                             1024,
+                                             1024,
+                                             smoothing=1.0)
+    decision = controller.step(num_free_blocks, 100, 0)
+    assert decision.start % 16 == 0
+    assert decision.threshold % 16 == 0
+    assert decision.threshold >= decision.start + 1024
+
+
+def test_lower_thresholds_migrate_earlier():
+    block_manager = BlockSpaceManagerV1(block_size=4,
+                                        num_gpu_blocks=32,
+                                        num_cpu_blocks=8,
+                                        num_remote_blocks=8,
+                                        watermark=0,
+                                        remote_allocator_number=2,
+                                        block_migrate_size=8,
+                                        block_migrate_threshold=16,
+                                        block_migrate_start=8)
+    prompt, seq_group = create_dummy_prompt("0", 13, 4)
+    block_manager.allocate(seq_group)
+    prompt.status = SequenceStatus.RUNNING
+
+    block_manager.add_kvcache_migrate_block(prompt)
+    assert not block_manager.migrate_list
+
+    block_manager.set_kvcache_migrate_thresholds(8, 0)
+    block_manager.add_kvcache_migrate_block(prompt)
+    assert [sb.start for sb in block_manager.migrate_list] == [0]
+
+
+def test_scheduler_adapts_thresholds_to_pressure():
+    block_size = 4
+    scheduler_config = SchedulerConfig(128, 4, 128)
+    cache_config = CacheConfig(block_size,
+                               1.0,
+                               1,
+                               "auto",
+                               block_migrate_size=8,
+                               block_migrate_threshold=16,
+                               block_migrate_start=8,
+                               block_migrate_controller="adaptive")
+    cache_config.num_cpu_blocks = 8
+    cache_config.num_gpu_blocks = 32
+    cache_config.num_remote_gpu_blocks = 8
+    scheduler = Scheduler(scheduler_config, cache_config, None, 2)
+
+    scheduler.schedule()
+    idle = scheduler.migration_controller.last_decision
+    assert (scheduler.block_manager.block_migrate_threshold,
+            scheduler.block_manager.block_migrate_start) == (idle.threshold,
+                                                             idle.start)
+
+    for i in range(3):
+        _, seq_group = create_dummy_prompt(str(i), 32, block_size)
+        scheduler.add_seq_group(seq_group)
+    # Prefill the prompts, then decode one token with the blocks in use.
+    metas, out = scheduler.schedule()
+    for scheduled, meta in zip(out.scheduled_seq_groups, metas):
+        scheduled.seq_group.update_num_computed_tokens(meta.token_chunk_size)
+        for seq in scheduled.seq_group.get_seqs():
+            seq.append_token_id(1, {1: Logprob(1.0)})
+    scheduler.schedule()
+    loaded = scheduler.migration_controller.last_decision
+    assert loaded.pressure > idle.pressure
+    assert loaded.threshold < idle.threshold
+    assert (scheduler.block_manager.block_migrate_threshold,
+            scheduler.block_manager.block_migrate_start) == (loaded.threshold,
+                                                             loaded.start)
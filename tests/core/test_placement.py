@@ -0,0 +1,66 @@
+import pytest
+
+from vllm.core.block_manager_v1 import RemoteAllocator
+from vllm.core.placement import SelectionPolicy
+
+
+def _used_blocks(allocator: RemoteAllocator):
+    return [
+        allocator.num_gpu_blocks - allocator.get_num_free_blocks(rank)
+        for rank in range(1, allocator.remote_allocator + 1)
+    ]
+
+
+def test_only_append_fills_one_rank_first():
+    allocator = RemoteAllocator(16, 8, 3, SelectionPolicy.ONLYAPPEND)
+    ranks = [allocator.allocate(4)[0].remote_rank for _ in range(5)]
+    assert ranks == [1, 1, 2, 2, 3]
+
+
+def test_mean_append_round_robin():
+    allocator = RemoteAllocator(16, 8, 3, SelectionPolicy.MEANAPPEND)
+    ranks = [allocator.allocate(4)[0].remote_rank for _ in range(6)]
+    assert ranks == [2, 3, 1, 2, 3, 1]
+
+
+def test_least_loaded():
+    allocator = RemoteAllocator(16, 8, 3, SelectionPolicy.LEASTLOADED)
+    allocator.allocate(4)
+    allocator.allocate(2)
+    # Rank 3 is the only empty rank left.
+    assert allocator.allocate(2)[0].remote_rank == 3
+    assert _used_blocks(allocator) == [4, 2, 2]
+
+
+def test_affinity_keeps_sequence_on_one_rank():
+    allocator = RemoteAllocator(16, 8, 2, SelectionPolicy.AFFINITY)
+    seq_a = [allocator.allocate(2, seq_id=0)[0].remote_rank for _ in range(3)]
+    seq_b = [allocator.allocate(2, seq_id=1)[0].remote_rank for _ in range(2)]
+    assert seq_a == [1, 1, 1]
+    assert seq_b == [2, 2]
+
+    # The home rank of seq 0 is full, so it spills to rank 2.
+    assert allocator.allocate(2, seq_id=0)[0].remote_rank == 1
+    assert allocator.allocate(2, seq_id=0)[0].remote_rank == 2
+
+    allocator.free_seq(0)
+    assert 0 not in allocator.placement.home_ranks
+
+
+def test_spill_packs_lowest_rank():
+    allocator = RemoteAllocator(16, 10, 2, SelectionPolicy.SPILL)
+    ranks = [allocator.allocate(3)[0].remote_rank for _ in range(4)]
+    # Rank 1 keeps one block (10%) of headroom, then spills to rank 2.
+    assert ranks == [1, 1, 1, 2]
+
+
+@pytest.mark.parametrize("policy", list(SelectionPolicy))
+def test_no_rank_has_room(policy: SelectionPolicy):
+    allocator = RemoteAllocator(16, 4, 2, policy)
+    allocator.allocate(3)
+    allocator.allocate(3)
+    assert not allocator.can_allocate(2)
+    with pytest.raises(ValueError):
+        allocator.allocate(2)
+    # A failed selection must not leak blocks.
+    assert allocator.get_total_free_blocks() == 2
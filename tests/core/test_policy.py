@@ -0,0 +1,52 @@
+import random
+from collections import deque
+
+from vllm.core.policy import PolicyFactory, PolicyQueue
+
+from .utils import create_dummy_prompt
+
+
+def test_policy_queue_order():
+    policy = PolicyFactory.get_policy(policy_name="deadline")
+    seq_groups = []
+    for i in range(8):
+        _, seq_group = create_dummy_prompt(str(i), prompt_length=4)
+        # Every other request has no deadline.
+        seq_group.sampling_params.deadline = (None if i % 2 else 8.0 - i)
+        seq_groups.append(seq_group)
+    expected = sorted(seq_groups, key=lambda s: s.deadline)
+
+    shuffled = seq_groups.copy()
+    random.Random(0).shuffle(shuffled)
+    queue = PolicyQueue(policy, shuffled[:4])
+    queue.extend(shuffled[4:])
+    assert len(queue) == 8
+    assert queue[0] is expected[0]
+    # Sorting a queue of the same policy only copies it.
+    copied = policy.sort_by_priority(0.0, queue)
+    assert copied is not queue
+    assert [copied.popleft() for _ in range(8)] == expected
+    assert len(queue) == 8
+    assert list(policy.sort_by_priority(0.0, deque(shuffled))) == expected
+
+    # pop takes the lowest priority, the latest of the ties.
+    assert queue.pop() is expected[-1]
+    queue.remove(expected[1])
+    assert [queue.popleft()
+            for _ in range(6)] == ([expected[0]] + expected[2:-1])
+
+
+def test_policy_queue_appendleft():
+    policy = PolicyFactory.get_policy(policy_name="priority")
+    _, first = create_dummy_prompt("0", prompt_length=4)
+    _, second = create_dummy_prompt("1", prompt_length=4)
+    # The same arrival time, so only the end they are added to tells them
+    # apart.
+    second.metrics.arrival_time = first.metrics.arrival_time
+    _, urgent = create_dummy_prompt("2", prompt_length=4)
+    urgent.sampling_params.priority = -1
+    queue = PolicyQueue(policy)
+    queue.append(first)
+    queue.appendleft(second)
+    queue.append(urgent)
+    assert [queue.popleft() for _ in range(3)] == [urgent, second, first]
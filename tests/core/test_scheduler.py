@@ -6,11 +6,13 @@ from unittest.mock import MagicMock
 import pytest  # noqa
 
 from vllm.config import CacheConfig, LoRAConfig, SchedulerConfig
+from vllm.core.fair_share import TenantLimits
 from vllm.core.interfaces import AllocStatus
-from vllm.core.policy import PolicyFactory
-from vllm.core.scheduler import Scheduler, SchedulingBudget
+from vllm.core.policy import PolicyFactory, PolicyQueue
+from vllm.core.scheduler import PreemptionMode, Scheduler, SchedulingBudget
 from vllm.lora.request import LoRARequest
-from vllm.sequence import Logprob, SequenceGroup, SequenceStatus
+from vllm.sampling_params import SamplingParams
+from vllm.sequence import Logprob, Sequence, SequenceGroup, SequenceStatus
 
 from .utils import create_dummy_prompt
 
@@ -114,6 +116,41 @@ def test_scheduler_schedule_simple():
     append_new_token(out, 1)
 
 
+def test_scheduler_reuses_seq_group_metadata():
+    block_size = 4
+    scheduler_config = SchedulerConfig(64, 2, 16)
+    cache_config = CacheConfig(block_size, 1.0, 1, "auto")
+    cache_config.num_cpu_blocks = 8
+    cache_config.num_gpu_blocks = 8
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+    seq, seq_group = create_dummy_prompt("0", prompt_length=block_size)
+    scheduler.add_seq_group(seq_group)
+
+    metas, out = schedule_and_update_computed_tokens(scheduler)
+    prefill_meta = metas[0]
+    assert prefill_meta.is_prompt
+    assert prefill_meta.token_chunk_size == block_size
+    append_new_token(out, 1)
+
+    # The decode updates the metadata of the prefill in place.
+    metas, out = schedule_and_update_computed_tokens(scheduler)
+    assert metas[0] is prefill_meta
+    assert not prefill_meta.is_prompt
+    assert prefill_meta.token_chunk_size == 1
+    assert prefill_meta.seq_data[seq.seq_id] is seq.data
+    assert prefill_meta.block_tables[seq.seq_id] == [
+        block.block_number
+        for block in scheduler.block_manager.block_tables[seq.seq_id]
+    ]
+    assert len(prefill_meta.block_tables[seq.seq_id]) == 2
+
+    # The metadata is dropped with the finished request.
+    seq.status = SequenceStatus.FINISHED_STOPPED
+    scheduler.free_seq(seq)
+    scheduler.free_finished_seq_groups()
+    assert not scheduler._seq_group_metadata_cache
+
+
 def test_scheduler_prefill_prioritized():
     """Verify running batched tokens are not applied to prefill requests."""
     block_size = 4
@@ -622,6 +659,48 @@ def test_decode_swap_beam_search():
     assert output.blocks_to_copy == []
 
 
+@pytest.mark.parametrize("num_remote_gpu_blocks, expected_mode",
+                         [(8, PreemptionMode.SWAP_LOCAL),
+                          (2, PreemptionMode.SWAP)])
+def test_decode_preempt_remote_blocks(num_remote_gpu_blocks, expected_mode):
+    """
+    Test a sequence with superblocks on the SP ranks is swapped rather than
+    recomputed, and its remote blocks are swapped out only when the SP ranks
+    run out of blocks.
+    """
+    block_size = 4
+    scheduler_config = SchedulerConfig(128, 4, 128)
+    cache_config = CacheConfig(block_size,
+                               1.0,
+                               1,
+                               "auto",
+                               block_migrate_size=8,
+                               block_migrate_threshold=16,
+                               block_migrate_start=8,
+                               block_migrate_budget=2)
+    cache_config.num_cpu_blocks = 8
+    cache_config.num_gpu_blocks = 32
+    cache_config.num_remote_gpu_blocks = num_remote_gpu_blocks
+    cache_config.num_remote_cpu_blocks = 4
+    scheduler = Scheduler(scheduler_config, cache_config, None, 2)
+
+    _, seq_group = create_dummy_prompt("0", 28, block_size)
+    scheduler._allocate_and_set_running(seq_group)
+    scheduler.add_kvcache_migrate_group(seq_group)
+    scheduler.block_manager.get_kvcache_migrate_block([])
+    scheduler.block_manager.commit_kvcache_migrate_blocks()
+
+    blocks_to_swap_out: List[Tuple[int, int]] = []
+    remote_blocks_to_swap_out: List[Tuple[int, int, int]] = []
+    mode = scheduler._preempt(seq_group, blocks_to_swap_out,
+                              remote_blocks_to_swap_out)
+    assert mode == expected_mode
+    assert len(blocks_to_swap_out) == 3
+    assert len(remote_blocks_to_swap_out) == (4 if expected_mode
+                                              == PreemptionMode.SWAP else 0)
+    assert seq_group.get_seqs()[0].status == SequenceStatus.SWAPPED
+
+
 def test_schedule_decode_blocks_to_copy_update():
     """
     Verify blocks_to_copy is updated.
@@ -857,6 +936,46 @@ def test_schedule_swapped_blocks_to_copy():
     assert output.blocks_to_copy == [(2, 3)]
 
 
+def test_schedule_prefix_cache_swaps_both_ways():
+    """
+    Test the swaps of the CPU tier of prefix caching go both ways in a step
+    that promotes a cached prefix and demotes the blocks it evicts.
+    """
+    block_size = 4
+    scheduler_config = SchedulerConfig(64, 4, 64)
+    cache_config = CacheConfig(block_size,
+                               1.0,
+                               1,
+                               "auto",
+                               enable_prefix_caching=True,
+                               enable_cpu_prefix_cache=True)
+    cache_config.num_cpu_blocks = 8
+    cache_config.num_gpu_blocks = 4
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+
+    def run_prompt(request_id: str, prompt_tokens: List[int]):
+        prompt = Sequence(int(request_id),
+                          inputs={"prompt_token_ids": prompt_tokens},
+                          block_size=block_size)
+        scheduler.add_seq_group(
+            SequenceGroup(request_id=request_id,
+                          seqs=[prompt],
+                          arrival_time=time.time(),
+                          sampling_params=SamplingParams()))
+        _, out = schedule_and_update_computed_tokens(scheduler)
+        scheduler.abort_seq_group(request_id)
+        return out
+
+    out = run_prompt("0", list(range(13)))
+    assert out.blocks_to_swap_in == [] and out.blocks_to_swap_out == []
+    # The blocks of the first prompt are demoted as the second reuses them.
+    out = run_prompt("1", list(range(100, 113)))
+    assert out.blocks_to_swap_in == [] and out.blocks_to_swap_out != []
+    # The first prompt is promoted back over the blocks of the second.
+    out = run_prompt("2", list(range(13)))
+    assert out.blocks_to_swap_in != [] and out.blocks_to_swap_out != []
+
+
 def test_scheduling_budget():
     TOKEN_BUDGET = 4
     MAX_SEQS = 4
@@ -899,3 +1018,173 @@ def test_scheduling_budget():
     assert budget.num_curr_seqs == 0
     budget.subtract_num_seqs(seq_group.request_id, 2)
     assert budget.num_curr_seqs == 0
+
+
+@pytest.mark.parametrize("policy", ["priority", "deadline", "sjf"])
+def test_scheduler_policy_order(policy: str):
+    """Waiting requests are scheduled in the order of the policy instead of
+    their arrival."""
+    block_size = 4
+    scheduler_config = SchedulerConfig(64, 1, 16, policy=policy)
+    cache_config = CacheConfig(block_size, 1.0, 1, "auto")
+    cache_config.num_cpu_blocks = 8
+    cache_config.num_gpu_blocks = 8
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+
+    # Every later request has a higher priority, an earlier deadline and
+    # fewer tokens to generate.
+    seq_groups: List[SequenceGroup] = []
+    for i in range(3):
+        _, seq_group = create_dummy_prompt(str(i), prompt_length=block_size)
+        seq_group.sampling_params.priority = 2 - i
+        seq_group.sampling_params.deadline = 10.0 - i
+        seq_group.sampling_params.max_tokens = 16 - i
+        scheduler.add_seq_group(seq_group)
+        seq_groups.append(seq_group)
+
+    for seq_group in reversed(seq_groups):
+        _, out = schedule_and_update_computed_tokens(scheduler)
+        assert get_sequence_groups(out) == [seq_group]
+        for seq in seq_group.get_seqs():
+            seq.status = SequenceStatus.FINISHED_STOPPED
+            scheduler.free_seq(seq)
+        scheduler.free_finished_seq_groups()
+    assert not scheduler.has_unfinished_seqs()
+
+
+def test_decode_preempt_lowest_priority():
+    """The lowest-priority running request is preempted first, whatever its
+    arrival."""
+    scheduler = initialize_scheduler()
+    policy = PolicyFactory.get_policy(policy_name="priority")
+    running = PolicyQueue(policy)
+    for i, priority in enumerate([0, 2, 1]):
+        _, seq_group = create_dummy_prompt(str(i), prompt_length=60)
+        seq_group.sampling_params.priority = priority
+        scheduler._allocate_and_set_running(seq_group)
+        append_new_token_seq_group(60, seq_group, 1)
+        running.append(seq_group)
+    scheduler.block_manager.can_append_slots = MagicMock()
+
+    def cannot_append_third_group(seq_group, num_lookahead_slots):
+        return seq_group.request_id != "2"
+
+    scheduler.block_manager.can_append_slots.side_effect = (
+        cannot_append_third_group)
+
+    remaining_running, output = scheduler._schedule_running(
+        running, create_token_budget(), None, policy)
+    assert len(remaining_running) == 0
+    assert [s.seq_group.request_id for s in output.decode_seq_groups] == ["0"]
+    # Request 1 has the lowest priority, then 2 preempts itself.
+    assert [s.request_id for s in output.preempted] == ["1", "2"]
+    # The input queue is not modified.
+    assert len(running) == 3
+
+
+def initialize_fair_share_scheduler(tenant_quotas, max_num_seqs=16):
+    block_size = 4
+    scheduler_config = SchedulerConfig(64,
+                                       max_num_seqs,
+                                       64,
+                                       tenant_quotas=tenant_quotas)
+    cache_config = CacheConfig(block_size, 1.0, 1, "auto")
+    cache_config.num_cpu_blocks = 64
+    cache_config.num_gpu_blocks = 64
+    return Scheduler(scheduler_config, cache_config, None)
+
+
+def add_tenant_prompts(scheduler, tenant_ids: List[str]) -> None:
+    for i, tenant_id in enumerate(tenant_ids):
+        _, seq_group = create_dummy_prompt(str(i), prompt_length=16)
+        seq_group.sampling_params.tenant_id = tenant_id
+        scheduler.add_seq_group(seq_group)
+
+
+def test_scheduler_fair_share():
+    """The tenants split the token budget by their weights, even if the
+    requests of one tenant arrived first."""
+    scheduler = initialize_fair_share_scheduler({"a": {}, "b": {}})
+    add_tenant_prompts(scheduler, ["a", "a", "a", "a", "b", "b"])
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert [s.request_id
+            for s in get_sequence_groups(out)] == ["0", "1", "4", "5"]
+    assert [s.request_id for s in scheduler.waiting] == ["2", "3"]
+    stats = scheduler.tenant_manager.get_stats()
+    assert stats["num_requests"] == {"a": 4, "b": 2, "*": 0}
+    assert stats["num_scheduled_tokens"] == {"a": 32, "b": 32}
+    assert stats["num_deferred"] == {"a": 2}
+
+
+def test_scheduler_fair_share_unknown_tenants():
+    """The tenants without a quota share one, whatever ids they use."""
+    scheduler = initialize_fair_share_scheduler({"a": {}})
+    add_tenant_prompts(scheduler, ["x0", "x1", "x2", "x3", "a", "a"])
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert [s.request_id
+            for s in get_sequence_groups(out)] == ["0", "1", "4", "5"]
+    stats = scheduler.tenant_manager.get_stats()
+    assert stats["num_scheduled_tokens"] == {"a": 32, "*": 32}
+
+
+def test_scheduler_fair_share_work_conserving():
+    """The budget left after every tenant got its share goes to the requests
+    held back by their share, within the quota of their tenant."""
+    scheduler = initialize_fair_share_scheduler({"a": {}, "b": {}})
+    add_tenant_prompts(scheduler, ["a", "a", "a", "a", "b"])
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert [s.request_id
+            for s in get_sequence_groups(out)] == ["0", "1", "4", "2"]
+
+    scheduler = initialize_fair_share_scheduler({
+        "a": {
+            "max_num_seqs": 1
+        },
+        "b": {}
+    })
+    add_tenant_prompts(scheduler, ["a", "a", "b"])
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert [s.request_id for s in get_sequence_groups(out)] == ["0", "2"]
+
+
+def test_decode_preempt_over_quota_tenant():
+    """The requests of the tenants over their share are preempted first."""
+    scheduler = initialize_scheduler()
+    policy = PolicyFactory.get_policy(policy_name="fcfs")
+    running: Deque[SequenceGroup] = deque()
+    budget = SchedulingBudget(token_budget=10000,
+                              max_num_seqs=2,
+                              tenant_limits=TenantLimits(
+                                  token_budgets={},
+                                  max_num_seqs={
+                                      "a": 1,
+                                      "b": 1
+                                  },
+                                  hard_token_budgets={},
+                                  hard_max_num_seqs={},
+                                  quota_tenant_ids={"a", "b"}))
+    for i, tenant_id in enumerate(["a", "a", "a", "b"]):
+        _, seq_group = create_dummy_prompt(str(i), prompt_length=8)
+        seq_group.sampling_params.tenant_id = tenant_id
+        scheduler._allocate_and_set_running(seq_group)
+        append_new_token_seq_group(8, seq_group, 1)
+        running.append(seq_group)
+        budget.add_num_seqs(seq_group.request_id, 1, tenant_id)
+    assert budget.is_over_tenant_quota("a")
+    assert not budget.is_over_tenant_quota("b")
+    scheduler.block_manager.can_append_slots = MagicMock()
+    num_calls = 0
+
+    def cannot_append_first_call(seq_group, num_lookahead_slots):
+        nonlocal num_calls
+        num_calls += 1
+        return num_calls > 1
+
+    scheduler.block_manager.can_append_slots.side_effect = (
+        cannot_append_first_call)
+
+    _, output = scheduler._schedule_running(running, budget, None, policy)
+    # The newest request of tenant a is preempted instead of the newest one.
+    assert [s.request_id for s in output.preempted] == ["2"]
+    assert [s.seq_group.request_id
+            for s in output.decode_seq_groups] == ["0", "1", "3"]
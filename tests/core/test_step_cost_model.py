@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from vllm.core.step_cost_model import StepCostModel, StepFeatures
+
+# Seconds per unit of every term of the model.
+COEFFICIENTS = {
+    "base": 0.008,
+    "prefill_token": 4e-5,
+    "decode_seq": 1e-4,
+    "decode_context_token": 2e-7,
+}
+
+
+def step_time(features: StepFeatures) -> float:
+    return (COEFFICIENTS["base"] +
+            COEFFICIENTS["prefill_token"] * features.num_prefill_tokens +
+            COEFFICIENTS["decode_seq"] * features.num_decode_seqs +
+            COEFFICIENTS["decode_context_token"] *
+            features.num_decode_context_tokens)
+
+
+def random_features(rng: random.Random) -> StepFeatures:
+    num_decode_seqs = rng.randint(1, 256)
+    return StepFeatures(
+        num_prefill_tokens=rng.choice([0, rng.randint(1, 2048)]),
+        num_decode_seqs=num_decode_seqs,
+        num_decode_context_tokens=num_decode_seqs * rng.randint(16, 4096))
+
+
+def test_step_cost_model_fit():
+    rng = random.Random(0)
+    model = StepCostModel(min_samples=16)
+    assert not model.ready
+    assert model.get_max_prefill_tokens(1, 16, 0.05) is None
+
+    for _ in range(200):
+        features = random_features(rng)
+        model.update(features, step_time(features) * rng.gauss(1.0, 0.01))
+    assert model.ready
+    for term, coefficient in model.coefficients.items():
+        assert coefficient == pytest.approx(COEFFICIENTS[term], rel=0.1), term
+
+    coefficients, errors = model.get_stats()
+    assert coefficients == model.coefficients
+    assert len(errors) == 200 - 16
+    assert sum(errors[-50:]) / 50 < 0.05
+    assert model.get_stats()[1] == []
+
+    # The prefill tokens that fit into the target with 64 decodes of 1024
+    # tokens each: (0.05 - 0.008 - 0.0064 - 0.0131) / 4e-5.
+    assert model.get_max_prefill_tokens(64, 64 * 1024,
+                                        0.05) == pytest.approx(562, rel=0.1)
+    # Decodes alone over the target leave no room for prefills.
+    assert model.get_max_prefill_tokens(256, 256 * 4096, 0.05) == 0
+
+
+def test_step_cost_model_adapts():
+    rng = random.Random(0)
+    model = StepCostModel(forgetting_factor=0.95)
+    for _ in range(100):
+        features = random_features(rng)
+        model.update(features, step_time(features))
+    # The hardware gets twice as slow.
+    for _ in range(200):
+        features = random_features(rng)
+        model.update(features, 2 * step_time(features))
+    assert model.coefficients["prefill_token"] == pytest.approx(
+        2 * COEFFICIENTS["prefill_token"], rel=0.05)
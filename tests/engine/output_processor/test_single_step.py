@@ -0,0 +1,123 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from vllm.core.scheduler import Scheduler
+from vllm.engine.output_processor.single_step import SingleStepOutputProcessor
+from vllm.engine.output_processor.stop_checker import StopChecker
+from vllm.sampling_params import SamplingParams
+from vllm.sequence import (CompletionSequenceGroupOutput, Logprob,
+                           SequenceOutput, SequenceStatus)
+from vllm.transformers_utils.detokenizer import Detokenizer
+from vllm.utils import Counter
+
+from ...core.utils import create_seq_group
+
+
+def create_output_processor(scheduler: Scheduler) -> SingleStepOutputProcessor:
+    # Every token decodes to its id followed by a space.
+    def decode_sequence_inplace(seq, sampling_params):
+        text = f"{seq.get_last_token_id()} "
+        seq.output_text += text
+        return len(text)
+
+    detokenizer = MagicMock(spec=Detokenizer)
+    detokenizer.decode_sequence_inplace.side_effect = decode_sequence_inplace
+    return SingleStepOutputProcessor(
+        scheduler_config=MagicMock(),
+        detokenizer=detokenizer,
+        scheduler=scheduler,
+        seq_counter=Counter(start=1),
+        stop_checker=StopChecker(max_model_len=4096,
+                                 get_tokenizer_for_seq=lambda _: None),
+    )
+
+
+def create_output(seq_id: int, token_id: int):
+    return [
+        CompletionSequenceGroupOutput(
+            samples=[
+                SequenceOutput(parent_seq_id=seq_id,
+                               output_token=token_id,
+                               logprobs={token_id: Logprob(0.0)})
+            ],
+            prompt_logprobs=None,
+        )
+    ]
+
+
+@pytest.mark.skip_global_cleanup
+def test_deferred_stop_string():
+    scheduler = MagicMock(spec=Scheduler)
+    output_processor = create_output_processor(scheduler)
+    seq_group = create_seq_group(seq_prompt_len=8,
+                                 seq_output_lens=[0],
+                                 sampling_params=SamplingParams(max_tokens=16,
+                                                                stop=["7 "]))
+    seq = seq_group.get_seqs()[0]
+    seq.status = SequenceStatus.RUNNING
+
+    seqs = output_processor.append_outputs(seq_group, create_output(0, 7))
+    assert seqs == [seq]
+    assert seq.get_output_token_ids() == [7]
+    # The stop string is only found once the token is decoded.
+    assert seq.status == SequenceStatus.RUNNING
+    assert seq.output_text == ""
+
+    output_processor.finish_outputs(seq_group, seqs)
+    assert seq.status == SequenceStatus.FINISHED_STOPPED
+    assert seq.stop_reason == "7 "
+    scheduler.free_seq.assert_called_once_with(seq)
+
+    # The token of the step the sequence was scheduled for meanwhile is
+    # dropped.
+    seqs = output_processor.append_outputs(seq_group, create_output(0, 8))
+    assert seqs == []
+    assert seq.get_output_token_ids() == [7]
+
+
+@pytest.mark.skip_global_cleanup
+def test_append_stops_on_max_tokens():
+    scheduler = MagicMock(spec=Scheduler)
+    output_processor = create_output_processor(scheduler)
+    seq_group = create_seq_group(seq_prompt_len=8,
+                                 seq_output_lens=[3],
+                                 sampling_params=SamplingParams(max_tokens=4,
+                                                                stop=["9 "]))
+    seq = seq_group.get_seqs()[0]
+    seq.status = SequenceStatus.RUNNING
+
+    seqs = output_processor.append_outputs(seq_group, create_output(0, 9))
+    # Stopped before the next step is scheduled.
+    assert seq.status == SequenceStatus.FINISHED_LENGTH_CAPPED
+    scheduler.free_seq.assert_called_once_with(seq)
+
+    # A stop string at the last token stops the sequence like without
+    # pipelining, the sequence is not freed again.
+    output_processor.finish_outputs(seq_group, seqs)
+    assert seq.status == SequenceStatus.FINISHED_STOPPED
+    assert seq.output_text == ""
+    scheduler.free_seq.assert_called_once_with(seq)
+
+
+@pytest.mark.skip_global_cleanup
+def test_append_falls_back_for_forks():
+    scheduler = MagicMock(spec=Scheduler)
+    output_processor = create_output_processor(scheduler)
+    seq_group = create_seq_group(seq_prompt_len=8,
+                                 seq_output_lens=[0],
+                                 sampling_params=SamplingParams(n=2,
+                                                                max_tokens=4))
+    seq = seq_group.get_seqs()[0]
+    seq.status = SequenceStatus.RUNNING
+
+    outputs = create_output(0, 1)
+    outputs[0].samples.append(
+        SequenceOutput(parent_seq_id=0,
+                       output_token=2,
+                       logprobs={2: Logprob(0.0)}))
+    assert output_processor.append_outputs(seq_group, outputs) is None
+    # Processed in full: forked and decoded.
+    assert seq_group.num_seqs() == 2
+    assert scheduler.fork_seq.call_count == 1
+    assert {seq.output_text for seq in seq_group.get_seqs()} == {"1 ", "2 "}
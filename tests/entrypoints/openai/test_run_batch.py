@@ -1,8 +1,19 @@
+import asyncio
+import json
 import subprocess
 import sys
 import tempfile
+from typing import List
 
-from vllm.entrypoints.openai.protocol import BatchRequestOutput
+import pytest
+from pydantic import ValidationError
+
+from vllm.entrypoints.openai.protocol import (BatchRequestInput,
+                                              BatchRequestOutput,
+                                              CompletionRequest,
+                                              CompletionResponse,
+                                              EmbeddingRequest, UsageInfo)
+from vllm.entrypoints.openai.run_batch import BatchOutputWriter, run_batch
 
 # ruff: noqa: E501
 INPUT_BATCH = """{"custom_id": "request-1", "method": "POST", "url": "/v1/chat/completions", "body": {"model": "NousResearch/Meta-Llama-3-8B-Instruct", "messages": [{"role": "system", "content": "You are a helpful assistant."},{"role": "user", "content": "Hello world!"}],"max_tokens": 1000}}
@@ -51,3 +62,146 @@ def test_e2e_invalid_input():
         proc.communicate()
         proc.wait()
         assert proc.returncode != 0, f"{proc=}"
+
+
+def make_request_line(custom_id: str, url: str = "/v1/completions") -> str:
+    body = ({
+        "model": "test",
+        "input": custom_id
+    } if url == "/v1/embeddings" else {
+        "model": "test",
+        "prompt": custom_id
+    })
+    return json.dumps({
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": url,
+        "body": body
+    })
+
+
+def test_batch_request_input_url():
+    request = BatchRequestInput.model_validate_json(
+        make_request_line("request-1", "/v1/embeddings"))
+    assert isinstance(request.body, EmbeddingRequest)
+    request = BatchRequestInput.model_validate_json(
+        make_request_line("request-1", "/v1/completions"))
+    assert isinstance(request.body, CompletionRequest)
+    # The body of an unknown url is not validated, its line gets an error.
+    request = BatchRequestInput.model_validate_json(
+        make_request_line("request-1", "/v1/unknown"))
+    assert request.body == {"model": "test", "prompt": "request-1"}
+    with pytest.raises(ValidationError):
+        BatchRequestInput.model_validate_json(
+            make_request_line("request-1", "/v1/completions").replace(
+                '"prompt"', '"input"'))
+
+
+class FakeCompletionHandler:
+    """Finishes the requests in the reverse order of their prompts, recording
+    the most requests in flight at once."""
+
+    def __init__(self):
+        self.num_running = 0
+        self.max_num_running = 0
+
+    async def __call__(self, request: CompletionRequest):
+        self.num_running += 1
+        self.max_num_running = max(self.max_num_running, self.num_running)
+        await asyncio.sleep(0.01 / (1 + int(request.prompt.split("-")[1])))
+        self.num_running -= 1
+        return CompletionResponse(model="test",
+                                  choices=[],
+                                  usage=UsageInfo(prompt_tokens=1))
+
+
+async def lines_of(lines: List[str]):
+    for line in lines:
+        yield line
+
+
+def read_output_ids(path: str) -> List[str]:
+    with open(path) as f:
+        return [
+            BatchRequestOutput.model_validate_json(line).custom_id
+            for line in f
+        ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("ordered", [True, False])
+async def test_run_batch_window(tmp_path, ordered: bool):
+    lines = [make_request_line(f"request-{i}") for i in range(16)]
+    handler = FakeCompletionHandler()
+    writer = BatchOutputWriter(str(tmp_path / "output.jsonl"))
+    await run_batch(lines_of(lines), {"/v1/completions": handler},
+                    writer,
+                    max_concurrent_requests=4,
+                    ordered=ordered)
+    writer.close()
+
+    assert handler.max_num_running == 4
+    output_ids = read_output_ids(str(tmp_path / "output.jsonl"))
+    expected_ids = [f"request-{i}" for i in range(16)]
+    if ordered:
+        assert output_ids == expected_ids
+    else:
+        assert output_ids != expected_ids
+        assert sorted(output_ids) == sorted(expected_ids)
+
+
+@pytest.mark.asyncio
+async def test_run_batch_resume(tmp_path):
+    output_path = str(tmp_path / "output.jsonl")
+    checkpoint_path = str(tmp_path / "checkpoint.jsonl")
+    lines = [make_request_line(f"request-{i}") for i in range(8)]
+
+    writer = BatchOutputWriter(output_path, checkpoint_path)
+    await run_batch(lines_of(lines[:5]),
+                    {"/v1/completions": FakeCompletionHandler()},
+                    writer,
+                    max_concurrent_requests=2)
+    writer.close()
+    # A crash after the output of request-5, during its checkpoint line.
+    with open(output_path, "a") as f:
+        f.write('{"id": "vllm-cut", "custom_id": "request-5"}\n')
+    with open(checkpoint_path, "a") as f:
+        f.write('{"custom_id": "req')
+
+    writer = BatchOutputWriter(output_path, checkpoint_path)
+    assert writer.completed == {f"request-{i}" for i in range(5)}
+    handler = FakeCompletionHandler()
+    await run_batch(lines_of(lines), {"/v1/completions": handler},
+                    writer,
+                    max_concurrent_requests=2)
+    writer.close()
+
+    assert read_output_ids(output_path) == [f"request-{i}" for i in range(8)]
+    assert BatchOutputWriter(output_path, checkpoint_path).completed == {
+        f"request-{i}"
+        for i in range(8)
+    }
+
+
+@pytest.mark.asyncio
+async def test_run_batch_unsupported_url(tmp_path):
+    writer = BatchOutputWriter(str(tmp_path / "output.jsonl"))
+    lines = [
+        make_request_line("request-0", "/v1/embeddings"),
+        make_request_line("request-1"),
+        make_request_line("request-2", "/v1/unknown"),
+        make_request_line("request-3"),
+    ]
+    await run_batch(lines_of(lines),
+                    {"/v1/completions": FakeCompletionHandler()},
+                    writer,
+                    max_concurrent_requests=2)
+    writer.close()
+
+    # Only the lines of the urls that are not served fail.
+    with open(tmp_path / "output.jsonl") as f:
+        outputs = [BatchRequestOutput.model_validate_json(line) for line in f]
+    assert [output.custom_id
+            for output in outputs] == [f"request-{i}" for i in range(4)]
+    assert [output.response.status_code
+            for output in outputs] == [400, 200, 400, 200]
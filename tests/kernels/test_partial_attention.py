@@ -0,0 +1,153 @@
+import random
+from typing import List, Optional
+
+import pytest
+import torch
+
+from vllm.attention.ops.paged_attn import PagedAttention
+from vllm.attention.ops.partial_attention import (merge_attn_states,
+                                                  paged_partial_attention)
+
+NUM_BLOCKS = 256
+NUM_SEQS = [1, 5]
+NUM_HEADS = [(8, 8), (8, 2)]
+HEAD_SIZES = [64]
+BLOCK_SIZES = [16]
+NUM_RANKS = [1, 2, 4]
+USE_ALIBI = [False, True]
+DTYPES = [torch.float, torch.bfloat16]
+
+
+def ref_decode_attention(query: torch.Tensor, keys: torch.Tensor,
+                         values: torch.Tensor, scale: float,
+                         alibi_slopes: Optional[torch.Tensor]) -> torch.Tensor:
+    # query: [num_heads, head_size], keys/values: [seq_len, num_heads, ...]
+    logits = scale * torch.einsum("hd,khd->hk", query.float(), keys.float())
+    if alibi_slopes is not None:
+        positions = torch.arange(keys.shape[0]) - (keys.shape[0] - 1)
+        logits += alibi_slopes[:, None] * positions[None, :].float()
+    weights = torch.softmax(logits, dim=-1)
+    return torch.einsum("hk,khd->hd", weights, values.float())
+
+
+@pytest.mark.parametrize("num_seqs", NUM_SEQS)
+@pytest.mark.parametrize("num_heads", NUM_HEADS)
+@pytest.mark.parametrize("head_size", HEAD_SIZES)
+@pytest.mark.parametrize("block_size", BLOCK_SIZES)
+@pytest.mark.parametrize("num_ranks", NUM_RANKS)
+@pytest.mark.parametrize("use_alibi", USE_ALIBI)
+@pytest.mark.parametrize("dtype", DTYPES)
+@torch.inference_mode()
+def test_partial_attention_merge(num_seqs: int, num_heads, head_size: int,
+                                 block_size: int, num_ranks: int,
+                                 use_alibi: bool, dtype: torch.dtype) -> None:
+    """Splits the blocks of every sequence over `num_ranks` ranks, like the
+    superblock migration does, and checks that merging the partial results
+    gives the attention over the whole sequence."""
+    random.seed(0)
+    torch.manual_seed(0)
+    num_query_heads, num_kv_heads = num_heads
+    num_queries_per_kv = num_query_heads // num_kv_heads
+    scale = head_size**-0.5
+    query = torch.randn(num_seqs, num_query_heads, head_size, dtype=dtype)
+    key_cache = torch.randn(NUM_BLOCKS,
+                            block_size,
+                            num_kv_heads,
+                            head_size,
+                            dtype=dtype)
+    value_cache = torch.randn_like(key_cache)
+    alibi_slopes = torch.rand(num_query_heads) if use_alibi else None
+
+    seq_lens = [random.randint(1, 8 * block_size) for _ in range(num_seqs)]
+    free_blocks = list(range(NUM_BLOCKS))
+    random.shuffle(free_blocks)
+    # The blocks of every sequence, and where its rank partitions start.
+    seq_blocks: List[List[int]] = []
+    splits: List[List[int]] = []
+    for seq_len in seq_lens:
+        num_blocks = (seq_len + block_size - 1) // block_size
+        seq_blocks.append([free_blocks.pop() for _ in range(num_blocks)])
+        points = sorted(
+            random.randint(0, num_blocks) for _ in range(num_ranks - 1))
+        splits.append([0] + points + [num_blocks])
+
+    tmp_out = torch.empty(num_seqs,
+                          num_query_heads,
+                          num_ranks,
+                          head_size,
+                          dtype=dtype)
+    exp_sums = torch.empty(num_seqs, num_query_heads, num_ranks)
+    max_logits = torch.empty_like(exp_sums)
+    for rank in range(num_ranks):
+        block_tables = torch.zeros(num_seqs, 8, dtype=torch.int)
+        rank_seq_lens = torch.zeros(num_seqs, dtype=torch.int)
+        offsets = torch.zeros(num_seqs, dtype=torch.int)
+        for i, seq_len in enumerate(seq_lens):
+            start, end = splits[i][rank], splits[i][rank + 1]
+            block_tables[i, :end - start] = torch.tensor(
+                seq_blocks[i][start:end])
+            rank_seq_lens[i] = max(
+                0,
+                min(seq_len, end * block_size) - start * block_size)
+            offsets[i] = start * block_size - (seq_len - 1)
+        out, exp_sum, max_logit = paged_partial_attention(
+            query, key_cache, value_cache, block_tables, rank_seq_lens, scale,
+            alibi_slopes, offsets)
+        tmp_out[:, :, rank] = out
+        exp_sums[:, :, rank] = exp_sum
+        max_logits[:, :, rank] = max_logit
+
+    output, _, _ = merge_attn_states(tmp_out, exp_sums, max_logits)
+    atol, rtol = (1e-5, 1e-5) if dtype == torch.float else (2e-2, 2e-2)
+    for i, seq_len in enumerate(seq_lens):
+        keys = key_cache[seq_blocks[i]].flatten(0, 1)[:seq_len]
+        values = value_cache[seq_blocks[i]].flatten(0, 1)[:seq_len]
+        keys = keys.repeat_interleave(num_queries_per_kv, dim=1)
+        values = values.repeat_interleave(num_queries_per_kv, dim=1)
+        ref_output = ref_decode_attention(query[i], keys, values, scale,
+                                          alibi_slopes)
+        assert torch.allclose(output[i].float(),
+                              ref_output,
+                              atol=atol,
+                              rtol=rtol)
+
+
+@torch.inference_mode()
+def test_merge_attn_states_online() -> None:
+    """Folding the states in one at a time, as along a ring, gives the same
+    result as merging them all at once."""
+    torch.manual_seed(0)
+    num_seqs, num_heads, num_ranks, head_size = 3, 4, 5, 32
+    tmp_out = torch.randn(num_seqs, num_heads, num_ranks, head_size)
+    exp_sums = torch.rand(num_seqs, num_heads, num_ranks) * 10
+    max_logits = torch.randn(num_seqs, num_heads, num_ranks) * 5
+    # One rank holds no KV of the first sequence.
+    exp_sums[0, :, 2] = 0
+    max_logits[0, :, 2] = torch.finfo(torch.float32).min
+
+    output, exp_sum, max_logit = merge_attn_states(tmp_out, exp_sums,
+                                                   max_logits)
+    acc = (tmp_out[:, :, 0], exp_sums[:, :, 0], max_logits[:, :, 0])
+    for rank in range(1, num_ranks):
+        acc = merge_attn_states(
+            torch.stack([acc[0], tmp_out[:, :, rank]], dim=2),
+            torch.stack([acc[1], exp_sums[:, :, rank]], dim=2),
+            torch.stack([acc[2], max_logits[:, :, rank]], dim=2))
+    assert torch.allclose(acc[0], output, atol=1e-5)
+    assert torch.allclose(acc[1], exp_sum, rtol=1e-5)
+    assert torch.equal(acc[2], max_logit)
+
+    # The reducer falls back to the reference merge off CUDA.
+    assert torch.equal(
+        PagedAttention.sequence_block_reducer(tmp_out, exp_sums, max_logits),
+        output)
+
+
+@torch.inference_mode()
+def test_merge_attn_states_all_empty() -> None:
+    tmp_out = torch.zeros(1, 2, 3, 8)
+    exp_sums = torch.zeros(1, 2, 3)
+    max_logits = torch.full_like(exp_sums, torch.finfo(torch.float32).min)
+    output, exp_sum, _ = merge_attn_states(tmp_out, exp_sums, max_logits)
+    assert not output.isnan().any()
+    assert not exp_sum.any()
@@ -1,3 +1,4 @@
+import time
 from typing import List
 
 import pytest
@@ -6,6 +7,7 @@ from prometheus_client import REGISTRY
 from vllm import EngineArgs, LLMEngine
 from vllm.engine.arg_utils import AsyncEngineArgs
 from vllm.engine.async_llm_engine import AsyncLLMEngine
+from vllm.engine.metrics import LoggingStatLogger, PrometheusStatLogger, Stats
 from vllm.sampling_params import SamplingParams
 
 MODELS = [
@@ -192,3 +194,114 @@ def assert_metrics(engine: LLMEngine, disable_log_stats: bool,
                                                      labels)
             assert (
                 metric_value == num_requests), "Metrics should be collected"
+
+
+def _sp_stats(now: float, num_migrated: List[int]) -> Stats:
+    return Stats(now=now,
+                 num_running_sys=1,
+                 num_waiting_sys=0,
+                 num_swapped_sys=0,
+                 gpu_cache_usage_sys=0.5,
+                 cpu_cache_usage_sys=0.0,
+                 migrate_threshold_sys=4096,
+                 migrate_start_sys=2048,
+                 migrate_pressure_sys=0.5,
+                 num_queued_superblocks_sys=3,
+                 sp_num_free_blocks_sys=[6, 8],
+                 sp_cache_usage_sys=[0.25, 0.0],
+                 num_prompt_tokens_iter=0,
+                 num_generation_tokens_iter=1,
+                 time_to_first_tokens_iter=[],
+                 time_per_output_tokens_iter=[],
+                 num_preemption_iter=0,
+                 num_migrated_superblocks_iter=num_migrated,
+                 num_recalled_superblocks_iter=[0, 1],
+                 num_migrated_bytes_iter=sum(num_migrated) * 1024,
+                 num_recalled_bytes_iter=1024,
+                 time_e2e_requests=[],
+                 num_prompt_tokens_requests=[],
+                 num_generation_tokens_requests=[],
+                 best_of_requests=[],
+                 n_requests=[],
+                 finished_reason_requests=[])
+
+
+def test_sp_migration_metrics() -> None:
+    labels = {"model_name": "sp-metrics-test"}
+    stat_logger = PrometheusStatLogger(local_interval=5,
+                                       labels=labels,
+                                       max_model_len=128)
+    logging_stat_logger = LoggingStatLogger(local_interval=0)
+    now = time.time()
+    for step, num_migrated in enumerate([[1, 0], [2, 1]]):
+        stats = _sp_stats(now + step + 1, num_migrated)
+        stat_logger.log(stats)
+        logging_stat_logger.log(stats)
+
+    def sample(name: str, **extra_labels) -> float:
+        return REGISTRY.get_sample_value(name, {**labels, **extra_labels})
+
+    assert sample("vllm:kv_migrated_superblocks_total", sp_rank="1") == 3
+    assert sample("vllm:kv_migrated_superblocks_total", sp_rank="2") == 1
+    assert sample("vllm:kv_recalled_superblocks_total", sp_rank="2") == 2
+    assert sample("vllm:kv_migrated_bytes_total") == 4 * 1024
+    assert sample("vllm:kv_recalled_bytes_total") == 2 * 1024
+    assert sample("vllm:kv_migrate_queue_superblocks") == 3
+    assert sample("vllm:sp_num_free_blocks", sp_rank="1") == 6
+    assert sample("vllm:sp_cache_usage_perc", sp_rank="1") == 0.25
+    assert sample("vllm:kv_migrated_superblocks_per_step_count") == 2
+    assert sample("vllm:kv_migrated_superblocks_per_step_sum") == 4
+    # The logging stat logger resets its tracked stats every interval.
+    assert logging_stat_logger.num_migrated_superblocks == []
+
+
+def test_tenant_metrics() -> None:
+    labels = {"model_name": "tenant-metrics-test"}
+    stat_logger = PrometheusStatLogger(local_interval=5,
+                                       labels=labels,
+                                       max_model_len=128)
+    now = time.time()
+    for step in range(2):
+        stats = _sp_stats(now + step + 1, [0, 0])
+        stats.tenant_num_requests_sys = {"a": 2 - step, "*": 1}
+        stats.tenant_bucket_tokens_sys = {"a": -8.0}
+        stats.tenant_num_scheduled_tokens_iter = {"a": 16, "*": 4}
+        stats.tenant_num_deferred_iter = {"a": 1}
+        stats.tenant_num_preempted_iter = {"*": step}
+        stat_logger.log(stats)
+
+    def sample(name: str, tenant: str) -> float:
+        return REGISTRY.get_sample_value(name, {**labels, "tenant": tenant})
+
+    assert sample("vllm:tenant_num_requests", "a") == 1
+    assert sample("vllm:tenant_num_requests", "*") == 1
+    assert sample("vllm:tenant_token_bucket_tokens", "a") == -8.0
+    assert sample("vllm:tenant_scheduled_tokens_total", "a") == 32
+    assert sample("vllm:tenant_scheduled_tokens_total", "*") == 8
+    assert sample("vllm:tenant_deferred_requests_total", "a") == 2
+    assert sample("vllm:tenant_preemptions_total", "*") == 1
+
+
+def test_step_cost_model_metrics() -> None:
+    labels = {"model_name": "step-cost-metrics-test"}
+    stat_logger = PrometheusStatLogger(local_interval=5,
+                                       labels=labels,
+                                       max_model_len=128)
+    stats = _sp_stats(time.time() + 1, [0, 0])
+    stats.step_cost_coefficients_sys = {
+        "base": 0.01,
+        "prefill_token": 4e-5,
+        "decode_seq": 1e-4,
+        "decode_context_token": 2e-7,
+    }
+    stats.step_cost_errors_iter = [0.03, 0.3]
+    stat_logger.log(stats)
+
+    def sample(name: str, **extra_labels) -> float:
+        return REGISTRY.get_sample_value(name, {**labels, **extra_labels})
+
+    assert sample("vllm:step_cost_model_coefficient", term="base") == 0.01
+    assert sample("vllm:step_cost_model_coefficient",
+                  term="prefill_token") == 4e-5
+    assert sample("vllm:step_cost_model_relative_error_count") == 2
+    assert sample("vllm:step_cost_model_relative_error_bucket", le="0.05") == 1
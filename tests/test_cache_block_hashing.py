@@ -7,7 +7,7 @@ from typing import List, Optional
 import pytest
 
 from vllm.lora.request import LoRARequest
-from vllm.sequence import Sequence
+from vllm.sequence import Logprob, Sequence
 from vllm.transformers_utils.tokenizer_group import TokenizerGroup
 
 # Make two prefixes with different first blocks.
@@ -97,3 +97,64 @@ def test_auto_prefix_caching(model: str, block_size: int, max_num_seqs: int,
         different_hashes = [h[-1] for h in hash_pref]
         assert (len(set(same_hashes)) == 1)
         assert (len(set(different_hashes)) == len(different_hashes))
+
+
+@pytest.mark.parametrize("block_size", [1, 4, 16])
+@pytest.mark.parametrize("prompt_len", [1, 15, 33])
+@pytest.mark.parametrize("lora_int_id", [None, 1])
+def test_incremental_block_hashing(block_size: int, prompt_len: int,
+                                   lora_int_id: Optional[int]):
+    lora_request = None
+    if lora_int_id is not None:
+        lora_request = LoRARequest(f"example_lora_{lora_int_id}", lora_int_id,
+                                   f"example/path/to/lora_{lora_int_id}")
+    token_ids = list(range(100, 100 + prompt_len + 40))
+    seq = Sequence(0,
+                   inputs={"prompt_token_ids": token_ids[:prompt_len]},
+                   block_size=block_size,
+                   lora_request=lora_request)
+
+    # Hash while appending output tokens, like the block manager does.
+    hashes: List[int] = []
+    for token_id in token_ids[prompt_len:]:
+        seq.append_token_id(token_id, {token_id: Logprob(0.0)})
+        if seq.get_len() % block_size == 0:
+            hashes.append(seq.hash_of_block(seq.n_blocks - 1))
+    assert hashes == [
+        seq.hash_of_block(idx)
+        for idx in range(prompt_len // block_size, seq.n_blocks)
+    ][:len(hashes)]
+
+    # A sequence with the same tokens all in its prompt has the same hashes.
+    same_seq = Sequence(1,
+                        inputs={"prompt_token_ids": token_ids},
+                        block_size=block_size,
+                        lora_request=lora_request)
+    assert [same_seq.hash_of_block(idx) for idx in range(seq.n_blocks)
+            ] == [seq.hash_of_block(idx) for idx in range(seq.n_blocks)]
+
+    # The hash of a block covers the blocks before it.
+    other_seq = Sequence(2,
+                         inputs={"prompt_token_ids": [0] + token_ids[1:]},
+                         block_size=block_size,
+                         lora_request=lora_request)
+    for idx in range(seq.n_blocks):
+        assert other_seq.hash_of_block(idx) != seq.hash_of_block(idx)
+
+
+def test_lora_block_hashing():
+    token_ids = list(range(32))
+
+    def block_hashes(lora_request: Optional[LoRARequest]) -> List[int]:
+        seq = Sequence(0,
+                       inputs={"prompt_token_ids": token_ids},
+                       block_size=16,
+                       lora_request=lora_request)
+        return [seq.hash_of_block(idx) for idx in range(2)]
+
+    # The blocks of an adapter are keyed by its name and path, not by the
+    # id it is registered under, which a restart may give to another one.
+    adapter = block_hashes(LoRARequest("lora", 1, "/path/to/lora"))
+    assert block_hashes(LoRARequest("lora", 2, "/path/to/lora")) == adapter
+    assert block_hashes(LoRARequest("other", 1, "/path/to/other")) != adapter
+    assert block_hashes(None) != adapter
@@ -1,3 +1,5 @@
+import pickle
+
 import pytest
 
 from vllm.sequence import (CompletionSequenceGroupOutput, SamplerOutput,
@@ -95,3 +97,36 @@ def test_sequence_group_stage():
     assert seq_group.is_prefill() is True
     seq_group.update_num_computed_tokens(1)
     assert seq_group.is_prefill() is False
+
+
+def test_sequence_data_token_buffer():
+    prompt_token_ids = list(range(10))
+    seq_data = SequenceData(prompt_token_ids)
+    view = seq_data.get_token_ids_view()
+    # Append past the initial capacity so the buffer has to grow.
+    for token_id in range(100, 150):
+        seq_data.append_token_id(token_id, logprob=-1.0)
+        assert seq_data.get_last_token_id() == token_id
+
+    expected = prompt_token_ids + list(range(100, 150))
+    assert seq_data.get_len() == len(expected)
+    assert seq_data.get_output_len() == 50
+    assert seq_data.get_token_ids() == expected
+    assert seq_data.get_token_ids_in_range(5, 15) == expected[5:15]
+    assert seq_data.get_token_ids_view(58).tolist() == expected[58:]
+    assert seq_data.get_output_token_ids() == expected[10:]
+    assert seq_data.cumulative_logprob == -50.0
+    # Views taken before the buffer grew are still valid.
+    assert view.tolist() == prompt_token_ids
+
+    # Replacing the output tokens rebuilds the buffer.
+    seq_data.output_token_ids = [7, 8]
+    assert seq_data.get_token_ids() == prompt_token_ids + [7, 8]
+    assert seq_data.get_last_token_id() == 8
+
+    # Pickling drops the unused capacity.
+    restored = pickle.loads(pickle.dumps(seq_data))
+    assert len(restored.get_token_ids_view()) == 12
+    restored.append_token_id(9, logprob=0.0)
+    assert restored.get_token_ids() == prompt_token_ids + [7, 8, 9]
+    assert seq_data.get_len() == 12
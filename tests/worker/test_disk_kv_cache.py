@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import torch
+
+from vllm.worker.disk_kv_cache import DiskKVCache
+from vllm.worker.worker import Worker
+from vllm.worker.worker_base import WorkerInput
+
+
+def test_disk_kv_cache_roundtrip(tmp_path):
+    num_layers, num_cpu_blocks, num_disk_blocks = 2, 4, 3
+    cpu_cache = [
+        torch.randn(2, num_cpu_blocks, 16, dtype=torch.float16)
+        for _ in range(num_layers)
+    ]
+    expected = [layer_cache.clone() for layer_cache in cpu_cache]
+    disk_kv_cache = DiskKVCache(str(tmp_path), num_disk_blocks, 0, cpu_cache)
+    disk_kv_cache.spill(torch.tensor([[0, 2], [3, 0]]))
+
+    # A restarted worker reads the blocks back to other CPU blocks.
+    cpu_cache = [torch.zeros_like(layer_cache) for layer_cache in cpu_cache]
+    disk_kv_cache = DiskKVCache(str(tmp_path), num_disk_blocks, 0, cpu_cache)
+    disk_kv_cache.load(torch.tensor([[2, 1], [0, 2]]))
+    for layer_cache, expected_cache in zip(cpu_cache, expected):
+        assert torch.equal(layer_cache[:, 1], expected_cache[:, 0])
+        assert torch.equal(layer_cache[:, 2], expected_cache[:, 3])
+        assert not layer_cache[:, [0, 3]].any()
+
+
+def test_spill_waits_for_swap_out(tmp_path, monkeypatch):
+    """A block demoted to the CPU tier is spilled in the same step, after its
+    asynchronous swap out landed in the CPU cache."""
+    num_layers, num_blocks = 2, 4
+    gpu_cache = [
+        torch.randn(2, num_blocks, 16, dtype=torch.float16)
+        for _ in range(num_layers)
+    ]
+    cpu_cache = [torch.zeros_like(layer_cache) for layer_cache in gpu_cache]
+    pending_copies = []
+
+    def swap_out(blocks_to_swap_out: torch.Tensor) -> None:
+        # Like cudaMemcpyAsync, the copy lands when the stream is synced.
+        for src, dst in blocks_to_swap_out.tolist():
+            for gpu_layer, cpu_layer in zip(gpu_cache, cpu_cache):
+                pending_copies.append(lambda g=gpu_layer, c=cpu_layer, s=src, d
+                                      =dst: c[:, d].copy_(g[:, s]))
+
+    def synchronize() -> None:
+        while pending_copies:
+            pending_copies.pop(0)()
+
+    monkeypatch.setattr(torch.cuda, "current_stream",
+                        lambda: SimpleNamespace(synchronize=synchronize))
+    worker = SimpleNamespace(kv_migrator=MagicMock(),
+                             cache_engine=SimpleNamespace(swap_out=swap_out),
+                             disk_kv_cache=DiskKVCache(str(tmp_path),
+                                                       num_blocks, 0,
+                                                       cpu_cache))
+    # GPU block 1 is demoted to CPU block 2, which is spilled to slot 0.
+    Worker.execute_worker(
+        worker,
+        WorkerInput(blocks_to_swap_out=torch.tensor([[1, 2]]),
+                    blocks_to_spill=torch.tensor([[2, 0]])))
+
+    cpu_cache = [torch.zeros_like(layer_cache) for layer_cache in cpu_cache]
+    disk_kv_cache = DiskKVCache(str(tmp_path), num_blocks, 0, cpu_cache)
+    disk_kv_cache.load(torch.tensor([[0, 3]]))
+    for layer_cache, gpu_layer_cache in zip(cpu_cache, gpu_cache):
+        assert torch.equal(layer_cache[:, 3], gpu_layer_cache[:, 1])
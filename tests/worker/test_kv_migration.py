@@ -0,0 +1,198 @@
+"""Checks the ordering of the KV superblock migration and recall on CPU
+with gloo.
+
+Rank 0 plays a master worker and rank 1 an SP worker. Both use fake KV
+caches and the same MigrationStream/gather/scatter helpers as the Worker.
+"""
+import multiprocessing
+from typing import List, Tuple
+
+import torch
+import torch.distributed as dist
+
+from vllm.utils import get_open_port, update_environment_variables
+from vllm.worker.kv_migration import (MigrationStream, gather_blocks,
+                                      gather_chunks, scatter_blocks,
+                                      scatter_chunks)
+
+NUM_LAYERS = 2
+CHUNK_SIZE = 2
+BUDGET = 2
+NUM_MASTER_BLOCKS = 12
+NUM_SP_BLOCKS = 16
+STAGING_IDX = NUM_MASTER_BLOCKS - BUDGET * CHUNK_SIZE
+
+# Every step: (src superblock starts, [(dst chunk, dst rank)]).
+STEPS: List[Tuple[List[int], List[Tuple[int, int]]]] = [
+    ([0, 4], [(3, 1), (0, 1)]),
+    ([2], [(1, 1)]),
+]
+# Recalled (src chunk on the SP worker, local dst blocks on the master).
+RECALLS: List[Tuple[int, List[int]]] = [(3, [5, 6]), (0, [9, 2])]
+
+
+def _fake_cache(num_blocks: int, fill: bool) -> List[torch.Tensor]:
+    caches = []
+    for layer in range(NUM_LAYERS):
+        cache = torch.zeros(2, num_blocks, 4)
+        if fill:
+            for block in range(num_blocks):
+                cache[0, block] = layer * 100 + block
+                cache[1, block] = -(layer * 100 + block)
+        caches.append(cache)
+    return caches
+
+
+def _get_blocks_fn(caches: List[torch.Tensor]):
+
+    def get_blocks(layer: int, start: int, step: int) -> torch.Tensor:
+        return caches[layer][:, start:start + step]
+
+    return get_blocks
+
+
+def _master(caches: List[torch.Tensor]) -> None:
+    get_blocks = _get_blocks_fn(caches)
+    send_stream = MigrationStream(torch.device("cpu"))
+    for src_starts, superblocks in STEPS:
+        # The staging area is only reused once the last send finished.
+        send_stream.wait()
+        for i, src in enumerate(src_starts):
+            dst = STAGING_IDX + i * CHUNK_SIZE
+            for layer in range(NUM_LAYERS):
+                get_blocks(layer, dst, CHUNK_SIZE).copy_(
+                    get_blocks(layer, src, CHUNK_SIZE))
+        with send_stream.launch():
+            chunks = send_stream.hold(
+                gather_blocks(get_blocks, NUM_LAYERS, STAGING_IDX,
+                              len(superblocks) * CHUNK_SIZE))
+            assert chunks.is_contiguous()
+            dist.send(chunks, dst=superblocks[0][1])
+        # Clobber the staging area, like the blocks freed by the migration
+        # being reused by the forward of the next step.
+        for layer in range(NUM_LAYERS):
+            get_blocks(layer, STAGING_IDX, BUDGET * CHUNK_SIZE).fill_(0)
+    send_stream.wait()
+
+
+def _sp_worker(caches: List[torch.Tensor]) -> None:
+    get_blocks = _get_blocks_fn(caches)
+    recv_stream = MigrationStream(torch.device("cpu"))
+    for _, superblocks in STEPS:
+        recv_stream.wait()
+        with recv_stream.launch():
+            chunks = recv_stream.hold(
+                torch.empty_like(
+                    gather_blocks(get_blocks, NUM_LAYERS, 0,
+                                  len(superblocks) * CHUNK_SIZE)))
+            dist.recv(chunks, src=0)
+            scatter_chunks(get_blocks, chunks,
+                           [chunk * CHUNK_SIZE for chunk, _ in superblocks],
+                           CHUNK_SIZE)
+    recv_stream.wait()
+
+    expected = _fake_cache(NUM_MASTER_BLOCKS, fill=True)
+    for src_starts, superblocks in STEPS:
+        for src, (chunk, _) in zip(src_starts, superblocks):
+            dst = chunk * CHUNK_SIZE
+            for layer in range(NUM_LAYERS):
+                torch.testing.assert_close(
+                    caches[layer][:, dst:dst + CHUNK_SIZE],
+                    expected[layer][:, src:src + CHUNK_SIZE])
+    # The chunks no superblock was migrated to are untouched.
+    for layer in range(NUM_LAYERS):
+        assert not caches[layer][:, 8:].any()
+
+
+def _recall_master(caches: List[torch.Tensor]) -> None:
+    get_blocks = _get_blocks_fn(caches)
+    recall_stream = MigrationStream(torch.device("cpu"))
+    block_numbers = [block for _, blocks in RECALLS for block in blocks]
+    with recall_stream.launch():
+        chunks = recall_stream.hold(
+            torch.empty_like(
+                gather_blocks(get_blocks, NUM_LAYERS, 0, len(block_numbers))))
+        dist.recv(chunks, src=1)
+        scatter_blocks(get_blocks, chunks, block_numbers)
+    recall_stream.wait()
+
+    expected = _fake_cache(NUM_SP_BLOCKS, fill=True)
+    for chunk, blocks in RECALLS:
+        for offset, block in enumerate(blocks):
+            src = chunk * CHUNK_SIZE + offset
+            for layer in range(NUM_LAYERS):
+                torch.testing.assert_close(caches[layer][:, block],
+                                           expected[layer][:, src])
+
+
+def _recall_sp_worker(caches: List[torch.Tensor]) -> None:
+    get_blocks = _get_blocks_fn(caches)
+    recall_stream = MigrationStream(torch.device("cpu"))
+    with recall_stream.launch():
+        chunks = recall_stream.hold(
+            gather_chunks(get_blocks, NUM_LAYERS,
+                          [chunk * CHUNK_SIZE for chunk, _ in RECALLS],
+                          CHUNK_SIZE))
+        assert chunks.is_contiguous()
+        dist.send(chunks, dst=0)
+    recall_stream.wait()
+
+
+def _migrate_fn() -> None:
+    if dist.get_rank() == 0:
+        _master(_fake_cache(NUM_MASTER_BLOCKS, fill=True))
+    else:
+        _sp_worker(_fake_cache(NUM_SP_BLOCKS, fill=False))
+
+
+def _recall_fn() -> None:
+    if dist.get_rank() == 0:
+        _recall_master(_fake_cache(NUM_MASTER_BLOCKS, fill=False))
+    else:
+        _recall_sp_worker(_fake_cache(NUM_SP_BLOCKS, fill=True))
+
+
+def _worker_fn(env, fn) -> None:
+    update_environment_variables(env)
+    dist.init_process_group(backend="gloo")
+    fn()
+    dist.barrier()
+    dist.destroy_process_group()
+
+
+def _run_two_ranks(fn) -> None:
+    port = str(get_open_port())
+    processes = []
+    for rank in range(2):
+        env = {
+            "RANK": str(rank),
+            "WORLD_SIZE": "2",
+            "MASTER_ADDR": "localhost",
+            "MASTER_PORT": port,
+        }
+        p = multiprocessing.Process(target=_worker_fn, args=(env, fn))
+        processes.append(p)
+        p.start()
+    for p in processes:
+        p.join(timeout=120)
+    for p in processes:
+        assert p.exitcode == 0
+
+
+def test_migration_ordering_gloo():
+    _run_two_ranks(_migrate_fn)
+
+
+def test_recall_ordering_gloo():
+    _run_two_ranks(_recall_fn)
+
+
+def test_gather_scatter_roundtrip():
+    src = _fake_cache(NUM_MASTER_BLOCKS, fill=True)
+    dst = _fake_cache(NUM_SP_BLOCKS, fill=False)
+    packed = gather_blocks(_get_blocks_fn(src), NUM_LAYERS, 4, 2 * CHUNK_SIZE)
+    assert packed.shape == (NUM_LAYERS, 2, 2 * CHUNK_SIZE, 4)
+    scatter_chunks(_get_blocks_fn(dst), packed, [10, 2], CHUNK_SIZE)
+    for layer in range(NUM_LAYERS):
+        torch.testing.assert_close(dst[layer][:, 10:12], src[layer][:, 4:6])
+        torch.testing.assert_close(dst[layer][:, 2:4], src[layer][:, 6:8])
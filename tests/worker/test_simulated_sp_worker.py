@@ -0,0 +1,186 @@
+"""Runs the KV superblock migration end to end on CPU with gloo.
+
+Rank 0 is the driver master worker and runs the scheduler, rank 1 is an SP
+worker. Every step goes scheduler -> ExecuteModelRequest -> worker -> cache
+engine, and the KV written by the fake forward passes must end up in the
+blocks the block tables point to, local or remote.
+"""
+import multiprocessing
+from typing import List, Optional, Tuple
+
+import pytest
+import torch
+
+from vllm.config import CacheConfig, ParallelConfig, SchedulerConfig
+from vllm.core.scheduler import Scheduler
+from vllm.distributed.parallel_state import get_sp_group
+from vllm.sequence import ExecuteModelRequest, Logprob, Sequence
+from vllm.utils import get_open_port
+from vllm.worker.simulated_sp_worker import (SimulatedCacheEngine,
+                                             SimulatedSPWorker)
+
+from ..core.utils import create_dummy_prompt
+
+BLOCK_SIZE = 4
+NUM_LAYERS = 2
+BLOCK_NUMEL = 8
+NUM_GPU_BLOCKS = 32
+NUM_CPU_BLOCKS = 8
+NUM_REMOTE_GPU_BLOCKS = 16
+PROMPT_LEN = 28
+NUM_DECODE_STEPS = 6
+
+
+def _kv(seq_id: int, logical_idx: int, layer: int) -> float:
+    return float(seq_id * 1000 + logical_idx * 10 + layer)
+
+
+def _write_kv(cache_engine: SimulatedCacheEngine, block_table, seq: Sequence,
+              logical_indices) -> None:
+    """The fake forward: writes the KV of `logical_indices` blocks."""
+    for idx in logical_indices:
+        block = block_table[idx]
+        assert block.remote_rank == 0
+        for layer in range(NUM_LAYERS):
+            cache_engine.gpu_cache[layer][0, block.block_number] = _kv(
+                seq.seq_id, idx, layer)
+            cache_engine.gpu_cache[layer][1, block.block_number] = -_kv(
+                seq.seq_id, idx, layer)
+
+
+def _check_kv(cache_engine: SimulatedCacheEngine,
+              expected: List[Tuple[int, int, int]]) -> None:
+    for block_number, seq_id, idx in expected:
+        for layer in range(NUM_LAYERS):
+            cache = cache_engine.gpu_cache[layer]
+            assert (cache[0, block_number] == _kv(seq_id, idx, layer)).all()
+            assert (cache[1, block_number] == -_kv(seq_id, idx, layer)).all()
+
+
+def _configs(block_recall_watermark: Optional[float]):
+    cache_config = CacheConfig(BLOCK_SIZE,
+                               1.0,
+                               1,
+                               "auto",
+                               block_migrate_size=2 * BLOCK_SIZE,
+                               block_migrate_threshold=4 * BLOCK_SIZE,
+                               block_migrate_start=2 * BLOCK_SIZE,
+                               block_migrate_budget=2,
+                               block_recall_watermark=block_recall_watermark)
+    parallel_config = ParallelConfig(1,
+                                     1,
+                                     sequence_parallel_size=2,
+                                     distributed_executor_backend="mp")
+    return cache_config, parallel_config
+
+
+def _driver(worker: SimulatedSPWorker, cache_config: CacheConfig) -> int:
+    scheduler = Scheduler(SchedulerConfig(128, 4, 128), cache_config, None, 1)
+    block_manager = scheduler.block_manager
+    for i in range(2):
+        _, seq_group = create_dummy_prompt(str(i), PROMPT_LEN, BLOCK_SIZE)
+        scheduler.add_seq_group(seq_group)
+
+    num_migrated = 0
+    for _ in range(NUM_DECODE_STEPS + 1):
+        metas, out = scheduler.schedule()
+        num_migrated += len(out.superblocks_to_migrate)
+        worker.execute_model(
+            ExecuteModelRequest(
+                seq_group_metadata_list=metas,
+                blocks_to_swap_in=out.blocks_to_swap_in,
+                blocks_to_swap_out=out.blocks_to_swap_out,
+                blocks_to_copy=out.blocks_to_copy,
+                blocks_to_migrate=out.blocks_to_migrate,
+                superblocks_to_migrate=out.superblocks_to_migrate,
+                superblocks_to_recall=out.superblocks_to_recall,
+                blocks_to_recall=out.blocks_to_recall,
+                remote_blocks_to_swap_in=out.remote_blocks_to_swap_in,
+                remote_blocks_to_swap_out=out.remote_blocks_to_swap_out))
+        for scheduled, meta in zip(out.scheduled_seq_groups, metas):
+            seq_group = scheduled.seq_group
+            for seq in seq_group.get_seqs():
+                block_table = block_manager.block_tables[seq.seq_id]
+                # Prefills write the KV of the whole prompt, decodes of the
+                # last token only.
+                indices = (range(len(block_table))
+                           if meta.is_prompt else [len(block_table) - 1])
+                _write_kv(worker.cache_engine, block_table, seq, indices)
+            seq_group.update_num_computed_tokens(scheduled.token_chunk_size)
+            for seq in seq_group.get_seqs():
+                seq.append_token_id(1, {1: Logprob(0.0)})
+    worker.execute_model()
+
+    local: List[Tuple[int, int, int]] = []
+    remote: List[Tuple[int, int, int]] = []
+    for seq_id, block_table in block_manager.block_tables.items():
+        for idx, block in enumerate(block_table):
+            (remote if block.remote_rank else local).append(
+                (block.block_number, seq_id, idx))
+    _check_kv(worker.cache_engine, local)
+    get_sp_group(0).broadcast_object(remote, src=0)
+    return num_migrated
+
+
+def _run_rank(rank: int, port: int, block_recall_watermark: Optional[float],
+              result_queue) -> None:
+    cache_config, parallel_config = _configs(block_recall_watermark)
+    worker = SimulatedSPWorker(cache_config,
+                               parallel_config,
+                               rank,
+                               f"tcp://127.0.0.1:{port}",
+                               num_layers=NUM_LAYERS,
+                               block_numel=BLOCK_NUMEL,
+                               is_driver_worker=rank == 0,
+                               is_sp_worker=rank == 1)
+    worker.init_device()
+    worker.initialize_cache(NUM_GPU_BLOCKS, NUM_CPU_BLOCKS,
+                            NUM_REMOTE_GPU_BLOCKS, 0)
+    if rank == 0:
+        result_queue.put((rank, _driver(worker, cache_config)))
+    else:
+        while worker.execute_model() is not None:
+            pass
+        remote = get_sp_group(0).broadcast_object(None, src=0)
+        _check_kv(worker.cache_engine, remote)
+        result_queue.put((rank, len(remote)))
+
+
+@pytest.mark.parametrize("block_recall_watermark", [None, 0.5])
+def test_migration_flow_gloo(block_recall_watermark):
+    port = get_open_port()
+    result_queue: multiprocessing.Queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_run_rank,
+                                args=(rank, port, block_recall_watermark,
+                                      result_queue)) for rank in range(2)
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join(timeout=120)
+    for p in processes:
+        assert p.exitcode == 0
+    results = dict(result_queue.get() for _ in processes)
+    num_migrated_blocks = results[0] * 2
+    assert num_migrated_blocks > 0
+    # Without a recall watermark the migrated superblocks stay remote,
+    # otherwise some of them are recalled once the GPU blocks free up.
+    if block_recall_watermark is None:
+        assert results[1] == num_migrated_blocks
+    else:
+        assert 0 < results[1] < num_migrated_blocks
+
+
+def test_simulated_cache_engine_ops():
+    engine = SimulatedCacheEngine(NUM_LAYERS, 4, 2, BLOCK_NUMEL)
+    for layer in range(NUM_LAYERS):
+        engine.gpu_cache[layer][:, 1] = layer + 1
+    engine.swap_out(torch.tensor([[1, 0]]))
+    engine.swap_in(torch.tensor([[0, 3]]))
+    engine.copy(torch.tensor([[3, 2]]))
+    for layer in range(NUM_LAYERS):
+        assert (engine.get_blocks(layer, 1, 3) == layer + 1).all()
+        assert not engine.get_blocks(layer, 0, 1).any()
+    assert SimulatedCacheEngine.get_cache_block_size(
+        NUM_LAYERS, BLOCK_NUMEL) == NUM_LAYERS * 2 * BLOCK_NUMEL * 4
@@ -4,6 +4,7 @@ from typing import List, Optional, Tuple
 import torch
 
 from vllm import _custom_ops as ops
+from vllm.attention.ops.partial_attention import merge_attn_states
 from vllm.attention.ops.prefix_prefill import context_attention_fwd
 
 # Should be the same as PARTITION_SIZE in `paged_attention_v2_launcher`.
@@ -104,6 +105,9 @@ class PagedAttention:
         exp_sum: torch.Tensor,
         max_logits: torch.Tensor,
     ) -> torch.Tensor:
+        if not tmp_out.is_cuda:
+            output, _, _ = merge_attn_states(tmp_out, exp_sum, max_logits)
+            return output
         num_seqs = tmp_out.size(0)
         num_heads = tmp_out.size(1)
         head_size = tmp_out.size(3)
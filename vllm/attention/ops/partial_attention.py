@@ -0,0 +1,121 @@
+"""Partial attention over a subset of the KV blocks and its merge.
+
+With sequence parallelism the KV cache of a long sequence is spread over
+the master worker and the SP workers. Every rank attends the decode query to
+the blocks it holds and returns its partial result as an attention state:
+the output normalized over its own blocks, the sum of the exponentiated
+logits and their max. The master merges the states of all ranks in one step
+with a log-sum-exp rescale, so only num_heads * (head_size + 2) values per
+sequence cross the network instead of the KV cache.
+
+These are reference PyTorch implementations that run on any device.
+`merge_attn_states` has the layout and semantics of the
+`sequence_block_reducer` CUDA kernel, and is used in its place off CUDA.
+"""
+from typing import Optional, Tuple
+
+import torch
+
+# Max logit of a rank holding no KV of a sequence. Finite like the -FLT_MAX
+# of the kernels, so that merging only empty states does not give NaNs.
+_EMPTY_MAX_LOGIT = torch.finfo(torch.float32).min
+
+
+def paged_partial_attention(
+    query: torch.Tensor,
+    key_cache: torch.Tensor,
+    value_cache: torch.Tensor,
+    block_tables: torch.Tensor,
+    seq_lens: torch.Tensor,
+    scale: float,
+    alibi_slopes: Optional[torch.Tensor] = None,
+    alibi_offsets: Optional[torch.Tensor] = None,
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Attends one decode query per sequence to the KV blocks of this rank.
+
+    Args:
+        query: shape = [num_seqs, num_heads, head_size]
+        key_cache: shape = [num_blocks, block_size, num_kv_heads, head_size]
+        value_cache: shape = [num_blocks, block_size, num_kv_heads, head_size]
+        block_tables: shape = [num_seqs, max_num_blocks_per_seq]. The blocks
+            of every sequence held by this rank.
+        seq_lens: shape = [num_seqs]. The number of tokens of every sequence
+            held by this rank, 0 if it holds none.
+        scale: softmax scale.
+        alibi_slopes: shape = [num_heads], optional.
+        alibi_offsets: shape = [num_seqs]. Position of the first token held
+            by this rank relative to the decode query, i.e. at most 0, in
+            every sequence. Defaults to this rank holding the last tokens.
+    Returns:
+        The attention state of this rank: the output of shape
+        [num_seqs, num_heads, head_size] normalized over the tokens of this
+        rank, and the exp sums and max logits of shape [num_seqs, num_heads].
+    """
+    num_seqs, num_heads, head_size = query.shape
+    block_size = key_cache.shape[1]
+    num_kv_heads = key_cache.shape[2]
+    num_queries_per_kv = num_heads // num_kv_heads
+
+    output = torch.zeros_like(query)
+    exp_sums = torch.zeros(num_seqs,
+                           num_heads,
+                           dtype=torch.float32,
+                           device=query.device)
+    max_logits = torch.full_like(exp_sums, _EMPTY_MAX_LOGIT)
+    for i in range(num_seqs):
+        seq_len = int(seq_lens[i])
+        if seq_len == 0:
+            continue
+        num_blocks = (seq_len + block_size - 1) // block_size
+        blocks = block_tables[i, :num_blocks]
+        # [seq_len, num_kv_heads, head_size]
+        keys = key_cache[blocks].flatten(0, 1)[:seq_len]
+        values = value_cache[blocks].flatten(0, 1)[:seq_len]
+        if num_queries_per_kv > 1:
+            keys = keys.repeat_interleave(num_queries_per_kv, dim=1)
+            values = values.repeat_interleave(num_queries_per_kv, dim=1)
+
+        # [num_heads, seq_len]
+        logits = scale * torch.einsum("hd,khd->hk", query[i].float(),
+                                      keys.float())
+        if alibi_slopes is not None:
+            offset = (1 - seq_len
+                      if alibi_offsets is None else int(alibi_offsets[i]))
+            positions = torch.arange(seq_len, device=query.device) + offset
+            logits += (alibi_slopes.float()[:, None] *
+                       positions.float()[None, :])
+        max_logit = logits.max(dim=-1).values
+        exps = torch.exp(logits - max_logit[:, None])
+        exp_sum = exps.sum(dim=-1)
+        output[i] = torch.einsum("hk,khd->hd", exps / exp_sum[:, None],
+                                 values.float()).to(output.dtype)
+        exp_sums[i] = exp_sum
+        max_logits[i] = max_logit
+    return output, exp_sums, max_logits
+
+
+def merge_attn_states(
+    tmp_out: torch.Tensor,
+    exp_sums: torch.Tensor,
+    max_logits: torch.Tensor,
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Merges the attention states of several ranks.
+
+    Args:
+        tmp_out: shape = [num_seqs, num_heads, num_partitions, head_size]
+        exp_sums: shape = [num_seqs, num_heads, num_partitions]
+        max_logits: shape = [num_seqs, num_heads, num_partitions]
+    Returns:
+        The merged attention state: the output of shape
+        [num_seqs, num_heads, head_size], and the exp sums and max logits of
+        shape [num_seqs, num_heads]. The merge is associative, so states can
+        also be folded in one at a time as they arrive, e.g. along a ring.
+    """
+    max_logit = max_logits.max(dim=-1).values
+    # Rescale every state to the global max logit.
+    rescaled_exp_sums = exp_sums * torch.exp(max_logits -
+                                             max_logit.unsqueeze(-1))
+    exp_sum = rescaled_exp_sums.sum(dim=-1)
+    weights = rescaled_exp_sums / (exp_sum.unsqueeze(-1) + 1e-6)
+    output = (tmp_out.float() * weights.unsqueeze(-1)).sum(dim=-2)
+    return output.to(tmp_out.dtype), exp_sum, max_logit
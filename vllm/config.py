@@ -26,6 +26,12 @@ logger = init_logger(__name__)
 
 _GB = 1 << 30
 _EMBEDDING_MODEL_MAX_NUM_BATCHED_TOKENS = 32768
+_BLOCK_MIGRATE_POLICIES = [
+    "onlyappend", "meanappend", "leastloaded", "affinity", "spill"
+]
+_BLOCK_MIGRATE_CONTROLLERS = ["static", "adaptive"]
+_PREFIX_CACHING_EVICTION_POLICIES = ["lru", "lfu", "cost_aware"]
+_BLOCK_RESERVATION_POLICIES = ["none", "max_tokens", "expected"]
 
 
 class ModelConfig:
@@ -390,6 +396,25 @@ class CacheConfig:
         cache_dtype: Data type for kv cache storage.
         num_gpu_blocks_override: Number of GPU blocks to use. This overrides the
             profiled num_gpu_blocks if specified. Does nothing if None.
+        block_migrate_policy: Placement policy used to choose the sequence
+            parallel rank that receives a migrated superblock.
+        block_migrate_budget: Maximum number of superblocks migrated to the
+            sequence parallel ranks in one step.
+        block_migrate_controller: Controller of the migration thresholds.
+            "static" always uses block_migrate_threshold/block_migrate_start,
+            "adaptive" scales them with the pressure on the local GPU blocks.
+        block_recall_watermark: Fraction of the local GPU blocks that must
+            stay free for migrated superblocks to be recalled from the
+            sequence parallel ranks. None disables the recall.
+        prefix_caching_eviction_policy: The policy evicting the cached
+            blocks of prefix caching: "lru", "lfu" or "cost_aware".
+        enable_cpu_prefix_cache: Whether the blocks evicted by prefix caching
+            are demoted to the CPU swap space and promoted back on a prefix
+            hit.
+        disk_prefix_cache_dir: The directory of the disk tier of prefix
+            caching, which keeps the cached blocks across restarts. None
+            disables it.
+        disk_prefix_cache_space: Size of the disk tier in GiB.
     """
 
     def __init__(
@@ -404,6 +429,14 @@ class CacheConfig:
         block_migrate_size: int = 1024,
         block_migrate_threshold: int = 6144,
         block_migrate_start: int = 4096,
+        block_migrate_policy: str = "onlyappend",
+        block_migrate_budget: int = 1,
+        block_migrate_controller: str = "static",
+        block_recall_watermark: Optional[float] = None,
+        prefix_caching_eviction_policy: str = "lru",
+        enable_cpu_prefix_cache: bool = False,
+        disk_prefix_cache_dir: Optional[str] = None,
+        disk_prefix_cache_space: float = 16,
     ) -> None:
         self.block_size = block_size
         self.gpu_memory_utilization = gpu_memory_utilization
@@ -412,6 +445,14 @@ class CacheConfig:
         self.cache_dtype = cache_dtype
         self.sliding_window = sliding_window
         self.enable_prefix_caching = enable_prefix_caching
+        self.block_migrate_policy = block_migrate_policy
+        self.block_migrate_budget = block_migrate_budget
+        self.block_migrate_controller = block_migrate_controller
+        self.block_recall_watermark = block_recall_watermark
+        self.prefix_caching_eviction_policy = prefix_caching_eviction_policy
+        self.enable_cpu_prefix_cache = enable_cpu_prefix_cache
+        self.disk_prefix_cache_dir = disk_prefix_cache_dir
+        self.disk_prefix_cache_space_bytes = int(disk_prefix_cache_space * _GB)
         self._verify_args()
         self._verify_cache_dtype()
         self._verify_prefix_caching()
@@ -420,6 +461,11 @@ class CacheConfig:
         self.num_gpu_blocks = None
         self.num_cpu_blocks = None
         self.num_remote_gpu_blocks = None
+        self.num_remote_cpu_blocks = None
+        # The directory of the disk tier for the model and its number of
+        # blocks. Set by the engine.
+        self.disk_prefix_cache_path: Optional[str] = None
+        self.num_disk_blocks = 0
 
         # 4096 tokens per chunk
 
@@ -438,6 +484,28 @@ class CacheConfig:
             raise ValueError(
                 "GPU memory utilization must be less than 1.0. Got "
                 f"{self.gpu_memory_utilization}.")
+        if self.block_migrate_policy not in _BLOCK_MIGRATE_POLICIES:
+            raise ValueError("Unknown block migrate policy: "
+                             f"{self.block_migrate_policy}. Must be one of "
+                             f"{_BLOCK_MIGRATE_POLICIES}.")
+        if self.block_migrate_budget < 1:
+            raise ValueError("block_migrate_budget must be at least 1. Got "
+                             f"{self.block_migrate_budget}.")
+        if self.block_migrate_controller not in _BLOCK_MIGRATE_CONTROLLERS:
+            raise ValueError(
+                "Unknown block migrate controller: "
+                f"{self.block_migrate_controller}. Must be one of "
+                f"{_BLOCK_MIGRATE_CONTROLLERS}.")
+        if (self.block_recall_watermark is not None
+                and not 0.0 <= self.block_recall_watermark < 1.0):
+            raise ValueError("block_recall_watermark must be in [0, 1). Got "
+                             f"{self.block_recall_watermark}.")
+        if (self.prefix_caching_eviction_policy
+                not in _PREFIX_CACHING_EVICTION_POLICIES):
+            raise ValueError(
+                "Unknown prefix caching eviction policy: "
+                f"{self.prefix_caching_eviction_policy}. Must be one of "
+                f"{_PREFIX_CACHING_EVICTION_POLICIES}.")
 
     def _verify_cache_dtype(self) -> None:
         if self.cache_dtype == "auto":
@@ -452,7 +520,16 @@ class CacheConfig:
             raise ValueError(f"Unknown kv cache dtype: {self.cache_dtype}")
 
     def _verify_prefix_caching(self) -> None:
+        if (self.disk_prefix_cache_dir is not None
+                and not self.enable_cpu_prefix_cache):
+            raise ValueError(
+                "The disk prefix cache loads the blocks through the CPU "
+                "prefix cache. Run with --enable-cpu-prefix-cache to use it.")
         if not self.enable_prefix_caching:
+            if self.enable_cpu_prefix_cache:
+                raise ValueError(
+                    "The CPU prefix cache requires prefix caching. Run with "
+                    "--enable-prefix-caching to use it.")
             return
 
         if self.sliding_window is not None:
@@ -742,6 +819,25 @@ class SchedulerConfig:
             swapping. However, when the sequence group has multiple sequences
             (e.g., beam search), recomputation is not currently supported. In
             such a case, we use swapping instead.
+        policy: The policy that orders the requests of the scheduler queues:
+            "fcfs", "priority", "deadline" (earliest deadline first) or "sjf"
+            (shortest predicted job first).
+        tenant_quotas: The quotas of the tenants the scheduler shares its
+            budget between, keyed by `SamplingParams.tenant_id`, with the
+            quota of all other tenants under "*". A quota takes the keys
+            "weight", "max_num_seqs", "token_rate" and "burst_tokens", see
+            `vllm.core.fair_share.TenantQuota`. If None, the requests are
+            scheduled regardless of their tenant.
+        target_step_latency_ms: With chunked prefill, the prefill chunks are
+            sized so that the predicted time of every step stays within this
+            many milliseconds, see `vllm.core.step_cost_model`. If None, the
+            prefills fill the token budget.
+        block_reservation_policy: The forecast of the blocks the running and
+            swapped sequences still need, which new prompts are not admitted
+            into: "none", "max_tokens" (every sequence runs until its
+            max_tokens) or "expected" (the expected output length estimated
+            online, bounded by max_tokens), see
+            `vllm.core.block_reservation`.
     """
 
     def __init__(self,
@@ -753,7 +849,11 @@ class SchedulerConfig:
                  delay_factor: float = 0.0,
                  enable_chunked_prefill: bool = False,
                  embedding_mode: Optional[bool] = False,
-                 preemption_mode: Optional[str] = None) -> None:
+                 preemption_mode: Optional[str] = None,
+                 policy: str = "fcfs",
+                 tenant_quotas: Optional[Dict[str, Dict]] = None,
+                 target_step_latency_ms: Optional[float] = None,
+                 block_reservation_policy: str = "none") -> None:
         if max_num_batched_tokens is not None:
             self.max_num_batched_tokens = max_num_batched_tokens
         else:
@@ -780,6 +880,10 @@ class SchedulerConfig:
         self.chunked_prefill_enabled = enable_chunked_prefill
         self.embedding_mode = embedding_mode
         self.preemption_mode = preemption_mode
+        self.policy = policy
+        self.tenant_quotas = tenant_quotas
+        self.target_step_latency_ms = target_step_latency_ms
+        self.block_reservation_policy = block_reservation_policy
 
         self._verify_args()
 
@@ -806,6 +910,36 @@ class SchedulerConfig:
                 f"({self.num_lookahead_slots}) must be greater than or "
                 "equal to 0.")
 
+        if self.policy not in ("fcfs", "priority", "deadline", "sjf"):
+            raise ValueError(
+                f"Unknown scheduling policy {self.policy}. Must be one of "
+                "fcfs, priority, deadline or sjf.")
+
+        for tenant_id, quota in (self.tenant_quotas or {}).items():
+            unknown_keys = set(quota) - {
+                "weight", "max_num_seqs", "token_rate", "burst_tokens"
+            }
+            if unknown_keys:
+                raise ValueError(
+                    f"Unknown keys {sorted(unknown_keys)} in the quota of "
+                    f"tenant {tenant_id}. Must be weight, max_num_seqs, "
+                    "token_rate or burst_tokens.")
+
+        if self.target_step_latency_ms is not None:
+            if not self.chunked_prefill_enabled:
+                raise ValueError(
+                    "target_step_latency_ms requires chunked prefill.")
+            if self.target_step_latency_ms <= 0:
+                raise ValueError(
+                    "target_step_latency_ms must be positive. Got "
+                    f"{self.target_step_latency_ms}.")
+
+        if self.block_reservation_policy not in _BLOCK_RESERVATION_POLICIES:
+            raise ValueError(
+                "Unknown block reservation policy "
+                f"{self.block_reservation_policy}. Must be one of "
+                f"{_BLOCK_RESERVATION_POLICIES}.")
+
 
 class DeviceConfig:
 
@@ -9,6 +9,7 @@ from vllm.core.block.common import (CopyOnWriteTracker,
 from vllm.core.block.interfaces import Block, BlockAllocator, BlockId, Device
 from vllm.core.block.naive_block import NaiveBlock, NaiveBlockAllocator
 from vllm.core.evictor_v2 import EvictionPolicy, Evictor, make_evictor
+from vllm.sequence import hash_block_tokens
 from vllm.utils import cdiv
 
 PrefixHash = int
@@ -685,7 +686,7 @@ class PrefixCachingBlock(Block):
         - int: The computed hash value for the block.
         """
         assert (prev_block_hash is None) == is_first_block
-        return hash((is_first_block, prev_block_hash, *cur_block_token_ids))
+        return hash_block_tokens(prev_block_hash, cur_block_token_ids)
 
 
 def assert_prefix_caching_block_or_none(block: Optional[Block]):
@@ -1,17 +1,20 @@
 """A block manager that manages token blocks."""
-import enum
+import heapq
 import math
 from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
 from itertools import count, takewhile
 from os.path import commonprefix
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional
 from typing import Sequence as GenericSequence
 from typing import Set, Tuple
 
 from vllm.block import BlockTable, PhysicalTokenBlock
 from vllm.core.block.utils import check_no_caching_or_swa_for_blockmgr_encdec
+from vllm.core.disk_block_index import DiskBlockIndex
 from vllm.core.evictor_v1 import EvictionPolicy, Evictor, make_evictor
 from vllm.core.interfaces import AllocStatus, BlockSpaceManager
+from vllm.core.placement import Placement, SelectionPolicy, make_placement
 from vllm.logger import init_logger
 from vllm.sequence import Sequence, SequenceGroup, SequenceStatus
 from vllm.utils import Device
@@ -72,14 +75,20 @@ class CachedBlockAllocator(BlockAllocatorBase):
     The allocator maintains a list of free blocks and allocates a block when
     requested. When a block is freed, its reference count is decremented. If
     the reference count becomes zero, the block is added back to the free list.
+
+    `evict_callback` is called with every evicted block before it is reused,
+    while it still holds the hash and the computed state of its old content.
     """
 
-    def __init__(self,
-                 device: Device,
-                 block_size: int,
-                 num_blocks: int,
-                 blocks_for_migrate: int = 0,
-                 eviction_policy: EvictionPolicy = EvictionPolicy.LRU) -> None:
+    def __init__(
+        self,
+        device: Device,
+        block_size: int,
+        num_blocks: int,
+        blocks_for_migrate: int = 0,
+        eviction_policy: EvictionPolicy = EvictionPolicy.LRU,
+        evict_callback: Optional[Callable[[PhysicalTokenBlock], None]] = None
+    ) -> None:
         self.device = device
         self.block_size = block_size
         self.num_blocks = num_blocks - blocks_for_migrate
@@ -88,6 +97,7 @@ class CachedBlockAllocator(BlockAllocatorBase):
         self.cached_blocks: Dict[int, PhysicalTokenBlock] = {}
 
         self.evictor: Evictor = make_evictor(eviction_policy)
+        self.evict_callback = evict_callback
 
         self.default_hash_ctr = count()
 
@@ -95,6 +105,9 @@ class CachedBlockAllocator(BlockAllocatorBase):
                        num_hashed_tokens: int) -> PhysicalTokenBlock:
         if self.current_num_blocks == self.num_blocks:
             block = self.evictor.evict()
+            if self.evict_callback is not None:
+                self.evict_callback(block)
+            block.computed = False
             block.block_hash = block_hash
             block.num_hashed_tokens = num_hashed_tokens
             return block
@@ -171,37 +184,55 @@ class UncachedBlockAllocator(BlockAllocatorBase):
     The allocator maintains a list of free blocks and allocates a block when
     requested. When a block is freed, its reference count is decremented. If
     the reference count becomes zero, the block is added back to the free list.
+
+    The block objects are created on their first allocation, so that building
+    an allocator of many blocks is cheap. The free blocks are a stack: the
+    block freed last is allocated first, and the blocks that were never
+    allocated go by block number after all freed blocks.
     """
 
     def __init__(self,
                  device: Device,
                  block_size: int,
                  num_blocks: int,
-                 remote_rank: Optional[int] = 0) -> None:
+                 remote_rank: Optional[int] = 0,
+                 blocks_for_migrate: int = 0) -> None:
         self.device = device
         self.block_size = block_size
-        self.num_blocks = num_blocks
+        self.num_blocks = num_blocks - blocks_for_migrate
+        self.blocks_for_migrate = blocks_for_migrate
         self.remote_rank = 0 if remote_rank is None else remote_rank
-        # Initialize the free blocks.
+        # The blocks from this block number on were never allocated, and
+        # have no block object yet.
+        self.next_block_number = 0
+        # The freed blocks, allocated last in first out.
         self.free_blocks: BlockTable = []
-        for i in range(num_blocks):
-            block = PhysicalTokenBlock(device=device,
-                                       block_number=i,
-                                       block_size=block_size,
-                                       block_hash=-1,
-                                       num_hashed_tokens=0,
-                                       remote_rank=self.remote_rank)
-            self.free_blocks.append(block)
 
     def allocate(self,
                  block_hash: Optional[int] = None,
                  num_hashed_tokens: int = 0) -> PhysicalTokenBlock:
-        if not self.free_blocks:
+        if self.free_blocks:
+            block = self.free_blocks.pop()
+        elif self.next_block_number < self.num_blocks:
+            block = PhysicalTokenBlock(device=self.device,
+                                       block_number=self.next_block_number,
+                                       block_size=self.block_size,
+                                       block_hash=-1,
+                                       num_hashed_tokens=0,
+                                       remote_rank=self.remote_rank)
+            self.next_block_number += 1
+        else:
             raise ValueError("Out of memory! No free blocks are available.")
-        block = self.free_blocks.pop(0)
         block.ref_count = 1
         return block
 
+    def allocate_blocks(self, num_blocks: int) -> BlockTable:
+        """Allocates `num_blocks` blocks. Allocates none if there are not
+        enough free blocks."""
+        if num_blocks > self.get_num_free_blocks():
+            raise ValueError("Out of memory! No free blocks are available.")
+        return [self.allocate() for _ in range(num_blocks)]
+
     def free(self, block: PhysicalTokenBlock) -> None:
         if block.ref_count == 0:
             raise ValueError(f"Double free! {block} is already freed.")
@@ -210,7 +241,8 @@ class UncachedBlockAllocator(BlockAllocatorBase):
             self.free_blocks.append(block)
 
     def get_num_free_blocks(self) -> int:
-        return len(self.free_blocks)
+        return (self.num_blocks - self.next_block_number +
+                len(self.free_blocks))
 
     def get_num_total_blocks(self) -> int:
         return self.num_blocks
@@ -224,20 +256,146 @@ class UncachedBlockAllocator(BlockAllocatorBase):
             "Invalid codepath for uncached block allocator.")
 
     def get_migrate_blocks(self) -> List[int]:
-        raise NotImplementedError(
-            "Invalid codepath for uncached block allocator.")
+        return list(
+            range(self.num_blocks, self.num_blocks + self.blocks_for_migrate))
+
+
+class SuperBlockAllocator(UncachedBlockAllocator):
+    """Manages the GPU blocks of an SP rank, allocated by whole superblocks.
+
+    The KV migration writes a superblock to a chunk of `chunk_blocks`
+    blocks, chunk i holding blocks i * chunk_blocks to
+    (i + 1) * chunk_blocks - 1, and reports it by its chunk index. So the
+    blocks of a superblock must be a whole chunk, in ascending order,
+    whatever order its blocks were freed in. The free blocks are kept per
+    chunk, and a superblock takes the lowest chunk whose blocks are all
+    free. The single blocks of a swap in come from the chunks that are
+    already partly used when there are some, so the free chunks stay whole,
+    and else from the lowest whole chunk in ascending order, so a superblock
+    swapped in to a whole chunk can be recalled. The blocks after the last
+    whole chunk are not used.
+    """
 
+    def __init__(self, device: Device, block_size: int, num_blocks: int,
+                 remote_rank: int, chunk_blocks: int) -> None:
+        super().__init__(device, block_size,
+                         num_blocks // chunk_blocks * chunk_blocks,
+                         remote_rank)
+        self.chunk_blocks = chunk_blocks
+        self.num_chunks = num_blocks // chunk_blocks
+        # The chunks from this index on were never used, and have no block
+        # objects yet.
+        self.next_chunk = 0
+        # Mapping: chunk index -> its free blocks, in descending order if the
+        # chunk is whole.
+        self.chunk_free_blocks: Dict[int, BlockTable] = {}
+        # The chunks whose blocks are all free, as a heap that may hold
+        # chunks that are no longer whole, checked when popped.
+        self.free_chunks: List[int] = []
+        self.partial_chunks: Set[int] = set()
+        self.num_free_chunks = self.num_chunks
+        self.num_free_blocks = self.num_blocks
+
+    def _pop_free_chunk(self) -> Optional[int]:
+        while self.free_chunks:
+            chunk = heapq.heappop(self.free_chunks)
+            if len(self.chunk_free_blocks[chunk]) == self.chunk_blocks:
+                return chunk
+        if self.next_chunk < self.num_chunks:
+            chunk = self.next_chunk
+            self.next_chunk += 1
+            self.chunk_free_blocks[chunk] = [
+                PhysicalTokenBlock(device=self.device,
+                                   block_number=block_number,
+                                   block_size=self.block_size,
+                                   block_hash=-1,
+                                   num_hashed_tokens=0,
+                                   remote_rank=self.remote_rank)
+                for block_number in reversed(
+                    range(chunk * self.chunk_blocks, (chunk + 1) *
+                          self.chunk_blocks))
+            ]
+            return chunk
+        return None
 
-class SelectionPolicy(enum.Enum):
-    """Enum for eviction policy used by make_evictor to instantiate the correct
-       Evictor subclass.
-    """
-    LRU = enum.auto()
-    ONLYAPPEND = enum.auto()
-    MEANAPPEND = enum.auto()
+    def allocate(self,
+                 block_hash: Optional[int] = None,
+                 num_hashed_tokens: int = 0) -> PhysicalTokenBlock:
+        if self.partial_chunks:
+            chunk = next(iter(self.partial_chunks))
+        else:
+            chunk = self._pop_free_chunk()
+            if chunk is None:
+                raise ValueError(
+                    "Out of memory! No free blocks are available.")
+            self.num_free_chunks -= 1
+        free_blocks = self.chunk_free_blocks[chunk]
+        block = free_blocks.pop()
+        if free_blocks:
+            self.partial_chunks.add(chunk)
+        else:
+            self.partial_chunks.discard(chunk)
+        self.num_free_blocks -= 1
+        block.ref_count = 1
+        return block
+
+    def allocate_blocks(self, num_blocks: int) -> BlockTable:
+        """Allocates the blocks of the lowest free chunk, in ascending
+        order."""
+        if num_blocks != self.chunk_blocks:
+            raise ValueError(f"Superblocks have {self.chunk_blocks} blocks, "
+                             f"not {num_blocks}.")
+        chunk = self._pop_free_chunk()
+        if chunk is None:
+            raise ValueError("Out of memory! No free blocks are available.")
+        blocks = sorted(self.chunk_free_blocks[chunk],
+                        key=lambda block: block.block_number)
+        self.chunk_free_blocks[chunk] = []
+        self.num_free_chunks -= 1
+        self.num_free_blocks -= num_blocks
+        for block in blocks:
+            block.ref_count = 1
+        return blocks
+
+    def free(self, block: PhysicalTokenBlock) -> None:
+        if block.ref_count == 0:
+            raise ValueError(f"Double free! {block} is already freed.")
+        block.ref_count -= 1
+        if block.ref_count > 0:
+            return
+        chunk = block.block_number // self.chunk_blocks
+        free_blocks = self.chunk_free_blocks[chunk]
+        free_blocks.append(block)
+        self.num_free_blocks += 1
+        if len(free_blocks) == self.chunk_blocks:
+            free_blocks.sort(key=lambda block: block.block_number,
+                             reverse=True)
+            self.partial_chunks.discard(chunk)
+            heapq.heappush(self.free_chunks, chunk)
+            self.num_free_chunks += 1
+        else:
+            self.partial_chunks.add(chunk)
+
+    def get_num_free_blocks(self) -> int:
+        return self.num_free_blocks
+
+    def get_num_free_chunks(self) -> int:
+        return self.num_free_chunks
 
 
 class RemoteAllocator:
+    """Manages the free blocks of the sequence parallel ranks.
+
+    Every SP rank has its own UncachedBlockAllocator. The rank that receives a
+    migrated superblock is chosen by a pluggable Placement policy.
+
+    Every SP rank also has its own CPU swap space, so that the remote blocks
+    of a preempted sequence can be swapped out without involving the master.
+
+    With `superblock_blocks`, the GPU blocks of the SP ranks are allocated by
+    whole chunks of a SuperBlockAllocator, and the placement sees the blocks
+    of the free chunks only.
+    """
 
     def __init__(
         self,
@@ -245,62 +403,85 @@ class RemoteAllocator:
         num_gpu_blocks: int,
         remote_allocator: int,
         selection_policy: SelectionPolicy = SelectionPolicy.ONLYAPPEND,
+        num_cpu_blocks: int = 0,
+        superblock_blocks: int = 0,
     ) -> None:
         self.block_size = block_size
         self.num_gpu_blocks = num_gpu_blocks
         self.remote_allocator = remote_allocator
+        self.superblock_blocks = superblock_blocks
         self.selection_policy = selection_policy
-        self.last_used_rank = 1
-        self.allocator_group = []
+        self.placement: Placement = make_placement(selection_policy,
+                                                   remote_allocator,
+                                                   num_gpu_blocks)
+        self.allocator_group: List[UncachedBlockAllocator] = []
         for i in range(0, self.remote_allocator):
-            allocator = UncachedBlockAllocator(Device.GPU, self.block_size,
-                                               self.num_gpu_blocks, i + 1)
+            if self.superblock_blocks > 0:
+                allocator = SuperBlockAllocator(Device.GPU, self.block_size,
+                                                self.num_gpu_blocks, i + 1,
+                                                self.superblock_blocks)
+            else:
+                allocator = UncachedBlockAllocator(Device.GPU, self.block_size,
+                                                   self.num_gpu_blocks, i + 1)
             self.allocator_group.append(allocator)
+        self.num_cpu_blocks = num_cpu_blocks
+        self.cpu_allocator_group = [
+            UncachedBlockAllocator(Device.CPU, self.block_size,
+                                   self.num_cpu_blocks, i + 1)
+            for i in range(self.remote_allocator)
+        ]
 
-    def get_used_rank(self, block_number: int) -> int:
-        used_rank = self.last_used_rank
-        onlyappend = self.selection_policy == SelectionPolicy.ONLYAPPEND
-        meanappend = self.selection_policy == SelectionPolicy.MEANAPPEND
-        if onlyappend or meanappend:
-            if self.selection_policy == SelectionPolicy.MEANAPPEND:
-                used_rank = used_rank % self.remote_allocator + 1
-            find = False
-            total_number = self.remote_allocator
-            while not find:
-                allocator = self.allocator_group[used_rank - 1]
-                free_block = allocator.get_num_free_blocks()
-                if free_block > block_number:
-                    find = True
-                else:
-                    used_rank = used_rank % total_number + 1
-                    if used_rank == self.last_used_rank:
-                        break
-            if not find:
-                raise ValueError("No Enough Free blocks!")
-        # need to add more selection_policy handler
-        else:
-            used_rank = used_rank
-        self.last_used_rank = used_rank
+    def _select_rank(self, block_number: int,
+                     seq_id: Optional[int]) -> Optional[int]:
+        free_blocks = [
+            allocator.get_num_free_chunks() * self.superblock_blocks
+            if isinstance(allocator, SuperBlockAllocator) else
+            allocator.get_num_free_blocks()
+            for allocator in self.allocator_group
+        ]
+        return self.placement.select_rank(block_number, free_blocks, seq_id)
+
+    def can_allocate(self,
+                     block_number: int,
+                     seq_id: Optional[int] = None) -> bool:
+        return self._select_rank(block_number, seq_id) is not None
+
+    def get_used_rank(self,
+                      block_number: int,
+                      seq_id: Optional[int] = None) -> int:
+        used_rank = self._select_rank(block_number, seq_id)
+        if used_rank is None:
+            raise ValueError("No Enough Free blocks!")
+        self.placement.on_allocate(used_rank, seq_id)
         return used_rank
 
-    def allocate(self, block_number: int) -> List[PhysicalTokenBlock]:
-        used_rank = self.get_used_rank(block_number)
-        allocator = self.allocator_group[used_rank - 1]
-        blocks = []
-        for i in range(0, block_number):
-            block = allocator.allocate()
-            blocks.append(block)
-        return blocks
+    def allocate(self,
+                 block_number: int,
+                 seq_id: Optional[int] = None) -> List[PhysicalTokenBlock]:
+        used_rank = self.get_used_rank(block_number, seq_id)
+        return self.allocator_group[used_rank -
+                                    1].allocate_blocks(block_number)
+
+    def get_rank_allocator(self, remote_rank: int,
+                           device: Device) -> BlockAllocatorBase:
+        """Returns the GPU or CPU allocator of an SP rank."""
+        if device == Device.CPU:
+            return self.cpu_allocator_group[remote_rank - 1]
+        return self.allocator_group[remote_rank - 1]
+
+    def get_allocator(self, block: PhysicalTokenBlock) -> BlockAllocatorBase:
+        return self.get_rank_allocator(block.remote_rank, block.device)
 
     def free_group(self, block_group: List[PhysicalTokenBlock]) -> None:
         for block in block_group:
             if block.remote_rank != 0:
-                allocator = self.allocator_group[block.remote_rank - 1]
-                allocator.free(block)
+                self.get_allocator(block).free(block)
 
     def free(self, block: PhysicalTokenBlock) -> None:
-        allocator = self.allocator_group[block.remote_rank - 1]
-        allocator.free(block)
+        self.get_allocator(block).free(block)
+
+    def free_seq(self, seq_id: int) -> None:
+        self.placement.forget(seq_id)
 
     def get_num_free_blocks(self, remote_rank: int = 0) -> int:
         if self.remote_allocator == 0:
@@ -320,8 +501,38 @@ class RemoteAllocator:
             total_blocks += allocator.get_num_total_blocks()
         return total_blocks
 
+    def get_num_free_cpu_blocks(self, remote_rank: int) -> int:
+        return self.cpu_allocator_group[remote_rank - 1].get_num_free_blocks()
+
+
+class BlockTableSegment:
+    """Blocks shared by the block tables of forked sequences.
+
+    When a sequence is forked, the blocks whose tokens the parent and the
+    child have in common and will not write to again become a segment. The
+    segment holds one reference to each of its blocks, however many block
+    tables share it, and is itself referenced by the sequences and by the
+    segments of later forks. A fork then only references the segment instead
+    of every block.
+
+    The segments of a sequence form a chain from its last segment, covering
+    the first `end` blocks of its block table.
+    """
+
+    __slots__ = ("blocks", "parent", "end", "ref_count")
+
+    def __init__(self, blocks: BlockTable,
+                 parent: Optional["BlockTableSegment"], end: int) -> None:
+        self.blocks = blocks
+        self.parent = parent
+        self.end = end
+        self.ref_count = 1
+
 
 class SequenceSuperBlock:
+    """A superblock of a sequence, `block_size` tokens from token `start`."""
+
+    __slots__ = ("seq_id", "block_size", "start")
 
     def __init__(self, seq_id: int, block_size: int, start: int) -> None:
         self.seq_id = seq_id
@@ -329,6 +540,56 @@ class SequenceSuperBlock:
         self.start = start
 
 
+class SuperBlockQueue:
+    """FIFO queue of the superblocks waiting to be migrated.
+
+    The superblocks are also indexed by sequence, so dropping the superblocks
+    of a sequence costs O(its superblocks) instead of a scan of the queue,
+    and pushing, popping and removing a superblock are O(1).
+    """
+
+    __slots__ = ("_queue", "_seq_index")
+
+    def __init__(self) -> None:
+        # Mapping: (seq_id, start) -> SequenceSuperBlock, in FIFO order.
+        self._queue: "OrderedDict[Tuple[int, int], SequenceSuperBlock]" = (
+            OrderedDict())
+        # Mapping: seq_id -> starts of its queued superblocks.
+        self._seq_index: Dict[int, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def __iter__(self) -> Iterator[SequenceSuperBlock]:
+        return iter(self._queue.values())
+
+    def __contains__(self, key: Tuple[int, int]) -> bool:
+        return key in self._queue
+
+    def push(self, superblock: SequenceSuperBlock) -> None:
+        key = (superblock.seq_id, superblock.start)
+        if key in self._queue:
+            return
+        self._queue[key] = superblock
+        self._seq_index.setdefault(superblock.seq_id,
+                                   set()).add(superblock.start)
+
+    def peek(self) -> SequenceSuperBlock:
+        return next(iter(self._queue.values()))
+
+    def pop(self) -> SequenceSuperBlock:
+        (seq_id, start), superblock = self._queue.popitem(last=False)
+        starts = self._seq_index[seq_id]
+        starts.discard(start)
+        if not starts:
+            del self._seq_index[seq_id]
+        return superblock
+
+    def remove_seq(self, seq_id: int) -> None:
+        for start in self._seq_index.pop(seq_id, ()):
+            del self._queue[(seq_id, start)]
+
+
 class BlockSpaceManagerV1(BlockSpaceManager):
     """Manages the mapping between logical and physical token blocks."""
 
@@ -345,14 +606,27 @@ class BlockSpaceManagerV1(BlockSpaceManager):
         block_migrate_size: Optional[int] = 0,
         block_migrate_threshold: Optional[int] = 8192,
         block_migrate_start: Optional[int] = 4096,
+        block_migrate_policy: Optional[str] = "onlyappend",
+        block_migrate_budget: Optional[int] = 1,
+        block_recall_watermark: Optional[float] = None,
+        num_remote_cpu_blocks: Optional[int] = 0,
+        eviction_policy: EvictionPolicy = EvictionPolicy.LRU,
+        enable_cpu_prefix_cache: bool = False,
+        disk_prefix_cache_path: Optional[str] = None,
+        num_disk_blocks: int = 0,
     ) -> None:
         self.block_size = block_size
-        self.num_total_gpu_blocks = num_gpu_blocks
         self.num_total_cpu_blocks = num_cpu_blocks
 
         if enable_caching and sliding_window is not None:
             raise NotImplementedError(
                 "Sliding window is not allowed with prefix caching enabled!")
+        if enable_cpu_prefix_cache and not enable_caching:
+            raise ValueError(
+                "The CPU prefix cache tier requires prefix caching enabled!")
+        if disk_prefix_cache_path is not None and not enable_cpu_prefix_cache:
+            raise ValueError(
+                "The disk prefix cache tier requires the CPU tier enabled!")
 
         self.block_sliding_window = None
         if sliding_window is not None:
@@ -365,21 +639,7 @@ class BlockSpaceManagerV1(BlockSpaceManager):
 
         self.enable_caching = enable_caching
 
-        self.watermark_blocks = int(watermark * num_gpu_blocks)
-
-        if self.enable_caching:
-            logger.info("Automatic prefix caching is enabled.")
-            self.gpu_allocator: BlockAllocatorBase = CachedBlockAllocator(
-                Device.GPU, block_size, num_gpu_blocks)
-            self.cpu_allocator: BlockAllocatorBase = CachedBlockAllocator(
-                Device.CPU, block_size, num_cpu_blocks)
-        else:
-            self.gpu_allocator = UncachedBlockAllocator(
-                Device.GPU, block_size, num_gpu_blocks)
-            self.cpu_allocator = UncachedBlockAllocator(
-                Device.CPU, block_size, num_cpu_blocks)
         # used for kv cache migrate
-
         if block_migrate_size is not None:
             self.block_migrate_size = block_migrate_size
         else:
@@ -400,17 +660,134 @@ class BlockSpaceManagerV1(BlockSpaceManager):
             self.remote_allocator_number = remote_allocator_number
         else:
             self.remote_allocator_number = 0
-        self.remote_allocator = RemoteAllocator(block_size,
-                                                self.num_remote_blocks,
-                                                self.remote_allocator_number,
-                                                SelectionPolicy.ONLYAPPEND)
-        self.migrate_list: List[SequenceSuperBlock]
+        if block_migrate_policy is None:
+            block_migrate_policy = "onlyappend"
+        self.block_migrate_budget = (1 if block_migrate_budget is None else
+                                     block_migrate_budget)
+        self.superblock_blocks = self.block_migrate_size // block_size
+
+        # The tail of the local GPU pool stages the superblocks migrated in one
+        # step, so it is reserved only when there are SP ranks to migrate to.
+        blocks_for_migrate = 0
+        if (self.remote_allocator_number > 0 and self.num_remote_blocks > 0
+                and self.superblock_blocks > 0):
+            blocks_for_migrate = (self.block_migrate_budget *
+                                  self.superblock_blocks)
+        self.num_total_gpu_blocks = num_gpu_blocks - blocks_for_migrate
+
+        self.watermark_blocks = int(watermark * self.num_total_gpu_blocks)
+        # Migrated superblocks are recalled while more than this number of
+        # local GPU blocks stays free. None disables the recall.
+        self.recall_watermark_blocks: Optional[int] = None
+        if block_recall_watermark is not None and blocks_for_migrate > 0:
+            self.recall_watermark_blocks = int(block_recall_watermark *
+                                               self.num_total_gpu_blocks)
+
+        # The CPU tier of prefix caching. The computed GPU blocks evicted by
+        # prefix caching are demoted to the CPU blocks, which are evicted by
+        # the CPU allocator in turn, and promoted back on a prefix hit.
+        self.enable_cpu_prefix_cache = enable_cpu_prefix_cache
+        # (GPU block, CPU block) numbers of the demoted blocks and (CPU block,
+        # GPU block) numbers of the promoted blocks, since the last call to
+        # get_prefix_cache_swaps.
+        self.demoted_blocks: List[Tuple[int, int]] = []
+        self.promoted_blocks: List[Tuple[int, int]] = []
+        # The CPU blocks swapped to or from in this step and in the last step.
+        # They are held until the swaps ran, so that they are not reused by a
+        # swap of the same step.
+        self.pinned_cpu_blocks: List[PhysicalTokenBlock] = []
+        self.last_pinned_cpu_blocks: List[PhysicalTokenBlock] = []
+        # The disk tier of prefix caching. It holds the blocks copied to the
+        # CPU tier, and the reused GPU blocks, so that they survive a restart.
+        # Its blocks are loaded to the CPU tier and promoted from there.
+        self.disk_index: Optional[DiskBlockIndex] = None
+        if disk_prefix_cache_path is not None:
+            self.disk_index = DiskBlockIndex(disk_prefix_cache_path,
+                                             num_disk_blocks)
+        # (disk slot, CPU block) numbers of the loaded blocks and (CPU block,
+        # disk slot) numbers of the spilled blocks, since the last call to
+        # get_disk_prefix_cache_transfers.
+        self.loaded_blocks: List[Tuple[int, int]] = []
+        self.spilled_blocks: List[Tuple[int, int]] = []
+        # The full prompt blocks looked up in the prefix cache and the hits of
+        # every tier, since the last call to get_prefix_cache_stats.
+        self.prefix_cache_tiers = ["gpu"]
+        if enable_cpu_prefix_cache:
+            self.prefix_cache_tiers.append("cpu")
+        if self.disk_index is not None:
+            self.prefix_cache_tiers.append("disk")
+        self.prefix_cache_num_queries = 0
+        self.prefix_cache_num_hits = dict.fromkeys(self.prefix_cache_tiers, 0)
+
+        if self.enable_caching:
+            logger.info("Automatic prefix caching is enabled.")
+            self.gpu_allocator: BlockAllocatorBase = CachedBlockAllocator(
+                Device.GPU,
+                block_size,
+                num_gpu_blocks,
+                blocks_for_migrate,
+                eviction_policy,
+                evict_callback=(self._demote_block
+                                if enable_cpu_prefix_cache else None))
+            self.cpu_allocator: BlockAllocatorBase = CachedBlockAllocator(
+                Device.CPU,
+                block_size,
+                num_cpu_blocks,
+                eviction_policy=eviction_policy)
+        else:
+            self.gpu_allocator = UncachedBlockAllocator(
+                Device.GPU,
+                block_size,
+                num_gpu_blocks,
+                blocks_for_migrate=blocks_for_migrate)
+            self.cpu_allocator = UncachedBlockAllocator(
+                Device.CPU, block_size, num_cpu_blocks)
+
+        self.remote_allocator = RemoteAllocator(
+            block_size, self.num_remote_blocks, self.remote_allocator_number,
+            SelectionPolicy[block_migrate_policy.upper()],
+            num_remote_cpu_blocks or 0, self.superblock_blocks)
+        # Superblocks waiting to be migrated, in FIFO order.
+        self.migrate_list = SuperBlockQueue()
+        # Mapping: seq_id -> start of the next superblock to queue. All the
+        # superblocks before it are queued, in flight or migrated.
+        self.migrate_cursors: Dict[int, int] = {}
+        # Mapping: seq_id -> superblocks whose migration was issued in the
+        # last step, with their remote blocks. The block tables still point
+        # to the local blocks until commit_kvcache_migrate_blocks.
+        self.inflight_migrations: Dict[int, List[Tuple[
+            SequenceSuperBlock, List[PhysicalTokenBlock]]]] = {}
+        # Mapping: seq_id -> superblocks that live on the SP ranks, in
+        # migration order.
+        self.migrated_superblocks: Dict[int, List[SequenceSuperBlock]] = {}
+        # Mapping: seq_id -> migrated superblocks of the swapped out
+        # sequences, which are recall candidates again once swapped in.
+        self.swapped_superblocks: Dict[int, List[SequenceSuperBlock]] = {}
+        # Mapping: seq_id -> superblocks whose recall was issued in the last
+        # step, with the local blocks they are received into. The block
+        # tables still point to the remote blocks until
+        # commit_kvcache_migrate_blocks.
+        self.inflight_recalls: Dict[int, List[Tuple[
+            SequenceSuperBlock, List[PhysicalTokenBlock]]]] = {}
         # Mapping: seq_id -> BlockTable.
         self.block_tables: Dict[int, BlockTable] = {}
         # Mapping: req_id -> BlockTable
         # Note that each SequenceGroup has a unique
         # request ID
         self.cross_block_tables: Dict[str, BlockTable] = {}
+        # The block numbers and remote ranks of the block tables, as returned
+        # by get_block_table and get_block_table_remote_rank. They are
+        # updated from the first block that changed since they were last
+        # read, so that a decode step does not walk every block of every
+        # sequence. Mapping: seq_id -> (block numbers, remote ranks).
+        self._block_ids: Dict[int, Tuple[List[int], List[int]]] = {}
+        # Mapping: seq_id -> index of the first block changed since the block
+        # ids were last read.
+        self._block_ids_dirty: Dict[int, int] = {}
+        # Mapping: seq_id -> last segment of the blocks the sequence shares
+        # with the sequences it was forked from or to. The blocks after the
+        # segment are referenced by the sequence itself.
+        self._seq_segments: Dict[int, BlockTableSegment] = {}
 
     def _get_seq_num_required_blocks(self, seq: Sequence) -> int:
         return 0 if seq is None else seq.n_blocks
@@ -458,9 +835,12 @@ class BlockSpaceManagerV1(BlockSpaceManager):
                 # Set the reference counts of the token blocks.
                 block.ref_count = ref_count
             elif not is_encoder_decoder and self.enable_caching:
-                block = self.gpu_allocator.allocate(
-                    seq.hash_of_block(logical_idx),
-                    seq.num_hashed_tokens_of_block(logical_idx))
+                # Only the blocks that extend a cached prefix are worth
+                # promoting, the prefill recomputes the blocks after a miss.
+                block = self._allocate_cached_block(
+                    seq,
+                    logical_idx,
+                    promote=not block_table or block_table[-1].computed)
             else:
                 block = self.gpu_allocator.allocate()
                 # Set the reference counts of the token blocks.
@@ -469,6 +849,151 @@ class BlockSpaceManagerV1(BlockSpaceManager):
 
         return block_table
 
+    def _allocate_cached_block(self, seq: Sequence, logical_idx: int,
+                               promote: bool) -> PhysicalTokenBlock:
+        """Allocates a prompt block by its hash, from the GPU prefix cache,
+        or promoted from the CPU tier if it is cached there."""
+        block_hash = seq.hash_of_block(logical_idx)
+        num_hashed_tokens = seq.num_hashed_tokens_of_block(logical_idx)
+        is_full = num_hashed_tokens <= seq.get_len()
+        if is_full:
+            self.prefix_cache_num_queries += 1
+        if self.gpu_allocator.contains_block(block_hash):
+            if is_full:
+                self.prefix_cache_num_hits["gpu"] += 1
+            block = self.gpu_allocator.allocate(block_hash, num_hashed_tokens)
+            if (self.disk_index is not None and block.computed
+                    and block_hash not in self.disk_index):
+                # Write the reused blocks, e.g. of the shared system prompts,
+                # through to disk. They may never be evicted from the GPU.
+                self._demote_block(block)
+            return block
+
+        # Pin the CPU block first, the GPU allocation may evict a block to
+        # the CPU tier.
+        cpu_block = None
+        tier = "cpu"
+        if self.enable_cpu_prefix_cache and is_full and promote:
+            cpu_block = self._pin_cpu_cached_block(block_hash)
+            if (cpu_block is None and self.disk_index is not None
+                    and block_hash in self.disk_index):
+                cpu_block = self._load_disk_block(block_hash)
+                tier = "disk"
+        block = self.gpu_allocator.allocate(block_hash, num_hashed_tokens)
+        if cpu_block is not None:
+            self.prefix_cache_num_hits[tier] += 1
+            self.promoted_blocks.append(
+                (cpu_block.block_number, block.block_number))
+            # The swap in runs before the forward of this step.
+            block.computed = True
+        return block
+
+    def _pin_cpu_cached_block(self,
+                              block_hash: int) -> Optional[PhysicalTokenBlock]:
+        """Holds the computed CPU block of `block_hash` until the swaps of
+        this step ran. Returns None if the CPU tier does not have it."""
+        if not self.cpu_allocator.contains_block(block_hash):
+            return None
+        block = self.cpu_allocator.allocate(block_hash)
+        if not block.computed:
+            self.cpu_allocator.free(block)
+            return None
+        self.pinned_cpu_blocks.append(block)
+        return block
+
+    def _load_disk_block(self,
+                         block_hash: int) -> Optional[PhysicalTokenBlock]:
+        """Loads the block of `block_hash` from the disk tier to a CPU block
+        held until the transfers of this step ran. Returns None if there is
+        no free CPU block."""
+        assert self.disk_index is not None
+        if (self.cpu_allocator.contains_block(block_hash)
+                or self.cpu_allocator.get_num_free_blocks() == 0):
+            return None
+        slot = self.disk_index.pin(block_hash)
+        block = self.cpu_allocator.allocate(
+            block_hash, self.disk_index.get_num_hashed_tokens(block_hash))
+        block.computed = True
+        self.pinned_cpu_blocks.append(block)
+        self.loaded_blocks.append((slot, block.block_number))
+        return block
+
+    def _demote_block(self, block: PhysicalTokenBlock) -> None:
+        """Demotes a GPU block evicted by prefix caching to the CPU tier,
+        and spills it to the disk tier from there.
+
+        Called by the GPU allocator before the block is reused. The swap out
+        runs before the block is written by the swaps and the forward of this
+        step, and the spill after it.
+        """
+        if not block.computed:
+            return
+        block_hash = block.block_hash
+        on_disk = self.disk_index is None or block_hash in self.disk_index
+        if self.cpu_allocator.contains_block(block_hash):
+            if on_disk:
+                return
+            cpu_block = self._pin_cpu_cached_block(block_hash)
+            if cpu_block is None:
+                return
+        else:
+            if self.cpu_allocator.get_num_free_blocks() == 0:
+                return
+            cpu_block = self.cpu_allocator.allocate(block_hash,
+                                                    block.num_hashed_tokens)
+            cpu_block.computed = True
+            cpu_block.last_accessed = block.last_accessed
+            self.pinned_cpu_blocks.append(cpu_block)
+            self.demoted_blocks.append(
+                (block.block_number, cpu_block.block_number))
+        if not on_disk:
+            assert self.disk_index is not None
+            slot = self.disk_index.allocate(block_hash,
+                                            block.num_hashed_tokens)
+            if slot is not None:
+                self.spilled_blocks.append((cpu_block.block_number, slot))
+
+    def get_prefix_cache_swaps(
+            self) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+        """Returns the (CPU block, GPU block) numbers of the blocks promoted
+        from the CPU tier and the (GPU block, CPU block) numbers of the blocks
+        demoted to it since the last call.
+
+        Called once per step after scheduling. The CPU blocks of the last step
+        are released, their swaps ran.
+        """
+        for block in self.last_pinned_cpu_blocks:
+            self.cpu_allocator.free(block)
+        self.last_pinned_cpu_blocks = self.pinned_cpu_blocks
+        self.pinned_cpu_blocks = []
+        promoted_blocks, self.promoted_blocks = self.promoted_blocks, []
+        demoted_blocks, self.demoted_blocks = self.demoted_blocks, []
+        return promoted_blocks, demoted_blocks
+
+    def get_disk_prefix_cache_transfers(
+            self) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+        """Returns the (disk slot, CPU block) numbers of the blocks loaded
+        from the disk tier and the (CPU block, disk slot) numbers of the
+        blocks spilled to it since the last call.
+
+        Called once per step after scheduling, like get_prefix_cache_swaps.
+        The slots written by the last step are persisted in the index.
+        """
+        assert self.disk_index is not None
+        self.disk_index.end_step()
+        loaded_blocks, self.loaded_blocks = self.loaded_blocks, []
+        spilled_blocks, self.spilled_blocks = self.spilled_blocks, []
+        return loaded_blocks, spilled_blocks
+
+    def get_prefix_cache_stats(self) -> Tuple[int, Dict[str, int]]:
+        """Returns the full prompt blocks looked up in the prefix cache and
+        the hits of every tier since the last call."""
+        num_queries = self.prefix_cache_num_queries
+        num_hits = self.prefix_cache_num_hits
+        self.prefix_cache_num_queries = 0
+        self.prefix_cache_num_hits = dict.fromkeys(self.prefix_cache_tiers, 0)
+        return num_queries, num_hits
+
     def allocate(self, seq_group: SequenceGroup) -> None:
         is_encoder_decoder = seq_group.is_encoder_decoder()
         check_no_caching_or_swa_for_blockmgr_encdec(self, seq_group)
@@ -485,7 +1010,7 @@ class BlockSpaceManagerV1(BlockSpaceManager):
 
         # Assign the self-attention block tables for each sequence.
         for seq in seq_group.get_seqs(status=SequenceStatus.WAITING):
-            self.block_tables[seq.seq_id] = block_table.copy()
+            self._set_block_table(seq.seq_id, block_table.copy())
 
         # Allocate encoder sequence
         if is_encoder_decoder:
@@ -586,6 +1111,7 @@ class BlockSpaceManagerV1(BlockSpaceManager):
             # Currently this code only supports adding one physical block
             assert len(block_table) == n_blocks - 1
 
+            self._mark_block_ids_dirty(seq.seq_id, len(block_table))
             if (self.block_sliding_window
                     and len(block_table) >= self.block_sliding_window):
                 # reuse a block
@@ -608,7 +1134,10 @@ class BlockSpaceManagerV1(BlockSpaceManager):
                 # to save memory.
                 maybe_new_block = self._maybe_promote_last_block(
                     seq, last_block)
-                block_table[-1] = maybe_new_block
+                if maybe_new_block is not last_block:
+                    block_table[-1] = maybe_new_block
+                    self._mark_block_ids_dirty(seq.seq_id,
+                                               len(block_table) - 1)
             return []
         else:
             # The last block is shared with other sequences.
@@ -616,6 +1145,7 @@ class BlockSpaceManagerV1(BlockSpaceManager):
             new_block = self._allocate_last_physical_block(seq)
 
             block_table[-1] = new_block
+            self._mark_block_ids_dirty(seq.seq_id, len(block_table) - 1)
             self.gpu_allocator.free(last_block)
             return [(last_block.block_number, new_block.block_number)]
 
@@ -623,14 +1153,61 @@ class BlockSpaceManagerV1(BlockSpaceManager):
         # NOTE: fork does not allocate a new physical block.
         # Thus, it is always safe from OOM.
         src_block_table = self.block_tables[parent_seq.seq_id]
-        self.block_tables[child_seq.seq_id] = src_block_table.copy()
-        # When using a sliding window, blocks will be eventually reused.
-        # In this case the block tables will contain repeated blocks.
-        # When forking, we must make sure that each block's `ref_count`
-        # is only incremented by one, so we deduplicate them by wrapping
-        # them in a set.
-        for block in set(src_block_table):
+        if self.block_sliding_window is not None:
+            self._set_block_table(child_seq.seq_id, src_block_table.copy())
+            # When using a sliding window, blocks will be eventually reused.
+            # In this case the block tables will contain repeated blocks.
+            # When forking, we must make sure that each block's `ref_count`
+            # is only incremented by one, so we deduplicate them by wrapping
+            # them in a set.
+            for block in set(src_block_table):
+                block.ref_count += 1
+            return
+
+        # The blocks before the one of the last token are never written
+        # again, they are shared through a segment. The parent hands its
+        # references to the blocks it did not share yet to a new segment.
+        num_shared_blocks = min(len(src_block_table),
+                                (parent_seq.get_len() - 1) // self.block_size)
+        segment = self._seq_segments.get(parent_seq.seq_id)
+        start = 0 if segment is None else segment.end
+        if num_shared_blocks > start:
+            segment = BlockTableSegment(
+                src_block_table[start:num_shared_blocks], segment,
+                num_shared_blocks)
+            self._seq_segments[parent_seq.seq_id] = segment
+            start = num_shared_blocks
+        if segment is not None:
+            segment.ref_count += 1
+            self._seq_segments[child_seq.seq_id] = segment
+        # The last blocks are written again and copied on write.
+        for block in src_block_table[start:]:
+            block.ref_count += 1
+
+        self._set_block_table(child_seq.seq_id, src_block_table.copy())
+        block_numbers, remote_ranks = self._get_block_ids(parent_seq.seq_id)
+        self._block_ids[child_seq.seq_id] = (block_numbers.copy(),
+                                             remote_ranks.copy())
+
+    def _release_segment(self, segment: Optional[BlockTableSegment]) -> None:
+        """Drops a reference to a segment, freeing the blocks of the segments
+        of the chain that are no longer referenced."""
+        while segment is not None:
+            segment.ref_count -= 1
+            if segment.ref_count > 0:
+                return
+            self._free_block_table(segment.blocks)
+            segment = segment.parent
+
+    def _unshare_segments(self, seq_id: int) -> None:
+        """Makes the sequence reference every block of its block table
+        itself, before the shared blocks are swapped or migrated."""
+        segment = self._seq_segments.pop(seq_id, None)
+        if segment is None:
+            return
+        for block in self.block_tables[seq_id][:segment.end]:
             block.ref_count += 1
+        self._release_segment(segment)
 
     def _get_physical_blocks(
             self, seq_group: SequenceGroup) -> List[PhysicalTokenBlock]:
@@ -639,17 +1216,66 @@ class BlockSpaceManagerV1(BlockSpaceManager):
         # the sequences in the same group.
         request_id = seq_group.request_id
         blocks: Set[PhysicalTokenBlock] = set()
+        # The segments shared by the sequences are walked once.
+        segments: Set[BlockTableSegment] = set()
         for seq in seq_group.get_seqs():
             if seq.is_finished():
                 continue
-            for block in self.block_tables[seq.seq_id]:
+            block_table = self.block_tables[seq.seq_id]
+            segment = self._seq_segments.get(seq.seq_id)
+            if segment is not None:
+                block_table = block_table[segment.end:]
+            while segment is not None and segment not in segments:
+                segments.add(segment)
+                blocks.update(block for block in segment.blocks
+                              if block.remote_rank == 0)
+                segment = segment.parent
+            for block in block_table:
                 if block.remote_rank == 0:
-                    blocks.update(block)
+                    blocks.add(block)
         # Cross-attention blocks
         if seq_group.is_encoder_decoder():
             blocks.update(self.cross_block_tables[request_id])
         return list(blocks)
 
+    def _get_num_remote_blocks(self, seq_group: SequenceGroup,
+                               device: Device) -> Dict[int, int]:
+        """Returns the number of blocks of the group that live on `device` of
+        every SP rank."""
+        blocks: Set[PhysicalTokenBlock] = set()
+        for seq in seq_group.get_seqs():
+            if seq.is_finished():
+                continue
+            for block in self.block_tables[seq.seq_id]:
+                if block.remote_rank != 0 and block.device == device:
+                    blocks.add(block)
+        num_blocks: Dict[int, int] = defaultdict(int)
+        for block in blocks:
+            num_blocks[block.remote_rank] += 1
+        return num_blocks
+
+    def has_remote_blocks(self, seq_group: SequenceGroup) -> bool:
+        """Whether part of the KV of the group lives on the SP ranks."""
+        for seq in seq_group.get_seqs():
+            if seq.is_finished() or seq.seq_id not in self.block_tables:
+                continue
+            if any(block.remote_rank != 0
+                   for block in self.block_tables[seq.seq_id]):
+                return True
+        return False
+
+    def can_swap_out_remote(self, seq_group: SequenceGroup) -> bool:
+        """Whether the remote blocks of the group fit in the CPU swap space
+        of their SP ranks."""
+        num_blocks = self._get_num_remote_blocks(seq_group, Device.GPU)
+        return all(num <= self.remote_allocator.get_num_free_cpu_blocks(rank)
+                   for rank, num in num_blocks.items())
+
+    def is_remote_full(self) -> bool:
+        """Whether no SP rank has room left for another superblock."""
+        return (self.superblock_blocks > 0 and
+                not self.remote_allocator.can_allocate(self.superblock_blocks))
+
     def can_swap_in(self,
                     seq_group: SequenceGroup,
                     num_lookahead_slots: int = 0) -> AllocStatus:
@@ -665,50 +1291,103 @@ class BlockSpaceManagerV1(BlockSpaceManager):
         # at least one free block right after the swap-in.
         # NOTE: This should match the logic in can_append_slot().
         num_required_blocks = len(blocks) + num_swapped_seqs
+        # The remote blocks swapped out to the SP ranks return to the GPUs of
+        # the same ranks.
+        num_remote_blocks = self._get_num_remote_blocks(seq_group, Device.CPU)
         if self.gpu_allocator.get_num_total_blocks() < num_required_blocks:
             return AllocStatus.NEVER
+        elif any(num > self.remote_allocator.get_num_free_blocks(rank)
+                 for rank, num in num_remote_blocks.items()):
+            return AllocStatus.LATER
         elif num_free_blocks - num_required_blocks >= self.watermark_blocks:
             return AllocStatus.OK
         else:
             return AllocStatus.LATER
 
     def _swap_block_table(
-            self, block_table: BlockTable, src_allocator: BlockAllocatorBase,
-            dest_allocator: BlockAllocatorBase,
-            mapping: Dict[PhysicalTokenBlock,
-                          PhysicalTokenBlock]) -> BlockTable:
+        self,
+        block_table: BlockTable,
+        src_allocator: BlockAllocatorBase,
+        dest_allocator: BlockAllocatorBase,
+        mapping: Dict[PhysicalTokenBlock, PhysicalTokenBlock],
+        remote_mapping: Optional[Dict[PhysicalTokenBlock,
+                                      PhysicalTokenBlock]] = None
+    ) -> BlockTable:
+        """Swaps the local blocks of `block_table` with `src_allocator` and
+        `dest_allocator`. The remote blocks on `src_allocator`'s device are
+        swapped on their own SP rank only if `remote_mapping` is given,
+        otherwise they stay in place."""
         new_block_table = []
 
         for from_block in block_table:
             if from_block.remote_rank == 0:
-                if from_block in mapping:
-                    to_block = mapping[from_block]
-                    to_block.ref_count += 1
-                else:
-                    to_block = dest_allocator.allocate(
-                        from_block.block_hash, from_block.num_hashed_tokens)
-                    mapping[from_block] = to_block
-                new_block_table.append(to_block)
-                # Free the source block swapped in to destination.
-                src_allocator.free(from_block)
+                src, dest, block_mapping = (src_allocator, dest_allocator,
+                                            mapping)
+            elif (remote_mapping is not None
+                  and from_block.device == src_allocator.device):
+                src = self.remote_allocator.get_allocator(from_block)
+                dest = self.remote_allocator.get_rank_allocator(
+                    from_block.remote_rank, dest_allocator.device)
+                block_mapping = remote_mapping
             else:
                 new_block_table.append(from_block)
+                continue
+            if from_block in block_mapping:
+                to_block = block_mapping[from_block]
+                to_block.ref_count += 1
+            else:
+                to_block = dest.allocate(from_block.block_hash,
+                                         from_block.num_hashed_tokens)
+                block_mapping[from_block] = to_block
+            new_block_table.append(to_block)
+            if self.enable_cpu_prefix_cache:
+                # The swapped blocks stay cached in the CPU tier.
+                to_block.computed = to_block.computed or from_block.computed
+                if src is self.cpu_allocator:
+                    # Hold the source until the swap in ran, the swap outs
+                    # of the CPU tier run first.
+                    self.pinned_cpu_blocks.append(from_block)
+                    continue
+            # Free the source block swapped in to destination.
+            src.free(from_block)
 
         return new_block_table
 
-    def swap_in(self, seq_group: SequenceGroup) -> List[Tuple[int, int]]:
+    def swap_in(
+        self,
+        seq_group: SequenceGroup,
+        remote_mapping: Optional[List[Tuple[int, int, int]]] = None
+    ) -> List[Tuple[int, int]]:
+        """Swaps in the group and returns the (CPU block, GPU block) mapping
+        of the local blocks.
 
+        The remote blocks swapped out to the SP ranks are swapped back in as
+        well, their (rank, CPU block, GPU block) are appended to
+        `remote_mapping`.
+        """
         request_id = seq_group.request_id
 
         # CPU block -> GPU block.
         # dict is efficient in lookup `if cpu_block in mapping`
         mapping: Dict[PhysicalTokenBlock, PhysicalTokenBlock] = {}
+        remote_blocks: Dict[PhysicalTokenBlock, PhysicalTokenBlock] = {}
         for seq in seq_group.get_seqs(status=SequenceStatus.SWAPPED):
-            self.block_tables[seq.seq_id] = \
+            self._unshare_segments(seq.seq_id)
+            self._set_block_table(
+                seq.seq_id,
                 self._swap_block_table(self.block_tables[seq.seq_id],
-                                       self.cpu_allocator,
-                                       self.gpu_allocator,
-                                       mapping)
+                                       self.cpu_allocator, self.gpu_allocator,
+                                       mapping, remote_blocks))
+            migrated = self.swapped_superblocks.pop(seq.seq_id, None)
+            if migrated:
+                self.migrated_superblocks[seq.seq_id] = migrated
+        if remote_blocks:
+            assert remote_mapping is not None, (
+                "Swapping in remote blocks requires a remote mapping.")
+            remote_mapping.extend(
+                (cpu_block.remote_rank, cpu_block.block_number,
+                 gpu_block.block_number)
+                for cpu_block, gpu_block in remote_blocks.items())
 
         if seq_group.is_encoder_decoder():
             self.cross_block_tables[request_id] = \
@@ -724,18 +1403,48 @@ class BlockSpaceManagerV1(BlockSpaceManager):
         blocks = self._get_physical_blocks(seq_group)
         return len(blocks) <= self.cpu_allocator.get_num_free_blocks()
 
-    def swap_out(self, seq_group: SequenceGroup) -> List[Tuple[int, int]]:
+    def swap_out(
+        self,
+        seq_group: SequenceGroup,
+        remote_mapping: Optional[List[Tuple[int, int, int]]] = None
+    ) -> List[Tuple[int, int]]:
+        """Swaps out the group and returns the (GPU block, CPU block) mapping
+        of the local blocks.
+
+        The remote blocks stay on the GPUs of the SP ranks, unless
+        `remote_mapping` is given. Then they are swapped out to the CPU swap
+        space of their ranks and their (rank, GPU block, CPU block) are
+        appended to it.
+
+        The queued and in-flight migrations and recalls of the group are
+        dropped. Its migrated superblocks are kept, to be recalled once the
+        group is swapped in.
+        """
         request_id = seq_group.request_id
 
         # GPU block -> CPU block.
         # dict is efficient in lookup `if gpu_block in mapping`
         mapping: Dict[PhysicalTokenBlock, PhysicalTokenBlock] = {}
+        remote_blocks: Optional[Dict[PhysicalTokenBlock,
+                                     PhysicalTokenBlock]] = None
+        if remote_mapping is not None:
+            remote_blocks = {}
         for seq in seq_group.get_seqs(status=SequenceStatus.RUNNING):
-            self.block_tables[seq.seq_id] = \
+            self._drop_kvcache_migrations(seq.seq_id)
+            migrated = self.migrated_superblocks.pop(seq.seq_id, None)
+            if migrated:
+                self.swapped_superblocks[seq.seq_id] = migrated
+            self._unshare_segments(seq.seq_id)
+            self._set_block_table(
+                seq.seq_id,
                 self._swap_block_table(self.block_tables[seq.seq_id],
-                                       self.gpu_allocator,
-                                       self.cpu_allocator,
-                                       mapping)
+                                       self.gpu_allocator, self.cpu_allocator,
+                                       mapping, remote_blocks))
+        if remote_mapping is not None and remote_blocks:
+            remote_mapping.extend(
+                (gpu_block.remote_rank, gpu_block.block_number,
+                 cpu_block.block_number)
+                for gpu_block, cpu_block in remote_blocks.items())
 
         if seq_group.is_encoder_decoder():
             self.cross_block_tables[request_id] = \
@@ -756,7 +1465,10 @@ class BlockSpaceManagerV1(BlockSpaceManager):
         blocks_to_free = (block_table[-self.block_sliding_window:]
                           if self.block_sliding_window is not None else
                           block_table)
-        for block in set(blocks_to_free):
+        # NOTE: dict.fromkeys deduplicates the blocks while keeping the block
+        # table order. The remote allocators keep their free blocks per
+        # superblock chunk, so the order they are freed in does not matter.
+        for block in dict.fromkeys(blocks_to_free):
             if block.remote_rank != 0:
                 self.remote_allocator.free(block)
             elif block.device == Device.GPU:
@@ -769,9 +1481,17 @@ class BlockSpaceManagerV1(BlockSpaceManager):
             # Already freed or haven't been scheduled yet.
             return
         block_table = self.block_tables[seq.seq_id]
-        self._free_block_table(block_table)
+        segment = self._seq_segments.pop(seq.seq_id, None)
+        if segment is None:
+            self._free_block_table(block_table)
+        else:
+            self._free_block_table(block_table[segment.end:])
+            self._release_segment(segment)
         self.remove_kvcache_migrate_block(seq.seq_id)
+        self.remote_allocator.free_seq(seq.seq_id)
         del self.block_tables[seq.seq_id]
+        self._block_ids.pop(seq.seq_id, None)
+        self._block_ids_dirty.pop(seq.seq_id, None)
 
     def free_cross(self, seq_group: SequenceGroup) -> None:
         if seq_group.request_id not in self.cross_block_tables:
@@ -783,21 +1503,58 @@ class BlockSpaceManagerV1(BlockSpaceManager):
 
     def reset(self) -> None:
         # Free decoder block tables
-        for block_table in self.block_tables.values():
-            self._free_block_table(block_table)
+        for seq_id, block_table in self.block_tables.items():
+            segment = self._seq_segments.pop(seq_id, None)
+            if segment is None:
+                self._free_block_table(block_table)
+            else:
+                self._free_block_table(block_table[segment.end:])
+                self._release_segment(segment)
         self.block_tables.clear()
         # Free cross-attention block tables
         for block_table in self.cross_block_tables.values():
             self._free_block_table(block_table)
         self.cross_block_tables.clear()
 
+    def _set_block_table(self, seq_id: int, block_table: BlockTable) -> None:
+        self.block_tables[seq_id] = block_table
+        # The lists returned for the old block table are left as they are.
+        self._block_ids.pop(seq_id, None)
+        self._block_ids_dirty.pop(seq_id, None)
+
+    def _mark_block_ids_dirty(self, seq_id: int, start: int) -> None:
+        dirty = self._block_ids_dirty.get(seq_id)
+        if dirty is None or start < dirty:
+            self._block_ids_dirty[seq_id] = start
+
+    def _get_block_ids(self, seq_id: int) -> Tuple[List[int], List[int]]:
+        block_ids = self._block_ids.get(seq_id)
+        if block_ids is None:
+            block_table = self.block_tables[seq_id]
+            block_ids = ([block.block_number for block in block_table],
+                         [block.remote_rank for block in block_table])
+            self._block_ids[seq_id] = block_ids
+            return block_ids
+        start = self._block_ids_dirty.pop(seq_id, None)
+        if start is not None:
+            block_numbers, remote_ranks = block_ids
+            changed = self.block_tables[seq_id][start:]
+            block_numbers[start:] = [block.block_number for block in changed]
+            remote_ranks[start:] = [block.remote_rank for block in changed]
+        return block_ids
+
     def get_block_table(self, seq: Sequence) -> List[int]:
-        block_table = self.block_tables[seq.seq_id]
-        return [block.block_number for block in block_table]
+        """Returns the block numbers of the block table of the sequence.
+
+        The list is updated in place by the next calls, the caller must not
+        modify it.
+        """
+        return self._get_block_ids(seq.seq_id)[0]
 
     def get_block_table_remote_rank(self, seq: Sequence) -> List[int]:
-        block_table = self.block_tables[seq.seq_id]
-        return [block.remote_rank for block in block_table]
+        """Returns the remote ranks of the blocks of the block table of the
+        sequence, see `get_block_table`."""
+        return self._get_block_ids(seq.seq_id)[1]
 
     def get_cross_block_table(self, seq_group: SequenceGroup) -> List[int]:
         block_table = self.cross_block_tables[seq_group.request_id]
@@ -809,6 +1566,16 @@ class BlockSpaceManagerV1(BlockSpaceManager):
     def get_num_free_cpu_blocks(self) -> int:
         return self.cpu_allocator.get_num_free_blocks()
 
+    def get_num_free_remote_blocks(self) -> List[int]:
+        """The free GPU blocks of every SP rank, from rank 1 on."""
+        return [
+            self.remote_allocator.get_num_free_blocks(rank)
+            for rank in range(1, self.remote_allocator_number + 1)
+        ]
+
+    def get_num_queued_superblocks(self) -> int:
+        return len(self.migrate_list)
+
     def access_all_blocks_in_seq(
         self,
         seq: Sequence,
@@ -864,51 +1631,210 @@ class BlockSpaceManagerV1(BlockSpaceManager):
                 self.compute_full_blocks_in_seq(seq)
 
     def add_kvcache_migrate_block(self, seq: Sequence) -> None:
-        len = seq.get_len()
-        remain = (len - self.block_migrate_start) % self.block_migrate_size
+        if self.remote_allocator_number == 0 or self.superblock_blocks == 0:
+            return
+        seq_len = seq.get_len()
         is_running = seq.status == SequenceStatus.RUNNING
-        maybe_to_migrate = len >= self.block_migrate_threshold
-        if maybe_to_migrate and remain == 0 and is_running:
+        if seq_len >= self.block_migrate_threshold and is_running:
             block_table = self.block_tables[seq.seq_id]
-            start = self.block_migrate_start
-            migrate_set = set(self.migrate_list)
-            while start < len:
-                block = block_table[start]
+            # Only superblocks whose KV is already computed can be migrated.
+            # The KV of the last token is written by the upcoming forward.
+            start = self.migrate_cursors.get(seq.seq_id,
+                                             self.block_migrate_start)
+            while start + self.block_migrate_size < seq_len:
+                block = block_table[start // self.block_size]
                 if block.remote_rank == 0:
-                    migrate_set.update([
+                    self.migrate_list.push(
                         SequenceSuperBlock(seq.seq_id, self.block_migrate_size,
-                                           start)
-                    ])
+                                           start))
                 start = start + self.block_migrate_size
-            self.migrate_list = List(migrate_set)
-
-    def get_kvcache_migrate_block(self, mapping: List[Tuple[int, int,
-                                                            int]]) -> None:
-        length = len(self.migrate_list)
-        if length > 0:
-            migrate_block = self.migrate_list[0]
-            self.migrate_list.pop(0)
-            num_blocks = int(self.block_migrate_size / self.block_size)
-            to_blocks = self.remote_allocator.allocate(num_blocks)
+            self.migrate_cursors[seq.seq_id] = start
+
+    def get_kvcache_migrate_block(
+            self, mapping: List[Tuple[int, int,
+                                      int]]) -> List[Tuple[int, int]]:
+        """Migrates up to `block_migrate_budget` queued superblocks.
+
+        The remote blocks are allocated and `mapping` is extended with the
+        (src block, dst rank, dst block) of every migrated block. Superblocks
+        that do not fit on any rank stay queued for the next step.
+
+        The migration runs in the background of the forward of this step, so
+        the block tables keep pointing to the local blocks until the next
+        call of `commit_kvcache_migrate_blocks`.
+
+        Returns the (dst chunk, dst rank) of the migrated superblocks. They
+        are sorted by dst rank, so the superblocks sent to the same rank sit
+        next to each other in the staging area and can be sent at once.
+        """
+        num_blocks = self.superblock_blocks
+        selected: List[Tuple[SequenceSuperBlock,
+                             List[PhysicalTokenBlock]]] = []
+        while self.migrate_list and len(selected) < self.block_migrate_budget:
+            migrate_block = self.migrate_list.peek()
+            block_table = self.block_tables.get(migrate_block.seq_id)
+            start = migrate_block.start // self.block_size
+            if (block_table is None or len(block_table) < start + num_blocks
+                    or block_table[start].remote_rank != 0):
+                # Stale entry, the superblock is gone or already migrated.
+                self.migrate_list.pop()
+                continue
+            if not self.remote_allocator.can_allocate(num_blocks,
+                                                      migrate_block.seq_id):
+                break
+            self.migrate_list.pop()
+            to_blocks = self.remote_allocator.allocate(num_blocks,
+                                                       migrate_block.seq_id)
+            selected.append((migrate_block, to_blocks))
+
+        selected.sort(key=lambda item: item[1][0].remote_rank)
+        superblocks_to_migrate: List[Tuple[int, int]] = []
+        for migrate_block, to_blocks in selected:
             remote_rank = to_blocks[0].remote_rank
             block_table = self.block_tables[migrate_block.seq_id]
-            start = migrate_block.start
-            end = migrate_block.start + migrate_block.block_size
-            for index in range(start, end):
-                self.gpu_allocator.free(block_table[index])
-                to_block = to_blocks[index - migrate_block.start]
-                mapping_item = (block_table[index].block_number, remote_rank,
-                                to_block.block_number)
-                mapping.append(mapping_item)
-                block_table[index] = to_block
-            self.block_tables[migrate_block.seq_id] = block_table
+            start = migrate_block.start // self.block_size
+            for offset, to_block in enumerate(to_blocks):
+                mapping.append((block_table[start + offset].block_number,
+                                remote_rank, to_block.block_number))
+            superblocks_to_migrate.append(
+                (to_blocks[0].block_number // num_blocks, remote_rank))
+            migrations = self.inflight_migrations.setdefault(
+                migrate_block.seq_id, [])
+            migrations.append((migrate_block, to_blocks))
+        return superblocks_to_migrate
+
+    def get_kvcache_recall_block(self,
+                                 mapping: List[int]) -> List[Tuple[int, int]]:
+        """Recalls up to `block_migrate_budget` migrated superblocks back to
+        the local GPU blocks.
+
+        Superblocks are only recalled when no superblock is waiting to be
+        migrated and more than `recall_watermark_blocks` local blocks stay
+        free. The sequences with the fewest remote superblocks go first, as
+        recalling them removes their cross-rank attention soonest, starting
+        from their most recently migrated superblock.
+
+        `mapping` is extended with the local blocks the recalled superblocks
+        are received into, `superblock_blocks` per superblock. Like for the
+        migration, the block tables switch to them in the next call of
+        `commit_kvcache_migrate_blocks`.
+
+        Returns the (src chunk, src rank) of the recalled superblocks, sorted
+        by src rank.
+        """
+        if (self.recall_watermark_blocks is None or self.migrate_list
+                or self.inflight_migrations or not self.migrated_superblocks):
+            return []
+        num_blocks = self.superblock_blocks
+        num_to_recall = min(self.block_migrate_budget,
+                            (self.gpu_allocator.get_num_free_blocks() -
+                             self.recall_watermark_blocks) // num_blocks)
+        if num_to_recall <= 0:
+            return []
+        selected: List[Tuple[SequenceSuperBlock,
+                             List[PhysicalTokenBlock]]] = []
+        candidates = sorted(self.migrated_superblocks.items(),
+                            key=lambda item: len(item[1]))
+        for seq_id, superblocks in candidates:
+            block_table = self.block_tables[seq_id]
+            while superblocks and len(selected) < num_to_recall:
+                recall_block = superblocks[-1]
+                start = recall_block.start // self.block_size
+                from_blocks = block_table[start:start + num_blocks]
+                segment = self._seq_segments.get(seq_id)
+                if segment is not None and start < segment.end:
+                    # Shared through a segment of a forked sequence.
+                    break
+                if (from_blocks[0].block_number % num_blocks != 0 or any(
+                        block.ref_count != 1 or block.device != Device.GPU
+                        or block.block_number != from_blocks[0].block_number +
+                        offset for offset, block in enumerate(from_blocks))):
+                    # Shared with a forked sequence, or no longer a whole
+                    # chunk after a swap, so it stays remote.
+                    break
+                superblocks.pop()
+                to_blocks = [
+                    self.gpu_allocator.allocate() for _ in range(num_blocks)
+                ]
+                selected.append((recall_block, to_blocks))
+            if not superblocks:
+                del self.migrated_superblocks[seq_id]
+            if len(selected) == num_to_recall:
+                break
+
+        superblocks_to_recall: List[Tuple[int, int, int]] = []
+        for recall_block, to_blocks in selected:
+            block_table = self.block_tables[recall_block.seq_id]
+            from_block = block_table[recall_block.start // self.block_size]
+            superblocks_to_recall.append(
+                (from_block.block_number // num_blocks, from_block.remote_rank,
+                 len(superblocks_to_recall)))
+            recalls = self.inflight_recalls.setdefault(recall_block.seq_id, [])
+            recalls.append((recall_block, to_blocks))
+        # Sort by rank, the local blocks follow the same order.
+        superblocks_to_recall.sort(key=lambda item: item[1])
+        for _, _, i in superblocks_to_recall:
+            mapping.extend(block.block_number for block in selected[i][1])
+        return [(chunk, rank) for chunk, rank, _ in superblocks_to_recall]
+
+    def commit_kvcache_migrate_blocks(self) -> None:
+        """Points the block tables to the superblocks migrated or recalled in
+        the last step and frees the blocks they were moved from.
+
+        Must be called before the block tables of the next step are built.
+        The workers wait for the migration events before that step runs.
+        """
+        for seq_id, migrations in self.inflight_migrations.items():
+            self._unshare_segments(seq_id)
+            block_table = self.block_tables[seq_id]
+            migrated = self.migrated_superblocks.setdefault(seq_id, [])
+            for migrate_block, to_blocks in migrations:
+                start = migrate_block.start // self.block_size
+                for offset, to_block in enumerate(to_blocks):
+                    self.gpu_allocator.free(block_table[start + offset])
+                    block_table[start + offset] = to_block
+                self._mark_block_ids_dirty(seq_id, start)
+                migrated.append(migrate_block)
+        self.inflight_migrations.clear()
+        for seq_id, recalls in self.inflight_recalls.items():
+            self._unshare_segments(seq_id)
+            block_table = self.block_tables[seq_id]
+            for recall_block, to_blocks in recalls:
+                start = recall_block.start // self.block_size
+                self.remote_allocator.free_group(block_table[start:start +
+                                                             len(to_blocks)])
+                block_table[start:start + len(to_blocks)] = to_blocks
+                self._mark_block_ids_dirty(seq_id, start)
+        self.inflight_recalls.clear()
+
+    def set_kvcache_migrate_thresholds(self, threshold: int,
+                                       start: int) -> None:
+        """Updates the migration thresholds, in tokens.
+
+        Sequences that already queued superblocks keep migrating from their
+        cursor, the new start only applies to the other sequences.
+        """
+        self.block_migrate_threshold = threshold
+        self.block_migrate_start = start
 
     def remove_kvcache_migrate_block(self, seq_id: int) -> None:
-        length = len(self.migrate_list)
-        if length > 0:
-            for i in range(length - 1, -1, -1):
-                if self.migrate_list[i].seq_id == seq_id:
-                    del self.migrate_list[i]
+        self._drop_kvcache_migrations(seq_id)
+        self.migrated_superblocks.pop(seq_id, None)
+        self.swapped_superblocks.pop(seq_id, None)
+
+    def _drop_kvcache_migrations(self, seq_id: int) -> None:
+        """Drops the queued and in-flight migrations and recalls of the
+        sequence, and its cursor."""
+        # The in-flight superblocks of the sequence are dropped, together with
+        # their remote blocks.
+        for _, to_blocks in self.inflight_migrations.pop(seq_id, ()):
+            self.remote_allocator.free_group(to_blocks)
+        # Likewise for the local blocks of the in-flight recalls.
+        for _, to_blocks in self.inflight_recalls.pop(seq_id, ()):
+            for block in to_blocks:
+                self.gpu_allocator.free(block)
+        self.migrate_list.remove_seq(seq_id)
+        self.migrate_cursors.pop(seq_id, None)
 
     def format_kvcache_migrate_blocks(
             self, blocks_to_migrate: List[Tuple[int, int, int]],
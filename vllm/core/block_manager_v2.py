@@ -312,12 +312,18 @@ class BlockSpaceManagerV2(BlockSpaceManager):
         return self._can_swap(seq_group, Device.GPU, SequenceStatus.SWAPPED,
                               num_lookahead_slots)
 
-    def swap_in(self, seq_group: SequenceGroup) -> List[Tuple[int, int]]:
+    def swap_in(
+        self,
+        seq_group: SequenceGroup,
+        remote_mapping: Optional[List[Tuple[int, int, int]]] = None
+    ) -> List[Tuple[int, int]]:
         """Returns the block id mapping (from CPU to GPU) generated by
         swapping in the given seq_group with num_lookahead_slots.
 
         Args:
             seq_group (SequenceGroup): The sequence group to swap in.
+            remote_mapping (Optional[List[Tuple[int, int, int]]]): Unused,
+                this block manager has no blocks on the SP ranks.
 
         Returns:
             List[Tuple[int, int]]: The mapping of swapping block from CPU 
@@ -355,12 +361,18 @@ class BlockSpaceManagerV2(BlockSpaceManager):
             return True
         return False
 
-    def swap_out(self, sequence_group: SequenceGroup) -> List[Tuple[int, int]]:
+    def swap_out(
+        self,
+        sequence_group: SequenceGroup,
+        remote_mapping: Optional[List[Tuple[int, int, int]]] = None
+    ) -> List[Tuple[int, int]]:
         """Returns the block id mapping (from GPU to CPU) generated by
         swapping out the given sequence_group with num_lookahead_slots.
 
         Args:
             sequence_group (SequenceGroup): The sequence group to swap in.
+            remote_mapping (Optional[List[Tuple[int, int, int]]]): Unused,
+                this block manager has no blocks on the SP ranks.
 
         Returns:
             List[Tuple[int, int]]: The mapping of swapping block from 
@@ -0,0 +1,182 @@
+"""Forecasts of the GPU blocks the scheduled sequences still need to finish,
+used by the scheduler to hold back prefills while the running sequences need
+the free blocks to grow.
+
+The scheduler only checks that the next step fits, so when many long
+generations grow together it admits prompts whose blocks the decodes need a
+few steps later and preempts them again. With a block reservation policy,
+the forecast of the blocks the running and swapped sequences will still
+need is kept free of new prompts.
+"""
+import enum
+from collections import deque
+from typing import Deque, Iterable, Optional, Tuple
+
+import numpy as np
+
+from vllm.sequence import Sequence, SequenceGroup, SequenceStatus
+
+
+class BlockReservationPolicy(enum.Enum):
+    """Enum for the forecast of the output length of a sequence used by the
+    BlockDemandForecaster.
+
+    NONE: No blocks are reserved.
+    MAX_TOKENS: A sequence runs until its `max_tokens`. Preemptions are
+        avoided but the admission is throttled the most.
+    EXPECTED: A sequence runs for the expected output length of the
+        sequences that ran as long as it did, bounded by its `max_tokens`.
+    """
+    NONE = enum.auto()
+    MAX_TOKENS = enum.auto()
+    EXPECTED = enum.auto()
+
+
+class OutputLengthEstimator:
+    """Estimates the output length of a running sequence online, from the
+    output lengths of the last finished sequences.
+
+    The output length of a sequence cut by its max length is only known to be
+    at least its output length. It counts as running until the
+    `max_tokens` of the sequence the estimate is for.
+
+    Args:
+        max_samples: The number of last finished sequences the estimate is
+            made from.
+        min_samples: The number of finished sequences before the estimate is
+            used. Until then, the sequences run until their `max_tokens`.
+    """
+
+    def __init__(self, max_samples: int = 1024, min_samples: int = 32) -> None:
+        self.min_samples = min_samples
+        # (output length, whether the output was cut by the max length).
+        self._samples: Deque[Tuple[int, bool]] = deque(maxlen=max_samples)
+        # The sorted output lengths of the samples, rebuilt on demand.
+        self._stopped: Optional[np.ndarray] = None
+        self._stopped_cumsum = np.zeros(1)
+        self._capped = np.zeros(0)
+
+    @property
+    def ready(self) -> bool:
+        return len(self._samples) >= self.min_samples
+
+    def observe(self, output_len: int, capped: bool) -> None:
+        """Adds the output length of a finished sequence, `capped` if it was
+        cut by the max length rather than stopped."""
+        self._samples.append((output_len, capped))
+        self._stopped = None
+
+    def _build(self) -> np.ndarray:
+        if self._stopped is None:
+            samples = np.array(self._samples, dtype=np.int64).reshape(-1, 2)
+            is_capped = samples[:, 1].astype(bool)
+            self._stopped = np.sort(samples[~is_capped, 0])
+            self._stopped_cumsum = np.concatenate(
+                ([0], np.cumsum(self._stopped)))
+            self._capped = np.sort(samples[is_capped, 0])
+        return self._stopped
+
+    def get_expected_output_lens(self, output_lens: np.ndarray,
+                                 max_tokens: np.ndarray) -> np.ndarray:
+        """Returns the expected final output lengths of running sequences
+        with `output_lens` output tokens so far, bounded by their
+        `max_tokens`."""
+        if not self.ready:
+            return max_tokens.astype(np.float64)
+        stopped = self._build()
+        # The samples that ran longer than the sequence so far, whose
+        # outputs are bounded by the max tokens of the sequence.
+        first = np.searchsorted(stopped, output_lens, side="right")
+        last = np.maximum(np.searchsorted(stopped, max_tokens, side="right"),
+                          first)
+        num_stopped = len(stopped) - first
+        stopped_sum = (self._stopped_cumsum[last] -
+                       self._stopped_cumsum[first] +
+                       (len(stopped) - last) * max_tokens)
+        num_capped = len(self._capped) - np.searchsorted(
+            self._capped, output_lens, side="right")
+        num_samples = num_stopped + num_capped
+        total = stopped_sum + num_capped * max_tokens
+        # Without a sample that ran as long, the sequence may run until its
+        # max tokens.
+        return np.where(num_samples > 0, total / np.maximum(num_samples, 1),
+                        max_tokens).astype(np.float64)
+
+
+class BlockDemandForecaster:
+    """Forecasts the GPU blocks sequences still need to run to the end.
+
+    Args:
+        policy: The forecast of the output lengths.
+        block_size: The number of tokens of a block.
+        max_model_len: The maximum length of a sequence.
+    """
+
+    def __init__(self, policy: BlockReservationPolicy, block_size: int,
+                 max_model_len: int) -> None:
+        assert policy != BlockReservationPolicy.NONE
+        self.policy = policy
+        self.block_size = block_size
+        self.max_model_len = max_model_len
+        self.output_length_estimator = OutputLengthEstimator()
+
+    def observe_finished(self, seq_group: SequenceGroup) -> None:
+        """Feeds the output lengths of a finished sequence group to the
+        estimate. Aborted sequences tell nothing about the lengths."""
+        if seq_group.sampling_params is None:
+            return
+        for seq in seq_group.get_seqs():
+            if seq.status == SequenceStatus.FINISHED_STOPPED:
+                self.output_length_estimator.observe(seq.get_output_len(),
+                                                     capped=False)
+            elif seq.status == SequenceStatus.FINISHED_LENGTH_CAPPED:
+                self.output_length_estimator.observe(seq.get_output_len(),
+                                                     capped=True)
+
+    def _get_max_tokens(self, seq_group: SequenceGroup, seq: Sequence) -> int:
+        max_tokens = self.max_model_len - seq.get_prompt_len()
+        if (seq_group.sampling_params is not None
+                and seq_group.sampling_params.max_tokens is not None):
+            max_tokens = min(max_tokens, seq_group.sampling_params.max_tokens)
+        return max(max_tokens, seq.get_output_len())
+
+    def forecast(self, seq_groups: Iterable[SequenceGroup]) -> int:
+        """Returns the number of blocks the unfinished sequences of the
+        sequence groups still need to run to the end. The blocks of running
+        sequences are allocated already, the other sequences need all of
+        their blocks. A waiting sequence group needs the blocks of its
+        prompt once and the blocks of the outputs of all of its sequences.
+        """
+        prompt_lens, output_lens, max_tokens = [], [], []
+        num_held_blocks = 0
+        for seq_group in seq_groups:
+            if seq_group.sampling_params is None:
+                # Embeddings do not grow.
+                continue
+            for seq in seq_group.get_unfinished_seqs():
+                num_copies = 1
+                if seq.status == SequenceStatus.RUNNING:
+                    num_held_blocks += seq.n_blocks
+                elif seq.status == SequenceStatus.WAITING:
+                    num_copies = seq_group.get_max_num_running_seqs()
+                    # The copies share the blocks of the prompt.
+                    num_held_blocks += (num_copies - 1) * seq.n_blocks
+                for _ in range(num_copies):
+                    prompt_lens.append(seq.get_prompt_len())
+                    output_lens.append(seq.get_output_len())
+                    max_tokens.append(self._get_max_tokens(seq_group, seq))
+        if not prompt_lens:
+            return 0
+
+        output_lens_array = np.array(output_lens)
+        max_tokens_array = np.array(max_tokens)
+        if self.policy == BlockReservationPolicy.EXPECTED:
+            final_output_lens = np.ceil(
+                self.output_length_estimator.get_expected_output_lens(
+                    output_lens_array, max_tokens_array))
+        else:
+            final_output_lens = max_tokens_array
+        final_lens = np.array(prompt_lens) + np.maximum(
+            final_output_lens, output_lens_array)
+        num_blocks = int(np.sum(-(-final_lens // self.block_size)))
+        return max(num_blocks - num_held_blocks, 0)
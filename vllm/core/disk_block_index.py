@@ -0,0 +1,128 @@
+"""The index of the disk tier of prefix caching.
+
+The KV of the blocks in the disk tier is kept by every worker in a memory
+mapped file of `num_blocks` slots (see `vllm.worker.disk_kv_cache`). This
+index maps the chained block hashes to the slots. It is memory mapped too,
+next to the KV files, so that the blocks cached on disk survive a restart of
+the engine.
+
+An entry is persisted one step after its slot was handed out, when the
+workers have written the KV of the slot, and it is cleared as soon as its
+slot is reused. A crash between the two leaves the slot empty rather than
+pointing to a partially written block.
+"""
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from vllm.logger import init_logger
+
+logger = init_logger(__name__)
+
+INDEX_FILE_NAME = "index.bin"
+
+
+class DiskBlockIndex:
+    """Maps the hashes of the blocks cached on disk to their slots, and
+    evicts the least recently used slot when the disk tier is full.
+
+    Args:
+        path: The directory of the disk tier of the model.
+        num_blocks: The number of slots of the disk tier.
+    """
+
+    def __init__(self, path: str, num_blocks: int) -> None:
+        if num_blocks <= 0:
+            raise ValueError(
+                f"The disk tier needs at least one block, got {num_blocks}.")
+        self.num_blocks = num_blocks
+        os.makedirs(path, exist_ok=True)
+        index_path = os.path.join(path, INDEX_FILE_NAME)
+        # Every slot holds (block hash, number of hashed tokens). Empty slots
+        # have no hashed tokens.
+        shape = (num_blocks, 2)
+        nbytes = num_blocks * 2 * np.dtype(np.int64).itemsize
+        if (os.path.exists(index_path)
+                and os.path.getsize(index_path) == nbytes):
+            mode = "r+"
+        else:
+            mode = "w+"
+        self._entries = np.memmap(index_path,
+                                  dtype=np.int64,
+                                  mode=mode,
+                                  shape=shape)
+
+        # Mapping: block hash -> slot, in LRU order.
+        self._slots: "OrderedDict[int, int]" = OrderedDict()
+        self._num_hashed_tokens: Dict[int, int] = {}
+        self._free_slots: List[int] = []
+        for slot in reversed(range(num_blocks)):
+            block_hash, num_hashed_tokens = self._entries[slot].tolist()
+            if num_hashed_tokens > 0 and block_hash not in self._slots:
+                self._slots[block_hash] = slot
+                self._num_hashed_tokens[block_hash] = num_hashed_tokens
+            else:
+                self._entries[slot, 1] = 0
+                self._free_slots.append(slot)
+        if self._slots:
+            logger.info("Loaded %d cached blocks from the disk tier at %s.",
+                        len(self._slots), path)
+
+        # Slots read or written by the transfers of this step, they are not
+        # reused until the transfers ran.
+        self._pinned_slots: Set[int] = set()
+        # Slots handed out in this step and in the last step, whose entries
+        # are persisted once their KV was written.
+        self._writing: Dict[int, Tuple[int, int]] = {}
+        self._written: Dict[int, Tuple[int, int]] = {}
+
+    def __contains__(self, block_hash: int) -> bool:
+        return block_hash in self._slots
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def get_num_hashed_tokens(self, block_hash: int) -> int:
+        return self._num_hashed_tokens[block_hash]
+
+    def pin(self, block_hash: int) -> int:
+        """Returns the slot of a cached block to read in this step."""
+        slot = self._slots[block_hash]
+        self._slots.move_to_end(block_hash)
+        self._pinned_slots.add(slot)
+        return slot
+
+    def allocate(self, block_hash: int,
+                 num_hashed_tokens: int) -> Optional[int]:
+        """Returns the slot to write a block to in this step, evicting the
+        least recently used block if the disk tier is full. None if all the
+        slots are in use by this step."""
+        assert block_hash not in self._slots
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            for evicted_hash, slot in self._slots.items():
+                if slot not in self._pinned_slots:
+                    break
+            else:
+                return None
+            del self._slots[evicted_hash]
+            del self._num_hashed_tokens[evicted_hash]
+            self._written.pop(slot, None)
+            self._entries[slot, 1] = 0
+        self._slots[block_hash] = slot
+        self._num_hashed_tokens[block_hash] = num_hashed_tokens
+        self._pinned_slots.add(slot)
+        self._writing[slot] = (block_hash, num_hashed_tokens)
+        return slot
+
+    def end_step(self) -> None:
+        """Called once per step after scheduling. Persists the entries of
+        the slots written by the last step and unpins the slots."""
+        for slot, entry in self._written.items():
+            self._entries[slot] = entry
+        self._written = self._writing
+        self._writing = {}
+        self._pinned_slots.clear()
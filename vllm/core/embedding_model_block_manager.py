@@ -1,4 +1,4 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from vllm.core.interfaces import AllocStatus, BlockSpaceManager
 from vllm.sequence import Sequence, SequenceGroup
@@ -46,13 +46,21 @@ class EmbeddingModelBlockSpaceManager(BlockSpaceManager):
                     num_lookahead_slots: int) -> AllocStatus:
         return AllocStatus.OK
 
-    def swap_in(self, seq_group: SequenceGroup) -> List[Tuple[int, int]]:
+    def swap_in(
+        self,
+        seq_group: SequenceGroup,
+        remote_mapping: Optional[List[Tuple[int, int, int]]] = None
+    ) -> List[Tuple[int, int]]:
         return None  # type: ignore
 
     def can_swap_out(self, seq_group: SequenceGroup) -> bool:
         return True
 
-    def swap_out(self, seq_group: SequenceGroup) -> List[Tuple[int, int]]:
+    def swap_out(
+        self,
+        seq_group: SequenceGroup,
+        remote_mapping: Optional[List[Tuple[int, int, int]]] = None
+    ) -> List[Tuple[int, int]]:
         return None  # type: ignore
 
     def free(self, seq: Sequence) -> None:
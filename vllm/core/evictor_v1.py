@@ -1,6 +1,8 @@
 import enum
+import heapq
 from abc import ABC, abstractmethod
-from typing import OrderedDict
+from itertools import count
+from typing import Any, Dict, List, Tuple
 
 from vllm.block import PhysicalTokenBlock
 
@@ -10,6 +12,8 @@ class EvictionPolicy(enum.Enum):
        Evictor subclass.
     """
     LRU = enum.auto()
+    LFU = enum.auto()
+    COST_AWARE = enum.auto()
 
 
 class Evictor(ABC):
@@ -50,57 +54,151 @@ class Evictor(ABC):
         pass
 
 
-class LRUEvictor(Evictor):
-    """Evicts in a least-recently-used order using the last_accessed timestamp
-    that's recorded in the PhysicalTokenBlock. If there are multiple blocks with
-    the same last_accessed time, then the one with the largest num_hashed_tokens
-    will be evicted. If two blocks each have the lowest last_accessed time and
-    highest num_hashed_tokens value, then one will be chose arbitrarily
+class HeapEvictor(Evictor):
+    """Base of the evictors that evict the free block with the lowest
+    priority, `_get_priority`, kept in a heap so that an eviction takes
+    O(log n). The priority of a block is taken when it is added.
+
+    Removed blocks are dropped from the heap lazily: their heap entries are
+    skipped on eviction, and the heap is rebuilt once most of its entries
+    are stale.
     """
 
     def __init__(self):
-        self.free_table: OrderedDict[int, PhysicalTokenBlock] = OrderedDict()
+        self.free_table: Dict[int, PhysicalTokenBlock] = {}
+        # Entries (priority, entry id, block hash). The entry id breaks ties
+        # in the order the blocks were added.
+        self._heap: List[Tuple[Any, int, int]] = []
+        # Mapping: block hash -> id of its live heap entry.
+        self._entry_ids: Dict[int, int] = {}
+        self._entry_counter = count()
 
     def __contains__(self, block_hash: int) -> bool:
         return block_hash in self.free_table
 
+    def _get_priority(self, block: PhysicalTokenBlock) -> Any:
+        raise NotImplementedError
+
+    def _on_evict(self, block: PhysicalTokenBlock, priority: Any) -> None:
+        pass
+
     def evict(self) -> PhysicalTokenBlock:
         if len(self.free_table) == 0:
             raise ValueError("No usable cache memory left")
 
-        evicted_block = next(iter(self.free_table.values()))
-        # The blocks with the lowest timestamps should be placed consecutively
-        # at the start of OrderedDict. Loop through all these blocks to
-        # find the one with maximum number of hashed tokens.
-        for _, block in self.free_table.items():
-            if evicted_block.last_accessed < block.last_accessed:
+        while True:
+            priority, entry_id, block_hash = heapq.heappop(self._heap)
+            if self._entry_ids.get(block_hash) == entry_id:
                 break
-            if evicted_block.num_hashed_tokens < block.num_hashed_tokens:
-                evicted_block = block
-
-        self.free_table.pop(evicted_block.block_hash)
-
-        evicted_block.computed = False
+        del self._entry_ids[block_hash]
+        evicted_block = self.free_table.pop(block_hash)
+        self._on_evict(evicted_block, priority)
         return evicted_block
 
     def add(self, block: PhysicalTokenBlock):
+        entry_id = next(self._entry_counter)
         self.free_table[block.block_hash] = block
+        self._entry_ids[block.block_hash] = entry_id
+        heapq.heappush(self._heap,
+                       (self._get_priority(block), entry_id, block.block_hash))
+        if len(self._heap) > 2 * len(self.free_table) + 64:
+            self._compact()
 
     def remove(self, block_hash: int) -> PhysicalTokenBlock:
         if block_hash not in self.free_table:
             raise ValueError(
                 "Attempting to remove block that's not in the evictor")
-        block: PhysicalTokenBlock = self.free_table[block_hash]
-        self.free_table.pop(block_hash)
-        return block
+        del self._entry_ids[block_hash]
+        return self.free_table.pop(block_hash)
+
+    def _compact(self) -> None:
+        self._heap = [
+            entry for entry in self._heap
+            if self._entry_ids.get(entry[2]) == entry[1]
+        ]
+        heapq.heapify(self._heap)
 
     @property
     def num_blocks(self) -> int:
         return len(self.free_table)
 
 
+class LRUEvictor(HeapEvictor):
+    """Evicts in a least-recently-used order using the last_accessed timestamp
+    that's recorded in the PhysicalTokenBlock. If there are multiple blocks with
+    the same last_accessed time, then the one with the largest num_hashed_tokens
+    will be evicted. If two blocks each have the lowest last_accessed time and
+    highest num_hashed_tokens value, then the one added first is evicted.
+    """
+
+    def _get_priority(self, block: PhysicalTokenBlock) -> Tuple[float, int]:
+        return (block.last_accessed, -block.num_hashed_tokens)
+
+
+class GreedyDualEvictor(HeapEvictor):
+    """Base of the frequency based evictors, aged like GreedyDual: the
+    priority of a block is its value plus the priority of the last evicted
+    block, so that the blocks that stop being reused are evicted eventually
+    however often they were reused before. Ties are broken like LRUEvictor.
+
+    A hit is a block brought back from the evictor by `remove`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._age = 0.0
+        # Mapping: block hash -> number of hits, dropped on eviction.
+        self._num_hits: Dict[int, int] = {}
+
+    def _get_value(self, block: PhysicalTokenBlock, num_hits: int) -> float:
+        raise NotImplementedError
+
+    def _get_priority(self,
+                      block: PhysicalTokenBlock) -> Tuple[float, float, int]:
+        value = self._get_value(block, self._num_hits.get(block.block_hash, 0))
+        return (self._age + value, block.last_accessed,
+                -block.num_hashed_tokens)
+
+    def _on_evict(self, block: PhysicalTokenBlock,
+                  priority: Tuple[float, float, int]) -> None:
+        self._age = priority[0]
+        self._num_hits.pop(block.block_hash, None)
+
+    def remove(self, block_hash: int) -> PhysicalTokenBlock:
+        block = super().remove(block_hash)
+        self._num_hits[block_hash] = self._num_hits.get(block_hash, 0) + 1
+        return block
+
+
+class LFUEvictor(GreedyDualEvictor):
+    """Evicts the least frequently reused block (LFU with dynamic aging)."""
+
+    def _get_value(self, block: PhysicalTokenBlock, num_hits: int) -> float:
+        return 1.0 + num_hits
+
+
+class CostAwareEvictor(GreedyDualEvictor):
+    """Evicts the block that is the cheapest to lose given its prefix depth.
+
+    A cached block is only reused if all blocks of its prefix are cached
+    too, so losing a block at the head of a prefix costs the reuse of every
+    block after it. The value of a block is its hits divided by its depth in
+    blocks, so the tail blocks of long prefixes go first.
+    """
+
+    def _get_value(self, block: PhysicalTokenBlock, num_hits: int) -> float:
+        # The blocks allocated without a hash, e.g. the cross-attention
+        # blocks, are not part of a prefix.
+        depth = max(block.num_hashed_tokens // block.block_size, 1)
+        return (1.0 + num_hits) / depth
+
+
 def make_evictor(eviction_policy: EvictionPolicy) -> Evictor:
     if eviction_policy == EvictionPolicy.LRU:
         return LRUEvictor()
+    elif eviction_policy == EvictionPolicy.LFU:
+        return LFUEvictor()
+    elif eviction_policy == EvictionPolicy.COST_AWARE:
+        return CostAwareEvictor()
     else:
         raise ValueError(f"Unknown cache eviction policy: {eviction_policy}")
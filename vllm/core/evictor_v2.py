@@ -1,6 +1,8 @@
 import enum
+import heapq
 from abc import ABC, abstractmethod
-from typing import OrderedDict, Tuple
+from itertools import count
+from typing import Dict, List, OrderedDict, Tuple
 
 
 class EvictionPolicy(enum.Enum):
@@ -72,11 +74,21 @@ class LRUEvictor(Evictor):
     that's recorded in the PhysicalTokenBlock. If there are multiple blocks with
     the same last_accessed time, then the one with the largest num_hashed_tokens
     will be evicted. If two blocks each have the lowest last_accessed time and
-    highest num_hashed_tokens value, then one will be chose arbitrarily
+    highest num_hashed_tokens value, then the one added or updated first is
+    evicted.
+
+    The blocks are kept in a heap, so that an eviction takes O(log n). The
+    heap entries of removed and updated blocks are skipped on eviction, and
+    the heap is rebuilt once most of its entries are stale.
     """
 
     def __init__(self):
         self.free_table: OrderedDict[int, BlockMetaData] = OrderedDict()
+        # Entries (last_accessed, -num_hashed_tokens, entry id, block id).
+        self._heap: List[Tuple[float, int, int, int]] = []
+        # Mapping: block id -> id of its live heap entry.
+        self._entry_ids: Dict[int, int] = {}
+        self._entry_counter = count()
 
     def __contains__(self, block_id: int) -> bool:
         return block_id in self.free_table
@@ -85,36 +97,46 @@ class LRUEvictor(Evictor):
         if len(self.free_table) == 0:
             raise ValueError("No usable cache memory left")
 
-        evicted_block = next(iter(self.free_table.values()))
-        evicted_block_id = next(iter(self.free_table.keys()))
-        # The blocks with the lowest timestamps should be placed consecutively
-        # at the start of OrderedDict. Loop through all these blocks to
-        # find the one with maximum number of hashed tokens.
-        for _id, block in self.free_table.items():
-            if evicted_block.last_accessed > block.last_accessed or (
-                    evicted_block.last_accessed == block.last_accessed and
-                    evicted_block.num_hashed_tokens < block.num_hashed_tokens):
-                evicted_block = block
-                evicted_block_id = _id
-
-        self.free_table.pop(evicted_block_id)
+        while True:
+            _, _, entry_id, block_id = heapq.heappop(self._heap)
+            if self._entry_ids.get(block_id) == entry_id:
+                break
+        del self._entry_ids[block_id]
+        evicted_block = self.free_table.pop(block_id)
 
-        return evicted_block_id, evicted_block.content_hash
+        return block_id, evicted_block.content_hash
 
     def add(self, block_id: int, content_hash: int, num_hashed_tokens: int,
             last_accessed: float):
         self.free_table[block_id] = BlockMetaData(content_hash,
                                                   num_hashed_tokens,
                                                   last_accessed)
+        self._push(block_id)
 
     def update(self, block_id: int, last_accessed: float):
         self.free_table[block_id].last_accessed = last_accessed
+        self._push(block_id)
+
+    def _push(self, block_id: int) -> None:
+        block = self.free_table[block_id]
+        entry_id = next(self._entry_counter)
+        self._entry_ids[block_id] = entry_id
+        heapq.heappush(self._heap,
+                       (block.last_accessed, -block.num_hashed_tokens,
+                        entry_id, block_id))
+        if len(self._heap) > 2 * len(self.free_table) + 64:
+            self._heap = [
+                entry for entry in self._heap
+                if self._entry_ids.get(entry[3]) == entry[2]
+            ]
+            heapq.heapify(self._heap)
 
     def remove(self, block_id: int):
         if block_id not in self.free_table:
             raise ValueError(
                 "Attempting to remove block that's not in the evictor")
         self.free_table.pop(block_id)
+        del self._entry_ids[block_id]
 
     @property
     def num_blocks(self) -> int:
@@ -0,0 +1,247 @@
+"""Weighted fair sharing of the scheduling budget between tenants.
+
+Every request is accounted to a tenant, `SamplingParams.tenant_id`. The
+tenants without a quota of their own are accounted together to
+`OTHER_TENANTS`, as the tenant ids are set by the clients. Each step the
+tenants with unfinished requests split the token and sequence budgets of the
+step by their weights, and a tenant with a token rate is held back while
+its token bucket is empty. The scheduler admits new requests within the
+shares, hands the budget left over to the tenants that were held back by
+their share alone, and preempts the requests of the tenants over their share
+first.
+"""
+import math
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import AbstractSet, Dict, Mapping, Optional
+
+# The key of the quota of the tenants without one of their own. Those tenants
+# share its budget, token bucket and metrics as one tenant.
+OTHER_TENANTS = "*"
+
+
+def get_tenant_group(tenant_id: str,
+                     quota_tenant_ids: AbstractSet[str]) -> str:
+    """The tenant the requests of `tenant_id` are accounted to."""
+    return tenant_id if tenant_id in quota_tenant_ids else OTHER_TENANTS
+
+
+@dataclass
+class TenantQuota:
+    """The quota of a tenant.
+
+    Args:
+        weight: The share of the budgets of a step the tenant gets, relative
+            to the weights of the other tenants with unfinished requests.
+        max_num_seqs: The max number of running sequences of the tenant.
+            None for no limit.
+        token_rate: The tokens per second the token bucket of the tenant is
+            refilled with. Every token scheduled for the tenant is taken from
+            the bucket, and no new request of the tenant is admitted while it
+            is empty. None for no bucket.
+        burst_tokens: The capacity of the token bucket. Defaults to one
+            second of `token_rate`.
+    """
+    weight: float = 1.0
+    max_num_seqs: Optional[int] = None
+    token_rate: Optional[float] = None
+    burst_tokens: Optional[int] = None
+
+    def __post_init__(self):
+        if self.weight <= 0:
+            raise ValueError(f"weight must be positive, got {self.weight}.")
+        if self.max_num_seqs is not None and self.max_num_seqs < 1:
+            raise ValueError(
+                f"max_num_seqs must be at least 1, got {self.max_num_seqs}.")
+        if self.token_rate is not None and self.token_rate <= 0:
+            raise ValueError(
+                f"token_rate must be positive, got {self.token_rate}.")
+        if self.burst_tokens is not None:
+            if self.token_rate is None:
+                raise ValueError("burst_tokens requires a token_rate.")
+            if self.burst_tokens < 1:
+                raise ValueError("burst_tokens must be at least 1, got "
+                                 f"{self.burst_tokens}.")
+
+
+class TokenBucket:
+    """A token bucket that may go into debt.
+
+    The tokens of the running requests are taken even if the bucket runs dry,
+    as their decodes are never held back; the debt then delays the next
+    admissions of the tenant until it is paid back.
+    """
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = now
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def consume(self, num_tokens: int) -> None:
+        self.tokens -= num_tokens
+
+
+@dataclass
+class TenantLimits:
+    """The limits of the tenants in one scheduling step.
+
+    `token_budgets` and `max_num_seqs` are the fair shares of the tenants
+    capped by their quotas. `hard_token_budgets` and `hard_max_num_seqs` are
+    the quotas alone, which still hold when the budget left over after the
+    shares is handed out. A tenant missing from a dict is not limited by it.
+
+    The dicts are keyed by `get_group`: the tenants not in
+    `quota_tenant_ids` are limited together under `OTHER_TENANTS`.
+    """
+    token_budgets: Dict[str, int]
+    max_num_seqs: Dict[str, int]
+    hard_token_budgets: Dict[str, int]
+    hard_max_num_seqs: Dict[str, int]
+    quota_tenant_ids: AbstractSet[str]
+
+    def get_group(self, tenant_id: str) -> str:
+        return get_tenant_group(tenant_id, self.quota_tenant_ids)
+
+    @property
+    def shares_lifted(self) -> bool:
+        return self.token_budgets is self.hard_token_budgets
+
+    def lift_shares(self) -> "TenantLimits":
+        return TenantLimits(token_budgets=self.hard_token_budgets,
+                            max_num_seqs=self.hard_max_num_seqs,
+                            hard_token_budgets=self.hard_token_budgets,
+                            hard_max_num_seqs=self.hard_max_num_seqs,
+                            quota_tenant_ids=self.quota_tenant_ids)
+
+
+class TenantManager:
+    """Keeps the quotas, token buckets and statistics of the tenants.
+
+    Args:
+        quotas: The quotas keyed by tenant id, with the quota of all other
+            tenants under `OTHER_TENANTS`. The other tenants get
+            `TenantQuota()` if it is missing.
+    """
+
+    def __init__(self, quotas: Mapping[str, TenantQuota]) -> None:
+        self.quotas = dict(quotas)
+        self.default_quota = self.quotas.pop(OTHER_TENANTS, TenantQuota())
+        # Number of unfinished requests of the tenants that have any, keyed
+        # by `get_group` like the token buckets.
+        self._num_requests: Dict[str, int] = defaultdict(int)
+        self._buckets: Dict[str, TokenBucket] = {}
+        # Statistics since the last `get_stats`, keyed by `get_group`.
+        self._num_scheduled_tokens: Counter = Counter()
+        self._num_deferred: Counter = Counter()
+        self._num_preempted: Counter = Counter()
+
+    @classmethod
+    def from_config(
+            cls, tenant_quotas: Mapping[str,
+                                        Mapping[str,
+                                                float]]) -> "TenantManager":
+        return cls({
+            tenant_id: TenantQuota(**quota)
+            for tenant_id, quota in tenant_quotas.items()
+        })
+
+    def get_quota(self, tenant_id: str) -> TenantQuota:
+        return self.quotas.get(tenant_id, self.default_quota)
+
+    def get_group(self, tenant_id: str) -> str:
+        """The tenant the budget, token bucket and metrics of the tenant are
+        accounted to. Tenants without a quota of their own are folded into
+        `OTHER_TENANTS`, so that the clients get no more of the budget and
+        the label cardinality stays bounded however many ids they use."""
+        return get_tenant_group(tenant_id, self.quotas)
+
+    def add_request(self, tenant_id: str) -> None:
+        self._num_requests[self.get_group(tenant_id)] += 1
+
+    def remove_request(self, tenant_id: str) -> None:
+        group = self.get_group(tenant_id)
+        self._num_requests[group] -= 1
+        if self._num_requests[group] <= 0:
+            del self._num_requests[group]
+
+    def get_limits(self, token_budget: int, max_num_seqs: int,
+                   now: float) -> TenantLimits:
+        """Splits the budgets of a step between the tenants with unfinished
+        requests by their weights."""
+        total_weight = sum(
+            self.get_quota(tenant_id).weight
+            for tenant_id in self._num_requests)
+        limits = TenantLimits({}, {}, {}, {}, self.quotas.keys())
+        for tenant_id in self._num_requests:
+            quota = self.get_quota(tenant_id)
+            share = quota.weight / total_weight
+            limits.token_budgets[tenant_id] = math.ceil(token_budget * share)
+            limits.max_num_seqs[tenant_id] = math.ceil(max_num_seqs * share)
+            if quota.token_rate is not None:
+                bucket = self._get_bucket(tenant_id, quota, now)
+                bucket.refill(now)
+                if bucket.tokens <= 0:
+                    limits.token_budgets[tenant_id] = 0
+                    limits.hard_token_budgets[tenant_id] = 0
+            if quota.max_num_seqs is not None:
+                limits.max_num_seqs[tenant_id] = min(
+                    limits.max_num_seqs[tenant_id], quota.max_num_seqs)
+                limits.hard_max_num_seqs[tenant_id] = quota.max_num_seqs
+        return limits
+
+    def _get_bucket(self, tenant_id: str, quota: TenantQuota,
+                    now: float) -> TokenBucket:
+        bucket = self._buckets.get(tenant_id)
+        if bucket is None:
+            assert quota.token_rate is not None
+            capacity = (quota.burst_tokens if quota.burst_tokens is not None
+                        else quota.token_rate)
+            bucket = self._buckets[tenant_id] = TokenBucket(
+                quota.token_rate, capacity, now)
+        return bucket
+
+    def commit_usage(self, num_batched_tokens: Mapping[str, int]) -> None:
+        """Takes the tokens scheduled in a step from the token buckets."""
+        for tenant_id, num_tokens in num_batched_tokens.items():
+            group = self.get_group(tenant_id)
+            bucket = self._buckets.get(group)
+            if bucket is not None:
+                bucket.consume(num_tokens)
+            self._num_scheduled_tokens[group] += num_tokens
+
+    def record_deferred(self, tenant_id: str) -> None:
+        self._num_deferred[self.get_group(tenant_id)] += 1
+
+    def record_preempted(self, tenant_id: str) -> None:
+        self._num_preempted[self.get_group(tenant_id)] += 1
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Returns the number of unfinished requests and token bucket tokens
+        of the tenants, and the tokens scheduled and the requests deferred
+        and preempted since the last call, keyed by metric label."""
+        # Every label is reported so that the gauges of the tenants whose
+        # requests all finished drop to 0.
+        num_requests: Counter = Counter(
+            {label: 0
+             for label in [*self.quotas, OTHER_TENANTS]})
+        num_requests.update(self._num_requests)
+        stats = {
+            "num_requests": dict(num_requests),
+            "bucket_tokens": {
+                tenant_id: bucket.tokens
+                for tenant_id, bucket in self._buckets.items()
+            },
+            "num_scheduled_tokens": dict(self._num_scheduled_tokens),
+            "num_deferred": dict(self._num_deferred),
+            "num_preempted": dict(self._num_preempted),
+        }
+        self._num_scheduled_tokens.clear()
+        self._num_deferred.clear()
+        self._num_preempted.clear()
+        return stats
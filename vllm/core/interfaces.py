@@ -1,6 +1,6 @@
 import enum
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Dict, List, Optional
 from typing import Sequence as GenericSequence
 from typing import Tuple
 
@@ -73,7 +73,11 @@ class BlockSpaceManager(ABC):
         pass
 
     @abstractmethod
-    def swap_in(self, seq_group: SequenceGroup) -> List[Tuple[int, int]]:
+    def swap_in(
+        self,
+        seq_group: SequenceGroup,
+        remote_mapping: Optional[List[Tuple[int, int, int]]] = None
+    ) -> List[Tuple[int, int]]:
         pass
 
     @abstractmethod
@@ -81,9 +85,26 @@ class BlockSpaceManager(ABC):
         pass
 
     @abstractmethod
-    def swap_out(self, seq_group: SequenceGroup) -> List[Tuple[int, int]]:
+    def swap_out(
+        self,
+        seq_group: SequenceGroup,
+        remote_mapping: Optional[List[Tuple[int, int, int]]] = None
+    ) -> List[Tuple[int, int]]:
         pass
 
+    # The hooks of the sequence parallel (SP) KV cache are not abstract: they
+    # default to a block manager without SP ranks, as only the v1 block
+    # manager migrates blocks to them.
+
+    def has_remote_blocks(self, seq_group: SequenceGroup) -> bool:
+        return False
+
+    def can_swap_out_remote(self, seq_group: SequenceGroup) -> bool:
+        return True
+
+    def is_remote_full(self) -> bool:
+        return False
+
     @abstractmethod
     def free(self, seq: Sequence) -> None:
         pass
@@ -100,6 +121,12 @@ class BlockSpaceManager(ABC):
     def get_num_free_cpu_blocks(self) -> int:
         pass
 
+    def get_num_free_remote_blocks(self) -> List[int]:
+        return []
+
+    def get_num_queued_superblocks(self) -> int:
+        return 0
+
     @abstractmethod
     def access_all_blocks_in_seq(
         self,
@@ -117,21 +144,35 @@ class BlockSpaceManager(ABC):
     def mark_blocks_as_computed(self, seq_group: SequenceGroup):
         pass
 
-    @abstractmethod
+    def get_prefix_cache_stats(self) -> Tuple[int, Dict[str, int]]:
+        """Returns the full prompt blocks looked up in the prefix cache and
+        the hits of every tier since the last call. Only the v1 block manager
+        tracks them."""
+        return 0, {}
+
     def add_kvcache_migrate_block(self, seq: Sequence) -> None:
-        pass
+        return
 
-    @abstractmethod
-    def get_kvcache_migrate_block(self, mapping: List[Tuple[int, int,
-                                                            int]]) -> None:
-        pass
+    def get_kvcache_migrate_block(
+            self, mapping: List[Tuple[int, int,
+                                      int]]) -> List[Tuple[int, int]]:
+        return []
+
+    def get_kvcache_recall_block(self,
+                                 mapping: List[int]) -> List[Tuple[int, int]]:
+        return []
+
+    def commit_kvcache_migrate_blocks(self) -> None:
+        return
+
+    def set_kvcache_migrate_thresholds(self, threshold: int,
+                                       start: int) -> None:
+        return
 
-    @abstractmethod
     def remove_kvcache_migrate_block(self, seq_id: int) -> None:
-        pass
+        return
 
-    @abstractmethod
     def format_kvcache_migrate_blocks(
             self, blocks_to_migrate: List[Tuple[int, int, int]],
             blocks_to_copy: List[Tuple[int, int]]) -> None:
-        pass
+        return
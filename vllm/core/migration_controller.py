@@ -0,0 +1,142 @@
+"""Controllers that choose when superblocks are migrated to the sequence
+parallel ranks."""
+import enum
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+
+class MigrationControllerPolicy(enum.Enum):
+    """Enum for the controller used by make_migration_controller to
+       instantiate the correct MigrationController subclass.
+    """
+    STATIC = enum.auto()
+    ADAPTIVE = enum.auto()
+
+
+@dataclass
+class MigrationDecision:
+    """The migration thresholds in effect for a scheduler step."""
+    # Sequences start migrating once they reach this many tokens.
+    threshold: int
+    # The first token of a sequence that can be migrated.
+    start: int
+    # Estimated pressure on the local GPU blocks, in [0, 1].
+    pressure: float
+
+
+class MigrationController(ABC):
+    """The MigrationController subclasses are used by the Scheduler to set the
+    migration thresholds of the block manager at the start of every step.
+
+    All values are in tokens. The superblock size itself is not adapted, the
+    remote allocators and the workers rely on it being fixed.
+    """
+
+    def __init__(self, block_size: int, block_migrate_size: int,
+                 block_migrate_threshold: int,
+                 block_migrate_start: int) -> None:
+        self.block_size = block_size
+        self.block_migrate_size = block_migrate_size
+        self.block_migrate_threshold = block_migrate_threshold
+        self.block_migrate_start = block_migrate_start
+        self.last_decision = MigrationDecision(block_migrate_threshold,
+                                               block_migrate_start, 0.0)
+
+    @abstractmethod
+    def step(self, num_free_blocks: int, num_total_blocks: int,
+             num_waiting_tokens: int) -> MigrationDecision:
+        """Returns the thresholds for the next step given the free local GPU
+        blocks and the number of prompt tokens waiting to be scheduled."""
+        pass
+
+
+class StaticMigrationController(MigrationController):
+    """Always uses the configured thresholds."""
+
+    def step(self, num_free_blocks: int, num_total_blocks: int,
+             num_waiting_tokens: int) -> MigrationDecision:
+        return self.last_decision
+
+
+class AdaptiveMigrationController(MigrationController):
+    """Scales the configured thresholds with the pressure on the local GPU
+    blocks.
+
+    The pressure is the fraction of the local blocks that are used or needed
+    by the waiting prompts, smoothed with an exponential moving average. At
+    or below `low_watermark` the thresholds are scaled by `max_scale` so the
+    sequences stay local longer, and at or above `high_watermark` by
+    `min_scale` so they move to the SP ranks earlier. In between, the scale
+    is interpolated linearly.
+
+    The controller only depends on its inputs, so a scripted trace of the
+    inputs always yields the same decisions.
+    """
+
+    def __init__(self,
+                 block_size: int,
+                 block_migrate_size: int,
+                 block_migrate_threshold: int,
+                 block_migrate_start: int,
+                 low_watermark: float = 0.5,
+                 high_watermark: float = 0.9,
+                 min_scale: float = 0.25,
+                 max_scale: float = 2.0,
+                 smoothing: float = 0.5) -> None:
+        super().__init__(block_size, block_migrate_size,
+                         block_migrate_threshold, block_migrate_start)
+        assert 0.0 <= low_watermark < high_watermark <= 1.0
+        assert 0.0 < min_scale <= max_scale
+        assert 0.0 < smoothing <= 1.0
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.smoothing = smoothing
+        self.pressure = 0.0
+
+    def _round_to_blocks(self, num_tokens: float) -> int:
+        return int(num_tokens) // self.block_size * self.block_size
+
+    def step(self, num_free_blocks: int, num_total_blocks: int,
+             num_waiting_tokens: int) -> MigrationDecision:
+        if num_total_blocks > 0:
+            num_waiting_blocks = -(-num_waiting_tokens // self.block_size)
+            demand = num_total_blocks - num_free_blocks + num_waiting_blocks
+            raw_pressure = min(1.0, demand / num_total_blocks)
+        else:
+            raw_pressure = 1.0
+        self.pressure += self.smoothing * (raw_pressure - self.pressure)
+
+        if self.pressure <= self.low_watermark:
+            scale = self.max_scale
+        elif self.pressure >= self.high_watermark:
+            scale = self.min_scale
+        else:
+            ratio = ((self.pressure - self.low_watermark) /
+                     (self.high_watermark - self.low_watermark))
+            scale = self.max_scale + ratio * (self.min_scale - self.max_scale)
+
+        start = self._round_to_blocks(self.block_migrate_start * scale)
+        # A sequence needs at least one full superblock past `start`.
+        threshold = max(
+            self._round_to_blocks(self.block_migrate_threshold * scale),
+            start + self.block_migrate_size)
+        self.last_decision = MigrationDecision(threshold, start, self.pressure)
+        return self.last_decision
+
+
+def make_migration_controller(policy: MigrationControllerPolicy,
+                              block_size: int, block_migrate_size: int,
+                              block_migrate_threshold: int,
+                              block_migrate_start: int) -> MigrationController:
+    if policy == MigrationControllerPolicy.STATIC:
+        return StaticMigrationController(block_size, block_migrate_size,
+                                         block_migrate_threshold,
+                                         block_migrate_start)
+    elif policy == MigrationControllerPolicy.ADAPTIVE:
+        return AdaptiveMigrationController(block_size, block_migrate_size,
+                                           block_migrate_threshold,
+                                           block_migrate_start)
+    else:
+        raise ValueError(f"Unknown migration controller: {policy}")
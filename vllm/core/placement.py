@@ -0,0 +1,172 @@
+"""Placement policies for superblocks migrated to sequence parallel ranks."""
+import enum
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+
+class SelectionPolicy(enum.Enum):
+    """Enum for placement policy used by make_placement to instantiate the
+       correct Placement subclass.
+    """
+    ONLYAPPEND = enum.auto()
+    MEANAPPEND = enum.auto()
+    LEASTLOADED = enum.auto()
+    AFFINITY = enum.auto()
+    SPILL = enum.auto()
+
+
+class Placement(ABC):
+    """The Placement subclasses are used by the RemoteAllocator to choose the
+    sequence parallel rank that receives a migrated superblock.
+
+    Ranks are 1-based (rank 0 is the master). `free_blocks[i]` is the number of
+    free blocks on rank `i + 1`.
+    """
+
+    def __init__(self, num_ranks: int, num_blocks_per_rank: int) -> None:
+        self.num_ranks = num_ranks
+        self.num_blocks_per_rank = num_blocks_per_rank
+
+    @abstractmethod
+    def select_rank(self, num_blocks: int, free_blocks: List[int],
+                    seq_id: Optional[int]) -> Optional[int]:
+        """Returns the rank that should hold `num_blocks` blocks of sequence
+        `seq_id`, or None if no single rank has enough free blocks. Must not
+        change the internal state of the policy."""
+        pass
+
+    def on_allocate(self, rank: int, seq_id: Optional[int]) -> None:
+        """Records that a superblock of `seq_id` was placed on `rank`."""
+        return
+
+    def forget(self, seq_id: int) -> None:
+        """Drops any per-sequence state once the sequence is freed."""
+        return
+
+
+class OnlyAppendPlacement(Placement):
+    """Keeps filling the last used rank and moves on to the next rank (in
+    round-robin order) only when it runs out of free blocks.
+    """
+
+    def __init__(self, num_ranks: int, num_blocks_per_rank: int) -> None:
+        super().__init__(num_ranks, num_blocks_per_rank)
+        self.last_used_rank = 1
+
+    def _first_fit_from(self, start: int, num_blocks: int,
+                        free_blocks: List[int]) -> Optional[int]:
+        for offset in range(self.num_ranks):
+            rank = (start - 1 + offset) % self.num_ranks + 1
+            if free_blocks[rank - 1] >= num_blocks:
+                return rank
+        return None
+
+    def select_rank(self, num_blocks: int, free_blocks: List[int],
+                    seq_id: Optional[int]) -> Optional[int]:
+        return self._first_fit_from(self.last_used_rank, num_blocks,
+                                    free_blocks)
+
+    def on_allocate(self, rank: int, seq_id: Optional[int]) -> None:
+        self.last_used_rank = rank
+
+
+class MeanAppendPlacement(OnlyAppendPlacement):
+    """Spreads superblocks over the ranks in round-robin order, skipping the
+    ranks that run out of free blocks.
+    """
+
+    def select_rank(self, num_blocks: int, free_blocks: List[int],
+                    seq_id: Optional[int]) -> Optional[int]:
+        start = self.last_used_rank % self.num_ranks + 1
+        return self._first_fit_from(start, num_blocks, free_blocks)
+
+
+class LeastLoadedPlacement(Placement):
+    """Places every superblock on the rank with the most free blocks. Ties are
+    broken by the lowest rank.
+    """
+
+    def select_rank(self, num_blocks: int, free_blocks: List[int],
+                    seq_id: Optional[int]) -> Optional[int]:
+        if self.num_ranks == 0:
+            return None
+        index = max(range(self.num_ranks), key=lambda i: (free_blocks[i], -i))
+        if free_blocks[index] < num_blocks:
+            return None
+        return index + 1
+
+
+class AffinityPlacement(LeastLoadedPlacement):
+    """Keeps all the superblocks of a sequence on the same rank so that the
+    decode attention of the sequence fans out to as few ranks as possible.
+
+    The first superblock of a sequence goes to the least loaded rank. When the
+    home rank of a sequence is full, the superblock spills to the least loaded
+    rank, which becomes the new home rank of the sequence.
+    """
+
+    def __init__(self, num_ranks: int, num_blocks_per_rank: int) -> None:
+        super().__init__(num_ranks, num_blocks_per_rank)
+        # Mapping: seq_id -> home rank.
+        self.home_ranks: Dict[int, int] = {}
+
+    def select_rank(self, num_blocks: int, free_blocks: List[int],
+                    seq_id: Optional[int]) -> Optional[int]:
+        home_rank = self.home_ranks.get(seq_id) if seq_id is not None else None
+        if home_rank is not None and free_blocks[home_rank - 1] >= num_blocks:
+            return home_rank
+        return super().select_rank(num_blocks, free_blocks, seq_id)
+
+    def on_allocate(self, rank: int, seq_id: Optional[int]) -> None:
+        if seq_id is not None:
+            self.home_ranks[seq_id] = rank
+
+    def forget(self, seq_id: int) -> None:
+        self.home_ranks.pop(seq_id, None)
+
+
+class SpillPlacement(Placement):
+    """Capacity-aware spill. Packs superblocks into the lowest ranks as long as
+    each rank keeps `reserve_fraction` of its blocks free, and only spills to
+    the next rank once that headroom is used up. When every rank is past its
+    headroom, the rank with the most free blocks is used.
+
+    Packing keeps the number of ranks a decode step has to talk to small under
+    light load, while the headroom leaves room for the sequences that already
+    live on a rank to keep growing there.
+    """
+
+    def __init__(self,
+                 num_ranks: int,
+                 num_blocks_per_rank: int,
+                 reserve_fraction: float = 0.1) -> None:
+        super().__init__(num_ranks, num_blocks_per_rank)
+        self.reserve_blocks = int(reserve_fraction * num_blocks_per_rank)
+
+    def select_rank(self, num_blocks: int, free_blocks: List[int],
+                    seq_id: Optional[int]) -> Optional[int]:
+        for index in range(self.num_ranks):
+            if free_blocks[index] - num_blocks >= self.reserve_blocks:
+                return index + 1
+        best: Optional[int] = None
+        for index in range(self.num_ranks):
+            if free_blocks[index] >= num_blocks and (
+                    best is None or free_blocks[index] > free_blocks[best]):
+                best = index
+        return None if best is None else best + 1
+
+
+def make_placement(selection_policy: SelectionPolicy, num_ranks: int,
+                   num_blocks_per_rank: int) -> Placement:
+    if selection_policy == SelectionPolicy.ONLYAPPEND:
+        return OnlyAppendPlacement(num_ranks, num_blocks_per_rank)
+    elif selection_policy == SelectionPolicy.MEANAPPEND:
+        return MeanAppendPlacement(num_ranks, num_blocks_per_rank)
+    elif selection_policy == SelectionPolicy.LEASTLOADED:
+        return LeastLoadedPlacement(num_ranks, num_blocks_per_rank)
+    elif selection_policy == SelectionPolicy.AFFINITY:
+        return AffinityPlacement(num_ranks, num_blocks_per_rank)
+    elif selection_policy == SelectionPolicy.SPILL:
+        return SpillPlacement(num_ranks, num_blocks_per_rank)
+    else:
+        raise ValueError(f"Unknown placement policy: {selection_policy}")
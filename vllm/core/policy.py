@@ -1,8 +1,13 @@
+import heapq
 from collections import deque
-from typing import Deque
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple, Union
 
 from vllm.sequence import SequenceGroup
 
+# Higher priorities go first. Tuples are compared element-wise, so policies
+# can break ties with later elements.
+PriorityKey = Union[float, Tuple[float, ...]]
+
 
 class Policy:
 
@@ -10,14 +15,17 @@ class Policy:
         self,
         now: float,
         seq_group: SequenceGroup,
-    ) -> float:
+    ) -> PriorityKey:
         raise NotImplementedError
 
     def sort_by_priority(
         self,
         now: float,
-        seq_groups: Deque[SequenceGroup],
-    ) -> Deque[SequenceGroup]:
+        seq_groups: "SequenceGroupQueue",
+    ) -> "SequenceGroupQueue":
+        if isinstance(seq_groups, PolicyQueue) and seq_groups.policy is self:
+            # Already kept in the order of this policy.
+            return seq_groups.copy()
         return deque(
             sorted(
                 seq_groups,
@@ -36,9 +44,173 @@ class FCFS(Policy):
         return now - seq_group.metrics.arrival_time
 
 
+class Priority(Policy):
+    """Lower `SamplingParams.priority` first, then FCFS."""
+
+    def get_priority(
+        self,
+        now: float,
+        seq_group: SequenceGroup,
+    ) -> Tuple[float, float]:
+        return (-seq_group.priority, now - seq_group.metrics.arrival_time)
+
+
+class EDF(Policy):
+    """Earliest deadline first, then FCFS. Requests without a deadline go
+    after all requests with one."""
+
+    def get_priority(
+        self,
+        now: float,
+        seq_group: SequenceGroup,
+    ) -> Tuple[float, float]:
+        return (-seq_group.deadline, now - seq_group.metrics.arrival_time)
+
+
+class SJF(Policy):
+    """Shortest predicted job first, then FCFS. The job size is predicted as
+    the number of tokens the request has left to compute, see
+    `SequenceGroup.get_num_remaining_tokens`."""
+
+    def get_priority(
+        self,
+        now: float,
+        seq_group: SequenceGroup,
+    ) -> Tuple[float, float]:
+        return (-seq_group.get_num_remaining_tokens(),
+                now - seq_group.metrics.arrival_time)
+
+
+class _QueueEntry:
+    __slots__ = ("priority", "order", "seq_group")
+
+    def __init__(self, priority: PriorityKey, order: int,
+                 seq_group: SequenceGroup) -> None:
+        self.priority = priority
+        self.order = order
+        self.seq_group = seq_group
+
+    def __lt__(self, other: "_QueueEntry") -> bool:
+        # The head of the heap is the highest priority, ties go to the
+        # entry that was put in front of the queue or appended first.
+        if self.priority != other.priority:
+            return self.priority > other.priority  # type: ignore[operator]
+        return self.order < other.order
+
+
+class PolicyQueue:
+    """A queue of sequence groups kept in the order of a policy in a heap.
+
+    A drop-in for the deques of the scheduler, so that a scheduling step pops
+    the groups it schedules in O(log n) each instead of sorting the whole
+    queue. Whatever end a group is added to, it is placed by its priority;
+    `appendleft` only puts it in front of the groups of equal priority.
+    `pop` and `remove` take O(n), and iterating does not follow the order.
+
+    The priority of a group is taken when it is added. Priorities are taken
+    at a fixed `now`: the waiting time term of every policy grows alike for
+    all groups, so it does not change their order.
+    """
+
+    def __init__(self,
+                 policy: Policy,
+                 seq_groups: Optional[Iterable[SequenceGroup]] = None) -> None:
+        self.policy = policy
+        self._heap: List[_QueueEntry] = []
+        # Orders of the next groups added to the front and to the back.
+        self._front = 0
+        self._back = 0
+        if seq_groups is not None:
+            for seq_group in seq_groups:
+                self._heap.append(self._entry(seq_group, self._back))
+                self._back += 1
+            heapq.heapify(self._heap)
+
+    def _entry(self, seq_group: SequenceGroup, order: int) -> _QueueEntry:
+        return _QueueEntry(self.policy.get_priority(0.0, seq_group), order,
+                           seq_group)
+
+    def append(self, seq_group: SequenceGroup) -> None:
+        heapq.heappush(self._heap, self._entry(seq_group, self._back))
+        self._back += 1
+
+    def appendleft(self, seq_group: SequenceGroup) -> None:
+        self._front -= 1
+        heapq.heappush(self._heap, self._entry(seq_group, self._front))
+
+    def extend(self, seq_groups: Iterable[SequenceGroup]) -> None:
+        for seq_group in seq_groups:
+            self.append(seq_group)
+
+    def extendleft(self, seq_groups: Iterable[SequenceGroup]) -> None:
+        for seq_group in seq_groups:
+            self.appendleft(seq_group)
+
+    def popleft(self) -> SequenceGroup:
+        """Pops the highest-priority sequence group."""
+        if not self._heap:
+            raise IndexError("pop from an empty queue")
+        return heapq.heappop(self._heap).seq_group
+
+    def pop(self) -> SequenceGroup:
+        """Pops the lowest-priority sequence group."""
+        if not self._heap:
+            raise IndexError("pop from an empty queue")
+        index = max(range(len(self._heap)), key=self._heap.__getitem__)
+        return self._remove_at(index)
+
+    def remove(self, seq_group: SequenceGroup) -> None:
+        for index, entry in enumerate(self._heap):
+            if entry.seq_group is seq_group:
+                self._remove_at(index)
+                return
+        raise ValueError(f"{seq_group} is not in the queue")
+
+    def _remove_at(self, index: int) -> SequenceGroup:
+        entry = self._heap[index]
+        last = self._heap.pop()
+        if index < len(self._heap):
+            self._heap[index] = last
+            heapq.heapify(self._heap)
+        return entry.seq_group
+
+    def copy(self) -> "PolicyQueue":
+        queue = PolicyQueue(self.policy)
+        queue._heap = self._heap.copy()
+        queue._front = self._front
+        queue._back = self._back
+        return queue
+
+    def __getitem__(self, index: int) -> SequenceGroup:
+        if index != 0:
+            raise IndexError("only the head of a PolicyQueue can be indexed")
+        if not self._heap:
+            raise IndexError("queue is empty")
+        return self._heap[0].seq_group
+
+    def __iter__(self) -> Iterator[SequenceGroup]:
+        return (entry.seq_group for entry in self._heap)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __repr__(self) -> str:
+        return (f"PolicyQueue(policy={type(self.policy).__name__}, "
+                f"len={len(self)})")
+
+
+# The queues of the scheduler.
+SequenceGroupQueue = Union[Deque[SequenceGroup], PolicyQueue]
+
+
 class PolicyFactory:
 
-    _POLICY_REGISTRY = {'fcfs': FCFS}
+    _POLICY_REGISTRY = {
+        'fcfs': FCFS,
+        'priority': Priority,
+        'deadline': EDF,
+        'sjf': SJF,
+    }
 
     @classmethod
     def get_policy(cls, policy_name: str, **kwargs) -> Policy:
@@ -7,12 +7,20 @@ from dataclasses import dataclass, field
 from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 from vllm.config import CacheConfig, LoRAConfig, SchedulerConfig
+from vllm.core.block_reservation import (BlockDemandForecaster,
+                                         BlockReservationPolicy)
+from vllm.core.evictor_v1 import EvictionPolicy
+from vllm.core.fair_share import TenantLimits, TenantManager
 from vllm.core.interfaces import AllocStatus, BlockSpaceManager
-from vllm.core.policy import Policy, PolicyFactory
+from vllm.core.migration_controller import (MigrationControllerPolicy,
+                                            make_migration_controller)
+from vllm.core.policy import (FCFS, Policy, PolicyFactory, PolicyQueue,
+                              SequenceGroupQueue)
+from vllm.core.step_cost_model import StepCostModel, StepFeatures
 from vllm.logger import init_logger
 from vllm.lora.request import LoRARequest
-from vllm.sequence import (Sequence, SequenceData, SequenceGroup,
-                           SequenceGroupMetadata, SequenceStatus)
+from vllm.sequence import (Sequence, SequenceGroup, SequenceGroupMetadata,
+                           SequenceStatus)
 
 logger = init_logger(__name__)
 
@@ -28,13 +36,17 @@ class PreemptionMode(enum.Enum):
     """Preemption modes.
 
     1. Swapping: Swap out the blocks of the preempted sequences to CPU memory
-    and swap them back in when the sequences are resumed.
+    and swap them back in when the sequences are resumed. The remote blocks
+    are swapped out to the CPU swap space of their SP ranks if there is room.
     2. Recomputation: Discard the blocks of the preempted sequences and
     recompute them when the sequences are resumed, treating the sequences as
     new prompts.
+    3. Local swapping: Swap out only the master-resident blocks of the
+    preempted sequences. Their remote superblocks stay on the SP ranks.
     """
     SWAP = enum.auto()
     RECOMPUTE = enum.auto()
+    SWAP_LOCAL = enum.auto()
 
 
 @dataclass
@@ -50,10 +62,16 @@ class SchedulingBudget:
     """
     token_budget: int
     max_num_seqs: int
+    # The per-tenant limits of the step. None if the budget is not shared
+    # between tenants.
+    tenant_limits: Optional[TenantLimits] = None
     _request_ids_num_batched_tokens: Set[str] = field(default_factory=set)
     _request_ids_num_curr_seqs: Set[str] = field(default_factory=set)
     _num_batched_tokens: int = 0
     _num_curr_seqs: int = 0
+    # Keyed by `TenantLimits.get_group`.
+    _tenant_num_batched_tokens: Dict[str, int] = field(default_factory=dict)
+    _tenant_num_curr_seqs: Dict[str, int] = field(default_factory=dict)
 
     def can_schedule(self, *, num_new_tokens: int, num_new_seqs: int):
         assert num_new_tokens != 0
@@ -61,33 +79,118 @@ class SchedulingBudget:
         return (self.num_batched_tokens + num_new_tokens <= self.token_budget
                 and self.num_curr_seqs + num_new_seqs <= self.max_num_seqs)
 
+    def tenant_can_schedule(self, tenant_id: str, *, num_new_tokens: int,
+                            num_new_seqs: int) -> bool:
+        """Whether the tokens and sequences fit in the limits of the tenant
+        on top of `can_schedule`."""
+        if self.tenant_limits is None:
+            return True
+        tenant_id = self.tenant_limits.get_group(tenant_id)
+        token_budget = self.tenant_limits.token_budgets.get(tenant_id)
+        max_num_seqs = self.tenant_limits.max_num_seqs.get(tenant_id)
+        return ((token_budget is None
+                 or self._tenant_num_batched_tokens.get(tenant_id, 0) +
+                 num_new_tokens <= token_budget) and
+                (max_num_seqs is None
+                 or self._tenant_num_curr_seqs.get(tenant_id, 0) + num_new_seqs
+                 <= max_num_seqs))
+
     def remaining_token_budget(self):
         return self.token_budget - self.num_batched_tokens
 
-    def add_num_batched_tokens(self, req_id: str, num_batched_tokens: int):
+    def remaining_tenant_token_budget(self, tenant_id: str) -> int:
+        """The tokens left to the tenant, capped by `remaining_token_budget`.
+        """
+        remaining = self.remaining_token_budget()
+        if self.tenant_limits is None:
+            return remaining
+        tenant_id = self.tenant_limits.get_group(tenant_id)
+        token_budget = self.tenant_limits.token_budgets.get(tenant_id)
+        if token_budget is None:
+            return remaining
+        return max(
+            min(
+                remaining, token_budget -
+                self._tenant_num_batched_tokens.get(tenant_id, 0)), 0)
+
+    def is_over_tenant_quota(self, tenant_id: str) -> bool:
+        """Whether the tenant has more tokens or sequences in the step than
+        its limits, counting the running requests that are never held back.
+        """
+        if self.tenant_limits is None:
+            return False
+        tenant_id = self.tenant_limits.get_group(tenant_id)
+        token_budget = self.tenant_limits.token_budgets.get(tenant_id)
+        max_num_seqs = self.tenant_limits.max_num_seqs.get(tenant_id)
+        return (
+            (token_budget is not None and
+             self._tenant_num_batched_tokens.get(tenant_id, 0) > token_budget)
+            or
+            (max_num_seqs is not None
+             and self._tenant_num_curr_seqs.get(tenant_id, 0) > max_num_seqs))
+
+    def lift_tenant_shares(self) -> bool:
+        """Lifts the fair shares of the tenants once the step has budget
+        left, keeping only their quotas. Returns whether they were lifted.
+        """
+        if (self.tenant_limits is None or self.tenant_limits.shares_lifted
+                or self.remaining_token_budget() <= 0
+                or self.num_curr_seqs >= self.max_num_seqs):
+            return False
+        self.tenant_limits = self.tenant_limits.lift_shares()
+        return True
+
+    def add_num_batched_tokens(self,
+                               req_id: str,
+                               num_batched_tokens: int,
+                               tenant_id: Optional[str] = None):
         if req_id in self._request_ids_num_batched_tokens:
             return
 
         self._request_ids_num_batched_tokens.add(req_id)
         self._num_batched_tokens += num_batched_tokens
-
-    def subtract_num_batched_tokens(self, req_id: str,
-                                    num_batched_tokens: int):
+        if self.tenant_limits is not None and tenant_id is not None:
+            tenant_id = self.tenant_limits.get_group(tenant_id)
+            self._tenant_num_batched_tokens[tenant_id] = (
+                self._tenant_num_batched_tokens.get(tenant_id, 0) +
+                num_batched_tokens)
+
+    def subtract_num_batched_tokens(self,
+                                    req_id: str,
+                                    num_batched_tokens: int,
+                                    tenant_id: Optional[str] = None):
         if req_id in self._request_ids_num_batched_tokens:
             self._request_ids_num_batched_tokens.remove(req_id)
             self._num_batched_tokens -= num_batched_tokens
-
-    def add_num_seqs(self, req_id: str, num_curr_seqs: int):
+            if self.tenant_limits is not None and tenant_id is not None:
+                tenant_id = self.tenant_limits.get_group(tenant_id)
+                self._tenant_num_batched_tokens[tenant_id] -= (
+                    num_batched_tokens)
+
+    def add_num_seqs(self,
+                     req_id: str,
+                     num_curr_seqs: int,
+                     tenant_id: Optional[str] = None):
         if req_id in self._request_ids_num_curr_seqs:
             return
 
         self._request_ids_num_curr_seqs.add(req_id)
         self._num_curr_seqs += num_curr_seqs
-
-    def subtract_num_seqs(self, req_id: str, num_curr_seqs: int):
+        if self.tenant_limits is not None and tenant_id is not None:
+            tenant_id = self.tenant_limits.get_group(tenant_id)
+            self._tenant_num_curr_seqs[tenant_id] = (
+                self._tenant_num_curr_seqs.get(tenant_id, 0) + num_curr_seqs)
+
+    def subtract_num_seqs(self,
+                          req_id: str,
+                          num_curr_seqs: int,
+                          tenant_id: Optional[str] = None):
         if req_id in self._request_ids_num_curr_seqs:
             self._request_ids_num_curr_seqs.remove(req_id)
             self._num_curr_seqs -= num_curr_seqs
+            if self.tenant_limits is not None and tenant_id is not None:
+                tenant_id = self.tenant_limits.get_group(tenant_id)
+                self._tenant_num_curr_seqs[tenant_id] -= num_curr_seqs
 
     @property
     def num_batched_tokens(self):
@@ -97,6 +200,10 @@ class SchedulingBudget:
     def num_curr_seqs(self):
         return self._num_curr_seqs
 
+    @property
+    def tenant_num_batched_tokens(self) -> Dict[str, int]:
+        return self._tenant_num_batched_tokens
+
 
 @dataclass
 class ScheduledSequenceGroup:
@@ -121,12 +228,25 @@ class SchedulerOutputs:
     blocks_to_swap_in: List[Tuple[int, int]]
     # Blocks to swap out. List of GPU -> CPU block number.
     blocks_to_swap_out: List[Tuple[int, int]]
+    # Remote blocks to swap in on the SP ranks. List of
+    # [rank, CPU -> GPU block number].
+    remote_blocks_to_swap_in: List[Tuple[int, int, int]]
+    # Remote blocks to swap out on the SP ranks. List of
+    # [rank, GPU -> CPU block number].
+    remote_blocks_to_swap_out: List[Tuple[int, int, int]]
     # Blocks to copy. Source to dest block.
     blocks_to_copy: List[Tuple[int, int]]
     # Blocks to migrate. list of GPU -> [GPU, rank].
     blocks_to_migrate: List[Tuple[int, int, int]]
-    # Dest superblock idx and rank. Note: we only set 1 superblock in master
-    superblock_to_migrate: Tuple
+    # Dest superblock idx and rank of the superblocks migrated in this step,
+    # grouped by rank.
+    superblocks_to_migrate: List[Tuple[int, int]]
+    # Src superblock idx and rank of the superblocks recalled from the SP
+    # ranks in this step, grouped by rank.
+    superblocks_to_recall: List[Tuple[int, int]]
+    # Local blocks the recalled superblocks are received into, in the order
+    # of superblocks_to_recall.
+    blocks_to_recall: List[int]
     # Sequence groups that are going to be ignored.
     ignored_seq_groups: List[SequenceGroup]
     # The number of slots for lookahead decoding.
@@ -134,11 +254,22 @@ class SchedulerOutputs:
     # The number of requests in the running queue
     running_queue_size: int
     preempted: int
+    # The features of the step for the step cost model. None if there is no
+    # target step latency.
+    step_features: Optional[StepFeatures] = None
+    # Blocks to write to the disk tier of prefix caching. List of
+    # CPU block number -> disk slot.
+    blocks_to_spill: List[Tuple[int, int]] = field(default_factory=list)
+    # Blocks to read from the disk tier of prefix caching. List of
+    # disk slot -> CPU block number.
+    blocks_to_load: List[Tuple[int, int]] = field(default_factory=list)
+    # The number of computed tokens discarded by the preemptions by
+    # recomputation of the step, which are computed again.
+    num_recompute_tokens: int = 0
 
     def __post_init__(self):
-        # Swap in and swap out should never happen at the same time.
-        assert not (self.blocks_to_swap_in and self.blocks_to_swap_out)
-
+        # Swap in and swap out can happen at the same time, see
+        # Scheduler._get_swaps.
         self.num_loras: int = len(self.lora_requests)
         if self.num_loras > 0:
             self._sort_by_lora_ids()
@@ -146,7 +277,8 @@ class SchedulerOutputs:
     def is_empty(self) -> bool:
         # NOTE: We do not consider the ignored sequence groups.
         return (not self.scheduled_seq_groups and not self.blocks_to_swap_in
-                and not self.blocks_to_swap_out and not self.blocks_to_copy)
+                and not self.blocks_to_swap_out and not self.blocks_to_copy
+                and not self.blocks_to_spill and not self.blocks_to_load)
 
     def _sort_by_lora_ids(self):
         self.scheduled_seq_groups = sorted(
@@ -180,6 +312,8 @@ class SchedulerRunningOutputs:
     swapped_out: List[SequenceGroup]
     # The blocks to swap out.
     blocks_to_swap_out: List[Tuple[int, int]]
+    # The remote blocks to swap out on the SP ranks.
+    remote_blocks_to_swap_out: List[Tuple[int, int, int]]
     # The blocks to copy.
     blocks_to_copy: List[Tuple[int, int]]
     # The number of slots for lookahead decoding.
@@ -193,6 +327,7 @@ class SchedulerRunningOutputs:
             preempted=[],
             swapped_out=[],
             blocks_to_swap_out=[],
+            remote_blocks_to_swap_out=[],
             blocks_to_copy=[],
             num_lookahead_slots=0,
         )
@@ -212,6 +347,8 @@ class SchedulerSwappedInOutputs:
     prefill_seq_groups: List[SequenceGroup]
     # The blocks to swap in.
     blocks_to_swap_in: List[Tuple[int, int]]
+    # The remote blocks to swap in on the SP ranks.
+    remote_blocks_to_swap_in: List[Tuple[int, int, int]]
     # The blocks to copy.
     blocks_to_copy: List[Tuple[int, int]]
     # The number of slots for lookahead decoding.
@@ -225,6 +362,7 @@ class SchedulerSwappedInOutputs:
             decode_seq_groups=[],
             prefill_seq_groups=[],
             blocks_to_swap_in=[],
+            remote_blocks_to_swap_in=[],
             blocks_to_copy=[],
             num_lookahead_slots=0,
             infeasible_seq_groups=[],
@@ -253,6 +391,24 @@ class SchedulerPrefillOutputs:
         )
 
 
+@dataclass
+class SchedulerMigrationOutputs:
+    """The superblocks that are migrated to the sequence parallel ranks in
+    this step.
+    """
+    # Blocks to migrate. List of GPU -> [rank, remote GPU] block number.
+    blocks_to_migrate: List[Tuple[int, int, int]]
+    # Blocks to copy into the staging area of the migration.
+    blocks_to_copy: List[Tuple[int, int]]
+    # Dest superblock idx and rank, grouped by rank.
+    superblocks_to_migrate: List[Tuple[int, int]]
+    # Src superblock idx and rank of the recalled superblocks, grouped by
+    # rank.
+    superblocks_to_recall: List[Tuple[int, int]]
+    # Local blocks the recalled superblocks are received into.
+    blocks_to_recall: List[int]
+
+
 class Scheduler:
 
     def __init__(
@@ -285,20 +441,69 @@ class Scheduler:
             num_cpu_blocks=self.cache_config.num_cpu_blocks,
             sliding_window=self.cache_config.sliding_window,
             enable_caching=self.cache_config.enable_prefix_caching,
+            num_remote_blocks=self.cache_config.num_remote_gpu_blocks,
             remote_allocator_number=remote_allocator,
             block_migrate_size=self.cache_config.block_migrate_size,
             block_migrate_threshold=self.cache_config.block_migrate_threshold,
+            block_migrate_start=self.cache_config.block_migrate_start,
+            block_migrate_policy=self.cache_config.block_migrate_policy,
+            block_migrate_budget=self.cache_config.block_migrate_budget,
+            block_recall_watermark=self.cache_config.block_recall_watermark,
+            num_remote_cpu_blocks=self.cache_config.num_remote_cpu_blocks,
+            eviction_policy=EvictionPolicy[
+                self.cache_config.prefix_caching_eviction_policy.upper()],
+            enable_cpu_prefix_cache=self.cache_config.enable_cpu_prefix_cache,
+            disk_prefix_cache_path=self.cache_config.disk_prefix_cache_path,
+            num_disk_blocks=self.cache_config.num_disk_blocks)
+        # Chooses the migration thresholds of every step.
+        self.migrate_to_remote = bool(remote_allocator)
+        self.migration_controller = make_migration_controller(
+            MigrationControllerPolicy[
+                self.cache_config.block_migrate_controller.upper()],
+            block_size=self.cache_config.block_size,
+            block_migrate_size=self.cache_config.block_migrate_size,
+            block_migrate_threshold=self.cache_config.block_migrate_threshold,
             block_migrate_start=self.cache_config.block_migrate_start)
 
+        # Orders the queues below. FCFS keeps them as deques in arrival
+        # order, the other policies keep them in heaps.
+        self.policy = PolicyFactory.get_policy(
+            policy_name=self.scheduler_config.policy)
         # Sequence groups in the WAITING state.
         # Contain new prefill or preempted requests.
-        self.waiting: Deque[SequenceGroup] = deque()
+        self.waiting: SequenceGroupQueue = self._new_queue()
         # Sequence groups in the RUNNING state.
         # Contain decode requests.
-        self.running: Deque[SequenceGroup] = deque()
+        self.running: SequenceGroupQueue = self._new_queue()
         # Sequence groups in the SWAPPED state.
         # Contain decode requests that are swapped out.
-        self.swapped: Deque[SequenceGroup] = deque()
+        self.swapped: SequenceGroupQueue = self._new_queue()
+        # Shares the budget of every step between the tenants of the
+        # requests. None if no tenant quotas are configured.
+        self.tenant_manager: Optional[TenantManager] = None
+        if self.scheduler_config.tenant_quotas is not None:
+            self.tenant_manager = TenantManager.from_config(
+                self.scheduler_config.tenant_quotas)
+        # Predicts the step times the prefill chunks are sized by. None if
+        # there is no target step latency.
+        self.step_cost_model: Optional[StepCostModel] = None
+        if self.scheduler_config.target_step_latency_ms is not None:
+            self.step_cost_model = StepCostModel()
+        # Forecasts the blocks the running and swapped sequences still need,
+        # which are kept free of new prefills. None if no blocks are
+        # reserved.
+        self.block_forecaster: Optional[BlockDemandForecaster] = None
+        block_reservation_policy = BlockReservationPolicy[
+            self.scheduler_config.block_reservation_policy.upper()]
+        if block_reservation_policy != BlockReservationPolicy.NONE:
+            self.block_forecaster = BlockDemandForecaster(
+                block_reservation_policy,
+                block_size=self.cache_config.block_size,
+                max_model_len=self.scheduler_config.max_model_len)
+
+        # The metadata of the scheduled requests, reused from step to step
+        # and updated in place. Mapping: request_id -> SequenceGroupMetadata.
+        self._seq_group_metadata_cache: Dict[str, SequenceGroupMetadata] = {}
 
         # Time at previous scheduling step
         self.prev_time = 0.0
@@ -316,6 +521,25 @@ class Scheduler:
                                        if self.enable_artificial_preemption
                                        else 0)
         self.num_cumulative_preemption: int = 0
+        # The computed tokens discarded by the preemptions by recomputation
+        # in the current step.
+        self._num_recompute_tokens: int = 0
+
+    def _new_queue(
+        self, seq_groups: Iterable[SequenceGroup] = ()) -> SequenceGroupQueue:
+        if isinstance(self.policy, FCFS):
+            return deque(seq_groups)
+        return PolicyQueue(self.policy, seq_groups)
+
+    def _new_budget(self) -> SchedulingBudget:
+        budget = SchedulingBudget(
+            token_budget=self.scheduler_config.max_num_batched_tokens,
+            max_num_seqs=self.scheduler_config.max_num_seqs,
+        )
+        if self.tenant_manager is not None:
+            budget.tenant_limits = self.tenant_manager.get_limits(
+                budget.token_budget, budget.max_num_seqs, time.time())
+        return budget
 
     @property
     def lora_enabled(self) -> bool:
@@ -329,6 +553,15 @@ class Scheduler:
     def add_seq_group(self, seq_group: SequenceGroup) -> None:
         # Add sequence groups to the waiting queue.
         self.waiting.append(seq_group)
+        if self.tenant_manager is not None:
+            self.tenant_manager.add_request(seq_group.tenant_id)
+
+    def _free_seq_group(self, seq_group: SequenceGroup) -> None:
+        """Drops the state kept for a sequence group that finished or was
+        aborted or ignored."""
+        self._seq_group_metadata_cache.pop(seq_group.request_id, None)
+        if self.tenant_manager is not None:
+            self.tenant_manager.remove_request(seq_group.tenant_id)
 
     def abort_seq_group(self, request_id: Union[str, Iterable[str]]) -> None:
         """Aborts a sequence group with the given ID.
@@ -360,6 +593,7 @@ class Scheduler:
             for aborted_group in aborted_groups:
                 # Remove the sequence group from the state queue.
                 state_queue.remove(aborted_group)
+                self._free_seq_group(aborted_group)
                 for seq in aborted_group.get_seqs():
                     if seq.is_finished():
                         continue
@@ -379,12 +613,12 @@ class Scheduler:
 
     def _schedule_running(
         self,
-        running_queue: deque,
+        running_queue: SequenceGroupQueue,
         budget: SchedulingBudget,
         curr_loras: Optional[Set[int]],
         policy: Policy,
         enable_chunking: bool = False,
-    ) -> Tuple[deque, SchedulerRunningOutputs]:
+    ) -> Tuple[SequenceGroupQueue, SchedulerRunningOutputs]:
         """Schedule sequence groups that are running.
 
         Running queue should include decode and chunked prefill requests.
@@ -408,6 +642,7 @@ class Scheduler:
         """
         # Blocks that need to be swapped or copied before model execution.
         blocks_to_swap_out: List[Tuple[int, int]] = []
+        remote_blocks_to_swap_out: List[Tuple[int, int, int]] = []
         blocks_to_copy: List[Tuple[int, int]] = []
 
         decode_seq_groups: List[ScheduledSequenceGroup] = []
@@ -432,10 +667,11 @@ class Scheduler:
             running_queue.popleft()
             while not self._can_append_slots(seq_group):
                 budget.subtract_num_batched_tokens(seq_group.request_id,
-                                                   num_running_tokens)
+                                                   num_running_tokens,
+                                                   seq_group.tenant_id)
                 num_running_seqs = seq_group.get_max_num_running_seqs()
                 budget.subtract_num_seqs(seq_group.request_id,
-                                         num_running_seqs)
+                                         num_running_seqs, seq_group.tenant_id)
 
                 if (curr_loras is not None and seq_group.lora_int_id > 0
                         and seq_group.lora_int_id in curr_loras):
@@ -443,9 +679,11 @@ class Scheduler:
 
                 if running_queue:
                     # Preempt the lowest-priority sequence groups.
-                    victim_seq_group = running_queue.pop()
+                    victim_seq_group = self._pop_preemption_victim(
+                        running_queue, budget, policy, now)
                     preempted_mode = self._preempt(victim_seq_group,
-                                                   blocks_to_swap_out)
+                                                   blocks_to_swap_out,
+                                                   remote_blocks_to_swap_out)
                     if preempted_mode == PreemptionMode.RECOMPUTE:
                         preempted.append(victim_seq_group)
                     else:
@@ -454,7 +692,8 @@ class Scheduler:
                     # No other sequence groups can be preempted.
                     # Preempt the current sequence group.
                     preempted_mode = self._preempt(seq_group,
-                                                   blocks_to_swap_out)
+                                                   blocks_to_swap_out,
+                                                   remote_blocks_to_swap_out)
                     if preempted_mode == PreemptionMode.RECOMPUTE:
                         preempted.append(seq_group)
                     else:
@@ -474,14 +713,16 @@ class Scheduler:
                                                token_chunk_size=1))
                     self.add_kvcache_migrate_group(seq_group)
                 budget.add_num_batched_tokens(seq_group.request_id,
-                                              num_running_tokens)
+                                              num_running_tokens,
+                                              seq_group.tenant_id)
                 # OPTIMIZATION:  Note that get_max_num_running_seqs is
                 # expensive. For the default scheduling chase where
                 # enable_chunking is False, num_seqs are updated before running
                 # this method, so we don't have to update it again here.
                 if enable_chunking:
                     num_running_seqs = seq_group.get_max_num_running_seqs()
-                    budget.add_num_seqs(seq_group.request_id, num_running_seqs)
+                    budget.add_num_seqs(seq_group.request_id, num_running_seqs,
+                                        seq_group.tenant_id)
                 if curr_loras is not None and seq_group.lora_int_id > 0:
                     curr_loras.add(seq_group.lora_int_id)
 
@@ -491,18 +732,19 @@ class Scheduler:
             preempted=preempted,
             swapped_out=swapped_out,
             blocks_to_swap_out=blocks_to_swap_out,
+            remote_blocks_to_swap_out=remote_blocks_to_swap_out,
             blocks_to_copy=blocks_to_copy,
             num_lookahead_slots=self._get_num_lookahead_slots(
                 is_prefill=False))
 
     def _schedule_swapped(
         self,
-        swapped_queue: deque,
+        swapped_queue: SequenceGroupQueue,
         budget: SchedulingBudget,
         curr_loras: Optional[Set[int]],
         policy: Policy,
         enable_chunking: bool = False,
-    ) -> Tuple[deque, SchedulerSwappedInOutputs]:
+    ) -> Tuple[SequenceGroupQueue, SchedulerSwappedInOutputs]:
         """Schedule sequence groups that are swapped out.
 
         It schedules swapped requests as long as it fits `budget` and
@@ -528,6 +770,7 @@ class Scheduler:
         """
         # Blocks that need to be swapped or copied before model execution.
         blocks_to_swap_in: List[Tuple[int, int]] = []
+        remote_blocks_to_swap_in: List[Tuple[int, int, int]] = []
         blocks_to_copy: List[Tuple[int, int]] = []
         decode_seq_groups: List[ScheduledSequenceGroup] = []
         prefill_seq_groups: List[ScheduledSequenceGroup] = []
@@ -584,7 +827,8 @@ class Scheduler:
             if lora_int_id > 0 and curr_loras is not None:
                 curr_loras.add(lora_int_id)
             swapped_queue.popleft()
-            self._swap_in(seq_group, blocks_to_swap_in)
+            self._swap_in(seq_group, blocks_to_swap_in,
+                          remote_blocks_to_swap_in)
             self._append_slots(seq_group, blocks_to_copy)
             is_prefill = seq_group.is_prefill()
             if is_prefill:
@@ -594,8 +838,10 @@ class Scheduler:
             else:
                 decode_seq_groups.append(
                     ScheduledSequenceGroup(seq_group, token_chunk_size=1))
-            budget.add_num_batched_tokens(seq_group.request_id, num_new_tokens)
-            budget.add_num_seqs(seq_group.request_id, num_new_seqs)
+            budget.add_num_batched_tokens(seq_group.request_id, num_new_tokens,
+                                          seq_group.tenant_id)
+            budget.add_num_seqs(seq_group.request_id, num_new_seqs,
+                                seq_group.tenant_id)
 
         swapped_queue.extendleft(leftover_swapped)
 
@@ -603,6 +849,7 @@ class Scheduler:
             decode_seq_groups=decode_seq_groups,
             prefill_seq_groups=prefill_seq_groups,
             blocks_to_swap_in=blocks_to_swap_in,
+            remote_blocks_to_swap_in=remote_blocks_to_swap_in,
             blocks_to_copy=blocks_to_copy,
             num_lookahead_slots=self._get_num_lookahead_slots(
                 is_prefill=False),
@@ -626,11 +873,11 @@ class Scheduler:
 
     def _schedule_prefills(
         self,
-        waiting_queue: deque,
+        waiting_queue: SequenceGroupQueue,
         budget: SchedulingBudget,
         curr_loras: Optional[Set[int]],
         enable_chunking: bool = False,
-    ) -> Tuple[deque, SchedulerPrefillOutputs]:
+    ) -> Tuple[SequenceGroupQueue, SchedulerPrefillOutputs]:
         """Schedule sequence groups that are in prefill stage.
 
         Note that the current scheduler treats PREEMPTED_FOR_RECOMPUTE
@@ -661,9 +908,21 @@ class Scheduler:
         seq_groups: List[SequenceGroup] = []
         # We don't sort waiting queue because we assume it is sorted.
         # Copy the queue so that the input queue is not modified.
-        waiting_queue = deque([s for s in waiting_queue])
+        waiting_queue = waiting_queue.copy()
 
         leftover_waiting_sequences: Deque[SequenceGroup] = deque()
+        # Tenants of the requests held back by the limits of their tenant.
+        deferred_tenant_ids: List[str] = []
+        # The free blocks left after the blocks reserved for the running and
+        # swapped sequences, and those preempted in this step which are
+        # scheduled first in the next step. None if no blocks are reserved.
+        num_unreserved_blocks: Optional[int] = None
+        if self.block_forecaster is not None and waiting_queue:
+            num_reserved_blocks = self.block_forecaster.forecast(
+                list(self.running) + list(self.swapped))
+            num_unreserved_blocks = (
+                self.block_manager.get_num_free_gpu_blocks() -
+                num_reserved_blocks)
         while self._passed_delay(time.time()) and waiting_queue:
             seq_group = waiting_queue[0]
 
@@ -724,6 +983,34 @@ class Scheduler:
                                                num_new_seqs=num_new_seqs)):
                 break
 
+            if budget.tenant_limits is not None:
+                tenant_id = seq_group.tenant_id
+                if enable_chunking:
+                    num_new_tokens = min(
+                        num_new_tokens,
+                        budget.remaining_tenant_token_budget(tenant_id))
+                if num_new_tokens == 0 or not budget.tenant_can_schedule(
+                        tenant_id,
+                        num_new_tokens=num_new_tokens,
+                        num_new_seqs=num_new_seqs):
+                    # The tenant used up its limits of this step, let the
+                    # requests of the other tenants go first.
+                    deferred_tenant_ids.append(tenant_id)
+                    leftover_waiting_sequences.appendleft(seq_group)
+                    waiting_queue.popleft()
+                    continue
+
+            if num_unreserved_blocks is not None:
+                assert self.block_forecaster is not None
+                num_required_blocks = self.block_forecaster.forecast(
+                    [seq_group])
+                # Without running sequences the request can not be preempted
+                # by their growth, let it run.
+                if (num_required_blocks > num_unreserved_blocks
+                        and (seq_groups or self.running or self.swapped)):
+                    break
+                num_unreserved_blocks -= num_required_blocks
+
             # Can schedule this request.
             if curr_loras is not None and lora_int_id > 0:
                 curr_loras.add(lora_int_id)
@@ -732,11 +1019,23 @@ class Scheduler:
             seq_groups.append(
                 ScheduledSequenceGroup(seq_group=seq_group,
                                        token_chunk_size=num_new_tokens))
-            budget.add_num_batched_tokens(seq_group.request_id, num_new_tokens)
-            budget.add_num_seqs(seq_group.request_id, num_new_seqs)
+            budget.add_num_batched_tokens(seq_group.request_id, num_new_tokens,
+                                          seq_group.tenant_id)
+            budget.add_num_seqs(seq_group.request_id, num_new_seqs,
+                                seq_group.tenant_id)
 
         # Queue requests that couldn't be scheduled.
         waiting_queue.extendleft(leftover_waiting_sequences)
+        if deferred_tenant_ids and budget.lift_tenant_shares():
+            # Hand the budget left after every tenant got its share to the
+            # requests that were held back by the share of their tenant.
+            waiting_queue, prefills = self._schedule_prefills(
+                waiting_queue, budget, curr_loras, enable_chunking)
+            seq_groups.extend(prefills.seq_groups)
+            ignored_seq_groups.extend(prefills.ignored_seq_groups)
+        elif self.tenant_manager is not None:
+            for tenant_id in deferred_tenant_ids:
+                self.tenant_manager.record_deferred(tenant_id)
         if len(seq_groups) > 0:
             self.prev_prompt = True
 
@@ -745,6 +1044,36 @@ class Scheduler:
             ignored_seq_groups=ignored_seq_groups,
             num_lookahead_slots=self._get_num_lookahead_slots(is_prefill=True))
 
+    def _schedule_migration(self) -> SchedulerMigrationOutputs:
+        """Migrates up to `block_migrate_budget` queued superblocks to the
+        sequence parallel ranks.
+
+        The migrated blocks are first copied into the staging area at the end
+        of the local GPU pool, from where the workers send them to the SP
+        ranks, one transfer per destination rank, in the background of the
+        forward. The block tables switch to the remote blocks in the next
+        step.
+
+        When nothing is left to migrate and the local GPU blocks are idle,
+        migrated superblocks are recalled instead, received straight into
+        newly allocated local blocks.
+        """
+        blocks_to_migrate: List[Tuple[int, int, int]] = []
+        blocks_to_copy: List[Tuple[int, int]] = []
+        superblocks_to_migrate = self.block_manager.get_kvcache_migrate_block(
+            blocks_to_migrate)
+        self.block_manager.format_kvcache_migrate_blocks(
+            blocks_to_migrate, blocks_to_copy)
+        blocks_to_recall: List[int] = []
+        superblocks_to_recall = self.block_manager.get_kvcache_recall_block(
+            blocks_to_recall)
+        return SchedulerMigrationOutputs(
+            blocks_to_migrate=blocks_to_migrate,
+            blocks_to_copy=blocks_to_copy,
+            superblocks_to_migrate=superblocks_to_migrate,
+            superblocks_to_recall=superblocks_to_recall,
+            blocks_to_recall=blocks_to_recall)
+
     def _schedule_default(self) -> SchedulerOutputs:
         """Schedule queued requests.
 
@@ -754,15 +1083,13 @@ class Scheduler:
         be swapped or preempted.
         """
         # Include running requests to the budget.
-        budget = SchedulingBudget(
-            token_budget=self.scheduler_config.max_num_batched_tokens,
-            max_num_seqs=self.scheduler_config.max_num_seqs,
-        )
+        budget = self._new_budget()
         # Make sure we include num running seqs before scheduling prefill,
         # so that we don't schedule beyond max_num_seqs for prefill.
         for seq_group in self.running:
             budget.add_num_seqs(seq_group.request_id,
-                                seq_group.get_max_num_running_seqs())
+                                seq_group.get_max_num_running_seqs(),
+                                seq_group.tenant_id)
         curr_loras = set(
             seq_group.lora_int_id for seq_group in self.running
             if seq_group.lora_int_id > 0) if self.lora_enabled else None
@@ -779,7 +1106,6 @@ class Scheduler:
             remaining_waiting, prefills = self._schedule_prefills(
                 self.waiting, budget, curr_loras, enable_chunking=False)
 
-        fcfs_policy = PolicyFactory.get_policy(policy_name="fcfs")
         # Don't schedule decodes if prefills are scheduled.
         # NOTE: If `_schedule_prefills` doesn't enable chunking, self.running
         # only contains decode requests, not chunked prefills.
@@ -788,7 +1114,7 @@ class Scheduler:
                 self.running,
                 budget,
                 curr_loras,
-                fcfs_policy,
+                self.policy,
                 enable_chunking=False)
 
             # If any sequence group is preempted, do not swap in any sequence
@@ -796,11 +1122,13 @@ class Scheduler:
             if len(running_scheduled.preempted) + len(
                     running_scheduled.swapped_out) == 0:
                 remaining_swapped, swapped_in = self._schedule_swapped(
-                    self.swapped, budget, curr_loras, fcfs_policy)
+                    self.swapped, budget, curr_loras, self.policy)
 
         assert (budget.num_batched_tokens <=
                 self.scheduler_config.max_num_batched_tokens)
         assert budget.num_curr_seqs <= self.scheduler_config.max_num_seqs
+        if self.tenant_manager is not None:
+            self.tenant_manager.commit_usage(budget.tenant_num_batched_tokens)
 
         # Update waiting requests.
         self.waiting = remaining_waiting
@@ -817,35 +1145,39 @@ class Scheduler:
         self.swapped.extend(running_scheduled.swapped_out)
         preempted = (len(running_scheduled.preempted) +
                      len(running_scheduled.swapped_out))
-        blocks_to_migrate: List[Tuple[int, int, int]] = []
-        blocks_to_copy_for_migration: List[Tuple[int, int]] = []
-        self.block_manager.get_kvcache_migrate_block(blocks_to_migrate)
-        self.block_manager.format_kvcache_migrate_blocks(
-            blocks_to_migrate, blocks_to_copy_for_migration)
-        superblock_size = len(blocks_to_migrate)
-        superblock_to_migrate = (blocks_to_migrate[0][2] % superblock_size,
-                                 blocks_to_migrate[0][1])
+        migration = self._schedule_migration()
         # There should be no prefill from running queue because this policy
         # doesn't allow chunked prefills.
         assert len(running_scheduled.prefill_seq_groups) == 0
         assert len(swapped_in.prefill_seq_groups) == 0
+        blocks_to_swap_in, blocks_to_swap_out = self._get_swaps(
+            swapped_in, running_scheduled)
+        blocks_to_load, blocks_to_spill = (
+            self._get_disk_prefix_cache_transfers())
         return SchedulerOutputs(
             scheduled_seq_groups=(prefills.seq_groups +
                                   running_scheduled.decode_seq_groups +
                                   swapped_in.decode_seq_groups),
             num_prefill_groups=len(prefills.seq_groups),
             num_batched_tokens=budget.num_batched_tokens,
-            blocks_to_swap_in=swapped_in.blocks_to_swap_in,
-            blocks_to_swap_out=running_scheduled.blocks_to_swap_out,
+            blocks_to_swap_in=blocks_to_swap_in,
+            blocks_to_swap_out=blocks_to_swap_out,
+            remote_blocks_to_swap_in=swapped_in.remote_blocks_to_swap_in,
+            remote_blocks_to_swap_out=running_scheduled.
+            remote_blocks_to_swap_out,
             blocks_to_copy=running_scheduled.blocks_to_copy +
-            swapped_in.blocks_to_copy + blocks_to_copy_for_migration,
-            blocks_to_migrate=blocks_to_migrate,
-            superblock_to_migrate=superblock_to_migrate,
+            swapped_in.blocks_to_copy + migration.blocks_to_copy,
+            blocks_to_migrate=migration.blocks_to_migrate,
+            superblocks_to_migrate=migration.superblocks_to_migrate,
+            superblocks_to_recall=migration.superblocks_to_recall,
+            blocks_to_recall=migration.blocks_to_recall,
             ignored_seq_groups=prefills.ignored_seq_groups +
             swapped_in.infeasible_seq_groups,
             num_lookahead_slots=running_scheduled.num_lookahead_slots,
             running_queue_size=len(self.running),
             preempted=preempted,
+            blocks_to_spill=blocks_to_spill,
+            blocks_to_load=blocks_to_load,
         )
 
     def _schedule_chunked_prefill(self):
@@ -862,10 +1194,9 @@ class Scheduler:
         inter token latency because decodes requests don't need to blocked
         by prefill requests.
         """
-        budget = SchedulingBudget(
-            token_budget=self.scheduler_config.max_num_batched_tokens,
-            max_num_seqs=self.scheduler_config.max_num_seqs,
-        )
+        budget = self._new_budget()
+        if self.step_cost_model is not None:
+            self._limit_prefill_tokens(budget)
         curr_loras: Set[int] = set()
 
         remaining_waiting, prefills = (self.waiting,
@@ -875,13 +1206,12 @@ class Scheduler:
         remaining_swapped, swapped_in = (
             self.swapped, SchedulerSwappedInOutputs.create_empty())
 
-        # Decoding should be always scheduled first by fcfs.
-        fcfs_policy = PolicyFactory.get_policy(policy_name="fcfs")
+        # Decoding should be always scheduled first.
         remaining_running, running_scheduled = self._schedule_running(
             self.running,
             budget,
             curr_loras,
-            fcfs_policy,
+            self.policy,
             enable_chunking=True)
 
         # Schedule swapped out requests.
@@ -889,7 +1219,7 @@ class Scheduler:
         if len(running_scheduled.preempted) + len(
                 running_scheduled.swapped_out) == 0:
             remaining_swapped, swapped_in = self._schedule_swapped(
-                self.swapped, budget, curr_loras, fcfs_policy)
+                self.swapped, budget, curr_loras, self.policy)
 
         # Schedule new prefills.
         remaining_waiting, prefills = self._schedule_prefills(
@@ -898,6 +1228,8 @@ class Scheduler:
         assert (budget.num_batched_tokens <=
                 self.scheduler_config.max_num_batched_tokens)
         assert budget.num_curr_seqs <= self.scheduler_config.max_num_seqs
+        if self.tenant_manager is not None:
+            self.tenant_manager.commit_usage(budget.tenant_num_batched_tokens)
 
         # Update waiting requests.
         self.waiting = remaining_waiting
@@ -916,6 +1248,18 @@ class Scheduler:
         # Update swapped requests.
         self.swapped = remaining_swapped
         self.swapped.extend(running_scheduled.swapped_out)
+        migration = self._schedule_migration()
+        step_features = None
+        if self.step_cost_model is not None:
+            step_features = self._get_step_features(
+                prefills.seq_groups + running_scheduled.prefill_seq_groups +
+                swapped_in.prefill_seq_groups,
+                running_scheduled.decode_seq_groups +
+                swapped_in.decode_seq_groups)
+        blocks_to_swap_in, blocks_to_swap_out = self._get_swaps(
+            swapped_in, running_scheduled)
+        blocks_to_load, blocks_to_spill = (
+            self._get_disk_prefix_cache_transfers())
         return SchedulerOutputs(
             scheduled_seq_groups=(prefills.seq_groups +
                                   running_scheduled.prefill_seq_groups +
@@ -926,26 +1270,143 @@ class Scheduler:
                                 len(swapped_in.prefill_seq_groups) +
                                 len(running_scheduled.prefill_seq_groups)),
             num_batched_tokens=budget.num_batched_tokens,
-            blocks_to_swap_in=swapped_in.blocks_to_swap_in,
-            blocks_to_swap_out=running_scheduled.blocks_to_swap_out,
+            blocks_to_swap_in=blocks_to_swap_in,
+            blocks_to_swap_out=blocks_to_swap_out,
+            remote_blocks_to_swap_in=swapped_in.remote_blocks_to_swap_in,
+            remote_blocks_to_swap_out=running_scheduled.
+            remote_blocks_to_swap_out,
             blocks_to_copy=running_scheduled.blocks_to_copy +
-            swapped_in.blocks_to_copy,
-            blocks_to_migrate=[],
-            superblock_to_migrate=(0, 0),
+            swapped_in.blocks_to_copy + migration.blocks_to_copy,
+            blocks_to_migrate=migration.blocks_to_migrate,
+            superblocks_to_migrate=migration.superblocks_to_migrate,
+            superblocks_to_recall=migration.superblocks_to_recall,
+            blocks_to_recall=migration.blocks_to_recall,
             ignored_seq_groups=prefills.ignored_seq_groups +
             swapped_in.infeasible_seq_groups,
             num_lookahead_slots=running_scheduled.num_lookahead_slots,
             running_queue_size=len(self.running),
             preempted=(len(running_scheduled.preempted) +
                        len(running_scheduled.swapped_out)),
+            step_features=step_features,
+            blocks_to_spill=blocks_to_spill,
+            blocks_to_load=blocks_to_load,
         )
 
+    def _limit_prefill_tokens(self, budget: SchedulingBudget) -> None:
+        """Lowers the token budget of a chunked prefill step so that the
+        predicted time of the step with the running decodes and the prefill
+        chunks batched with them stays within the target step latency."""
+        assert self.step_cost_model is not None
+        assert self.scheduler_config.target_step_latency_ms is not None
+        num_decode_seqs = num_decode_context_tokens = 0
+        for seq_group in self.running:
+            if seq_group.is_prefill():
+                continue
+            for seq in seq_group.get_seqs(status=SequenceStatus.RUNNING):
+                num_decode_seqs += 1
+                num_decode_context_tokens += seq.get_len()
+        max_prefill_tokens = self.step_cost_model.get_max_prefill_tokens(
+            num_decode_seqs, num_decode_context_tokens,
+            self.scheduler_config.target_step_latency_ms / 1000)
+        if max_prefill_tokens is None:
+            return
+        # The prefills still make progress when the decodes alone take
+        # longer than the target.
+        max_prefill_tokens = max(max_prefill_tokens,
+                                 self.cache_config.block_size)
+        budget.token_budget = min(budget.token_budget,
+                                  num_decode_seqs + max_prefill_tokens)
+
+    @staticmethod
+    def _get_step_features(
+        prefill_seq_groups: List[ScheduledSequenceGroup],
+        decode_seq_groups: List[ScheduledSequenceGroup],
+    ) -> StepFeatures:
+        num_decode_seqs = num_decode_context_tokens = 0
+        for scheduled_seq_group in decode_seq_groups:
+            for seq in scheduled_seq_group.seq_group.get_seqs(
+                    status=SequenceStatus.RUNNING):
+                num_decode_seqs += 1
+                num_decode_context_tokens += seq.get_len()
+        return StepFeatures(
+            num_prefill_tokens=sum(s.token_chunk_size
+                                   for s in prefill_seq_groups),
+            num_decode_seqs=num_decode_seqs,
+            num_decode_context_tokens=num_decode_context_tokens)
+
+    def observe_step_time(self, scheduler_outputs: SchedulerOutputs,
+                          step_time: float) -> None:
+        """Fits the step cost model to the measured time of the model step
+        of `scheduler_outputs`, in seconds."""
+        if (self.step_cost_model is not None
+                and scheduler_outputs.step_features is not None):
+            self.step_cost_model.update(scheduler_outputs.step_features,
+                                        step_time)
+
     def _schedule(self) -> SchedulerOutputs:
         """Schedule queued requests."""
+        # The superblocks migrated in the last step have landed on the SP
+        # ranks by the time the workers run this step.
+        self.block_manager.commit_kvcache_migrate_blocks()
+        if self.migrate_to_remote:
+            self._update_migration_thresholds()
         if self.scheduler_config.chunked_prefill_enabled:
-            return self._schedule_chunked_prefill()
+            scheduler_outputs = self._schedule_chunked_prefill()
         else:
-            return self._schedule_default()
+            scheduler_outputs = self._schedule_default()
+        for seq_group in scheduler_outputs.ignored_seq_groups:
+            self._free_seq_group(seq_group)
+        scheduler_outputs.num_recompute_tokens = self._num_recompute_tokens
+        self._num_recompute_tokens = 0
+        return scheduler_outputs
+
+    def _get_swaps(
+        self, swapped_in: SchedulerSwappedInOutputs,
+        running_scheduled: SchedulerRunningOutputs
+    ) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+        """Returns the blocks to swap in and out in this step: those of the
+        preemptions, and those promoted from and demoted to the CPU tier of
+        prefix caching.
+
+        The swaps of preemption never go both ways in a step, as a step that
+        preempts swaps nothing in. The swaps of the CPU tier can: the workers
+        run the swap outs first, so that the GPU blocks demoted and reused
+        are read before they are swapped in to.
+        """
+        # Swap in and swap out of preemption should never happen at the same
+        # time.
+        assert not (swapped_in.blocks_to_swap_in
+                    and running_scheduled.blocks_to_swap_out)
+        if not self.cache_config.enable_cpu_prefix_cache:
+            return (swapped_in.blocks_to_swap_in,
+                    running_scheduled.blocks_to_swap_out)
+        promoted_blocks, demoted_blocks = (
+            self.block_manager.get_prefix_cache_swaps())
+        return (swapped_in.blocks_to_swap_in + promoted_blocks,
+                running_scheduled.blocks_to_swap_out + demoted_blocks)
+
+    def _get_disk_prefix_cache_transfers(
+            self) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+        """Returns the blocks to load from and spill to the disk tier of
+        prefix caching in this step. The workers spill after the swap outs
+        and load before the swap ins."""
+        if (not self.cache_config.enable_cpu_prefix_cache
+                or self.cache_config.disk_prefix_cache_path is None):
+            return [], []
+        return self.block_manager.get_disk_prefix_cache_transfers()
+
+    def _update_migration_thresholds(self) -> None:
+        """Lets the migration controller choose the thresholds of this step
+        from the local GPU blocks in use and the prompts waiting for them."""
+        num_waiting_tokens = sum(
+            seq.get_len() for seq_group in self.waiting
+            for seq in seq_group.get_seqs(status=SequenceStatus.WAITING))
+        decision = self.migration_controller.step(
+            num_free_blocks=self.block_manager.get_num_free_gpu_blocks(),
+            num_total_blocks=self.cache_config.num_gpu_blocks,
+            num_waiting_tokens=num_waiting_tokens)
+        self.block_manager.set_kvcache_migrate_thresholds(
+            decision.threshold, decision.start)
 
     def _can_append_slots(self, seq_group: SequenceGroup) -> bool:
         """Determine whether or not we have enough space in the KV cache to
@@ -982,24 +1443,53 @@ class Scheduler:
             token_chunk_size = scheduled_seq_group.token_chunk_size
             seq_group.maybe_set_first_scheduled_time(now)
 
+            # The metadata of a request is built on its first step, and then
+            # only updated with what changed: the new blocks of its block
+            # tables and the fields of the step.
+            seq_group_metadata = self._seq_group_metadata_cache.get(
+                seq_group.request_id)
+            if seq_group_metadata is None:
+                seq_group_metadata = SequenceGroupMetadata(
+                    request_id=seq_group.request_id,
+                    is_prompt=seq_group.is_prefill(),
+                    seq_data={},
+                    sampling_params=seq_group.sampling_params,
+                    block_tables={},
+                    block_tables_remote_rank={},
+                    pooling_params=seq_group.pooling_params,
+                    token_chunk_size=token_chunk_size,
+                    lora_request=seq_group.lora_request,
+                    state=seq_group.state,
+                )
+                self._seq_group_metadata_cache[
+                    seq_group.request_id] = seq_group_metadata
+
             # seq_id -> SequenceData
-            seq_data: Dict[int, SequenceData] = {}
+            seq_data = seq_group_metadata.seq_data
             # seq_id -> physical block numbers
-            block_tables: Dict[int, List[int]] = {}
-            block_tables_remote_rank: Dict[int, List[int]] = {}
-
-            for seq in seq_group.get_seqs(status=SequenceStatus.RUNNING):
+            block_tables = seq_group_metadata.block_tables
+            block_tables_remote_rank = (
+                seq_group_metadata.block_tables_remote_rank)
+            running_seqs = seq_group.get_seqs(status=SequenceStatus.RUNNING)
+            if len(seq_data) != len(running_seqs) or any(
+                    seq.seq_id not in seq_data for seq in running_seqs):
+                # Sequences were forked or finished.
+                seq_data.clear()
+                block_tables.clear()
+                block_tables_remote_rank.clear()
+
+            for seq in running_seqs:
                 seq_id = seq.seq_id
                 seq_data[seq_id] = seq.data
+                # The block tables are kept up to date by the block manager,
+                # this only looks them up.
                 block_tables[seq_id] = self.block_manager.get_block_table(seq)
-                remote_rank = self.block_manager.get_block_table_remote_rank(
-                    seq)
-                block_tables_remote_rank[seq_id] = remote_rank
+                block_tables_remote_rank[seq_id] = (
+                    self.block_manager.get_block_table_remote_rank(seq))
                 self.block_manager.access_all_blocks_in_seq(seq, now)
 
             common_computed_block_nums = (
-                self.block_manager.get_common_computed_block_ids(
-                    seq_group.get_seqs(status=SequenceStatus.RUNNING)))
+                self.block_manager.get_common_computed_block_ids(running_seqs))
 
             do_sample = True
             if seq_group.is_prefill():
@@ -1018,19 +1508,11 @@ class Scheduler:
             # It assumes the scheduled_seq_groups is ordered by
             # prefill < decoding.
             is_prompt = seq_group.is_prefill()
-            seq_group_metadata = SequenceGroupMetadata(
-                request_id=seq_group.request_id,
+            seq_group_metadata.update_step(
                 is_prompt=is_prompt,
-                seq_data=seq_data,
-                sampling_params=seq_group.sampling_params,
-                block_tables=block_tables,
-                block_tables_remote_rank=block_tables_remote_rank,
                 do_sample=do_sample,
-                pooling_params=seq_group.pooling_params,
                 token_chunk_size=token_chunk_size,
-                lora_request=seq_group.lora_request,
                 computed_block_nums=common_computed_block_nums,
-                state=seq_group.state,
                 # `multi_modal_data` will only be present for the 1st comm
                 # between engine and worker.
                 # the subsequent comms can still use delta, but
@@ -1058,8 +1540,15 @@ class Scheduler:
         self.block_manager.free(seq)
 
     def free_finished_seq_groups(self) -> None:
-        self.running = deque(seq_group for seq_group in self.running
-                             if not seq_group.is_finished())
+        running: List[SequenceGroup] = []
+        for seq_group in self.running:
+            if seq_group.is_finished():
+                if self.block_forecaster is not None:
+                    self.block_forecaster.observe_finished(seq_group)
+                self._free_seq_group(seq_group)
+            else:
+                running.append(seq_group)
+        self.running = self._new_queue(running)
 
     def _allocate_and_set_running(self, seq_group: SequenceGroup) -> None:
         self.block_manager.allocate(seq_group)
@@ -1088,10 +1577,29 @@ class Scheduler:
             cows = self.block_manager.append_slots(seq, num_lookahead_slots)
             blocks_to_copy.extend(cows)
 
+    def _pop_preemption_victim(self, running_queue: SequenceGroupQueue,
+                               budget: SchedulingBudget, policy: Policy,
+                               now: float) -> SequenceGroup:
+        """Pops the lowest-priority sequence group of the tenants over their
+        limits in the step, or of all tenants if none is."""
+        if budget.tenant_limits is not None:
+            over_quota = [
+                seq_group for seq_group in running_queue
+                if budget.is_over_tenant_quota(seq_group.tenant_id)
+            ]
+            if over_quota:
+                victim_seq_group = min(
+                    over_quota,
+                    key=lambda seq_group: policy.get_priority(now, seq_group))
+                running_queue.remove(victim_seq_group)
+                return victim_seq_group
+        return running_queue.pop()
+
     def _preempt(
         self,
         seq_group: SequenceGroup,
         blocks_to_swap_out: List[Tuple[int, int]],
+        remote_blocks_to_swap_out: Optional[List[Tuple[int, int, int]]] = None,
         preemption_mode: Optional[PreemptionMode] = None,
     ) -> PreemptionMode:
         # If preemption mode is not specified, we determine the mode as follows:
@@ -1105,8 +1613,13 @@ class Scheduler:
         # over sequence groups with a single sequence.
         # TODO(woosuk): Support recomputation for sequence groups with multiple
         # sequences. This may require a more sophisticated CUDA kernel.
+        # A sequence group with superblocks on the SP ranks is never
+        # recomputed by default, as its KV cache is too long to be
+        # recomputed cheaply, see `_get_remote_preemption_mode`.
         if self.user_specified_preemption_mode is None:
-            if seq_group.get_max_num_running_seqs() == 1:
+            if self.block_manager.has_remote_blocks(seq_group):
+                preemption_mode = self._get_remote_preemption_mode(seq_group)
+            elif seq_group.get_max_num_running_seqs() == 1:
                 preemption_mode = PreemptionMode.RECOMPUTE
             else:
                 preemption_mode = PreemptionMode.SWAP
@@ -1125,15 +1638,38 @@ class Scheduler:
                 "total_num_cumulative_preemption=%d", seq_group.request_id,
                 preemption_mode, self.num_cumulative_preemption + 1)
         self.num_cumulative_preemption += 1
+        if self.tenant_manager is not None:
+            self.tenant_manager.record_preempted(seq_group.tenant_id)
 
         if preemption_mode == PreemptionMode.RECOMPUTE:
             self._preempt_by_recompute(seq_group)
         elif preemption_mode == PreemptionMode.SWAP:
+            self._preempt_by_swap(seq_group, blocks_to_swap_out,
+                                  remote_blocks_to_swap_out)
+        elif preemption_mode == PreemptionMode.SWAP_LOCAL:
             self._preempt_by_swap(seq_group, blocks_to_swap_out)
         else:
             raise AssertionError("Invalid preemption mode.")
         return preemption_mode
 
+    def _get_remote_preemption_mode(
+            self, seq_group: SequenceGroup) -> PreemptionMode:
+        """Chooses the preemption mode of a sequence group that has
+        superblocks on the SP ranks.
+
+        The remote superblocks stay in place, unless the SP ranks are out of
+        GPU blocks and have room for them in their own CPU swap space. Only
+        a single sequence that does not fit in the CPU swap space of the
+        master is recomputed.
+        """
+        if (not self.block_manager.can_swap_out(seq_group)
+                and seq_group.get_max_num_running_seqs() == 1):
+            return PreemptionMode.RECOMPUTE
+        if (self.block_manager.is_remote_full()
+                and self.block_manager.can_swap_out_remote(seq_group)):
+            return PreemptionMode.SWAP
+        return PreemptionMode.SWAP_LOCAL
+
     def _preempt_by_recompute(
         self,
         seq_group: SequenceGroup,
@@ -1141,6 +1677,7 @@ class Scheduler:
         seqs = seq_group.get_seqs(status=SequenceStatus.RUNNING)
         assert len(seqs) == 1
         for seq in seqs:
+            self._num_recompute_tokens += seq.data.get_num_computed_tokens()
             seq.status = SequenceStatus.WAITING
             self.free_seq(seq)
             self.block_manager.remove_kvcache_migrate_block(seq.seq_id)
@@ -1150,36 +1687,48 @@ class Scheduler:
         self,
         seq_group: SequenceGroup,
         blocks_to_swap_out: List[Tuple[int, int]],
+        remote_blocks_to_swap_out: Optional[List[Tuple[int, int, int]]] = None,
     ) -> None:
-        self._swap_out(seq_group, blocks_to_swap_out)
+        self._swap_out(seq_group, blocks_to_swap_out,
+                       remote_blocks_to_swap_out)
 
     def _swap_in(
         self,
         seq_group: SequenceGroup,
         blocks_to_swap_in: List[Tuple[int, int]],
+        remote_blocks_to_swap_in: Optional[List[Tuple[int, int, int]]] = None,
     ) -> None:
-        mapping = self.block_manager.swap_in(seq_group)
+        mapping = self.block_manager.swap_in(seq_group,
+                                             remote_blocks_to_swap_in)
         blocks_to_swap_in.extend(mapping)
         for seq in seq_group.get_seqs(status=SequenceStatus.SWAPPED):
             seq.status = SequenceStatus.RUNNING
-            self.block_manager.add_kvcache_migrate(seq)
+            self.block_manager.add_kvcache_migrate_block(seq)
 
     def _swap_out(
         self,
         seq_group: SequenceGroup,
         blocks_to_swap_out: List[Tuple[int, int]],
+        remote_blocks_to_swap_out: Optional[List[Tuple[int, int, int]]] = None,
     ) -> None:
+        """Swaps out the local blocks of the group, and its remote blocks
+        too if `remote_blocks_to_swap_out` is given."""
         if not self.block_manager.can_swap_out(seq_group):
             # FIXME(woosuk): Abort the sequence group instead of aborting the
             # entire engine.
             raise RuntimeError(
                 "Aborted due to the lack of CPU swap space. Please increase "
                 "the swap space to avoid this error.")
-        mapping = self.block_manager.swap_out(seq_group)
+        if (remote_blocks_to_swap_out is not None
+                and not self.block_manager.can_swap_out_remote(seq_group)):
+            # No room on the SP ranks, the remote blocks stay in place.
+            remote_blocks_to_swap_out = None
+        mapping = self.block_manager.swap_out(seq_group,
+                                              remote_blocks_to_swap_out)
         blocks_to_swap_out.extend(mapping)
+        # The block manager dropped the pending migrations of the group.
         for seq in seq_group.get_seqs(status=SequenceStatus.RUNNING):
             seq.status = SequenceStatus.SWAPPED
-            self.block_manager.remove_kvcache_migrate_block(seq.seq_id)
 
     def _passed_delay(self, now: float) -> bool:
         if self.prev_prompt:
@@ -0,0 +1,121 @@
+"""An online model of the time of a model step, used by the scheduler to
+size the prefill chunks of chunked prefill to a target step latency.
+
+The step time is modeled as linear in the features of the step:
+
+    time = base + prefill_token * num_prefill_tokens
+                + decode_seq * num_decode_seqs
+                + decode_context_token * num_decode_context_tokens
+
+and fitted by recursive least squares on the measured step times. Older
+steps are forgotten exponentially, so the model follows the changes of the
+hardware clocks and of the batch composition.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# The terms of the model, in the order of its coefficients.
+STEP_COST_TERMS = ("base", "prefill_token", "decode_seq",
+                   "decode_context_token")
+
+
+@dataclass
+class StepFeatures:
+    """The features of a scheduled step the step time is modeled on."""
+    num_prefill_tokens: int
+    num_decode_seqs: int
+    # The sum of the context lengths of the decoding sequences.
+    num_decode_context_tokens: int
+
+    def to_array(self) -> np.ndarray:
+        return np.array([
+            1.0, self.num_prefill_tokens, self.num_decode_seqs,
+            self.num_decode_context_tokens
+        ])
+
+
+class StepCostModel:
+    """Predicts the time of a model step from its features.
+
+    Args:
+        forgetting_factor: The weight of a step in the fit is multiplied by
+            this factor on every newer step.
+        min_samples: The number of measured steps before the model is used.
+        initial_variance: The variance of the coefficients before the first
+            measured step. Large values let the first steps set them.
+    """
+
+    def __init__(self,
+                 forgetting_factor: float = 0.99,
+                 min_samples: int = 16,
+                 initial_variance: float = 1e4) -> None:
+        if not 0.0 < forgetting_factor <= 1.0:
+            raise ValueError("forgetting_factor must be in (0, 1], got "
+                             f"{forgetting_factor}.")
+        self.forgetting_factor = forgetting_factor
+        self.min_samples = min_samples
+        self.initial_variance = initial_variance
+        num_terms = len(STEP_COST_TERMS)
+        self._coefficients = np.zeros(num_terms)
+        self._covariance = np.eye(num_terms) * initial_variance
+        self.num_samples = 0
+        # The relative prediction errors since the last `get_stats`.
+        self._errors: List[float] = []
+
+    @property
+    def ready(self) -> bool:
+        return self.num_samples >= self.min_samples
+
+    @property
+    def coefficients(self) -> Dict[str, float]:
+        return dict(zip(STEP_COST_TERMS, self._coefficients.tolist()))
+
+    def predict(self, features: StepFeatures) -> float:
+        return float(features.to_array() @ self._coefficients)
+
+    def update(self, features: StepFeatures, step_time: float) -> None:
+        """Fits the model to the measured time of a step."""
+        x = features.to_array()
+        error = step_time - float(x @ self._coefficients)
+        if self.ready and step_time > 0:
+            self._errors.append(abs(error) / step_time)
+
+        p_x = self._covariance @ x
+        gain = p_x / (self.forgetting_factor + x @ p_x)
+        self._coefficients += gain * error
+        self._covariance = (self._covariance -
+                            np.outer(gain, p_x)) / self.forgetting_factor
+        # Steps that all look alike, e.g. decodes only, leave the variance
+        # of the other coefficients growing with every forgetting. Bound it
+        # so that the model stays stable and still adapts quickly.
+        trace = np.trace(self._covariance)
+        max_trace = self.initial_variance * len(STEP_COST_TERMS)
+        if trace > max_trace:
+            self._covariance *= max_trace / trace
+        self.num_samples += 1
+
+    def get_max_prefill_tokens(self, num_decode_seqs: int,
+                               num_decode_context_tokens: int,
+                               target_step_time: float) -> Optional[int]:
+        """Returns the number of prefill tokens that can be batched with the
+        decodes while the predicted step time stays within the target, or
+        None if the model can not tell yet."""
+        if not self.ready:
+            return None
+        base, prefill_token, decode_seq, decode_context_token = (
+            self._coefficients.tolist())
+        if prefill_token <= 0:
+            return None
+        spare_time = target_step_time - (
+            base + decode_seq * num_decode_seqs +
+            decode_context_token * num_decode_context_tokens)
+        return max(0, int(spare_time / prefill_token))
+
+    def get_stats(self) -> Tuple[Dict[str, float], List[float]]:
+        """Returns the coefficients, empty until the model is used, and the
+        relative prediction errors of the steps since the last call."""
+        coefficients = self.coefficients if self.ready else {}
+        errors, self._errors = self._errors, []
+        return coefficients, errors
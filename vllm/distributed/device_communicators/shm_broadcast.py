@@ -149,7 +149,12 @@ class ShmRingBufferIO:
         self.current_idx = 0
 
     @contextmanager
-    def acquire_write(self):
+    def acquire_write(self, timeout: Optional[float] = None):
+        """Yields the next block to write, waiting until it is ready.
+
+        Raises `TimeoutError` if the block is not ready after `timeout`
+        seconds, which with a timeout of 0 polls the block once.
+        """
         assert self._is_writer, "Only writers can acquire write"
         start_time = time.monotonic()
         n_warning = 1
@@ -163,6 +168,10 @@ class ShmRingBufferIO:
                     # if this block is not ready to write,
                     # we need to wait until it is read by all readers
 
+                    if (timeout is not None
+                            and time.monotonic() - start_time >= timeout):
+                        raise TimeoutError
+
                     # wait for a while
                     time.sleep(RINGBUFFER_SLEEP_INTERVAL)
 
@@ -200,7 +209,12 @@ class ShmRingBufferIO:
                 break
 
     @contextmanager
-    def acquire_read(self):
+    def acquire_read(self, timeout: Optional[float] = None):
+        """Yields the next block to read, waiting until it is ready.
+
+        Raises `TimeoutError` if the block is not ready after `timeout`
+        seconds, which with a timeout of 0 polls the block once.
+        """
         assert self._is_reader, "Only readers can acquire read"
         start_time = time.monotonic()
         n_warning = 1
@@ -217,6 +231,10 @@ class ShmRingBufferIO:
                     # if this block is not ready,
                     # we need to wait until it is written
 
+                    if (timeout is not None
+                            and time.monotonic() - start_time >= timeout):
+                        raise TimeoutError
+
                     # wait for a while
                     time.sleep(RINGBUFFER_SLEEP_INTERVAL)
 
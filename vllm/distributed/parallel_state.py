@@ -783,7 +783,9 @@ def init_model_parallel_group(group_ranks: List[List[int]], local_rank: int,
         group_ranks=group_ranks,
         local_rank=local_rank,
         torch_distributed_backend=backend,
-        use_pynccl=True,
+        # PyNccl only applies to NCCL groups, e.g. not to the gloo groups
+        # used to run sequence parallelism on CPU.
+        use_pynccl=backend == "nccl",
         use_custom_allreduce=_ENABLE_CUSTOM_ALL_REDUCE,
     )
 
@@ -936,7 +938,6 @@ def initialize_model_parallel(
     assert torch.distributed.is_initialized()
     world_size: int = torch.distributed.get_world_size()
     tp_pp_world_size: int = world_size - sequence_parallel_size + 1
-    sp_world_size: int = sequence_parallel_size
     backend = backend or torch.distributed.get_backend(
         get_world_group().device_group)
 
@@ -958,6 +959,8 @@ def initialize_model_parallel(
             range(i * tensor_model_parallel_size,
                   (i + 1) * tensor_model_parallel_size))
         group_ranks.append(ranks)
+    # Every SP worker is a tensor model-parallel group on its own.
+    group_ranks.extend([rank] for rank in range(tp_pp_world_size, world_size))
     _TP = init_model_parallel_group(group_ranks,
                                     get_world_group().local_rank, backend)
 
@@ -972,6 +975,8 @@ def initialize_model_parallel(
         ranks = list(
             range(i, tp_pp_world_size, num_pipeline_model_parallel_groups))
         group_ranks.append(ranks)
+    # Every SP worker is a pipeline model-parallel group on its own.
+    group_ranks.extend([rank] for rank in range(tp_pp_world_size, world_size))
     _PP = init_model_parallel_group(group_ranks,
                                     get_world_group().local_rank, backend)
 
@@ -982,11 +987,16 @@ def initialize_model_parallel(
     assert _SP is None, ("sequence parallel groups are already initialized")
     _SP = [None] * num_sequence_parallel_groups
     for i in range(num_sequence_parallel_groups):
-        ranks = [i] + list(
-            range(tp_pp_world_size, tp_pp_world_size + sp_world_size))
+        ranks = [i] + list(range(tp_pp_world_size, world_size))
         if get_world_group().rank in ranks:
             local_rank = get_world_group().local_rank
             _SP[i] = init_model_parallel_group([ranks], local_rank, backend)
+        else:
+            # All ranks must take part in creating a process group, even the
+            # ranks outside of it. Mirror the device and CPU groups created
+            # by the GroupCoordinator of the members.
+            torch.distributed.new_group(ranks, backend=backend)
+            torch.distributed.new_group(ranks, backend="gloo")
 
 
 def ensure_model_parallel_initialized(
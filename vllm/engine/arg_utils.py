@@ -3,7 +3,7 @@ import dataclasses
 import json
 import warnings
 from dataclasses import dataclass
-from typing import List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from vllm.config import (CacheConfig, DecodingConfig, DeviceConfig,
                          EngineConfig, LoadConfig, LoRAConfig, ModelConfig,
@@ -92,6 +92,10 @@ class EngineArgs:
 
     scheduler_delay_factor: float = 0.0
     enable_chunked_prefill: bool = False
+    scheduling_policy: str = 'fcfs'
+    tenant_quotas: Optional[Dict[str, Dict[str, Any]]] = None
+    target_step_latency_ms: Optional[float] = None
+    block_reservation_policy: str = "none"
 
     guided_decoding_backend: str = 'outlines'
     # Speculative decoding configuration.
@@ -110,6 +114,14 @@ class EngineArgs:
     block_migrate_size: int = 1024
     block_migrate_threshold: int = 6144
     block_migrate_start: int = 4096
+    block_migrate_policy: str = "onlyappend"
+    block_migrate_budget: int = 1
+    block_migrate_controller: str = "static"
+    prefix_caching_eviction_policy: str = "lru"
+    enable_cpu_prefix_cache: bool = False
+    disk_prefix_cache_dir: Optional[str] = None
+    disk_prefix_cache_space: float = 16
+    block_recall_watermark: Optional[float] = None
 
     def __post_init__(self):
         if self.tokenizer is None:
@@ -347,6 +359,36 @@ class EngineArgs:
         parser.add_argument('--enable-prefix-caching',
                             action='store_true',
                             help='Enables automatic prefix caching.')
+        parser.add_argument(
+            '--prefix-caching-eviction-policy',
+            type=str,
+            default=EngineArgs.prefix_caching_eviction_policy,
+            choices=['lru', 'lfu', 'cost_aware'],
+            help='The policy evicting the cached blocks of prefix caching. '
+            '"lru" evicts the least recently used block, "lfu" the least '
+            'frequently reused one, and "cost_aware" weighs the reuses of a '
+            'block against its depth in its prefix.')
+        parser.add_argument(
+            '--enable-cpu-prefix-cache',
+            action='store_true',
+            help='Demotes the blocks evicted by prefix caching to the CPU '
+            'swap space instead of dropping them, and promotes them back on '
+            'a prefix hit. Requires --enable-prefix-caching and the v1 block '
+            'manager.')
+        parser.add_argument(
+            '--disk-prefix-cache-dir',
+            type=str,
+            default=EngineArgs.disk_prefix_cache_dir,
+            help='Directory of the disk tier of prefix caching. The blocks of '
+            'the CPU tier and the reused blocks are written there, and are '
+            'loaded back on a prefix hit, also after a restart. Requires '
+            '--enable-cpu-prefix-cache.')
+        parser.add_argument(
+            '--disk-prefix-cache-space',
+            type=float,
+            default=EngineArgs.disk_prefix_cache_space,
+            help='Size of the disk tier of prefix caching in GiB. The least '
+            'recently used blocks are evicted beyond it.')
         parser.add_argument('--disable-sliding-window',
                             action='store_true',
                             help='Disables sliding window, '
@@ -543,6 +585,45 @@ class EngineArgs:
             action='store_true',
             help='If set, the prefill requests can be chunked based on the '
             'max_num_batched_tokens.')
+        parser.add_argument(
+            '--scheduling-policy',
+            choices=['fcfs', 'priority', 'deadline', 'sjf'],
+            default=EngineArgs.scheduling_policy,
+            help='The order the requests are scheduled in. "fcfs" by '
+            'arrival, "priority" by the priority of the request (lower '
+            'first), "deadline" by the deadline of the request (earliest '
+            'first) and "sjf" by the predicted number of tokens left to '
+            'compute (fewest first).')
+        parser.add_argument(
+            '--tenant-quotas',
+            default=EngineArgs.tenant_quotas,
+            type=json.loads,
+            help='Share the scheduling budget between the tenants of the '
+            'requests by these quotas in JSON format, keyed by tenant id '
+            'with "*" for all other tenants. For example, '
+            '{"a":{"weight":2},"*":{"weight":1,"token_rate":2000}}. '
+            'A quota takes the keys weight, max_num_seqs, token_rate '
+            '(tokens per second) and burst_tokens.')
+        parser.add_argument(
+            '--target-step-latency-ms',
+            type=float,
+            default=EngineArgs.target_step_latency_ms,
+            help='With chunked prefill, size the prefill chunks so that the '
+            'time of every step, predicted by a model fitted online from the '
+            'measured step times, stays within this many milliseconds. This '
+            'bounds the inter-token latency of the decodes batched with the '
+            'prefills.')
+        parser.add_argument(
+            '--block-reservation-policy',
+            type=str,
+            default=EngineArgs.block_reservation_policy,
+            choices=['none', 'max_tokens', 'expected'],
+            help='Keep the GPU blocks the running and swapped sequences are '
+            'forecast to need free of new prompts, so that they are not '
+            'preempted when they grow. "max_tokens" forecasts that every '
+            'sequence runs until its max_tokens, "expected" that it runs for '
+            'the expected output length of the sequences that finished '
+            'recently, bounded by its max_tokens.')
 
         parser.add_argument(
             '--speculative-model',
@@ -651,6 +732,43 @@ class EngineArgs:
                             default=EngineArgs.block_migrate_start,
                             help='The start index of kvcache migration.')
 
+        parser.add_argument(
+            '--block-migrate-policy',
+            type=str,
+            default=EngineArgs.block_migrate_policy,
+            choices=[
+                'onlyappend', 'meanappend', 'leastloaded', 'affinity', 'spill'
+            ],
+            help='The placement policy that chooses the sequence parallel '
+            'rank receiving a migrated superblock. "leastloaded" picks the '
+            'rank with the most free blocks, "affinity" keeps all '
+            'superblocks of a sequence on one rank and "spill" packs the '
+            'lowest ranks before spilling to the next one.')
+
+        parser.add_argument(
+            '--block-migrate-budget',
+            type=int,
+            default=EngineArgs.block_migrate_budget,
+            help='The maximum number of superblocks migrated to the sequence '
+            'parallel ranks in one step. The superblocks sent to the same '
+            'rank are batched into a single transfer.')
+        parser.add_argument(
+            '--block-migrate-controller',
+            type=str,
+            default=EngineArgs.block_migrate_controller,
+            choices=['static', 'adaptive'],
+            help='The controller of the migration thresholds. "static" '
+            'always uses --block-migrate-threshold and --block-migrate-start, '
+            '"adaptive" migrates earlier when the local GPU blocks are under '
+            'pressure and later when they are idle.')
+        parser.add_argument(
+            '--block-recall-watermark',
+            type=float,
+            default=EngineArgs.block_recall_watermark,
+            help='Recall migrated superblocks from the sequence parallel '
+            'ranks while more than this fraction of the local GPU blocks '
+            'stays free. The recall is disabled by default.')
+
         return parser
 
     @classmethod
@@ -745,7 +863,15 @@ class EngineArgs:
             enable_prefix_caching=self.enable_prefix_caching,
             block_migrate_size=self.block_migrate_size,
             block_migrate_threshold=self.block_migrate_threshold,
-            block_migrate_start=self.block_migrate_start)
+            block_migrate_start=self.block_migrate_start,
+            block_migrate_policy=self.block_migrate_policy,
+            block_migrate_budget=self.block_migrate_budget,
+            block_migrate_controller=self.block_migrate_controller,
+            block_recall_watermark=self.block_recall_watermark,
+            prefix_caching_eviction_policy=self.prefix_caching_eviction_policy,
+            enable_cpu_prefix_cache=self.enable_cpu_prefix_cache,
+            disk_prefix_cache_dir=self.disk_prefix_cache_dir,
+            disk_prefix_cache_space=self.disk_prefix_cache_space)
         parallel_config = ParallelConfig(
             pipeline_parallel_size=self.pipeline_parallel_size,
             tensor_parallel_size=self.tensor_parallel_size,
@@ -790,6 +916,10 @@ class EngineArgs:
             enable_chunked_prefill=self.enable_chunked_prefill,
             embedding_mode=model_config.embedding_mode,
             preemption_mode=self.preemption_mode,
+            policy=self.scheduling_policy,
+            tenant_quotas=self.tenant_quotas,
+            target_step_latency_ms=self.target_step_latency_ms,
+            block_reservation_policy=self.block_reservation_policy,
         )
         lora_config = LoRAConfig(
             max_lora_rank=self.max_lora_rank,
@@ -820,6 +950,12 @@ class EngineArgs:
         observability_config = ObservabilityConfig(
             otlp_traces_endpoint=self.otlp_traces_endpoint)
 
+        if (cache_config.enable_cpu_prefix_cache
+                and scheduler_config.use_v2_block_manager):
+            raise ValueError(
+                "The CPU prefix cache is not supported with the v2 block "
+                "manager.")
+
         if (model_config.get_sliding_window() is not None
                 and scheduler_config.chunked_prefill_enabled
                 and not scheduler_config.use_v2_block_manager):
@@ -848,6 +984,7 @@ class AsyncEngineArgs(EngineArgs):
     engine_use_ray: bool = False
     disable_log_requests: bool = False
     max_log_len: Optional[int] = None
+    enable_step_pipelining: bool = False
 
     @staticmethod
     def add_cli_args(parser: FlexibleArgumentParser,
@@ -867,6 +1004,18 @@ class AsyncEngineArgs(EngineArgs):
                             help='Max number of prompt characters or prompt '
                             'ID numbers being printed in log.'
                             '\n\nDefault: Unlimited')
+        parser.add_argument(
+            '--enable-step-pipelining',
+            action='store_true',
+            help='Schedule and launch every step before processing the '
+            'outputs of the step before, so that the detokenization and '
+            'streaming of the outputs overlap with the model execution. '
+            'A sequence stopped by a stop string is found one step late and '
+            'its extra token is dropped. Beam search sequence groups are '
+            'still processed in full before the next step. The step times '
+            'are not measured, so --target-step-latency-ms has no effect. '
+            'Speculative decoding, embedding models and --engine-use-ray '
+            'fall back to sequential steps.')
         return parser
 
 
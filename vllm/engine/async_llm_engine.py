@@ -1,5 +1,6 @@
 import asyncio
 import time
+from dataclasses import dataclass
 from functools import partial
 from typing import (AsyncIterator, Callable, Dict, Iterable, List, Optional,
                     Set, Tuple, Type, Union)
@@ -12,14 +13,19 @@ from vllm.core.scheduler import SchedulerOutputs
 from vllm.engine.arg_utils import AsyncEngineArgs
 from vllm.engine.async_timeout import asyncio_timeout
 from vllm.engine.llm_engine import LLMEngine
+from vllm.engine.output_processor.single_step import SingleStepOutputProcessor
+from vllm.engine.output_processor.util import create_output_by_sequence_group
 from vllm.executor.ray_utils import initialize_ray_cluster, ray
 from vllm.inputs import LLMInputs, PromptInputs
 from vllm.logger import init_logger
 from vllm.lora.request import LoRARequest
-from vllm.outputs import EmbeddingRequestOutput, RequestOutput
+from vllm.outputs import (EmbeddingRequestOutput, RequestOutput,
+                          RequestOutputFactory)
 from vllm.pooling_params import PoolingParams
 from vllm.sampling_params import SamplingParams
-from vllm.sequence import ExecuteModelRequest, SamplerOutput
+from vllm.sequence import (ExecuteModelRequest, PoolerOutput, SamplerOutput,
+                           Sequence, SequenceGroup, SequenceGroupMetadata,
+                           SequenceGroupOutput)
 from vllm.usage.usage_lib import UsageContext
 
 logger = init_logger(__name__)
@@ -127,6 +133,10 @@ class RequestTracker:
                                verbose: bool = False) -> None:
         """Process a request output from the engine."""
         request_id = request_output.request_id
+        if request_id not in self._request_streams:
+            # The request was aborted while its output was processed by the
+            # pipelined step loop.
+            return
 
         self._request_streams[request_id].put(request_output)
         if request_output.finished:
@@ -207,8 +217,87 @@ class RequestTracker:
         return not self._new_requests.empty()
 
 
+@dataclass
+class _DeferredOutputs:
+    """The outputs of a step whose processing is deferred to the next step
+    by the pipelined step loop."""
+    scheduler_outputs: SchedulerOutputs
+    model_output: List[SamplerOutput]
+    # The scheduled sequence groups with their outputs and the sequences
+    # whose new tokens are not detokenized yet, None if the group was
+    # processed in full.
+    seq_group_outputs: List[Tuple[SequenceGroup, List[SequenceGroupOutput],
+                                  Optional[List[Sequence]]]]
+    # The time the model outputs arrived at.
+    now: float
+
+
 class _AsyncLLMEngine(LLMEngine):
-    """Extension of LLMEngine to add async methods."""
+    """Extension of LLMEngine to add async methods.
+
+    Args:
+        pipeline_steps: Whether to process the outputs of a step while the
+            next step runs, see `_pipelined_step_async`.
+    """
+
+    def __init__(self, *args, pipeline_steps: bool = False, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.pipeline_steps = pipeline_steps
+        if pipeline_steps and (not isinstance(self.output_processor,
+                                              SingleStepOutputProcessor)
+                               or self.model_config.embedding_mode):
+            logger.warning(
+                "Step pipelining is only supported for generation with a "
+                "single step per iteration, running the steps sequentially.")
+            self.pipeline_steps = False
+        if self.pipeline_steps and self.scheduler.step_cost_model is not None:
+            logger.warning(
+                "The step times are not measured with step pipelining, the "
+                "prefill chunks are not sized by the target step latency.")
+        self._deferred_outputs: Optional[_DeferredOutputs] = None
+
+    def has_deferred_outputs(self) -> bool:
+        return self._deferred_outputs is not None
+
+    def _get_execute_model_req(
+            self, seq_group_metadata_list: List[SequenceGroupMetadata],
+            scheduler_outputs: SchedulerOutputs) -> ExecuteModelRequest:
+        return ExecuteModelRequest(
+            seq_group_metadata_list=seq_group_metadata_list,
+            blocks_to_swap_in=scheduler_outputs.blocks_to_swap_in,
+            blocks_to_swap_out=scheduler_outputs.blocks_to_swap_out,
+            blocks_to_copy=scheduler_outputs.blocks_to_copy,
+            blocks_to_spill=scheduler_outputs.blocks_to_spill,
+            blocks_to_load=scheduler_outputs.blocks_to_load,
+            blocks_to_migrate=scheduler_outputs.blocks_to_migrate,
+            superblocks_to_migrate=scheduler_outputs.superblocks_to_migrate,
+            superblocks_to_recall=scheduler_outputs.superblocks_to_recall,
+            blocks_to_recall=scheduler_outputs.blocks_to_recall,
+            remote_blocks_to_swap_in=scheduler_outputs.
+            remote_blocks_to_swap_in,
+            remote_blocks_to_swap_out=scheduler_outputs.
+            remote_blocks_to_swap_out,
+            num_lookahead_slots=scheduler_outputs.num_lookahead_slots,
+            running_queue_size=scheduler_outputs.running_queue_size,
+        )
+
+    async def _execute_model_async(
+        self,
+        seq_group_metadata_list: List[SequenceGroupMetadata],
+        scheduler_outputs: SchedulerOutputs,
+    ) -> List[Union[SamplerOutput, PoolerOutput]]:
+        execute_model_req = self._get_execute_model_req(
+            seq_group_metadata_list, scheduler_outputs)
+        start = time.perf_counter()
+        output = await self.model_executor.execute_model_async(
+            execute_model_req)
+        # The pipelined loop processes the outputs of the step before on the
+        # event loop while the model runs, which delays the end of the
+        # measurement past the end of the step.
+        if not self.pipeline_steps:
+            self.scheduler.observe_step_time(scheduler_outputs,
+                                             time.perf_counter() - start)
+        return output
 
     async def step_async(
             self) -> List[Union[RequestOutput, EmbeddingRequestOutput]]:
@@ -221,21 +310,15 @@ class _AsyncLLMEngine(LLMEngine):
         and updates the scheduler with the model outputs. Finally, it decodes
         the sequences and returns the newly generated results.
         """
+        if self.pipeline_steps:
+            return await self._pipelined_step_async()
+
         seq_group_metadata_list, scheduler_outputs = self.scheduler.schedule()
 
         if not scheduler_outputs.is_empty():
             # Execute the model.
-            execute_model_req = ExecuteModelRequest(
-                seq_group_metadata_list=seq_group_metadata_list,
-                blocks_to_swap_in=scheduler_outputs.blocks_to_swap_in,
-                blocks_to_swap_out=scheduler_outputs.blocks_to_swap_out,
-                blocks_to_copy=scheduler_outputs.blocks_to_copy,
-                blocks_to_migrate=scheduler_outputs.blocks_to_migrate,
-                num_lookahead_slots=scheduler_outputs.num_lookahead_slots,
-                running_queue_size=scheduler_outputs.running_queue_size,
-            )
-            output = await self.model_executor.execute_model_async(
-                execute_model_req)
+            output = await self._execute_model_async(seq_group_metadata_list,
+                                                     scheduler_outputs)
         else:
             output = []
 
@@ -259,6 +342,123 @@ class _AsyncLLMEngine(LLMEngine):
 
         return request_outputs
 
+    async def _pipelined_step_async(
+            self) -> List[Union[RequestOutput, EmbeddingRequestOutput]]:
+        """Schedules and launches a step, then processes the outputs of the
+        step before while the model runs, and returns them.
+
+        The outputs are processed in two parts. Right after the model
+        returns, the new tokens are appended and the sequences are stopped
+        on their token ids, so that the next step can be scheduled. The
+        detokenization, the stop strings, the request outputs and the stats
+        are deferred to the next step and overlap with its model execution.
+        A sequence stopped by a stop string is freed one step late, its
+        sample of the step it was scheduled for is dropped.
+
+        The scheduler updates the sequence group metadata and the block id
+        lists of the scheduled sequences in place. The next step is only
+        scheduled once the model returned the outputs of this one, after the
+        workers prepared their inputs from them. The deferred processing
+        does not update them, freeing a sequence leaves its lists as they
+        are.
+        """
+        seq_group_metadata_list, scheduler_outputs = self.scheduler.schedule()
+
+        execute_model_task: Optional[asyncio.Task] = None
+        if not scheduler_outputs.is_empty():
+            execute_model_task = asyncio.create_task(
+                self._execute_model_async(seq_group_metadata_list,
+                                          scheduler_outputs))
+            # Let the task hand the step to the workers before the outputs
+            # of the step before are processed.
+            await asyncio.sleep(0)
+
+        request_outputs: List[Union[RequestOutput,
+                                    EmbeddingRequestOutput]] = []
+        if self._deferred_outputs is not None:
+            request_outputs = self._finish_deferred_outputs(
+                self._deferred_outputs)
+            self._deferred_outputs = None
+
+        if execute_model_task is not None:
+            output = await execute_model_task
+        else:
+            output = []
+
+        if execute_model_task is not None or (
+                scheduler_outputs.ignored_seq_groups):
+            self._deferred_outputs = self._append_model_outputs(
+                output, scheduler_outputs, seq_group_metadata_list)
+
+        if not request_outputs and self._deferred_outputs is None:
+            # Stop the execute model loop in parallel workers until there are
+            # more requests to process, see `step_async`.
+            await self.model_executor.stop_remote_worker_execution_loop_async()
+
+        return request_outputs
+
+    def _append_model_outputs(
+        self,
+        output: List[SamplerOutput],
+        scheduler_outputs: SchedulerOutputs,
+        seq_group_metadata_list: List[SequenceGroupMetadata],
+    ) -> _DeferredOutputs:
+        """Applies the model outputs to the scheduled sequence groups as far
+        as the next step needs, see `_pipelined_step_async`."""
+        assert isinstance(self.output_processor, SingleStepOutputProcessor)
+        now = time.time()
+        output_by_sequence_group = create_output_by_sequence_group(
+            output, num_seq_groups=len(scheduler_outputs.scheduled_seq_groups))
+
+        seq_group_outputs = []
+        for scheduled_seq_group, outputs, seq_group_meta in zip(
+                scheduler_outputs.scheduled_seq_groups,
+                output_by_sequence_group, seq_group_metadata_list):
+            seq_group = scheduled_seq_group.seq_group
+            if seq_group.is_finished():
+                # Stopped by a stop string or aborted since it was
+                # scheduled, the output is dropped.
+                continue
+            seq_group.update_num_computed_tokens(
+                scheduled_seq_group.token_chunk_size)
+            seqs: Optional[List[Sequence]] = []
+            if seq_group_meta.do_sample:
+                seqs = self.output_processor.append_outputs(seq_group, outputs)
+            seq_group_outputs.append((seq_group, outputs, seqs))
+
+        # Free the sequence groups stopped by their token ids before the
+        # next step is scheduled.
+        self.scheduler.free_finished_seq_groups()
+        return _DeferredOutputs(scheduler_outputs=scheduler_outputs,
+                                model_output=output,
+                                seq_group_outputs=seq_group_outputs,
+                                now=now)
+
+    def _finish_deferred_outputs(
+        self, deferred: _DeferredOutputs
+    ) -> List[Union[RequestOutput, EmbeddingRequestOutput]]:
+        """Detokenizes the outputs of the step before and returns its request
+        outputs, see `_pipelined_step_async`."""
+        assert isinstance(self.output_processor, SingleStepOutputProcessor)
+        request_outputs: List[Union[RequestOutput,
+                                    EmbeddingRequestOutput]] = []
+        for seq_group, outputs, seqs in deferred.seq_group_outputs:
+            self.output_processor.process_prompt_logprob(seq_group, outputs)
+            if seqs:
+                self.output_processor.finish_outputs(seq_group, seqs)
+        # Free the sequence groups stopped by their stop strings.
+        self.scheduler.free_finished_seq_groups()
+
+        for seq_group, _, _ in deferred.seq_group_outputs:
+            seq_group.maybe_set_first_token_time(deferred.now)
+            request_outputs.append(RequestOutputFactory.create(seq_group))
+        for seq_group in deferred.scheduler_outputs.ignored_seq_groups:
+            request_outputs.append(RequestOutputFactory.create(seq_group))
+
+        self.do_log_stats(deferred.scheduler_outputs, deferred.model_output)
+        self.do_tracing(deferred.scheduler_outputs)
+        return request_outputs
+
     async def process_model_inputs_async(
         self,
         request_id: str,
@@ -339,6 +539,8 @@ class AsyncLLMEngine:
             being printed in log.
         start_engine_loop: If True, the background task to run the engine
             will be automatically started in the generate call.
+        pipeline_steps: Whether to process the outputs of a step while the
+            next step runs. Not supported with `engine_use_ray`.
         *args: Arguments for :class:`LLMEngine`.
         **kwargs: Arguments for :class:`LLMEngine`.
     """
@@ -352,12 +554,20 @@ class AsyncLLMEngine:
                  log_requests: bool = True,
                  max_log_len: Optional[int] = None,
                  start_engine_loop: bool = True,
+                 pipeline_steps: bool = False,
                  **kwargs) -> None:
         self.worker_use_ray = worker_use_ray
         self.engine_use_ray = engine_use_ray
         self.log_requests = log_requests
         self.max_log_len = max_log_len
-        self.engine = self._init_engine(*args, **kwargs)
+        if pipeline_steps and engine_use_ray:
+            logger.warning("Step pipelining is not supported with "
+                           "engine_use_ray, running the steps sequentially.")
+            pipeline_steps = False
+        self.pipeline_steps = pipeline_steps
+        self.engine = self._init_engine(*args,
+                                        pipeline_steps=pipeline_steps,
+                                        **kwargs)
 
         self.background_loop: Optional[asyncio.Future] = None
         # We need to keep a reference to unshielded
@@ -432,6 +642,7 @@ class AsyncLLMEngine:
             log_stats=not engine_args.disable_log_stats,
             max_log_len=engine_args.max_log_len,
             start_engine_loop=start_engine_loop,
+            pipeline_steps=engine_args.enable_step_pipelining,
             usage_context=usage_context,
         )
         return engine
@@ -538,6 +749,9 @@ class AsyncLLMEngine:
             self._request_tracker.process_request_output(
                 request_output, verbose=self.log_requests)
 
+        if self.pipeline_steps and self.engine.has_deferred_outputs():
+            # The outputs of the last step are returned by the next one.
+            return True
         return len(request_outputs) > 0
 
     async def _engine_abort(self, request_ids: Iterable[str]):
@@ -42,6 +42,9 @@ from vllm.usage.usage_lib import (UsageContext, is_usage_stats_enabled,
                                   usage_message)
 from vllm.utils import Counter
 from vllm.version import __version__ as VLLM_VERSION
+from vllm.worker.cache_engine import CacheEngine
+from vllm.worker.disk_kv_cache import (get_disk_prefix_cache_path,
+                                       get_num_disk_blocks)
 
 logger = init_logger(__name__)
 _LOCAL_LOGGING_INTERVAL_SEC = 5
@@ -293,8 +296,10 @@ class LLMEngine:
         # Create the scheduler.
         # NOTE: the cache_config here have been updated with the numbers of
         # GPU and CPU blocks, which are profiled in the distributed executor.
+        # The SP group of a master worker counts the master itself, the
+        # remote ranks are its other members.
         self.scheduler = Scheduler(scheduler_config, cache_config, lora_config,
-                                   parallel_config.sequence_parallel_size)
+                                   parallel_config.sequence_parallel_size - 1)
 
         # Metric Logging.
         if self.log_stats:
@@ -355,6 +360,16 @@ class LLMEngine:
         self.cache_config.num_gpu_blocks = num_gpu_blocks
         self.cache_config.num_cpu_blocks = num_cpu_blocks
         self.cache_config.num_remote_gpu_blocks = num_remote_gpu_blocks
+        if self.cache_config.disk_prefix_cache_dir is not None:
+            self.cache_config.disk_prefix_cache_path = (
+                get_disk_prefix_cache_path(self.cache_config,
+                                           self.model_config,
+                                           self.parallel_config))
+            self.cache_config.num_disk_blocks = get_num_disk_blocks(
+                self.cache_config, self.model_config, self.parallel_config)
+            logger.info("Disk prefix cache: %d blocks at %s",
+                        self.cache_config.num_disk_blocks,
+                        self.cache_config.disk_prefix_cache_path)
 
         self.model_executor.initialize_cache(num_gpu_blocks, num_cpu_blocks,
                                              num_remote_gpu_blocks)
@@ -824,13 +839,25 @@ class LLMEngine:
                 blocks_to_swap_in=scheduler_outputs.blocks_to_swap_in,
                 blocks_to_swap_out=scheduler_outputs.blocks_to_swap_out,
                 blocks_to_copy=scheduler_outputs.blocks_to_copy,
+                blocks_to_spill=scheduler_outputs.blocks_to_spill,
+                blocks_to_load=scheduler_outputs.blocks_to_load,
                 blocks_to_migrate=scheduler_outputs.blocks_to_migrate,
-                superblock_to_migrate=scheduler_outputs.superblock_to_migrate,
+                superblocks_to_migrate=scheduler_outputs.
+                superblocks_to_migrate,
+                superblocks_to_recall=scheduler_outputs.superblocks_to_recall,
+                blocks_to_recall=scheduler_outputs.blocks_to_recall,
+                remote_blocks_to_swap_in=scheduler_outputs.
+                remote_blocks_to_swap_in,
+                remote_blocks_to_swap_out=scheduler_outputs.
+                remote_blocks_to_swap_out,
                 num_lookahead_slots=scheduler_outputs.num_lookahead_slots,
                 running_queue_size=scheduler_outputs.running_queue_size,
             )
+            start = time.perf_counter()
             output = self.model_executor.execute_model(
                 execute_model_req=execute_model_req)
+            self.scheduler.observe_step_time(scheduler_outputs,
+                                             time.perf_counter() - start)
         else:
             output = []
 
@@ -908,6 +935,42 @@ class LLMEngine:
             )
             cpu_cache_usage_sys = 1.0 - (num_free_cpu / num_total_cpu)
 
+        # KV Cache Migration to the SP ranks
+        block_manager = self.scheduler.block_manager
+        migrate_decision = self.scheduler.migration_controller.last_decision
+        num_queued_superblocks_sys = 0
+        sp_num_free_blocks_sys: List[int] = []
+        sp_cache_usage_sys: List[float] = []
+        if self.scheduler.migrate_to_remote:
+            num_queued_superblocks_sys = (
+                block_manager.get_num_queued_superblocks())
+            sp_num_free_blocks_sys = block_manager.get_num_free_remote_blocks()
+            num_total_remote = self.cache_config.num_remote_gpu_blocks
+            if num_total_remote:
+                sp_cache_usage_sys = [
+                    1.0 - (num_free / num_total_remote)
+                    for num_free in sp_num_free_blocks_sys
+                ]
+
+        # Tenant stats
+        tenant_stats: Dict[str, Dict[str, float]] = {}
+        if self.scheduler.tenant_manager is not None:
+            tenant_stats = self.scheduler.tenant_manager.get_stats()
+
+        # Step cost model stats
+        step_cost_coefficients_sys: Dict[str, float] = {}
+        step_cost_errors_iter: List[float] = []
+        if self.scheduler.step_cost_model is not None:
+            step_cost_coefficients_sys, step_cost_errors_iter = (
+                self.scheduler.step_cost_model.get_stats())
+
+        # Prefix cache stats
+        prefix_cache_num_queries_iter = 0
+        prefix_cache_num_hits_iter: Dict[str, int] = {}
+        if self.cache_config.enable_prefix_caching:
+            prefix_cache_num_queries_iter, prefix_cache_num_hits_iter = (
+                block_manager.get_prefix_cache_stats())
+
         # Iteration stats
         num_prompt_tokens_iter = 0
         num_generation_tokens_iter = 0
@@ -915,6 +978,21 @@ class LLMEngine:
         time_per_output_tokens_iter: List[float] = []
         num_preemption_iter = (0 if scheduler_outputs is None else
                                scheduler_outputs.preempted)
+        num_recompute_tokens_iter = (0 if scheduler_outputs is None else
+                                     scheduler_outputs.num_recompute_tokens)
+        num_migrated_superblocks_iter = [0] * len(sp_num_free_blocks_sys)
+        num_recalled_superblocks_iter = [0] * len(sp_num_free_blocks_sys)
+        num_migrated_bytes_iter = num_recalled_bytes_iter = 0
+        if scheduler_outputs is not None and sp_num_free_blocks_sys:
+            for _, rank in scheduler_outputs.superblocks_to_migrate:
+                num_migrated_superblocks_iter[rank - 1] += 1
+            for _, rank in scheduler_outputs.superblocks_to_recall:
+                num_recalled_superblocks_iter[rank - 1] += 1
+            superblock_bytes = self._get_superblock_bytes()
+            num_migrated_bytes_iter = (sum(num_migrated_superblocks_iter) *
+                                       superblock_bytes)
+            num_recalled_bytes_iter = (sum(num_recalled_superblocks_iter) *
+                                       superblock_bytes)
 
         # Request stats
         #   Latency
@@ -1016,6 +1094,13 @@ class LLMEngine:
             #   KV Cache Usage in %
             gpu_cache_usage_sys=gpu_cache_usage_sys,
             cpu_cache_usage_sys=cpu_cache_usage_sys,
+            #   KV Cache Migration
+            migrate_threshold_sys=migrate_decision.threshold,
+            migrate_start_sys=migrate_decision.start,
+            migrate_pressure_sys=migrate_decision.pressure,
+            num_queued_superblocks_sys=num_queued_superblocks_sys,
+            sp_num_free_blocks_sys=sp_num_free_blocks_sys,
+            sp_cache_usage_sys=sp_cache_usage_sys,
 
             # Iteration stats
             num_prompt_tokens_iter=num_prompt_tokens_iter,
@@ -1024,6 +1109,10 @@ class LLMEngine:
             time_per_output_tokens_iter=time_per_output_tokens_iter,
             spec_decode_metrics=spec_decode_metrics,
             num_preemption_iter=num_preemption_iter,
+            num_migrated_superblocks_iter=num_migrated_superblocks_iter,
+            num_recalled_superblocks_iter=num_recalled_superblocks_iter,
+            num_migrated_bytes_iter=num_migrated_bytes_iter,
+            num_recalled_bytes_iter=num_recalled_bytes_iter,
 
             # Request stats
             #   Latency
@@ -1034,8 +1123,32 @@ class LLMEngine:
             best_of_requests=best_of_requests,
             n_requests=n_requests,
             finished_reason_requests=finished_reason_requests,
+
+            # Tenant stats
+            tenant_num_requests_sys=tenant_stats.get("num_requests", {}),
+            tenant_bucket_tokens_sys=tenant_stats.get("bucket_tokens", {}),
+            tenant_num_scheduled_tokens_iter=tenant_stats.get(
+                "num_scheduled_tokens", {}),
+            tenant_num_deferred_iter=tenant_stats.get("num_deferred", {}),
+            tenant_num_preempted_iter=tenant_stats.get("num_preempted", {}),
+            step_cost_coefficients_sys=step_cost_coefficients_sys,
+            step_cost_errors_iter=step_cost_errors_iter,
+            prefix_cache_num_queries_iter=prefix_cache_num_queries_iter,
+            prefix_cache_num_hits_iter=prefix_cache_num_hits_iter,
+            num_recompute_tokens_iter=num_recompute_tokens_iter,
         )
 
+    def _get_superblock_bytes(self) -> int:
+        """Bytes of KV cache moved by migrating one superblock, summed over
+        the master workers that each send their shard of it."""
+        superblock_blocks = (self.cache_config.block_migrate_size //
+                             self.cache_config.block_size)
+        num_masters = (self.parallel_config.tensor_parallel_size *
+                       self.parallel_config.pipeline_parallel_size)
+        return (CacheEngine.get_cache_block_size(
+            self.cache_config, self.model_config, self.parallel_config) *
+                superblock_blocks * num_masters)
+
     def add_lora(self, lora_request: LoRARequest) -> bool:
         return self.model_executor.add_lora(lora_request)
 
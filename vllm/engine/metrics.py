@@ -1,6 +1,6 @@
 import time
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import TYPE_CHECKING
 from typing import Counter as CollectionsCounter
 from typing import Dict, List, Optional, Protocol, Union
@@ -30,6 +30,10 @@ prometheus_client.disable_created_metrics()
 # begin-metrics-definitions
 class Metrics:
     labelname_finish_reason = "finished_reason"
+    labelname_sp_rank = "sp_rank"
+    labelname_tenant = "tenant"
+    labelname_term = "term"
+    labelname_tier = "tier"
     _base_library = prometheus_client
 
     def __init__(self, labelnames: List[str], max_model_len: int):
@@ -64,12 +68,87 @@ class Metrics:
             name="vllm:cpu_cache_usage_perc",
             documentation="CPU KV-cache usage. 1 means 100 percent usage.",
             labelnames=labelnames)
+        #   KV Cache Migration to the SP ranks
+        self.gauge_migrate_threshold = self._base_library.Gauge(
+            name="vllm:kv_migrate_threshold_tokens",
+            documentation="Length from which sequences migrate superblocks "
+            "to the sequence parallel ranks.",
+            labelnames=labelnames)
+        self.gauge_migrate_start = self._base_library.Gauge(
+            name="vllm:kv_migrate_start_tokens",
+            documentation="First token of a sequence that can be migrated "
+            "to the sequence parallel ranks.",
+            labelnames=labelnames)
+        self.gauge_migrate_pressure = self._base_library.Gauge(
+            name="vllm:kv_migrate_pressure",
+            documentation="Pressure on the local GPU KV-cache seen by the "
+            "migration controller. 1 means 100 percent.",
+            labelnames=labelnames)
+        self.gauge_migrate_queue = self._base_library.Gauge(
+            name="vllm:kv_migrate_queue_superblocks",
+            documentation="Number of superblocks waiting to be migrated to "
+            "the sequence parallel ranks.",
+            labelnames=labelnames)
+        self.gauge_sp_num_free_blocks = self._base_library.Gauge(
+            name="vllm:sp_num_free_blocks",
+            documentation="Number of free GPU KV-cache blocks of every "
+            "sequence parallel rank.",
+            labelnames=labelnames + [Metrics.labelname_sp_rank])
+        self.gauge_sp_cache_usage = self._base_library.Gauge(
+            name="vllm:sp_cache_usage_perc",
+            documentation="GPU KV-cache usage of every sequence parallel "
+            "rank. 1 means 100 percent usage.",
+            labelnames=labelnames + [Metrics.labelname_sp_rank])
+        self.gauge_tenant_num_requests = self._base_library.Gauge(
+            name="vllm:tenant_num_requests",
+            documentation="Number of unfinished requests of every tenant.",
+            labelnames=labelnames + [Metrics.labelname_tenant])
+        self.gauge_tenant_bucket_tokens = self._base_library.Gauge(
+            name="vllm:tenant_token_bucket_tokens",
+            documentation="Tokens in the token bucket of every tenant with a "
+            "token rate, negative while the tenant is in debt.",
+            labelnames=labelnames + [Metrics.labelname_tenant])
+        self.gauge_step_cost_coefficient = self._base_library.Gauge(
+            name="vllm:step_cost_model_coefficient",
+            documentation="Coefficients of the step time model of the "
+            "latency targeted chunked prefill, in seconds per unit of every "
+            "term.",
+            labelnames=labelnames + [Metrics.labelname_term])
 
         # Iteration stats
         self.counter_num_preemption = self._base_library.Counter(
             name="vllm:num_preemptions_total",
             documentation="Cumulative number of preemption from the engine.",
             labelnames=labelnames)
+        self.counter_recompute_tokens = self._base_library.Counter(
+            name="vllm:preemption_recompute_tokens_total",
+            documentation="Number of computed tokens discarded by the "
+            "preemptions by recomputation, which are computed again.",
+            labelnames=labelnames)
+        self.counter_tenant_scheduled_tokens = self._base_library.Counter(
+            name="vllm:tenant_scheduled_tokens_total",
+            documentation="Number of tokens scheduled for every tenant.",
+            labelnames=labelnames + [Metrics.labelname_tenant])
+        self.counter_tenant_deferred_requests = self._base_library.Counter(
+            name="vllm:tenant_deferred_requests_total",
+            documentation="Number of times a request was not admitted in a "
+            "step because its tenant was out of its share or quota.",
+            labelnames=labelnames + [Metrics.labelname_tenant])
+        self.counter_tenant_preemptions = self._base_library.Counter(
+            name="vllm:tenant_preemptions_total",
+            documentation="Number of preemptions of the requests of every "
+            "tenant.",
+            labelnames=labelnames + [Metrics.labelname_tenant])
+        self.counter_prefix_cache_queries = self._base_library.Counter(
+            name="vllm:prefix_cache_queries_total",
+            documentation="Number of full prompt blocks looked up in the "
+            "prefix cache.",
+            labelnames=labelnames)
+        self.counter_prefix_cache_hits = self._base_library.Counter(
+            name="vllm:prefix_cache_hits_total",
+            documentation="Number of full prompt blocks found in every tier "
+            "of the prefix cache, gpu, cpu or disk.",
+            labelnames=labelnames + [Metrics.labelname_tier])
         self.counter_prompt_tokens = self._base_library.Counter(
             name="vllm:prompt_tokens_total",
             documentation="Number of prefill tokens processed.",
@@ -94,6 +173,39 @@ class Metrics:
                 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.75,
                 1.0, 2.5
             ])
+        self.histogram_step_cost_error = self._base_library.Histogram(
+            name="vllm:step_cost_model_relative_error",
+            documentation="Histogram of the relative error of the step times "
+            "predicted by the step time model of the latency targeted "
+            "chunked prefill.",
+            labelnames=labelnames,
+            buckets=[0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0])
+        self.counter_migrated_superblocks = self._base_library.Counter(
+            name="vllm:kv_migrated_superblocks_total",
+            documentation="Number of superblocks migrated to every sequence "
+            "parallel rank.",
+            labelnames=labelnames + [Metrics.labelname_sp_rank])
+        self.counter_recalled_superblocks = self._base_library.Counter(
+            name="vllm:kv_recalled_superblocks_total",
+            documentation="Number of superblocks recalled from every sequence "
+            "parallel rank.",
+            labelnames=labelnames + [Metrics.labelname_sp_rank])
+        self.counter_migrated_bytes = self._base_library.Counter(
+            name="vllm:kv_migrated_bytes_total",
+            documentation="Bytes of KV-cache migrated to the sequence "
+            "parallel ranks.",
+            labelnames=labelnames)
+        self.counter_recalled_bytes = self._base_library.Counter(
+            name="vllm:kv_recalled_bytes_total",
+            documentation="Bytes of KV-cache recalled from the sequence "
+            "parallel ranks.",
+            labelnames=labelnames)
+        self.histogram_migrated_superblocks = self._base_library.Histogram(
+            name="vllm:kv_migrated_superblocks_per_step",
+            documentation="Histogram of the number of superblocks migrated "
+            "in one step.",
+            labelnames=labelnames,
+            buckets=[0, 1, 2, 4, 8, 16, 32, 64])
 
         # Request stats
         #   Latency
@@ -207,6 +319,15 @@ class Stats:
     #   KV Cache Usage in %
     gpu_cache_usage_sys: float
     cpu_cache_usage_sys: float
+    #   KV Cache Migration to the SP ranks
+    migrate_threshold_sys: int
+    migrate_start_sys: int
+    migrate_pressure_sys: float
+    num_queued_superblocks_sys: int
+    #   Free blocks and KV Cache Usage in % of every SP rank, from rank 1 on.
+    #   Empty without sequence parallelism.
+    sp_num_free_blocks_sys: List[int]
+    sp_cache_usage_sys: List[float]
 
     # Iteration stats (should have _iter suffix)
     num_prompt_tokens_iter: int
@@ -214,6 +335,11 @@ class Stats:
     time_to_first_tokens_iter: List[float]
     time_per_output_tokens_iter: List[float]
     num_preemption_iter: int
+    #   Superblocks migrated to and recalled from every SP rank.
+    num_migrated_superblocks_iter: List[int]
+    num_recalled_superblocks_iter: List[int]
+    num_migrated_bytes_iter: int
+    num_recalled_bytes_iter: int
 
     # Request stats (should have _requests suffix)
     #   Latency
@@ -227,6 +353,27 @@ class Stats:
 
     spec_decode_metrics: Optional["SpecDecodeWorkerMetrics"] = None
 
+    # Tenant stats keyed by tenant label. Empty without tenant quotas.
+    tenant_num_requests_sys: Dict[str, int] = field(default_factory=dict)
+    tenant_bucket_tokens_sys: Dict[str, float] = field(default_factory=dict)
+    tenant_num_scheduled_tokens_iter: Dict[str,
+                                           int] = field(default_factory=dict)
+    tenant_num_deferred_iter: Dict[str, int] = field(default_factory=dict)
+    tenant_num_preempted_iter: Dict[str, int] = field(default_factory=dict)
+
+    # Step cost model stats. Empty without a target step latency.
+    step_cost_coefficients_sys: Dict[str, float] = field(default_factory=dict)
+    #   Relative errors of the predicted step times.
+    step_cost_errors_iter: List[float] = field(default_factory=list)
+
+    # Prefix cache stats. Zero without prefix caching.
+    #   Full prompt blocks looked up and found in every tier.
+    prefix_cache_num_queries_iter: int = 0
+    prefix_cache_num_hits_iter: Dict[str, int] = field(default_factory=dict)
+
+    # Computed tokens discarded by the preemptions by recomputation.
+    num_recompute_tokens_iter: int = 0
+
 
 class SupportsMetricsInfo(Protocol):
 
@@ -245,6 +392,13 @@ def get_throughput(tracked_stats: List[int], now: float,
     return float(np.sum(tracked_stats) / (now - last_log))
 
 
+def _count_ranks(counts: List[int]) -> CollectionsCounter:
+    # Per SP rank counts, from rank 1 on, keyed by the sp_rank label.
+    return CollectionsCounter(
+        {str(rank): count
+         for rank, count in enumerate(counts, 1)})
+
+
 class StatLoggerBase(ABC):
     """Base class for StatLogger."""
 
@@ -252,6 +406,12 @@ class StatLoggerBase(ABC):
         # Tracked stats over current local logging interval.
         self.num_prompt_tokens: List[int] = []
         self.num_generation_tokens: List[int] = []
+        self.num_migrated_superblocks: List[int] = []
+        self.num_migrated_bytes: List[int] = []
+        self.num_prefix_cache_queries = 0
+        self.num_prefix_cache_hits: CollectionsCounter = CollectionsCounter()
+        self.num_preemptions = 0
+        self.num_recompute_tokens = 0
         self.last_local_log = time.time()
         self.local_interval = local_interval
 
@@ -277,6 +437,13 @@ class LoggingStatLogger(StatLoggerBase):
         # Save tracked stats for token counters.
         self.num_prompt_tokens.append(stats.num_prompt_tokens_iter)
         self.num_generation_tokens.append(stats.num_generation_tokens_iter)
+        self.num_migrated_superblocks.append(
+            sum(stats.num_migrated_superblocks_iter))
+        self.num_migrated_bytes.append(stats.num_migrated_bytes_iter)
+        self.num_prefix_cache_queries += stats.prefix_cache_num_queries_iter
+        self.num_prefix_cache_hits.update(stats.prefix_cache_num_hits_iter)
+        self.num_preemptions += stats.num_preemption_iter
+        self.num_recompute_tokens += stats.num_recompute_tokens_iter
 
         # Log locally every local_interval seconds.
         if local_interval_elapsed(stats.now, self.last_local_log,
@@ -307,16 +474,58 @@ class LoggingStatLogger(StatLoggerBase):
                 stats.cpu_cache_usage_sys * 100,
             )
 
-            # Reset tracked stats for next interval.
-            self.num_prompt_tokens = []
-            self.num_generation_tokens = []
-            self.last_local_log = stats.now
+            if stats.sp_num_free_blocks_sys:
+                logger.info(self._format_migration_str(stats))
+
+            if self.num_prefix_cache_queries:
+                logger.info(self._format_prefix_cache_str())
+
+            if self.num_preemptions:
+                logger.info(
+                    "Preempted: %d reqs, Recomputed: %d tokens since the "
+                    "last log.", self.num_preemptions,
+                    self.num_recompute_tokens)
 
             if stats.spec_decode_metrics is not None:
                 logger.info(
                     self._format_spec_decode_metrics_str(
                         stats.spec_decode_metrics))
 
+            # Reset tracked stats for next interval.
+            self.num_prompt_tokens = []
+            self.num_generation_tokens = []
+            self.num_migrated_superblocks = []
+            self.num_migrated_bytes = []
+            self.num_prefix_cache_queries = 0
+            self.num_prefix_cache_hits = CollectionsCounter()
+            self.num_preemptions = 0
+            self.num_recompute_tokens = 0
+            self.last_local_log = stats.now
+
+    def _format_prefix_cache_str(self) -> str:
+        hit_rates = ", ".join(
+            f"{tier.upper()}: "
+            f"{hits / self.num_prefix_cache_queries * 100:.1f}%"
+            for tier, hits in self.num_prefix_cache_hits.items())
+        return (f"Prefix cache hit rate: {hit_rates}, "
+                f"Queried: {self.num_prefix_cache_queries} blocks.")
+
+    def _format_migration_str(self, stats: Stats) -> str:
+        migrate_throughput = get_throughput(self.num_migrated_superblocks,
+                                            now=stats.now,
+                                            last_log=self.last_local_log)
+        migrate_bandwidth = get_throughput(self.num_migrated_bytes,
+                                           now=stats.now,
+                                           last_log=self.last_local_log)
+        sp_cache_usage = ", ".join(f"{usage * 100:.1f}%"
+                                   for usage in stats.sp_cache_usage_sys)
+        return ("KV migration: "
+                f"Avg migration throughput: {migrate_throughput:.1f} "
+                f"superblocks/s ({migrate_bandwidth / 2**20:.1f} MiB/s), "
+                f"Queued: {stats.num_queued_superblocks_sys} superblocks, "
+                f"SP free blocks: {stats.sp_num_free_blocks_sys}, "
+                f"SP KV cache usage: [{sp_cache_usage}].")
+
     def _format_spec_decode_metrics_str(
             self, metrics: "SpecDecodeWorkerMetrics") -> str:
 
@@ -359,6 +568,20 @@ class PrometheusStatLogger(StatLoggerBase):
         for label, count in data.items():
             counter.labels(**{**self.labels, label_key: label}).inc(count)
 
+    def _log_gauge_ranks(self, gauge, data: Union[List[int],
+                                                  List[float]]) -> None:
+        # Convenience function for logging a gauge of every SP rank.
+        for rank, datum in enumerate(data, 1):
+            gauge.labels(**{
+                **self.labels, Metrics.labelname_sp_rank: str(rank)
+            }).set(datum)
+
+    def _log_gauge_labels(self, gauge, data: Dict[str, Union[int, float]],
+                          label_key: str) -> None:
+        # Convenience function for logging a gauge of every label.
+        for label, datum in data.items():
+            gauge.labels(**{**self.labels, label_key: label}).set(datum)
+
     def _log_histogram(self, histogram, data: Union[List[int],
                                                     List[float]]) -> None:
         # Convenience function for logging list to histogram.
@@ -377,10 +600,24 @@ class PrometheusStatLogger(StatLoggerBase):
                         stats.gpu_cache_usage_sys)
         self._log_gauge(self.metrics.gauge_cpu_cache_usage,
                         stats.cpu_cache_usage_sys)
+        self._log_gauge(self.metrics.gauge_migrate_threshold,
+                        stats.migrate_threshold_sys)
+        self._log_gauge(self.metrics.gauge_migrate_start,
+                        stats.migrate_start_sys)
+        self._log_gauge(self.metrics.gauge_migrate_pressure,
+                        stats.migrate_pressure_sys)
+        self._log_gauge(self.metrics.gauge_migrate_queue,
+                        stats.num_queued_superblocks_sys)
+        self._log_gauge_ranks(self.metrics.gauge_sp_num_free_blocks,
+                              stats.sp_num_free_blocks_sys)
+        self._log_gauge_ranks(self.metrics.gauge_sp_cache_usage,
+                              stats.sp_cache_usage_sys)
 
         # Iteration level data
         self._log_counter(self.metrics.counter_num_preemption,
                           stats.num_preemption_iter)
+        self._log_counter(self.metrics.counter_recompute_tokens,
+                          stats.num_recompute_tokens_iter)
         self._log_counter(self.metrics.counter_prompt_tokens,
                           stats.num_prompt_tokens_iter)
         self._log_counter(self.metrics.counter_generation_tokens,
@@ -389,6 +626,54 @@ class PrometheusStatLogger(StatLoggerBase):
                             stats.time_to_first_tokens_iter)
         self._log_histogram(self.metrics.histogram_time_per_output_token,
                             stats.time_per_output_tokens_iter)
+        if stats.step_cost_coefficients_sys:
+            self._log_gauge_labels(self.metrics.gauge_step_cost_coefficient,
+                                   stats.step_cost_coefficients_sys,
+                                   Metrics.labelname_term)
+        self._log_histogram(self.metrics.histogram_step_cost_error,
+                            stats.step_cost_errors_iter)
+        if stats.prefix_cache_num_queries_iter:
+            self._log_counter(self.metrics.counter_prefix_cache_queries,
+                              stats.prefix_cache_num_queries_iter)
+            self._log_counter_labels(
+                self.metrics.counter_prefix_cache_hits,
+                CollectionsCounter(stats.prefix_cache_num_hits_iter),
+                Metrics.labelname_tier)
+        if stats.sp_num_free_blocks_sys:
+            self._log_counter_labels(
+                self.metrics.counter_migrated_superblocks,
+                _count_ranks(stats.num_migrated_superblocks_iter),
+                Metrics.labelname_sp_rank)
+            self._log_counter_labels(
+                self.metrics.counter_recalled_superblocks,
+                _count_ranks(stats.num_recalled_superblocks_iter),
+                Metrics.labelname_sp_rank)
+            self._log_counter(self.metrics.counter_migrated_bytes,
+                              stats.num_migrated_bytes_iter)
+            self._log_counter(self.metrics.counter_recalled_bytes,
+                              stats.num_recalled_bytes_iter)
+            self._log_histogram(self.metrics.histogram_migrated_superblocks,
+                                [sum(stats.num_migrated_superblocks_iter)])
+
+        if stats.tenant_num_requests_sys:
+            self._log_gauge_labels(self.metrics.gauge_tenant_num_requests,
+                                   stats.tenant_num_requests_sys,
+                                   Metrics.labelname_tenant)
+            self._log_gauge_labels(self.metrics.gauge_tenant_bucket_tokens,
+                                   stats.tenant_bucket_tokens_sys,
+                                   Metrics.labelname_tenant)
+            self._log_counter_labels(
+                self.metrics.counter_tenant_scheduled_tokens,
+                CollectionsCounter(stats.tenant_num_scheduled_tokens_iter),
+                Metrics.labelname_tenant)
+            self._log_counter_labels(
+                self.metrics.counter_tenant_deferred_requests,
+                CollectionsCounter(stats.tenant_num_deferred_iter),
+                Metrics.labelname_tenant)
+            self._log_counter_labels(
+                self.metrics.counter_tenant_preemptions,
+                CollectionsCounter(stats.tenant_num_preempted_iter),
+                Metrics.labelname_tenant)
 
         # Request level data
         # Latency
@@ -55,6 +55,78 @@ class SingleStepOutputProcessor(SequenceGroupOutputProcessor):
                 ), f"{type(self)} does not support multiple outputs per step"
         return self._process_sequence_group_outputs(sequence_group, outputs[0])
 
+    def append_outputs(
+            self, seq_group: SequenceGroup,
+            outputs: List[SequenceGroupOutput]) -> Optional[List[Sequence]]:
+        """Appends the new tokens to the sequences without detokenizing them,
+        and stops the sequences on the conditions of their token ids: the
+        eos and stop tokens and the max lengths. The sequences are ready to
+        be scheduled again, see `finish_outputs` for the rest.
+
+        A sample of a sequence stopped by a stop string since it was
+        scheduled, which `finish_outputs` finds one step late, is dropped.
+
+        Returns the sequences to pass to `finish_outputs`, or None if the
+        sequence group forks, which is processed in full by
+        `process_outputs` instead.
+        """
+        assert (len(outputs) == 1
+                ), f"{type(self)} does not support multiple outputs per step"
+        samples = outputs[0].samples
+        parent_seqs = {
+            seq.seq_id: seq
+            for seq in seq_group.get_seqs(status=SequenceStatus.RUNNING)
+        }
+        samples = [
+            sample for sample in samples if sample.parent_seq_id in parent_seqs
+        ]
+        num_sampled_parents = len({sample.parent_seq_id for sample in samples})
+        if (seq_group.sampling_params.use_beam_search
+                or len(samples) != len(parent_seqs)
+                or num_sampled_parents != len(samples)):
+            self.process_outputs(seq_group, outputs)
+            return None
+
+        seqs: List[Sequence] = []
+        for sample in samples:
+            seq = parent_seqs[sample.parent_seq_id]
+            seq.append_token_id(sample.output_token, sample.logprobs)
+            self.stop_checker.maybe_stop_sequence(
+                seq,
+                0,
+                seq_group.sampling_params,
+                lora_req=seq_group.lora_request,
+            )
+            if seq.is_finished():
+                self.scheduler.free_seq(seq)
+            seqs.append(seq)
+        return seqs
+
+    def finish_outputs(self, seq_group: SequenceGroup,
+                       seqs: List[Sequence]) -> None:
+        """Detokenizes the tokens appended by `append_outputs`, and stops the
+        sequences on their stop strings. The sequences stopped here may have
+        been scheduled again already."""
+        for seq in seqs:
+            if seq.status == SequenceStatus.FINISHED_ABORTED:
+                continue
+            if seq_group.sampling_params.detokenize and self.detokenizer:
+                new_char_count = self.detokenizer.decode_sequence_inplace(
+                    seq, seq_group.sampling_params)
+            else:
+                new_char_count = 0
+            was_finished = seq.is_finished()
+            # The conditions of the token ids give the same result again,
+            # and trim the output text now that it is decoded.
+            self.stop_checker.maybe_stop_sequence(
+                seq,
+                new_char_count,
+                seq_group.sampling_params,
+                lora_req=seq_group.lora_request,
+            )
+            if seq.is_finished() and not was_finished:
+                self.scheduler.free_seq(seq)
+
     def process_prompt_logprob(self, seq_group: SequenceGroup,
                                outputs: List[SequenceGroupOutput]) -> None:
         assert len(outputs) == 1, ("Single step should only has 1 output.")
@@ -0,0 +1,560 @@
+"""Serves an `AsyncLLMEngine` to API server processes over shared memory.
+
+Every API server process talks to the engine process over a `ShmChannel`
+made of two `ShmRingBuffer`s, one for its requests and one for their
+outputs. The API server processes tokenize the prompts, so the requests
+carry token ids, and the engine process only sends back the tokens, text
+and logprobs every output gained since its last message.
+"""
+import asyncio
+import pickle
+import struct
+from collections import deque
+from dataclasses import dataclass, field
+from typing import (Any, AsyncIterator, Deque, Dict, List, Optional, Tuple,
+                    Union)
+
+from transformers import PreTrainedTokenizer
+
+import vllm.envs as envs
+from vllm.config import DecodingConfig, ModelConfig, VisionLanguageConfig
+from vllm.distributed.device_communicators.shm_broadcast import (
+    ShmRingBuffer, ShmRingBufferIO)
+from vllm.engine.async_llm_engine import (AsyncEngineDeadError, AsyncLLMEngine,
+                                          AsyncStream)
+from vllm.inputs import PromptInputs
+from vllm.logger import init_logger
+from vllm.lora.request import LoRARequest
+from vllm.outputs import (CompletionOutput, EmbeddingRequestOutput,
+                          RequestOutput)
+from vllm.pooling_params import PoolingParams
+from vllm.sampling_params import SamplingParams
+from vllm.sequence import PromptLogprobs, RequestMetrics
+from vllm.transformers_utils.tokenizer import get_tokenizer
+from vllm.utils import Counter
+
+logger = init_logger(__name__)
+
+# The size of a block of the ring buffers, which bounds the size of a
+# message, e.g. the token ids of a prompt, and the number of blocks.
+SHM_MAX_CHUNK_BYTES = 4 * 1024 * 1024
+SHM_MAX_CHUNKS = 16
+
+# The time to wait before polling an empty or full ring buffer again. Unlike
+# the busy wait of `ShmRingBufferIO`, the event loop keeps running meanwhile.
+SHM_POLL_INTERVAL_S = 1e-3
+
+# The kinds of the messages sent to the engine process.
+GENERATE = 0
+ENCODE = 1
+ABORT = 2
+CHECK_HEALTH = 3
+
+# The kinds of the messages sent to the API server processes.
+OUTPUT = 0
+ERROR = 1
+FINISHED = 2
+HEALTH = 3
+
+# Every message in a block is preceded by its size, a size of 0 ends the
+# messages of a block that is not full.
+_MESSAGE_HEADER = struct.Struct("<I")
+
+
+class ShmChannel:
+    """A duplex channel between two processes over two `ShmRingBuffer`s with
+    a single reader each.
+
+    The messages are pickled into the blocks of the ring buffer, as many as
+    fit in a block, so the messages sent while the reader has not read the
+    next block are written together.
+
+    Args:
+        send_buffer: The buffer this end writes.
+        recv_buffer: The buffer this end reads.
+    """
+
+    def __init__(self, send_buffer: ShmRingBuffer,
+                 recv_buffer: ShmRingBuffer) -> None:
+        self._writer = ShmRingBufferIO(send_buffer, reader_rank=-1)
+        self._reader = ShmRingBufferIO(recv_buffer, reader_rank=0)
+        self.max_message_bytes = (send_buffer.max_chunk_bytes -
+                                  _MESSAGE_HEADER.size)
+        self._pending: Deque[bytes] = deque()
+        self._pending_event = asyncio.Event()
+
+    def send(self, message: Any) -> None:
+        """Queues a message, written by `run_sender`."""
+        data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_message_bytes:
+            raise ValueError(
+                f"The message of {len(data)} bytes is larger than the "
+                f"{self.max_message_bytes} bytes of a shared memory block.")
+        self._pending.append(data)
+        self._pending_event.set()
+
+    async def run_sender(self) -> None:
+        """Writes the queued messages as the reader frees blocks."""
+        while True:
+            await self._pending_event.wait()
+            self._pending_event.clear()
+            while self._pending:
+                try:
+                    with self._writer.acquire_write(timeout=0) as buf:
+                        self._write_pending(buf)
+                except TimeoutError:
+                    # The reader has not read the next block yet.
+                    await asyncio.sleep(SHM_POLL_INTERVAL_S)
+
+    def _write_pending(self, buf: memoryview) -> None:
+        offset = 0
+        while self._pending:
+            size = len(self._pending[0])
+            if offset + _MESSAGE_HEADER.size + size > len(buf):
+                break
+            _MESSAGE_HEADER.pack_into(buf, offset, size)
+            offset += _MESSAGE_HEADER.size
+            buf[offset:offset + size] = self._pending.popleft()
+            offset += size
+        if offset + _MESSAGE_HEADER.size <= len(buf):
+            _MESSAGE_HEADER.pack_into(buf, offset, 0)
+
+    async def recv(self) -> List[Any]:
+        """Waits for the next block and returns its messages."""
+        while True:
+            try:
+                with self._reader.acquire_read(timeout=0) as buf:
+                    return self._read_messages(buf)
+            except TimeoutError:
+                await asyncio.sleep(SHM_POLL_INTERVAL_S)
+
+    @staticmethod
+    def _read_messages(buf: memoryview) -> List[Any]:
+        messages = []
+        offset = 0
+        while offset + _MESSAGE_HEADER.size <= len(buf):
+            (size, ) = _MESSAGE_HEADER.unpack_from(buf, offset)
+            if size == 0:
+                break
+            offset += _MESSAGE_HEADER.size
+            messages.append(pickle.loads(buf[offset:offset + size]))
+            offset += size
+        return messages
+
+
+@dataclass
+class RequestOutputDelta:
+    """The part of a `RequestOutput` the API server process does not have.
+
+    The outputs only hold the text, token ids and logprobs they gained since
+    the last delta, unless `is_delta` is False. Beam search replaces its
+    outputs instead of extending them, so its deltas hold the whole outputs.
+    """
+    outputs: List[CompletionOutput]
+    finished: bool
+    is_delta: bool = True
+    # Only set on the first delta, if the request has no prompt token ids.
+    prompt: Optional[str] = None
+    prompt_token_ids: Optional[List[int]] = None
+    # Only set until the first tokens are generated, the chunks of a prompt
+    # extend them.
+    prompt_logprobs: Optional[PromptLogprobs] = None
+    # Only set on the last delta.
+    metrics: Optional[RequestMetrics] = None
+
+
+@dataclass
+class _SentOutputs:
+    """The lengths of the outputs of a request sent to its API server."""
+    # The number of token ids and the length of the text of every output.
+    lengths: Dict[int, Tuple[int, int]] = field(default_factory=dict)
+    sent_prompt: bool = False
+    generated: bool = False
+
+
+def _create_delta(request_output: RequestOutput, sent: _SentOutputs,
+                  send_prompt: bool, is_delta: bool) -> RequestOutputDelta:
+    outputs = []
+    for output in request_output.outputs:
+        num_token_ids, text_len = (sent.lengths.get(output.index,
+                                                    (0, 0)) if is_delta else
+                                   (0, 0))
+        outputs.append(
+            CompletionOutput(
+                output.index, output.text[text_len:],
+                output.token_ids[num_token_ids:], output.cumulative_logprob,
+                None if output.logprobs is None else
+                output.logprobs[num_token_ids:], output.finish_reason,
+                output.stop_reason))
+        sent.lengths[output.index] = (len(output.token_ids), len(output.text))
+
+    delta = RequestOutputDelta(outputs, request_output.finished, is_delta)
+    if send_prompt and not sent.sent_prompt:
+        sent.sent_prompt = True
+        delta.prompt = request_output.prompt
+        delta.prompt_token_ids = request_output.prompt_token_ids
+    if not sent.generated:
+        delta.prompt_logprobs = request_output.prompt_logprobs
+        sent.generated = any(output.token_ids
+                             for output in request_output.outputs)
+    if request_output.finished:
+        delta.metrics = request_output.metrics
+    return delta
+
+
+def _apply_delta(outputs: Dict[int, CompletionOutput],
+                 delta: RequestOutputDelta) -> List[CompletionOutput]:
+    """Adds the delta to the outputs of the request, and returns the outputs
+    of the delta in its order."""
+    if not delta.is_delta:
+        outputs.clear()
+    for output_delta in delta.outputs:
+        output = outputs.get(output_delta.index)
+        if output is None:
+            outputs[output_delta.index] = output_delta
+            continue
+        output.text += output_delta.text
+        output.token_ids.extend(output_delta.token_ids)
+        if output.logprobs is not None and output_delta.logprobs is not None:
+            output.logprobs.extend(output_delta.logprobs)
+        output.cumulative_logprob = output_delta.cumulative_logprob
+        output.finish_reason = output_delta.finish_reason
+        output.stop_reason = output_delta.stop_reason
+    return [outputs[output_delta.index] for output_delta in delta.outputs]
+
+
+class ShmEngineServer:
+    """Serves an `AsyncLLMEngine` to API server processes, each over its own
+    `ShmChannel`.
+
+    The buffers are created here and passed to the API server processes,
+    which open them by name, see `ShmEngineClient`.
+
+    Args:
+        engine: The engine to serve.
+        num_clients: The number of API server processes.
+    """
+
+    def __init__(self, engine: AsyncLLMEngine, num_clients: int) -> None:
+        self.engine = engine
+        # The buffers of the requests and of the outputs of every client.
+        self.client_buffers: List[Tuple[ShmRingBuffer, ShmRingBuffer]] = [
+            (ShmRingBuffer(1, SHM_MAX_CHUNK_BYTES, SHM_MAX_CHUNKS),
+             ShmRingBuffer(1, SHM_MAX_CHUNK_BYTES, SHM_MAX_CHUNKS))
+            for _ in range(num_clients)
+        ]
+        self._requests: Dict[Tuple[int, str], asyncio.Task] = {}
+
+    async def serve(self) -> None:
+        channels = [
+            ShmChannel(send_buffer=output_buffer, recv_buffer=request_buffer)
+            for request_buffer, output_buffer in self.client_buffers
+        ]
+        await asyncio.gather(
+            *(channel.run_sender() for channel in channels),
+            *(self._serve_client(client_id, channel)
+              for client_id, channel in enumerate(channels)))
+
+    async def _serve_client(self, client_id: int, channel: ShmChannel) -> None:
+        while True:
+            for message in await channel.recv():
+                kind = message[0]
+                if kind in (GENERATE, ENCODE):
+                    _, request_id, inputs, params, lora_request, \
+                        trace_headers = message
+                    if kind == GENERATE:
+                        results = self.engine.generate(inputs, params,
+                                                       request_id,
+                                                       lora_request,
+                                                       trace_headers)
+                    else:
+                        results = self.engine.encode(inputs, params,
+                                                     request_id, lora_request,
+                                                     trace_headers)
+                    # Without prompt token ids, the engine tokenizes the
+                    # prompt and sends the token ids back.
+                    send_prompt = (isinstance(inputs, str)
+                                   or "prompt_token_ids" not in inputs)
+                    self._requests[client_id,
+                                   request_id] = (asyncio.create_task(
+                                       self._send_outputs(
+                                           client_id, channel, request_id,
+                                           results, send_prompt,
+                                           params.use_beam_search if
+                                           isinstance(params, SamplingParams)
+                                           else False)))
+                elif kind == ABORT:
+                    # The request aborts itself in the engine when its
+                    # generator is cancelled.
+                    task = self._requests.get((client_id, message[1]))
+                    if task is not None:
+                        task.cancel()
+                elif kind == CHECK_HEALTH:
+                    asyncio.create_task(
+                        self._check_health(channel, call_id=message[1]))
+
+    async def _send_outputs(
+        self,
+        client_id: int,
+        channel: ShmChannel,
+        request_id: str,
+        results: AsyncIterator[Union[RequestOutput, EmbeddingRequestOutput]],
+        send_prompt: bool,
+        use_beam_search: bool,
+    ) -> None:
+        sent = _SentOutputs()
+        try:
+            async for request_output in results:
+                if isinstance(request_output, RequestOutput):
+                    channel.send(
+                        (OUTPUT, request_id,
+                         _create_delta(request_output, sent, send_prompt,
+                                       not use_beam_search)))
+                else:
+                    channel.send((OUTPUT, request_id, request_output))
+            # The request finished or was aborted by the engine.
+            channel.send((FINISHED, request_id))
+        except Exception as e:
+            channel.send((ERROR, request_id, _picklable_error(e)))
+        finally:
+            del self._requests[client_id, request_id]
+
+    async def _check_health(self, channel: ShmChannel, call_id: int) -> None:
+        error = None
+        try:
+            await self.engine.check_health()
+        except Exception as e:
+            error = _picklable_error(e)
+        channel.send((HEALTH, call_id, error))
+
+
+def _picklable_error(error: Exception) -> Exception:
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
+
+
+class ShmEngineClient:
+    """Stands in for the `AsyncLLMEngine` of the serving classes in an API
+    server process, and forwards their requests to the `ShmEngineServer` of
+    the engine process.
+
+    Args:
+        request_buffer: The buffer of the requests, from the server.
+        output_buffer: The buffer of the outputs, from the server.
+        model_config: The model config of the engine.
+        decoding_config: The decoding config of the engine.
+        vision_language_config: The vision language config of the engine,
+            if any.
+        tracing_enabled: Whether the engine traces the requests.
+    """
+
+    def __init__(
+        self,
+        request_buffer: ShmRingBuffer,
+        output_buffer: ShmRingBuffer,
+        model_config: ModelConfig,
+        decoding_config: DecodingConfig,
+        vision_language_config: Optional[VisionLanguageConfig],
+        tracing_enabled: bool,
+    ) -> None:
+        self.model_config = model_config
+        self.vision_language_config = vision_language_config
+        self.decoding_config = decoding_config
+        self.tracing_enabled = tracing_enabled
+        self._tokenizer: Optional[PreTrainedTokenizer] = None
+
+        self._channel = ShmChannel(send_buffer=request_buffer,
+                                   recv_buffer=output_buffer)
+        self._streams: Dict[str, AsyncStream] = {}
+        self._health_checks: Dict[int, asyncio.Future] = {}
+        self._call_counter = Counter()
+        self._background_tasks: List[asyncio.Task] = []
+        self._errored_with: Optional[BaseException] = None
+
+    @property
+    def engine(self) -> "ShmEngineClient":
+        # The serving classes read the configs from `AsyncLLMEngine.engine`.
+        return self
+
+    @property
+    def errored(self) -> bool:
+        return self._errored_with is not None
+
+    def _start_background_tasks(self) -> None:
+        if self._errored_with is not None:
+            raise AsyncEngineDeadError("The connection to the engine process "
+                                       "failed.") from self._errored_with
+        if self._background_tasks:
+            return
+        for coroutine in (self._channel.run_sender(), self._recv_outputs()):
+            task = asyncio.create_task(coroutine)
+            task.add_done_callback(self._on_background_task_done)
+            self._background_tasks.append(task)
+
+    def _on_background_task_done(self, task: asyncio.Task) -> None:
+        if task.cancelled():
+            return
+        self._errored_with = task.exception()
+        logger.error("The connection to the engine process failed",
+                     exc_info=self._errored_with)
+        for stream in self._streams.values():
+            stream.put(
+                AsyncEngineDeadError(
+                    "The connection to the engine process failed."))
+            stream.finish()
+        self._streams.clear()
+
+    async def _recv_outputs(self) -> None:
+        while True:
+            for message in await self._channel.recv():
+                kind = message[0]
+                if kind == HEALTH:
+                    _, call_id, error = message
+                    future = self._health_checks.pop(call_id, None)
+                    if future is not None and not future.done():
+                        future.set_result(error)
+                    continue
+                # The requests aborted here may still have outputs on the way.
+                request_id = message[1]
+                stream = self._streams.get(request_id)
+                if stream is None:
+                    continue
+                if kind in (OUTPUT, ERROR):
+                    stream.put(message[2])
+                if kind != OUTPUT or message[2].finished:
+                    del self._streams[request_id]
+                    stream.finish()
+
+    def _add_request(
+        self,
+        kind: int,
+        request_id: str,
+        inputs: PromptInputs,
+        params: Union[SamplingParams, PoolingParams],
+        lora_request: Optional[LoRARequest],
+        trace_headers: Optional[Dict[str, str]],
+    ) -> AsyncStream:
+        self._start_background_tasks()
+        if request_id in self._streams:
+            raise KeyError(f"Request {request_id} already exists.")
+        # The logits processors, e.g. the guides of guided decoding, are
+        # callables built in this process, which may not be picklable or fit
+        # in a block, so they are rejected before they are sent.
+        if (isinstance(params, SamplingParams) and params.logits_processors):
+            raise ValueError(
+                "Logits processors, including guided decoding, are not "
+                "supported with --api-server-workers.")
+        self._channel.send(
+            (kind, request_id, inputs, params, lora_request, trace_headers))
+        stream = AsyncStream(request_id)
+        self._streams[request_id] = stream
+        return stream
+
+    async def generate(
+        self,
+        inputs: PromptInputs,
+        sampling_params: SamplingParams,
+        request_id: str,
+        lora_request: Optional[LoRARequest] = None,
+        trace_headers: Optional[Dict[str, str]] = None,
+    ) -> AsyncIterator[RequestOutput]:
+        """Like `AsyncLLMEngine.generate`."""
+        stream = self._add_request(GENERATE, request_id, inputs,
+                                   sampling_params, lora_request,
+                                   trace_headers)
+        if isinstance(inputs, str):
+            prompt, prompt_token_ids = inputs, None
+        else:
+            prompt = inputs.get("prompt")
+            prompt_token_ids = inputs.get("prompt_token_ids")
+        prompt_logprobs = None
+        outputs: Dict[int, CompletionOutput] = {}
+        try:
+            async for delta in stream:
+                if delta.prompt_token_ids is not None:
+                    prompt = delta.prompt
+                    prompt_token_ids = delta.prompt_token_ids
+                if delta.prompt_logprobs is not None:
+                    prompt_logprobs = delta.prompt_logprobs
+                yield RequestOutput(request_id,
+                                    prompt,
+                                    prompt_token_ids,
+                                    prompt_logprobs,
+                                    _apply_delta(outputs, delta),
+                                    delta.finished,
+                                    delta.metrics,
+                                    lora_request=lora_request)
+        except (Exception, asyncio.CancelledError) as e:
+            self._abort(request_id)
+            raise e
+
+    async def encode(
+        self,
+        inputs: PromptInputs,
+        pooling_params: PoolingParams,
+        request_id: str,
+        lora_request: Optional[LoRARequest] = None,
+        trace_headers: Optional[Dict[str, str]] = None,
+    ) -> AsyncIterator[EmbeddingRequestOutput]:
+        """Like `AsyncLLMEngine.encode`."""
+        stream = self._add_request(ENCODE, request_id, inputs, pooling_params,
+                                   lora_request, trace_headers)
+        try:
+            async for request_output in stream:
+                yield request_output
+        except (Exception, asyncio.CancelledError) as e:
+            self._abort(request_id)
+            raise e
+
+    async def abort(self, request_id: str) -> None:
+        """Like `AsyncLLMEngine.abort`."""
+        self._abort(request_id)
+
+    def _abort(self, request_id: str) -> None:
+        stream = self._streams.pop(request_id, None)
+        if stream is None:
+            return
+        stream.finish()
+        self._channel.send((ABORT, request_id))
+
+    async def get_model_config(self) -> ModelConfig:
+        return self.model_config
+
+    async def get_decoding_config(self) -> DecodingConfig:
+        return self.decoding_config
+
+    async def get_tokenizer(self) -> "PreTrainedTokenizer":
+        if self._tokenizer is None:
+            self._tokenizer = get_tokenizer(
+                self.model_config.tokenizer,
+                tokenizer_mode=self.model_config.tokenizer_mode,
+                trust_remote_code=self.model_config.trust_remote_code,
+                revision=self.model_config.tokenizer_revision)
+        return self._tokenizer
+
+    async def is_tracing_enabled(self) -> bool:
+        return self.tracing_enabled
+
+    async def do_log_stats(self) -> None:
+        # The engine process logs the stats.
+        pass
+
+    async def check_health(self) -> None:
+        """Raises an error if the engine is unhealthy or does not answer."""
+        self._start_background_tasks()
+        call_id = next(self._call_counter)
+        future = asyncio.get_running_loop().create_future()
+        self._health_checks[call_id] = future
+        self._channel.send((CHECK_HEALTH, call_id))
+        try:
+            error = await asyncio.wait_for(
+                future, envs.VLLM_ENGINE_ITERATION_TIMEOUT_S)
+        except asyncio.TimeoutError as e:
+            self._health_checks.pop(call_id, None)
+            raise AsyncEngineDeadError(
+                "The engine process did not answer the health check.") from e
+        if error is not None:
+            raise error
@@ -1,7 +1,9 @@
 import asyncio
 import importlib
 import inspect
+import multiprocessing
 import re
+import socket
 from contextlib import asynccontextmanager
 from http import HTTPStatus
 from typing import Optional, Set
@@ -16,8 +18,11 @@ from prometheus_client import make_asgi_app
 from starlette.routing import Mount
 
 import vllm.envs as envs
+from vllm.config import DecodingConfig, ModelConfig, VisionLanguageConfig
+from vllm.distributed.device_communicators.shm_broadcast import ShmRingBuffer
 from vllm.engine.arg_utils import AsyncEngineArgs
 from vllm.engine.async_llm_engine import AsyncLLMEngine
+from vllm.engine.shm_engine import ShmEngineClient, ShmEngineServer
 from vllm.entrypoints.openai.cli_args import make_arg_parser
 # yapf conflicts with isort for this block
 # yapf: disable
@@ -48,14 +53,14 @@ logger = init_logger('vllm.entrypoints.openai.api_server')
 _running_tasks: Set[asyncio.Task] = set()
 
 
-@asynccontextmanager
-async def lifespan(app: fastapi.FastAPI):
+async def _force_log():
+    while True:
+        await asyncio.sleep(10)
+        await engine.do_log_stats()
 
-    async def _force_log():
-        while True:
-            await asyncio.sleep(10)
-            await engine.do_log_stats()
 
+@asynccontextmanager
+async def lifespan(app: fastapi.FastAPI):
     if not engine_args.disable_log_stats:
         task = asyncio.create_task(_force_log())
         _running_tasks.add(task)
@@ -167,9 +172,7 @@ async def create_embedding(request: EmbeddingRequest, raw_request: Request):
         return JSONResponse(content=generator.model_dump())
 
 
-if __name__ == "__main__":
-    args = parse_args()
-
+def setup_app(args) -> None:
     app.add_middleware(
         CORSMiddleware,
         allow_origins=args.allowed_origins,
@@ -203,14 +206,104 @@ if __name__ == "__main__":
             raise ValueError(f"Invalid middleware {middleware}. "
                              f"Must be a function or a class.")
 
-    logger.info("vLLM API server version %s", VLLM_VERSION)
-    logger.info("args: %s", args)
+    app.root_path = args.root_path
+
+
+def init_serving(model_config: ModelConfig, args) -> None:
+    global openai_serving_chat
+    global openai_serving_completion
+    global openai_serving_embedding
 
     if args.served_model_name is not None:
         served_model_names = args.served_model_name
     else:
         served_model_names = [args.model]
 
+    openai_serving_chat = OpenAIServingChat(engine, model_config,
+                                            served_model_names,
+                                            args.response_role,
+                                            args.lora_modules,
+                                            args.chat_template)
+    openai_serving_completion = OpenAIServingCompletion(
+        engine, model_config, served_model_names, args.lora_modules)
+    openai_serving_embedding = OpenAIServingEmbedding(engine, model_config,
+                                                      served_model_names)
+
+
+def run_api_server_worker(
+        args, request_buffer: ShmRingBuffer, output_buffer: ShmRingBuffer,
+        model_config: ModelConfig, decoding_config: DecodingConfig,
+        vision_language_config: Optional[VisionLanguageConfig],
+        tracing_enabled: bool, sock: socket.socket) -> None:
+    """Serves the HTTP requests of the shared socket in an API server
+    process, and forwards them to the engine process."""
+    global engine, engine_args
+    engine_args = AsyncEngineArgs.from_cli_args(args)
+    engine = ShmEngineClient(request_buffer, output_buffer, model_config,
+                             decoding_config, vision_language_config,
+                             tracing_enabled)
+    setup_app(args)
+    init_serving(model_config, args)
+    config = uvicorn.Config(app,
+                            log_level=args.uvicorn_log_level,
+                            timeout_keep_alive=TIMEOUT_KEEP_ALIVE,
+                            ssl_keyfile=args.ssl_keyfile,
+                            ssl_certfile=args.ssl_certfile,
+                            ssl_ca_certs=args.ssl_ca_certs,
+                            ssl_cert_reqs=args.ssl_cert_reqs)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def run_api_server_workers(args, model_config: ModelConfig) -> None:
+    """Runs the engine in this process, and `args.api_server_workers` API
+    server processes sharing the port."""
+    server = ShmEngineServer(engine, args.api_server_workers)
+    # The socket is bound here and shared by the API server processes. It
+    # is bound to all the IPv4 interfaces without a host.
+    sock = uvicorn.Config(
+        app,
+        host=args.host if args.host is not None else "0.0.0.0",
+        port=args.port).bind_socket()
+    # The API server processes must not inherit the CUDA context.
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=run_api_server_worker,
+                        args=(args, request_buffer,
+                              output_buffer, model_config,
+                              engine.engine.get_decoding_config(),
+                              getattr(engine.engine,
+                                      "vision_language_config", None),
+                              engine.engine.is_tracing_enabled(), sock),
+                        name=f"APIServerWorker-{i}",
+                        daemon=True)
+        for i, (request_buffer,
+                output_buffer) in enumerate(server.client_buffers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    async def serve():
+        if not engine_args.disable_log_stats:
+            task = asyncio.create_task(_force_log())
+            _running_tasks.add(task)
+            task.add_done_callback(_running_tasks.remove)
+        await server.serve()
+
+    try:
+        asyncio.run(serve())
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    logger.info("vLLM API server version %s", VLLM_VERSION)
+    logger.info("args: %s", args)
+
     engine_args = AsyncEngineArgs.from_cli_args(args)
 
     # Enforce pixel values as image input type for vision language models
@@ -221,6 +314,9 @@ if __name__ == "__main__":
             f"Invalid image_input_type: {engine_args.image_input_type}. "
             "Only --image-input-type 'pixel_values' is supported for serving "
             "vision language models with the vLLM API server.")
+    if args.api_server_workers > 0 and engine_args.engine_use_ray:
+        raise ValueError("--api-server-workers does not support "
+                         "--engine-use-ray.")
 
     engine = AsyncLLMEngine.from_engine_args(
         engine_args, usage_context=UsageContext.OPENAI_API_SERVER)
@@ -239,22 +335,17 @@ if __name__ == "__main__":
         # When using single vLLM without engine_use_ray
         model_config = asyncio.run(engine.get_model_config())
 
-    openai_serving_chat = OpenAIServingChat(engine, model_config,
-                                            served_model_names,
-                                            args.response_role,
-                                            args.lora_modules,
-                                            args.chat_template)
-    openai_serving_completion = OpenAIServingCompletion(
-        engine, model_config, served_model_names, args.lora_modules)
-    openai_serving_embedding = OpenAIServingEmbedding(engine, model_config,
-                                                      served_model_names)
-    app.root_path = args.root_path
-    uvicorn.run(app,
-                host=args.host,
-                port=args.port,
-                log_level=args.uvicorn_log_level,
-                timeout_keep_alive=TIMEOUT_KEEP_ALIVE,
-                ssl_keyfile=args.ssl_keyfile,
-                ssl_certfile=args.ssl_certfile,
-                ssl_ca_certs=args.ssl_ca_certs,
-                ssl_cert_reqs=args.ssl_cert_reqs)
+    if args.api_server_workers > 0:
+        run_api_server_workers(args, model_config)
+    else:
+        setup_app(args)
+        init_serving(model_config, args)
+        uvicorn.run(app,
+                    host=args.host,
+                    port=args.port,
+                    log_level=args.uvicorn_log_level,
+                    timeout_keep_alive=TIMEOUT_KEEP_ALIVE,
+                    ssl_keyfile=args.ssl_keyfile,
+                    ssl_certfile=args.ssl_certfile,
+                    ssl_ca_certs=args.ssl_ca_certs,
+                    ssl_cert_reqs=args.ssl_cert_reqs)
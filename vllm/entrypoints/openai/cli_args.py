@@ -111,6 +111,17 @@ def make_arg_parser():
         "using @app.middleware('http'). "
         "If a class is provided, vLLM will add it to the server "
         "using app.add_middleware(). ")
+    parser.add_argument(
+        "--api-server-workers",
+        type=int,
+        default=0,
+        help="The number of API server processes. With 0, the API server "
+        "runs in the engine process. Otherwise, the API server processes "
+        "share the port, serve the HTTP requests, tokenize the prompts and "
+        "build the responses, and send the token ids to the engine process "
+        "over shared memory, which sends back the new tokens of every step. "
+        "The engine metrics are logged by the engine process, but not "
+        "served on /metrics. Guided decoding is not supported.")
 
     parser = AsyncEngineArgs.add_cli_args(parser)
     return parser
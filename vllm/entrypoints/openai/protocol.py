@@ -5,7 +5,8 @@ from typing import Any, Dict, List, Literal, Optional, Union
 
 import openai.types.chat
 import torch
-from pydantic import BaseModel, ConfigDict, Field, model_validator
+from pydantic import (BaseModel, ConfigDict, Field, ValidationInfo,
+                      field_validator, model_validator)
 # pydantic needs the TypedDict from typing_extensions
 from typing_extensions import Annotated, Required, TypedDict
 
@@ -226,6 +227,23 @@ class ChatCompletionRequest(OpenAIBaseModel):
         description=(
             "If specified, will override the default whitespace pattern "
             "for guided json decoding."))
+    priority: Optional[int] = Field(
+        default=0,
+        description=(
+            "The priority of the request, lower values are scheduled first "
+            "when the server runs the 'priority' scheduling policy."))
+    deadline: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description=(
+            "The latency SLO of the request in seconds after its arrival. "
+            "The earliest deadline is scheduled first when the server runs "
+            "the 'deadline' scheduling policy."))
+    tenant_id: Optional[str] = Field(
+        default=None,
+        description=(
+            "The tenant the request is accounted to when the server shares "
+            "its scheduling budget between tenants."))
 
     # doc: end-chat-completion-extra-params
 
@@ -279,6 +297,9 @@ class ChatCompletionRequest(OpenAIBaseModel):
             include_stop_str_in_output=self.include_stop_str_in_output,
             length_penalty=self.length_penalty,
             logits_processors=logits_processors,
+            priority=self.priority or 0,
+            deadline=self.deadline,
+            tenant_id=self.tenant_id,
         )
 
     @model_validator(mode='before')
@@ -418,6 +439,23 @@ class CompletionRequest(OpenAIBaseModel):
         description=(
             "If specified, will override the default whitespace pattern "
             "for guided json decoding."))
+    priority: Optional[int] = Field(
+        default=0,
+        description=(
+            "The priority of the request, lower values are scheduled first "
+            "when the server runs the 'priority' scheduling policy."))
+    deadline: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description=(
+            "The latency SLO of the request in seconds after its arrival. "
+            "The earliest deadline is scheduled first when the server runs "
+            "the 'deadline' scheduling policy."))
+    tenant_id: Optional[str] = Field(
+        default=None,
+        description=(
+            "The tenant the request is accounted to when the server shares "
+            "its scheduling budget between tenants."))
 
     # doc: end-completion-extra-params
 
@@ -472,6 +510,9 @@ class CompletionRequest(OpenAIBaseModel):
             length_penalty=self.length_penalty,
             logits_processors=logits_processors,
             truncate_prompt_tokens=self.truncate_prompt_tokens,
+            priority=self.priority or 0,
+            deadline=self.deadline,
+            tenant_id=self.tenant_id,
         )
 
     @model_validator(mode="before")
@@ -663,11 +704,19 @@ class ChatCompletionStreamResponse(OpenAIBaseModel):
     usage: Optional[UsageInfo] = Field(default=None)
 
 
+_BATCH_REQUEST_TYPES = {
+    "/v1/chat/completions": ChatCompletionRequest,
+    "/v1/completions": CompletionRequest,
+    "/v1/embeddings": EmbeddingRequest,
+}
+
+
 class BatchRequestInput(OpenAIBaseModel):
     """
     The per-line object of the batch input file.
 
-    NOTE: Currently only the `/v1/chat/completions` endpoint is supported.
+    NOTE: Currently the `/v1/chat/completions`, `/v1/completions` and
+    `/v1/embeddings` endpoints are supported.
     """
 
     # A developer-provided per-request id that will be used to match outputs to
@@ -679,11 +728,22 @@ class BatchRequestInput(OpenAIBaseModel):
     method: str
 
     # The OpenAI API relative URL to be used for the request. Currently
-    # /v1/chat/completions is supported.
+    # /v1/chat/completions, /v1/completions and /v1/embeddings are supported.
     url: str
 
     # The parameteters of the request.
-    body: Union[ChatCompletionRequest, ]
+    body: Union[ChatCompletionRequest, CompletionRequest, EmbeddingRequest]
+
+    @field_validator("body", mode="plain")
+    @classmethod
+    def check_body_for_url(cls, body, info: ValidationInfo):
+        # The bodies of the endpoints overlap, the url tells them apart.
+        request_type = _BATCH_REQUEST_TYPES.get(info.data.get("url"))
+        if request_type is None:
+            # Left as is, `run_request` writes an error for the line instead
+            # of failing the batch.
+            return body
+        return request_type.model_validate(body)
 
 
 class BatchResponseData(OpenAIBaseModel):
@@ -694,7 +754,8 @@ class BatchResponseData(OpenAIBaseModel):
     request_id: str
 
     # The body of the response.
-    body: Union[ChatCompletionResponse, ]
+    body: Optional[Union[ChatCompletionResponse, CompletionResponse,
+                         EmbeddingResponse]] = None
 
 
 class BatchRequestOutput(OpenAIBaseModel):
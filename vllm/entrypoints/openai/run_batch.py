@@ -1,6 +1,11 @@
 import asyncio
-from io import StringIO
-from typing import Awaitable, List
+import json
+import os
+import tempfile
+from collections import deque
+from http import HTTPStatus
+from typing import (AsyncIterator, Awaitable, Callable, Deque, Dict, Optional,
+                    Set, Union)
 
 import aiohttp
 
@@ -10,8 +15,11 @@ from vllm.entrypoints.openai.protocol import (BatchRequestInput,
                                               BatchRequestOutput,
                                               BatchResponseData,
                                               ChatCompletionResponse,
-                                              ErrorResponse)
+                                              CompletionResponse,
+                                              EmbeddingResponse, ErrorResponse)
 from vllm.entrypoints.openai.serving_chat import OpenAIServingChat
+from vllm.entrypoints.openai.serving_completion import OpenAIServingCompletion
+from vllm.entrypoints.openai.serving_embedding import OpenAIServingEmbedding
 from vllm.logger import init_logger
 from vllm.usage.usage_lib import UsageContext
 from vllm.utils import FlexibleArgumentParser, random_uuid
@@ -19,6 +27,11 @@ from vllm.version import __version__ as VLLM_VERSION
 
 logger = init_logger(__name__)
 
+BatchResponse = Union[ChatCompletionResponse, CompletionResponse,
+                      EmbeddingResponse, ErrorResponse]
+# Serves the body of a batch request.
+BatchHandler = Callable[..., Awaitable[BatchResponse]]
+
 
 def parse_args():
     parser = FlexibleArgumentParser(
@@ -45,55 +58,174 @@ def parse_args():
                         default="assistant",
                         help="The role name to return if "
                         "`request.add_generation_prompt=true`.")
+    parser.add_argument(
+        "--max-concurrent-requests",
+        type=int,
+        default=None,
+        help="The maximum number of requests submitted to the engine and not "
+        "written to the output yet. Defaults to twice `--max-num-seqs`, so "
+        "that the engine always has requests waiting to replace the "
+        "finished ones.")
+    parser.add_argument(
+        "--output-order",
+        type=str,
+        default="ordered",
+        choices=["ordered", "unordered"],
+        help="The order of the output lines. `ordered` writes them in the "
+        "order of the input, holding the finished requests back until the "
+        "requests before them finish. `unordered` writes them as soon as "
+        "the requests finish.")
+    parser.add_argument(
+        "--checkpoint-file",
+        type=nullable_str,
+        default=None,
+        help="The path to a local file recording the custom ids of the "
+        "requests whose output is written. If the file exists, the batch "
+        "resumes: the requests recorded in it are skipped and the output is "
+        "appended to the output file. Requires a local output file.")
 
     parser = AsyncEngineArgs.add_cli_args(parser)
     return parser.parse_args()
 
 
-async def read_file(path_or_url: str) -> str:
-    if path_or_url.startswith("http://") or path_or_url.startswith("https://"):
-        async with aiohttp.ClientSession() as session, \
-                   session.get(path_or_url) as resp:
-            return await resp.text()
-    else:
-        with open(path_or_url, "r", encoding="utf-8") as f:
-            return f.read()
+def is_url(path_or_url: str) -> bool:
+    return path_or_url.startswith("http://") or path_or_url.startswith(
+        "https://")
 
 
-async def write_file(path_or_url: str, data: str) -> None:
-    if path_or_url.startswith("http://") or path_or_url.startswith("https://"):
+async def read_lines(path_or_url: str) -> AsyncIterator[str]:
+    """Yields the non-empty lines of the input file as they are read, without
+    holding the whole file in memory."""
+    if is_url(path_or_url):
         async with aiohttp.ClientSession() as session, \
-                   session.put(path_or_url, data=data.encode("utf-8")):
-            pass
+                   session.get(path_or_url) as resp:
+            resp.raise_for_status()
+            # The lines of a batch may be longer than the line limit of
+            # the stream reader, so they are split by hand.
+            buffer = b""
+            async for chunk in resp.content.iter_any():
+                if b"\n" not in chunk:
+                    buffer += chunk
+                    continue
+                *lines, last = (buffer + chunk).split(b"\n")
+                buffer = last
+                for line in lines:
+                    if line.strip():
+                        yield line.decode("utf-8")
+            if buffer.strip():
+                yield buffer.decode("utf-8")
     else:
         # We should make this async, but as long as this is always run as a
         # standalone program, blocking the event loop won't effect performance
         # in this particular case.
-        with open(path_or_url, "w", encoding="utf-8") as f:
-            f.write(data)
+        with open(path_or_url, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield line
+
+
+async def upload_file(path: str, url: str) -> None:
+    with open(path, "rb") as f:
+        async with aiohttp.ClientSession() as session, \
+                   session.put(url, data=f) as resp:
+            resp.raise_for_status()
+
 
+class BatchOutputWriter:
+    """Appends the output lines to a local file as they are written.
 
-async def run_request(chat_serving: OpenAIServingChat,
+    With a checkpoint file, every output line is followed by a checkpoint
+    line holding its custom id and the size of the output file after it. A
+    resumed batch skips the requests of the checkpoint and truncates the
+    output file to the last size of the checkpoint, which drops an output
+    line written without its checkpoint line.
+
+    Args:
+        output_path: The path to the output file.
+        checkpoint_path: The path to the checkpoint file, if any.
+    """
+
+    def __init__(self,
+                 output_path: str,
+                 checkpoint_path: Optional[str] = None) -> None:
+        self.completed: Set[str] = set()
+        output_size = 0
+        checkpoint_size = 0
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # The last line was cut by the crash.
+                        break
+                    checkpoint = json.loads(line)
+                    self.completed.add(checkpoint["custom_id"])
+                    output_size = checkpoint["output_size"]
+                    checkpoint_size += len(line)
+            if (output_size > 0
+                    and (not os.path.exists(output_path)
+                         or os.path.getsize(output_path) < output_size)):
+                raise ValueError(
+                    f"The output file {output_path} is shorter than the "
+                    f"output recorded by the checkpoint {checkpoint_path}.")
+            logger.info("Resuming the batch after %d completed requests.",
+                        len(self.completed))
+
+        self.output = open(output_path, "a", encoding="utf-8")  # noqa: SIM115
+        self.output.truncate(output_size)
+        self.checkpoint = None
+        if checkpoint_path is not None:
+            self.checkpoint = open(  # noqa: SIM115
+                checkpoint_path, "a", encoding="utf-8")
+            self.checkpoint.truncate(checkpoint_size)
+
+    def write(self, output: BatchRequestOutput) -> None:
+        self.output.write(output.model_dump_json() + "\n")
+        self.output.flush()
+        if self.checkpoint is not None:
+            # The output is flushed first, so that the checkpoint never
+            # records an output that is not written.
+            self.checkpoint.write(
+                json.dumps({
+                    "custom_id": output.custom_id,
+                    "output_size": self.output.tell(),
+                }) + "\n")
+            self.checkpoint.flush()
+
+    def close(self) -> None:
+        self.output.close()
+        if self.checkpoint is not None:
+            self.checkpoint.close()
+
+
+async def run_request(handler: Optional[BatchHandler],
                       request: BatchRequestInput) -> BatchRequestOutput:
-    chat_request = request.body
-    chat_response = await chat_serving.create_chat_completion(chat_request)
+    response: BatchResponse
+    if handler is None:
+        response = ErrorResponse(message=f"The url {request.url} is not "
+                                 "supported by the model.",
+                                 type="BadRequestError",
+                                 code=HTTPStatus.BAD_REQUEST.value)
+    else:
+        response = await handler(request.body)
 
-    if isinstance(chat_response, ChatCompletionResponse):
+    if isinstance(
+            response,
+        (ChatCompletionResponse, CompletionResponse, EmbeddingResponse)):
         batch_output = BatchRequestOutput(
             id=f"vllm-{random_uuid()}",
             custom_id=request.custom_id,
             response=BatchResponseData(
-                body=chat_response, request_id=f"vllm-batch-{random_uuid()}"),
+                body=response, request_id=f"vllm-batch-{random_uuid()}"),
             error=None,
         )
-    elif isinstance(chat_response, ErrorResponse):
+    elif isinstance(response, ErrorResponse):
         batch_output = BatchRequestOutput(
             id=f"vllm-{random_uuid()}",
             custom_id=request.custom_id,
             response=BatchResponseData(
-                status_code=chat_response.code,
+                status_code=response.code,
                 request_id=f"vllm-batch-{random_uuid()}"),
-            error=chat_response,
+            error=response,
         )
     else:
         raise ValueError("Request must not be sent in stream mode")
@@ -101,12 +233,66 @@ async def run_request(chat_serving: OpenAIServingChat,
     return batch_output
 
 
+async def run_batch(lines: AsyncIterator[str],
+                    handlers: Dict[str, BatchHandler],
+                    writer: BatchOutputWriter,
+                    max_concurrent_requests: int,
+                    ordered: bool = True) -> None:
+    """Submits the requests of the input lines as they are read, with at
+    most `max_concurrent_requests` of them submitted and not written, and
+    writes their outputs as they finish.
+
+    In order, a finished request is held back until the requests before it
+    are written, and keeps its place in the window, so the outputs held back
+    are bounded by the window too.
+    """
+    # The submitted requests whose outputs are not written, in the order of
+    # the input.
+    unwritten: Deque[asyncio.Task] = deque()
+
+    async def write_finished(wait: bool) -> None:
+        nonlocal unwritten
+        if wait:
+            await asyncio.wait([unwritten[0]] if ordered else unwritten,
+                               return_when=asyncio.FIRST_COMPLETED)
+        if ordered:
+            while unwritten and unwritten[0].done():
+                writer.write(unwritten.popleft().result())
+        else:
+            finished = [task for task in unwritten if task.done()]
+            if finished:
+                unwritten = deque(task for task in unwritten
+                                  if not task.done())
+                for task in finished:
+                    writer.write(task.result())
+
+    try:
+        async for line in lines:
+            request = BatchRequestInput.model_validate_json(line)
+            if request.custom_id in writer.completed:
+                continue
+            if len(unwritten) >= max_concurrent_requests:
+                await write_finished(wait=True)
+            unwritten.append(
+                asyncio.create_task(
+                    run_request(handlers.get(request.url), request)))
+            await write_finished(wait=False)
+        while unwritten:
+            await write_finished(wait=True)
+    finally:
+        for task in unwritten:
+            task.cancel()
+
+
 async def main(args):
     if args.served_model_name is not None:
         served_model_names = args.served_model_name
     else:
         served_model_names = [args.model]
 
+    if args.checkpoint_file is not None and is_url(args.output_file):
+        raise ValueError("--checkpoint-file requires a local output file.")
+
     engine_args = AsyncEngineArgs.from_cli_args(args)
     engine = AsyncLLMEngine.from_engine_args(
         engine_args, usage_context=UsageContext.OPENAI_BATCH_RUNNER)
@@ -114,27 +300,52 @@ async def main(args):
     # When using single vLLM without engine_use_ray
     model_config = await engine.get_model_config()
 
-    openai_serving_chat = OpenAIServingChat(
-        engine,
-        model_config,
-        served_model_names,
-        args.response_role,
-    )
+    handlers: Dict[str, BatchHandler] = {}
+    if model_config.embedding_mode:
+        handlers["/v1/embeddings"] = OpenAIServingEmbedding(
+            engine,
+            model_config,
+            served_model_names,
+        ).create_embedding
+    else:
+        handlers["/v1/chat/completions"] = OpenAIServingChat(
+            engine,
+            model_config,
+            served_model_names,
+            args.response_role,
+        ).create_chat_completion
+        handlers["/v1/completions"] = OpenAIServingCompletion(
+            engine,
+            model_config,
+            served_model_names,
+            lora_modules=None,
+        ).create_completion
 
-    # Submit all requests in the file to the engine "concurrently".
-    response_futures: List[Awaitable[BatchRequestOutput]] = []
-    for request_json in (await read_file(args.input_file)).strip().split("\n"):
-        request = BatchRequestInput.model_validate_json(request_json)
-        response_futures.append(run_request(openai_serving_chat, request))
+    max_concurrent_requests = (args.max_concurrent_requests
+                               or 2 * engine_args.max_num_seqs)
 
-    responses = await asyncio.gather(*response_futures)
+    # A URL output is written to a local file first and uploaded at the end.
+    output_path = args.output_file
+    if is_url(args.output_file):
+        fd, output_path = tempfile.mkstemp(prefix="vllm_batch_",
+                                           suffix=".jsonl")
+        os.close(fd)
 
-    output_buffer = StringIO()
-    for response in responses:
-        print(response.model_dump_json(), file=output_buffer)
+    writer = BatchOutputWriter(output_path, args.checkpoint_file)
+    try:
+        await run_batch(read_lines(args.input_file),
+                        handlers,
+                        writer,
+                        max_concurrent_requests,
+                        ordered=args.output_order == "ordered")
+    finally:
+        writer.close()
 
-    output_buffer.seek(0)
-    await write_file(args.output_file, output_buffer.read().strip())
+    if output_path != args.output_file:
+        try:
+            await upload_file(output_path, args.output_file)
+        finally:
+            os.remove(output_path)
 
 
 if __name__ == "__main__":
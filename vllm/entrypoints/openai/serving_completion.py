@@ -73,8 +73,9 @@ class OpenAIServingCompletion(OpenAIServing):
                          served_model_names=served_model_names,
                          lora_modules=lora_modules)
 
-    async def create_completion(self, request: CompletionRequest,
-                                raw_request: Request):
+    async def create_completion(self,
+                                request: CompletionRequest,
+                                raw_request: Optional[Request] = None):
         """Completion API similar to OpenAI's API.
 
         See https://platform.openai.com/docs/api-reference/completions/create
@@ -133,10 +134,10 @@ class OpenAIServingCompletion(OpenAIServing):
 
                 is_tracing_enabled = await self.engine.is_tracing_enabled()
                 trace_headers = None
-                if is_tracing_enabled:
+                if is_tracing_enabled and raw_request:
                     trace_headers = extract_trace_headers(raw_request.headers)
-                if not is_tracing_enabled and contains_trace_headers(
-                        raw_request.headers):
+                if (not is_tracing_enabled and raw_request
+                        and contains_trace_headers(raw_request.headers)):
                     log_tracing_disabled_warning()
 
                 generator = self.engine.generate(
@@ -179,7 +180,8 @@ class OpenAIServingCompletion(OpenAIServing):
         final_res_batch: List[Optional[RequestOutput]] = [None] * len(prompts)
         try:
             async for i, res in result_generator:
-                if await raw_request.is_disconnected():
+                if (raw_request is not None
+                        and await raw_request.is_disconnected()):
                     # Abort the request if the client disconnects.
                     await self.engine.abort(f"{request_id}-{i}")
                     return self.create_error_response("Client disconnected")
@@ -206,7 +208,7 @@ class OpenAIServingCompletion(OpenAIServing):
     async def completion_stream_generator(
         self,
         request: CompletionRequest,
-        raw_request: Request,
+        raw_request: Optional[Request],
         result_generator: AsyncIterator[Tuple[int, RequestOutput]],
         request_id: str,
         created_time: int,
@@ -222,7 +224,8 @@ class OpenAIServingCompletion(OpenAIServing):
             async for prompt_idx, res in result_generator:
 
                 # Abort the request if the client disconnects.
-                if await raw_request.is_disconnected():
+                if (raw_request is not None
+                        and await raw_request.is_disconnected()):
                     await self.engine.abort(f"{request_id}-{prompt_idx}")
                     raise StopAsyncIteration()
 
@@ -62,8 +62,9 @@ class OpenAIServingEmbedding(OpenAIServing):
                          lora_modules=None)
         self._check_embedding_mode(model_config.embedding_mode)
 
-    async def create_embedding(self, request: EmbeddingRequest,
-                               raw_request: Request):
+    async def create_embedding(self,
+                               request: EmbeddingRequest,
+                               raw_request: Optional[Request] = None):
         """Completion API similar to OpenAI's API.
 
         See https://platform.openai.com/docs/api-reference/embeddings/create
@@ -121,7 +122,8 @@ class OpenAIServingEmbedding(OpenAIServing):
         final_res_batch = [None] * len(prompts)
         try:
             async for i, res in result_generator:
-                if await raw_request.is_disconnected():
+                if (raw_request is not None
+                        and await raw_request.is_disconnected()):
                     # Abort the request if the client disconnects.
                     await self.engine.abort(f"{request_id}-{i}")
                     # TODO: Use a vllm-specific Validation Error
@@ -41,13 +41,22 @@ class DistributedGPUExecutor(GPUExecutor):
         # number of blocks across all workers to make sure all the memory
         # operators can be applied to all workers.
 
-        num_gpu_blocks = min(b[0] for b in num_blocks)
-        num_cpu_blocks = min(b[1] for b in num_blocks)
-
-        num_remote_blocks = [
-            num_block for num_block in num_blocks if num_block[1] < 0
-        ]
-        num_remote_gpu_blocks = min(b[0] for b in num_remote_blocks)
+        # The SP workers report their CPU swap space negated, -1 meaning
+        # none, and are sized separately from the master workers.
+        num_master_blocks = [b for b in num_blocks if b[1] >= 0]
+        num_remote_blocks = [b for b in num_blocks if b[1] < 0]
+        num_gpu_blocks = min(b[0] for b in num_master_blocks)
+        num_cpu_blocks = min(b[1] for b in num_master_blocks)
+
+        num_remote_gpu_blocks = min((b[0] for b in num_remote_blocks),
+                                    default=0)
+        # The CPU swap space of an SP worker is shared by the partitions of
+        # all the master workers.
+        pp_tp_size = (self.parallel_config.pipeline_parallel_size *
+                      self.parallel_config.tensor_parallel_size)
+        self.cache_config.num_remote_cpu_blocks = min(
+            (-b[1] if b[1] < -1 else 0
+             for b in num_remote_blocks), default=0) // pp_tp_size
         return num_gpu_blocks, num_cpu_blocks, num_remote_gpu_blocks
 
     def initialize_cache(self,
@@ -104,6 +104,14 @@ class SamplingParams:
         truncate_prompt_tokens: If set to an integer k, will use only the last k
             tokens from the prompt (i.e., left truncation). Defaults to None
             (i.e., no truncation).
+        priority: The priority of the request, lower values are scheduled
+            first by the `priority` scheduling policy. Defaults to 0.
+        deadline: The latency SLO of the request in seconds after its
+            arrival. The `deadline` scheduling policy schedules the request
+            with the earliest deadline first. Defaults to None (no deadline).
+        tenant_id: The tenant the request is accounted to when the scheduler
+            shares its budget between tenants, see `SchedulerConfig`.
+            Defaults to None (the "default" tenant).
     """
 
     def __init__(
@@ -134,6 +142,9 @@ class SamplingParams:
         spaces_between_special_tokens: bool = True,
         logits_processors: Optional[List[LogitsProcessor]] = None,
         truncate_prompt_tokens: Optional[Annotated[int, Field(ge=1)]] = None,
+        priority: int = 0,
+        deadline: Optional[float] = None,
+        tenant_id: Optional[str] = None,
     ) -> None:
         self.n = n
         self.best_of = best_of if best_of is not None else n
@@ -175,6 +186,9 @@ class SamplingParams:
         self.logits_processors = logits_processors
         self.include_stop_str_in_output = include_stop_str_in_output
         self.truncate_prompt_tokens = truncate_prompt_tokens
+        self.priority = priority
+        self.deadline = deadline
+        self.tenant_id = tenant_id
         # Number of characters to hold back for stop string evaluation
         # until sequence is finished.
         if self.stop and not include_stop_str_in_output:
@@ -242,6 +256,9 @@ class SamplingParams:
                 and self.truncate_prompt_tokens < 1):
             raise ValueError(f"truncate_prompt_tokens must be >= 1, "
                              f"got {self.truncate_prompt_tokens}")
+        if self.deadline is not None and self.deadline <= 0:
+            raise ValueError(
+                f"deadline must be positive, got {self.deadline}.")
         if any(not stop_str for stop_str in self.stop):
             raise ValueError("stop cannot contain an empty string.")
         if self.stop and not self.detokenize:
@@ -355,4 +372,7 @@ class SamplingParams:
             f"skip_special_tokens={self.skip_special_tokens}, "
             "spaces_between_special_tokens="
             f"{self.spaces_between_special_tokens}, "
-            f"truncate_prompt_tokens={self.truncate_prompt_tokens})")
+            f"truncate_prompt_tokens={self.truncate_prompt_tokens}, "
+            f"priority={self.priority}, "
+            f"deadline={self.deadline}, "
+            f"tenant_id={self.tenant_id})")
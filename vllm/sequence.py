@@ -1,11 +1,15 @@
 """Sequence and its related classes."""
 import copy
 import enum
+import hashlib
 import math
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from typing import Sequence as GenericSequence
+from typing import Tuple, Union
 
+import numpy as np
 import torch
 
 from vllm.lora.request import LoRARequest
@@ -17,6 +21,9 @@ if TYPE_CHECKING:
     from vllm.multimodal import MultiModalData
     from vllm.spec_decode.metrics import SpecDecodeWorkerMetrics
 
+# The tenant of the requests without a `SamplingParams.tenant_id`.
+DEFAULT_TENANT_ID = "default"
+
 
 @dataclass
 class Logprob:
@@ -39,6 +46,42 @@ PromptLogprobs = List[Optional[Dict[int, Logprob]]]
 SampleLogprobs = List[Dict[int, Logprob]]
 
 
+def get_lora_hash_id(lora_request: Optional[LoRARequest]) -> int:
+    """The id of the LoRA adapter in the block hashes, 0 without one.
+
+    Unlike `lora_int_id`, which is chosen per deployment, it is a digest of
+    the adapter name and path, so that the disk tier of prefix caching never
+    serves the KV of an adapter to another one registered under the same id
+    after a restart.
+    """
+    if lora_request is None:
+        return 0
+    digest = hashlib.sha256(
+        f"{lora_request.lora_name}\0{lora_request.lora_local_path}".encode(
+        )).digest()
+    return int.from_bytes(digest[:8], "little") | 1
+
+
+def hash_block_tokens(prev_block_hash: Optional[int],
+                      cur_block_token_ids: GenericSequence[int],
+                      lora_hash_id: int = 0) -> int:
+    """Computes the content hash of a block for prefix caching.
+
+    The hash chains the hash of the previous block, None for the first block,
+    with the token ids of the block, so it identifies the whole prefix up to
+    the block without rehashing it. Shared by the v1 block manager (through
+    `Sequence.hash_of_block`) and the v2 `PrefixCachingBlock`.
+
+    The hash only involves ints, so it is the same in every process of an
+    interpreter version and the disk tier of prefix caching, whose directory
+    is named after the version, can be keyed by it across restarts. The
+    first block chains -1, which no hash takes.
+    """
+    if prev_block_hash is None:
+        prev_block_hash = -1
+    return hash((prev_block_hash, tuple(cur_block_token_ids), lora_hash_id))
+
+
 class SequenceStatus(enum.IntEnum):
     """Status of a sequence."""
     WAITING = 0
@@ -97,9 +140,20 @@ class RequestMetrics:
     finished_time: Optional[float] = None
 
 
+def _grow_capacity(num_tokens: int) -> int:
+    """The capacity of a token id buffer that holds `num_tokens` tokens,
+    with room to append more before it has to grow again."""
+    return max(num_tokens + num_tokens // 2, 16)
+
+
 class SequenceData:
     """Data associated with a sequence.
 
+    The prompt and output token ids are also kept in one contiguous int64
+    buffer that grows geometrically, so the length and the last token are
+    O(1) and any range of token ids can be read as a zero-copy view
+    (`get_token_ids_view`) instead of concatenating the lists.
+
     Args:
         prompt_token_ids: The token IDs of the prompt.
         output_token_ids: The token IDs of the output. Set to an empty list if
@@ -127,21 +181,67 @@ class SequenceData:
         self._num_computed_tokens = 0
         self._stage: SequenceStage = SequenceStage.PREFILL
 
+    @property
+    def output_token_ids(self) -> List[int]:
+        return self._output_token_ids
+
+    @output_token_ids.setter
+    def output_token_ids(self, new_output_token_ids: List[int]) -> None:
+        self._output_token_ids = new_output_token_ids
+        num_tokens = len(self.prompt_token_ids) + len(new_output_token_ids)
+        self._token_ids = np.empty(_grow_capacity(num_tokens), dtype=np.int64)
+        self._token_ids[:len(self.prompt_token_ids)] = self.prompt_token_ids
+        self._token_ids[len(self.prompt_token_ids):num_tokens] = (
+            new_output_token_ids)
+        self._num_tokens = num_tokens
+        self._last_token_id = (
+            new_output_token_ids[-1] if new_output_token_ids else
+            self.prompt_token_ids[-1] if self.prompt_token_ids else None)
+
     def append_token_id(self, token_id: int, logprob: float) -> None:
-        self.output_token_ids.append(token_id)
+        self._output_token_ids.append(token_id)
+        if self._num_tokens == len(self._token_ids):
+            # Views handed out before keep pointing to the old buffer, whose
+            # tokens never change.
+            token_ids = np.empty(_grow_capacity(self._num_tokens + 1),
+                                 dtype=np.int64)
+            token_ids[:self._num_tokens] = self._token_ids
+            self._token_ids = token_ids
+        self._token_ids[self._num_tokens] = token_id
+        self._num_tokens += 1
+        self._last_token_id = token_id
         self.cumulative_logprob += logprob
 
+    def fork(self) -> "SequenceData":
+        """Returns a copy that shares the prompt token ids."""
+        new_data = copy.copy(self)
+        new_data._output_token_ids = self._output_token_ids.copy()
+        new_data._token_ids = self._token_ids.copy()
+        return new_data
+
     def get_len(self) -> int:
-        return len(self.output_token_ids) + len(self.prompt_token_ids)
+        return self._num_tokens
 
     def get_prompt_len(self) -> int:
         return len(self.prompt_token_ids)
 
     def get_output_len(self) -> int:
-        return len(self.output_token_ids)
+        return len(self._output_token_ids)
 
     def get_token_ids(self) -> List[int]:
-        return self.prompt_token_ids + self.output_token_ids
+        return self._token_ids[:self._num_tokens].tolist()
+
+    def get_token_ids_view(self,
+                           start: int = 0,
+                           end: Optional[int] = None) -> np.ndarray:
+        """A zero-copy int64 view of the token ids at positions [start, end).
+
+        The view stays valid after more tokens are appended, but must not be
+        written to.
+        """
+        if end is None or end > self._num_tokens:
+            end = self._num_tokens
+        return self._token_ids[start:end]
 
     def get_prefix_token_ids(
             self, num_tokens: int
@@ -154,6 +254,10 @@ class SequenceData:
         else:
             return (self._prompt_token_ids_tuple[:num_tokens], None)
 
+    def get_token_ids_in_range(self, start: int, end: int) -> List[int]:
+        """Get the token ids at positions [start, end)."""
+        return self.get_token_ids_view(start, end).tolist()
+
     def get_num_computed_tokens(self) -> int:
         """Return the number of prefill tokens that are already computed."""
         return self._num_computed_tokens
@@ -183,9 +287,8 @@ class SequenceData:
         return self.get_len() - self.get_num_computed_tokens()
 
     def get_last_token_id(self) -> int:
-        if not self.output_token_ids:
-            return self.prompt_token_ids[-1]
-        return self.output_token_ids[-1]
+        assert self._last_token_id is not None
+        return self._last_token_id
 
     def get_prompt_token_ids(self) -> List[int]:
         return self.prompt_token_ids
@@ -197,6 +300,12 @@ class SequenceData:
     def stage(self) -> SequenceStage:
         return self._stage
 
+    def __getstate__(self) -> Dict[str, Any]:
+        # Do not ship the unused capacity of the buffer to the workers.
+        state = self.__dict__.copy()
+        state["_token_ids"] = self._token_ids[:self._num_tokens].copy()
+        return state
+
     def __repr__(self) -> str:
         return (f"SequenceData("
                 f"prompt_token_ids={self.prompt_token_ids}, "
@@ -242,6 +351,11 @@ class Sequence:
         # Input + output tokens
         self.tokens: Optional[List[str]] = None
 
+        # Chained hashes of the full blocks hashed so far. A full block never
+        # changes, so every block is hashed once.
+        self._block_hashes: List[int] = []
+        self._lora_hash_id = get_lora_hash_id(lora_request)
+
     @property
     def n_blocks(self) -> int:
         return math.ceil(self.get_len() / self.block_size)
@@ -269,14 +383,28 @@ class Sequence:
             self.output_text)
 
     def hash_of_block(self, logical_idx: int) -> int:
+        """The content hash of the `logical_idx`-th block, chained with the
+        hashes of the blocks before it. The hashes of full blocks are cached,
+        so hashing a sequence block by block takes O(L)."""
         # TODO This can produce incorrect hash when block size > prompt size
-
-        # Compute the number of tokens in the sequence
-        # TODO: The current hashing function is O(L^2). We should optimize
-        # this in the future.
-        num_tokens = self.num_hashed_tokens_of_block(logical_idx)
-        hashed_tokens = self.data.get_prefix_token_ids(num_tokens)
-        return hash((hashed_tokens, self.lora_int_id))
+        num_full_blocks = self.get_len() // self.block_size
+        assert logical_idx <= num_full_blocks
+        while len(self._block_hashes) < min(logical_idx + 1, num_full_blocks):
+            self._block_hashes.append(
+                self._compute_block_hash(len(self._block_hashes)))
+        if logical_idx < len(self._block_hashes):
+            return self._block_hashes[logical_idx]
+        # The last block is not full yet, its hash can still change.
+        return self._compute_block_hash(logical_idx)
+
+    def _compute_block_hash(self, logical_idx: int) -> int:
+        prev_block_hash = (self._block_hashes[logical_idx -
+                                              1] if logical_idx > 0 else None)
+        start = logical_idx * self.block_size
+        token_ids = self.data.get_token_ids_in_range(
+            start, min(start + self.block_size, self.get_len()))
+        return hash_block_tokens(prev_block_hash, token_ids,
+                                 self._lora_hash_id)
 
     def num_hashed_tokens_of_block(self, logical_idx: int):
         return logical_idx * self.block_size + self.block_size
@@ -341,8 +469,16 @@ class Sequence:
         return SequenceStatus.is_finished(self.status)
 
     def fork(self, new_seq_id: int) -> "Sequence":
-        new_seq = copy.deepcopy(self)
+        # The inputs, the prompt and the logprobs of the tokens so far never
+        # change, they are shared with the child. Only the state that grows
+        # with the output is copied.
+        new_seq = copy.copy(self)
         new_seq.seq_id = new_seq_id
+        new_seq.data = self.data.fork()
+        new_seq.output_logprobs = self.output_logprobs.copy()
+        if self.tokens is not None:
+            new_seq.tokens = self.tokens.copy()
+        new_seq._block_hashes = self._block_hashes.copy()
         return new_seq
 
     def get_num_new_tokens(self) -> int:
@@ -441,6 +577,41 @@ class SequenceGroup:
     def lora_int_id(self) -> int:
         return self.lora_request.lora_int_id if self.lora_request else 0
 
+    @property
+    def priority(self) -> int:
+        """The priority of the request, lower values go first."""
+        return self.sampling_params.priority if self.sampling_params else 0
+
+    @property
+    def deadline(self) -> float:
+        """The time by which the request should finish, inf if it has no
+        deadline."""
+        if self.sampling_params is None or (self.sampling_params.deadline is
+                                            None):
+            return math.inf
+        return self.metrics.arrival_time + self.sampling_params.deadline
+
+    @property
+    def tenant_id(self) -> str:
+        """The tenant the request is accounted to."""
+        if self.sampling_params is None or (self.sampling_params.tenant_id is
+                                            None):
+            return DEFAULT_TENANT_ID
+        return self.sampling_params.tenant_id
+
+    def get_num_remaining_tokens(self) -> int:
+        """The predicted number of tokens left to compute for the request:
+        its uncomputed prompt tokens and the rest of its `max_tokens`, for
+        every running sequence."""
+        num_tokens = 0
+        max_tokens = (self.sampling_params.max_tokens
+                      if self.sampling_params else None)
+        for seq in self.get_unfinished_seqs():
+            num_tokens += seq.data.get_num_uncomputed_tokens()
+            if max_tokens is not None:
+                num_tokens += max(max_tokens - seq.get_output_len(), 0)
+        return num_tokens
+
     def get_last_latency(self, now: float) -> Optional[float]:
         """Sets the last token time for Request level timings."""
         # If still in prefill phase, raise Error.
@@ -657,6 +828,26 @@ class SequenceGroupMetadata:
         assert self._token_chunk_size is not None
         return self._token_chunk_size
 
+    def update_step(
+        self,
+        is_prompt: bool,
+        do_sample: bool,
+        token_chunk_size: int,
+        computed_block_nums: Optional[List[int]],
+        multi_modal_data: Optional["MultiModalData"],
+    ) -> None:
+        """Updates the fields of the metadata that change from step to step.
+
+        The scheduler keeps the metadata of a request across its steps, the
+        sequence data and block tables are updated in place.
+        """
+        self.is_prompt = is_prompt
+        self.do_sample = do_sample
+        self._token_chunk_size = token_chunk_size
+        self.computed_block_nums = computed_block_nums
+        self.multi_modal_data = multi_modal_data
+        self.num_speculative_tokens = None
+
 
 class SequenceOutput:
     """The model output associated with a sequence.
@@ -873,10 +1064,30 @@ class ExecuteModelRequest:
     blocks_to_swap_out: List[Tuple[int, int]] = field(default_factory=list)
     # Blocks to copy. Source to dest block.
     blocks_to_copy: List[Tuple[int, int]] = field(default_factory=list)
+    # Blocks to write to the disk tier of prefix caching. List of
+    # CPU block number -> disk slot.
+    blocks_to_spill: List[Tuple[int, int]] = field(default_factory=list)
+    # Blocks to read from the disk tier of prefix caching. List of
+    # disk slot -> CPU block number.
+    blocks_to_load: List[Tuple[int, int]] = field(default_factory=list)
     # Blocks to migrate. list of GPU -> [GPU, rank].
     blocks_to_migrate: List[Tuple[int, int, int]] = field(default_factory=list)
-    # Dest superblock idx and rank. Note: we only set 1 superblock in master
-    superblock_to_migrate: Optional[Tuple[int, int]] = None
+    # Dest superblock idx and rank of the migrated superblocks, grouped by
+    # rank.
+    superblocks_to_migrate: List[Tuple[int, int]] = field(default_factory=list)
+    # Src superblock idx and rank of the recalled superblocks, grouped by
+    # rank.
+    superblocks_to_recall: List[Tuple[int, int]] = field(default_factory=list)
+    # Local blocks the recalled superblocks are received into.
+    blocks_to_recall: List[int] = field(default_factory=list)
+    # Remote blocks to swap in on the SP ranks. List of
+    # [rank, CPU -> GPU block number].
+    remote_blocks_to_swap_in: List[Tuple[int, int,
+                                         int]] = field(default_factory=list)
+    # Remote blocks to swap out on the SP ranks. List of
+    # [rank, GPU -> CPU block number].
+    remote_blocks_to_swap_out: List[Tuple[int, int,
+                                          int]] = field(default_factory=list)
     # The number of slots for lookahead decoding.
     num_lookahead_slots: int = 0
     # The number of requests in the running queue.
@@ -895,7 +1106,14 @@ class ExecuteModelRequest:
             blocks_to_swap_in=self.blocks_to_swap_in.copy(),
             blocks_to_swap_out=self.blocks_to_swap_out.copy(),
             blocks_to_copy=self.blocks_to_copy.copy(),
+            blocks_to_spill=self.blocks_to_spill.copy(),
+            blocks_to_load=self.blocks_to_load.copy(),
             blocks_to_migrate=self.blocks_to_migrate.copy(),
+            superblocks_to_migrate=self.superblocks_to_migrate.copy(),
+            superblocks_to_recall=self.superblocks_to_recall.copy(),
+            blocks_to_recall=self.blocks_to_recall.copy(),
+            remote_blocks_to_swap_in=self.remote_blocks_to_swap_in.copy(),
+            remote_blocks_to_swap_out=self.remote_blocks_to_swap_out.copy(),
             num_lookahead_slots=self.num_lookahead_slots,
             running_queue_size=self.running_queue_size,
             previous_hidden_states=self.previous_hidden_states,
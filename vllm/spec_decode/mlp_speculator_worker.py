@@ -71,7 +71,8 @@ class MLPSpeculatorWorker(NonLLMProposerWorkerBase, MultiStepWorker):
                     seq_len = min(
                         seq_data_len,
                         context_len + seq_group_metadata.token_chunk_size)
-                    tokens = seq_data.get_token_ids()[context_len:seq_len]
+                    tokens = seq_data.get_token_ids_in_range(
+                        context_len, seq_len)
                     seq_lens.append(seq_len)
                     input_tokens.extend(tokens)
                     query_lens.append(seq_len - context_len)
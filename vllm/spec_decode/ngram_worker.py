@@ -64,9 +64,8 @@ class NGramWorker(NonLLMProposerWorkerBase, LoraNotSupportedWorkerBase):
                 execute_model_req.seq_group_metadata_list):
             seq_data = next(iter(seq_group_metadata.seq_data.values()))
 
-            input_ids = torch.as_tensor(seq_data.get_token_ids(),
-                                        dtype=torch.long,
-                                        device=self.device)
+            input_ids = torch.from_numpy(seq_data.get_token_ids_view()).to(
+                self.device)
             input_length = seq_data.get_len()
 
             for ngram_size in range(
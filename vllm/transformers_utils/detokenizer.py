@@ -97,25 +97,30 @@ class Detokenizer:
         Returns:
             The number of characters added to the output text.
         """
-        all_input_ids = seq.get_token_ids()
-        token_id_generated_this_iteration = all_input_ids[-1]
+        token_id_generated_this_iteration = seq.get_last_token_id()
         tokenizer = self.get_tokenizer_for_seq(seq)
 
         # Convert prompt token IDs to tokens if necessary.
         # Do it here so that we don't have to repeat this
-        # computation for each logprob.
+        # computation for each logprob. Only the last tokens of the prompt
+        # are converted, so do not copy the whole sequence.
         if seq.tokens is None:
+            seq_len = seq.get_len()
             (seq.tokens, seq.prefix_offset,
              seq.read_offset) = convert_prompt_ids_to_tokens(
                  tokenizer=tokenizer,
-                 prompt_ids=all_input_ids[:-1],
+                 prompt_ids=seq.data.get_token_ids_in_range(
+                     max(
+                         seq_len - INITIAL_INCREMENTAL_DETOKENIZATION_OFFSET -
+                         3, 0), seq_len - 1),
                  skip_special_tokens=prms.skip_special_tokens,
              )
 
+        # With prev_tokens given, only the new token id is read.
         (new_tokens, new_decoded_token_text, prefix_offset,
          read_offset) = detokenize_incrementally(
              tokenizer=tokenizer,
-             all_input_ids=all_input_ids,
+             all_input_ids=[token_id_generated_this_iteration],
              prev_tokens=seq.tokens,
              prefix_offset=seq.prefix_offset,
              read_offset=seq.read_offset,
@@ -126,7 +131,6 @@ class Detokenizer:
         # Decode logprobs
         logprobs = seq.output_logprobs[-1]
         if logprobs:
-            previous_tokens = all_input_ids[:-1]
             for token_id, sample_logprob in logprobs.items():
                 # If the token was generated this iteration,
                 # use the provided text.
@@ -136,10 +140,9 @@ class Detokenizer:
 
                 if (sample_logprob.decoded_token is None
                         and token_id != INVALID_TOKEN_ID):
-                    all_input_ids_with_logprob = previous_tokens + [token_id]
                     (_, new_text, _, _) = detokenize_incrementally(
                         tokenizer=tokenizer,
-                        all_input_ids=all_input_ids_with_logprob,
+                        all_input_ids=[token_id],
                         prev_tokens=seq.tokens,
                         prefix_offset=seq.prefix_offset,
                         read_offset=seq.read_offset,
@@ -0,0 +1,106 @@
+"""The KV data of the disk tier of prefix caching.
+
+Every worker keeps its shard of the KV of the blocks cached on disk in a
+memory mapped file next to the index of the scheduler (see
+`vllm.core.disk_block_index`). The blocks go through the CPU swap space: they
+are spilled from and loaded to the CPU cache, and swapped between the CPU and
+the GPU caches as usual.
+"""
+import hashlib
+import json
+import os
+import sys
+from typing import List
+
+import torch
+
+import vllm.envs as envs
+from vllm.config import CacheConfig, ModelConfig, ParallelConfig
+from vllm.worker.cache_engine import CacheEngine
+
+
+def get_disk_prefix_cache_path(cache_config: CacheConfig,
+                               model_config: ModelConfig,
+                               parallel_config: ParallelConfig) -> str:
+    """The directory of the disk tier for the model. It is named by a
+    fingerprint of everything the KV of a block depends on, so that the KV
+    of one model or layout is never loaded for another."""
+    assert cache_config.disk_prefix_cache_dir is not None
+    python_version = (f"{sys.implementation.name}-{sys.version_info[0]}."
+                      f"{sys.version_info[1]}-{sys.hash_info.width}")
+    fingerprint = {
+        "model": model_config.model,
+        "revision": model_config.revision,
+        "tokenizer": model_config.tokenizer,
+        "tokenizer_revision": model_config.tokenizer_revision,
+        "quantization": model_config.quantization,
+        "dtype": str(model_config.dtype),
+        "cache_dtype": cache_config.cache_dtype,
+        "block_size": cache_config.block_size,
+        "num_layers": model_config.get_num_layers(parallel_config),
+        "num_kv_heads": model_config.get_num_kv_heads(parallel_config),
+        "head_size": model_config.get_head_size(),
+        "tensor_parallel_size": parallel_config.tensor_parallel_size,
+        "attention_backend": envs.VLLM_ATTENTION_BACKEND,
+        # The blocks are keyed by their Python hashes, see hash_block_tokens.
+        "python": python_version,
+    }
+    digest = hashlib.sha256(json.dumps(fingerprint,
+                                       sort_keys=True).encode()).hexdigest()
+    return os.path.join(cache_config.disk_prefix_cache_dir, digest[:16])
+
+
+def get_num_disk_blocks(cache_config: CacheConfig, model_config: ModelConfig,
+                        parallel_config: ParallelConfig) -> int:
+    """The number of blocks of the disk tier. The disk space is shared by
+    the KV files of the tensor parallel workers."""
+    block_bytes = CacheEngine.get_cache_block_size(cache_config, model_config,
+                                                   parallel_config)
+    return int(cache_config.disk_prefix_cache_space_bytes //
+               (block_bytes * parallel_config.tensor_parallel_size))
+
+
+class DiskKVCache:
+    """The KV of the blocks of the disk tier on a worker, in a memory mapped
+    file of `num_blocks` slots.
+
+    Args:
+        path: The directory of the disk tier of the model.
+        num_blocks: The number of slots of the disk tier.
+        rank: The rank of the worker, the file holds its shard of the KV.
+        cpu_cache: The CPU cache of the worker, one tensor per layer whose
+            second dimension is the block number.
+    """
+
+    def __init__(self, path: str, num_blocks: int, rank: int,
+                 cpu_cache: List[torch.Tensor]) -> None:
+        self.cpu_cache = cpu_cache
+        block_shape = cpu_cache[0][:, 0].shape
+        shape = (num_blocks, len(cpu_cache), *block_shape)
+        numel = num_blocks * len(cpu_cache) * cpu_cache[0][:, 0].numel()
+        dtype = cpu_cache[0].dtype
+        nbytes = numel * dtype.itemsize
+
+        os.makedirs(path, exist_ok=True)
+        self.file_path = os.path.join(path, f"kv_rank{rank}.bin")
+        if (not os.path.exists(self.file_path)
+                or os.path.getsize(self.file_path) != nbytes):
+            # The slots of a file of another size are not indexed anymore.
+            with open(self.file_path, "wb") as f:
+                f.truncate(nbytes)
+        self.disk_cache = torch.from_file(self.file_path,
+                                          shared=True,
+                                          size=numel,
+                                          dtype=dtype).view(shape)
+
+    def spill(self, src_to_dst: torch.Tensor) -> None:
+        """Writes CPU blocks to their slots."""
+        src, dst = src_to_dst[:, 0], src_to_dst[:, 1]
+        for layer, cpu_cache in enumerate(self.cpu_cache):
+            self.disk_cache[dst, layer] = cpu_cache[:, src].transpose(0, 1)
+
+    def load(self, src_to_dst: torch.Tensor) -> None:
+        """Reads slots to their CPU blocks."""
+        src, dst = src_to_dst[:, 0], src_to_dst[:, 1]
+        for layer, cpu_cache in enumerate(self.cpu_cache):
+            cpu_cache[:, dst] = self.disk_cache[src, layer].transpose(0, 1)
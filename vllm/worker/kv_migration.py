@@ -0,0 +1,407 @@
+"""Helpers to overlap the KV superblock migration with the model forward."""
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional, Protocol
+
+import torch
+
+from vllm.config import CacheConfig, ParallelConfig
+from vllm.distributed import recv_sp_tensor, send_sp_tensor
+
+if TYPE_CHECKING:
+    from vllm.worker.worker_base import WorkerInput
+
+# (layer, start block, number of blocks) -> view of the KV cache blocks.
+GetBlocksFn = Callable[[int, int, int], torch.Tensor]
+
+
+class KVCacheOps(Protocol):
+    """The KV cache operations used by `KVMigrator`, see `CacheEngine`."""
+
+    def get_blocks(self, layer: int, start: int, step: int) -> torch.Tensor:
+        ...
+
+    def swap_in(self, src_to_dst: torch.Tensor) -> None:
+        ...
+
+    def swap_out(self, src_to_dst: torch.Tensor) -> None:
+        ...
+
+
+class MigrationStream:
+    """Runs KV migration transfers on a side stream.
+
+    The transfers are ordered after the work already queued on the current
+    stream (e.g. the copies into the staging area), and an event is recorded
+    once they are issued. `wait` makes the current stream wait for that
+    event, which the worker does at the start of the next step: before the
+    staging area is overwritten and before the forward can read the migrated
+    blocks. The transfers of a step thus overlap with the forward of the same
+    step without any host synchronization.
+
+    On CPU there are no streams, the transfers run inline and `wait` is a
+    no-op.
+    """
+
+    def __init__(self, device: torch.device) -> None:
+        self.is_cuda = device.type == "cuda"
+        self.stream = torch.cuda.Stream(device) if self.is_cuda else None
+        self.pending_event: Optional[torch.cuda.Event] = None
+        # Buffers used by the pending transfers, kept alive until they finish.
+        self.buffers: List[torch.Tensor] = []
+
+    @contextmanager
+    def launch(self) -> Iterator[None]:
+        if not self.is_cuda:
+            yield
+            return
+        assert self.stream is not None
+        self.stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(self.stream):
+            yield
+        event = torch.cuda.Event()
+        event.record(self.stream)
+        self.pending_event = event
+
+    def hold(self, buffer: torch.Tensor) -> torch.Tensor:
+        self.buffers.append(buffer)
+        return buffer
+
+    def wait(self) -> None:
+        if self.pending_event is not None:
+            torch.cuda.current_stream().wait_event(self.pending_event)
+            self.pending_event = None
+        self.buffers.clear()
+
+    def is_done(self) -> bool:
+        return self.pending_event is None or self.pending_event.query()
+
+
+def gather_blocks(get_blocks: GetBlocksFn, num_layers: int, start: int,
+                  num_blocks: int) -> torch.Tensor:
+    """Packs `num_blocks` blocks starting at `start` of every layer into a
+    single contiguous tensor, so they can be sent in one transfer."""
+    return torch.stack(
+        [get_blocks(layer, start, num_blocks) for layer in range(num_layers)])
+
+
+def gather_chunks(get_blocks: GetBlocksFn, num_layers: int,
+                  chunk_starts: List[int], chunk_size: int) -> torch.Tensor:
+    """Packs the chunks of `chunk_size` blocks starting at `chunk_starts` of
+    every layer into a single contiguous tensor, laid out like
+    `gather_blocks`."""
+    return torch.cat([
+        gather_blocks(get_blocks, num_layers, start, chunk_size)
+        for start in chunk_starts
+    ],
+                     dim=2)
+
+
+def scatter_chunks(get_blocks: GetBlocksFn, packed: torch.Tensor,
+                   chunk_starts: List[int], chunk_size: int) -> None:
+    """Unpacks a tensor built by `gather_blocks` into the chunks of
+    `chunk_size` blocks starting at `chunk_starts`."""
+    for i, start in enumerate(chunk_starts):
+        chunk = packed[:, :, i * chunk_size:(i + 1) * chunk_size]
+        for layer, layer_chunk in enumerate(chunk):
+            get_blocks(layer, start, chunk_size).copy_(layer_chunk)
+
+
+def scatter_blocks(get_blocks: GetBlocksFn, packed: torch.Tensor,
+                   block_numbers: List[int]) -> None:
+    """Unpacks a tensor built by `gather_blocks` into the blocks
+    `block_numbers`. Runs of consecutive blocks are copied at once."""
+    start = 0
+    while start < len(block_numbers):
+        end = start + 1
+        while (end < len(block_numbers)
+               and block_numbers[end] == block_numbers[end - 1] + 1):
+            end += 1
+        run = packed[:, :, start:end]
+        for layer, layer_run in enumerate(run):
+            get_blocks(layer, block_numbers[start],
+                       end - start).copy_(layer_run)
+        start = end
+
+
+class KVMigrator:
+    """Moves the KV superblocks between a master worker and the SP workers.
+
+    Master workers send the superblocks staged at the tail of their KV cache
+    to the SP workers and receive the recalled ones. SP workers keep one
+    partition of their KV cache for every master worker, receive the
+    migrated superblocks into it, send back the recalled ones and swap the
+    remote blocks of the preempted sequences with their own CPU swap space.
+
+    The transfers of a step overlap with its forward, and `wait` must be
+    called at the start of the next step. SP workers only rx and master
+    workers only tx migrated superblocks, recalls run the other way.
+    """
+
+    def __init__(
+        self,
+        cache_engine: KVCacheOps,
+        cache_config: CacheConfig,
+        parallel_config: ParallelConfig,
+        num_layers: int,
+        rank: int,
+        is_sp_worker: bool,
+        device: torch.device,
+    ) -> None:
+        self.cache_engine = cache_engine
+        self.cache_config = cache_config
+        self.parallel_config = parallel_config
+        self.num_layers = num_layers
+        self.rank = rank
+        self.is_sp_worker = is_sp_worker
+
+        self.send_stream: Optional[MigrationStream] = None
+        self.recv_streams: List[MigrationStream] = []
+        if self.is_sp_worker:
+            tp_pp_world = self.parallel_config.pipeline_parallel_size \
+                * self.parallel_config.tensor_parallel_size
+            self.recv_streams = [
+                MigrationStream(device) for _ in range(tp_pp_world)
+            ]
+        else:
+            self.send_stream = MigrationStream(device)
+        self.recall_stream = MigrationStream(device)
+
+    def execute(self, worker_input: "WorkerInput") -> None:
+        """Issues the remote swaps, migrations and recalls of a step, after
+        the local cache operations."""
+        if self.is_sp_worker:
+            self.swap_remote_blocks(worker_input.remote_blocks_to_swap_in,
+                                    worker_input.remote_blocks_to_swap_out)
+        # Note sequence parallel requires master workers (in sp and tp)
+        # to first copy blocks their chunk memories, and then migrate
+        # the chunk to the tgt sp worker. The migration runs in the
+        # background of the forward, and the scheduler only points the
+        # block tables to the migrated blocks from the next step on.
+        if (worker_input.superblocks_to_migrate is not None
+                and worker_input.superblocks_to_migrate.numel() > 0):
+            self.migrate_chunks(worker_input.superblocks_to_migrate.tolist())
+        # Recalls also run in the background of the forward. The SP workers
+        # only get `superblocks_to_recall`, they do not need the local blocks.
+        if (worker_input.superblocks_to_recall is not None
+                and worker_input.superblocks_to_recall.numel() > 0):
+            blocks_to_recall = (worker_input.blocks_to_recall.tolist()
+                                if worker_input.blocks_to_recall is not None
+                                else [])
+            self.recall_chunks(worker_input.superblocks_to_recall.tolist(),
+                               blocks_to_recall)
+
+    @torch.inference_mode()
+    def send_chunk(self,
+                   sp_group: int = 0,
+                   dst: int = 0,
+                   start: int = 0,
+                   num_chunks: int = 1) -> None:
+        """Sends `num_chunks` superblocks of the staging area, starting at
+        the `start`-th staged superblock, to `dst` in one transfer."""
+        # dst is the local sp rank
+        chunk_size = self.cache_config.block_migrate_size // \
+            self.cache_config.block_size
+        staging_idx = self.cache_config.num_gpu_blocks - \
+            self.cache_config.block_migrate_budget * chunk_size
+        block_idx = staging_idx + start * chunk_size
+
+        # Use a send stream to do KV migration. It starts after the copies
+        # into the staging area queued on the current stream.
+        assert self.send_stream is not None
+        with self.send_stream.launch():
+            # All layers of all the superblocks sent to the same SP worker
+            # are packed into a single contiguous tensor.
+            chunks = self.send_stream.hold(
+                gather_blocks(self.cache_engine.get_blocks, self.num_layers,
+                              block_idx, num_chunks * chunk_size))
+            send_sp_tensor(chunks, sp_group, dst)
+
+    @torch.inference_mode()
+    def recv_chunk(self, sp_group: int, chunk_indices: List[int]) -> None:
+        """Receives the superblocks sent by `send_chunk` in one transfer and
+        scatters them to the `chunk_indices` chunks of the `sp_group`
+        partition."""
+        chunk_size = self.cache_config.block_migrate_size // \
+            self.cache_config.block_size
+        pp_size = self.parallel_config.pipeline_parallel_size
+        tp_size = self.parallel_config.tensor_parallel_size
+        paralled_blocks = int(self.cache_config.num_gpu_blocks /
+                              (pp_size * tp_size))
+        partition_idx = sp_group * paralled_blocks
+
+        # Use a recv stream to do KV migration
+        recv_stream = self.recv_streams[sp_group]
+        with recv_stream.launch():
+            chunks = recv_stream.hold(
+                torch.empty_like(
+                    gather_blocks(self.cache_engine.get_blocks,
+                                  self.num_layers, partition_idx,
+                                  len(chunk_indices) * chunk_size)))
+            recv_sp_tensor(chunks, sp_group, src=0)
+            scatter_chunks(self.cache_engine.get_blocks, chunks, [
+                partition_idx + chunk_size * chunk_idx
+                for chunk_idx in chunk_indices
+            ], chunk_size)
+
+    @torch.inference_mode()
+    def send_recalled_chunk(self, sp_group: int,
+                            chunk_indices: List[int]) -> None:
+        """Sends the `chunk_indices` chunks of the `sp_group` partition back
+        to the master worker of `sp_group` in one transfer."""
+        chunk_size = self.cache_config.block_migrate_size // \
+            self.cache_config.block_size
+        pp_size = self.parallel_config.pipeline_parallel_size
+        tp_size = self.parallel_config.tensor_parallel_size
+        paralled_blocks = int(self.cache_config.num_gpu_blocks /
+                              (pp_size * tp_size))
+        partition_idx = sp_group * paralled_blocks
+
+        assert self.recall_stream is not None
+        with self.recall_stream.launch():
+            chunks = self.recall_stream.hold(
+                gather_chunks(self.cache_engine.get_blocks, self.num_layers, [
+                    partition_idx + chunk_size * chunk_idx
+                    for chunk_idx in chunk_indices
+                ], chunk_size))
+            send_sp_tensor(chunks, sp_group, dst=0)
+
+    @torch.inference_mode()
+    def recv_recalled_chunk(self, sp_group: int, src: int,
+                            block_numbers: List[int]) -> None:
+        """Receives the superblocks sent by `send_recalled_chunk` in one
+        transfer and scatters them to the local `block_numbers`."""
+
+        assert self.recall_stream is not None
+        with self.recall_stream.launch():
+            chunks = self.recall_stream.hold(
+                torch.empty_like(
+                    gather_blocks(self.cache_engine.get_blocks,
+                                  self.num_layers, 0, len(block_numbers))))
+            recv_sp_tensor(chunks, sp_group, src=src)
+            scatter_blocks(self.cache_engine.get_blocks, chunks, block_numbers)
+
+    def wait(self) -> None:
+        """Makes the current stream wait for the KV migration and recall
+        issued in the previous step."""
+        if self.is_sp_worker:
+            for recv_stream in self.recv_streams:
+                recv_stream.wait()
+        elif self.send_stream is not None:
+            self.send_stream.wait()
+        if self.recall_stream is not None:
+            self.recall_stream.wait()
+
+    @torch.inference_mode()
+    def migrate_chunks(self, superblocks_to_migrate: List[List[int]]) -> None:
+        """
+        Migrate the staged KV chunks. `superblocks_to_migrate` lists the
+        (dst_chunk, dst_rank) of every staged superblock, grouped by rank.
+        Note that dst_rank is a local rank in the SP group.
+        """
+        # Temporary method to get the rank in sp group.
+        pp_size = self.parallel_config.pipeline_parallel_size
+        tp_size = self.parallel_config.tensor_parallel_size
+
+        # Issue one transfer for each run of superblocks sent to the same
+        # SP rank.
+        start = 0
+        while start < len(superblocks_to_migrate):
+            dst_rank = superblocks_to_migrate[start][1]
+            end = start
+            while (end < len(superblocks_to_migrate)
+                   and superblocks_to_migrate[end][1] == dst_rank):
+                end += 1
+            dst_global_rank = dst_rank + pp_size * tp_size - 1
+
+            # Only the master workers or the target sp workers
+            # involves in the KV cache migration.
+            for src_global_rank in range(pp_size * tp_size):
+                if self.rank == src_global_rank:
+                    self.send_chunk(sp_group=src_global_rank,
+                                    dst=dst_rank,
+                                    start=start,
+                                    num_chunks=end - start)
+                elif self.rank == dst_global_rank:
+                    self.recv_chunk(
+                        sp_group=src_global_rank,
+                        chunk_indices=[
+                            chunk
+                            for chunk, _ in superblocks_to_migrate[start:end]
+                        ])
+            start = end
+
+    @torch.inference_mode()
+    def recall_chunks(self, superblocks_to_recall: List[List[int]],
+                      blocks_to_recall: List[int]) -> None:
+        """
+        Recall KV chunks from the SP workers, the reverse of
+        `migrate_chunks`. `superblocks_to_recall` lists the (src_chunk,
+        src_rank) of every recalled superblock, grouped by rank, and
+        `blocks_to_recall` the local blocks they land in, `chunk_size` per
+        superblock. Note that src_rank is a local rank in the SP group.
+        """
+        chunk_size = self.cache_config.block_migrate_size // \
+            self.cache_config.block_size
+        pp_size = self.parallel_config.pipeline_parallel_size
+        tp_size = self.parallel_config.tensor_parallel_size
+
+        # Issue one transfer for each run of superblocks recalled from the
+        # same SP rank.
+        start = 0
+        while start < len(superblocks_to_recall):
+            src_rank = superblocks_to_recall[start][1]
+            end = start
+            while (end < len(superblocks_to_recall)
+                   and superblocks_to_recall[end][1] == src_rank):
+                end += 1
+            src_global_rank = src_rank + pp_size * tp_size - 1
+
+            for dst_global_rank in range(pp_size * tp_size):
+                if self.rank == dst_global_rank:
+                    self.recv_recalled_chunk(
+                        sp_group=dst_global_rank,
+                        src=src_rank,
+                        block_numbers=blocks_to_recall[start * chunk_size:end *
+                                                       chunk_size])
+                elif self.rank == src_global_rank:
+                    self.send_recalled_chunk(
+                        sp_group=dst_global_rank,
+                        chunk_indices=[
+                            chunk
+                            for chunk, _ in superblocks_to_recall[start:end]
+                        ])
+            start = end
+
+    def swap_remote_blocks(
+            self, remote_blocks_to_swap_in: Optional[torch.Tensor],
+            remote_blocks_to_swap_out: Optional[torch.Tensor]) -> None:
+        """Swaps the remote blocks of the preempted sequences between the
+        GPU and the CPU swap space of this SP worker."""
+        pp_size = self.parallel_config.pipeline_parallel_size
+        tp_size = self.parallel_config.tensor_parallel_size
+        num_partitions = pp_size * tp_size
+        gpu_partition = int(self.cache_config.num_gpu_blocks / num_partitions)
+        cpu_partition = self.cache_config.num_cpu_blocks // num_partitions
+        sp_rank = self.rank - (num_partitions - 1)
+        for blocks, swap_in in ((remote_blocks_to_swap_in, True),
+                                (remote_blocks_to_swap_out, False)):
+            if blocks is None or blocks.numel() == 0:
+                continue
+            blocks = blocks[blocks[:, 0] == sp_rank, 1:]
+            if blocks.numel() == 0:
+                continue
+            # Every master worker owns one partition of the GPU and CPU
+            # caches of the SP worker.
+            src_partition, dst_partition = ((cpu_partition,
+                                             gpu_partition) if swap_in else
+                                            (gpu_partition, cpu_partition))
+            offsets = torch.arange(num_partitions, dtype=torch.int64)
+            src = (blocks[:, 0].unsqueeze(0) +
+                   (offsets * src_partition).unsqueeze(1)).flatten()
+            dst = (blocks[:, 1].unsqueeze(0) +
+                   (offsets * dst_partition).unsqueeze(1)).flatten()
+            mapping = torch.stack([src, dst], dim=1)
+            if swap_in:
+                self.cache_engine.swap_in(mapping)
+            else:
+                self.cache_engine.swap_out(mapping)
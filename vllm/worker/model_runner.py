@@ -1,5 +1,6 @@
 import dataclasses
 import gc
+import itertools
 import time
 import warnings
 from collections import defaultdict
@@ -370,7 +371,7 @@ class GPUModelRunnerBase(ModelRunnerBase[TModelInputForGPU]):
         # self.cache_config.block_migrate_size/self.cache_config.block_size
         # to be modified
         max_sequence_length = self.model_config.max_model_len
-        max_block_size = max_sequence_length / self.cache_config.block_size
+        max_block_size = max_sequence_length // self.cache_config.block_size
         seq_lens_remote: List[List[int]] = []
         block_tables_remote: List[List[List[int]]] = []
         q_remote_distribution: List[List[int]] = []
@@ -426,11 +427,10 @@ class GPUModelRunnerBase(ModelRunnerBase[TModelInputForGPU]):
                         "now.")
 
                 seq_data = seq_group_metadata.seq_data[seq_id]
-                remote_len = 0
                 blk_ranks = seq_group_metadata.block_tables_remote_rank[seq_id]
-                for rank in blk_ranks:
-                    if rank > 0:
-                        remote_len += self.block_size
+                # Rank 0 holds the local blocks.
+                num_remote_blocks = len(blk_ranks) - blk_ranks.count(0)
+                remote_len = num_remote_blocks * self.block_size
 
                 if is_prompt:
                     context_len = seq_data.get_num_computed_tokens()
@@ -444,7 +444,8 @@ class GPUModelRunnerBase(ModelRunnerBase[TModelInputForGPU]):
                     seq_data.get_len(),
                     context_len + seq_group_metadata.token_chunk_size)
                 if is_prompt:
-                    tokens = seq_data.get_token_ids()[context_len:seq_len]
+                    tokens = seq_data.get_token_ids_in_range(
+                        context_len, seq_len)
                 else:
                     # Optimization. get_token_ids requires the entire copy of
                     # tokens.
@@ -509,10 +510,13 @@ class GPUModelRunnerBase(ModelRunnerBase[TModelInputForGPU]):
                         # chunked prefill or decode
                         block_to_filte = seq_group_metadata.block_tables[
                             seq_id]
-                        block_table = []
-                        for blk_number, rank in zip(block_to_filte, blk_ranks):
-                            if rank == 0:
-                                block_table.append(blk_number)
+                        if num_remote_blocks == 0:
+                            block_table = block_to_filte
+                        else:
+                            block_table = list(
+                                itertools.compress(block_to_filte,
+                                                   (rank == 0
+                                                    for rank in blk_ranks)))
                         if curr_sliding_window_blocks is not None:
                             block_table = block_table[
                                 -curr_sliding_window_blocks:]
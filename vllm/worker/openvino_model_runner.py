@@ -147,7 +147,8 @@ class OpenVINOModelRunner:
                     computed_len + seq_group_metadata.token_chunk_size,
                 )
                 if is_prompt:
-                    tokens = seq_data.get_token_ids()[computed_len:seq_len]
+                    tokens = seq_data.get_token_ids_in_range(
+                        computed_len, seq_len)
                 else:
                     # Optimization. get_token_ids requires the entire copy of
                     # tokens.
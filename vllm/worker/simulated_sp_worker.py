@@ -0,0 +1,209 @@
+"""A model-less worker that simulates sequence parallelism on CPU.
+
+The KV superblock migration between the master workers and the SP workers
+normally needs one GPU per worker. `SimulatedSPWorker` runs the same cache
+operations as `Worker` (swaps, copies into the staging area, migrations and
+recalls) on CPU tensors, with gloo process groups, so the whole flow from
+the scheduler to the KV caches can run across processes on one machine.
+The forward pass is left to the caller, which writes the KV cache through
+`SimulatedCacheEngine`.
+"""
+from typing import List, Optional
+
+import torch
+
+from vllm.config import CacheConfig, ParallelConfig
+from vllm.distributed import (broadcast_sp_tensor_dict, broadcast_tensor_dict,
+                              ensure_model_parallel_initialized,
+                              init_distributed_environment)
+from vllm.sequence import ExecuteModelRequest
+from vllm.worker.kv_migration import KVMigrator
+from vllm.worker.worker_base import WorkerInput
+
+
+class SimulatedCacheEngine:
+    """CPU stand-in of `CacheEngine`.
+
+    Every layer has a "GPU" cache of shape (2, num_gpu_blocks, block_numel)
+    for the keys and values of every block, and a CPU swap space laid out
+    the same way.
+    """
+
+    def __init__(
+        self,
+        num_layers: int,
+        num_gpu_blocks: int,
+        num_cpu_blocks: int,
+        block_numel: int,
+        dtype: torch.dtype = torch.float32,
+    ) -> None:
+        self.num_layers = num_layers
+        self.num_gpu_blocks = num_gpu_blocks
+        self.num_cpu_blocks = num_cpu_blocks
+        self.gpu_cache = [
+            torch.zeros(2, num_gpu_blocks, block_numel, dtype=dtype)
+            for _ in range(num_layers)
+        ]
+        self.cpu_cache = [
+            torch.zeros(2, num_cpu_blocks, block_numel, dtype=dtype)
+            for _ in range(num_layers)
+        ]
+
+    @staticmethod
+    def _swap_blocks(src: torch.Tensor, dst: torch.Tensor,
+                     src_to_dst: torch.Tensor) -> None:
+        dst[:, src_to_dst[:, 1]] = src[:, src_to_dst[:, 0]]
+
+    def swap_in(self, src_to_dst: torch.Tensor) -> None:
+        for i in range(self.num_layers):
+            self._swap_blocks(self.cpu_cache[i], self.gpu_cache[i], src_to_dst)
+
+    def swap_out(self, src_to_dst: torch.Tensor) -> None:
+        for i in range(self.num_layers):
+            self._swap_blocks(self.gpu_cache[i], self.cpu_cache[i], src_to_dst)
+
+    def copy(self, src_to_dsts: torch.Tensor) -> None:
+        for i in range(self.num_layers):
+            self._swap_blocks(self.gpu_cache[i], self.gpu_cache[i],
+                              src_to_dsts)
+
+    def get_blocks(self, layer: int, start: int, step: int) -> torch.Tensor:
+        return self.gpu_cache[layer][:, start:start + step]
+
+    @staticmethod
+    def get_cache_block_size(num_layers: int,
+                             block_numel: int,
+                             dtype: torch.dtype = torch.float32) -> int:
+        return num_layers * 2 * block_numel * torch.finfo(dtype).bits // 8
+
+
+class SimulatedSPWorker:
+    """Runs the KV cache operations of a master or SP `Worker` on CPU.
+
+    Ranks follow the layout of `initialize_model_parallel`: the
+    pp_size * tp_size master workers come first, the SP workers last. The
+    driver worker (rank 0) builds the `WorkerInput` of every step from the
+    `ExecuteModelRequest` and broadcasts it like `Worker.execute_model`.
+    """
+
+    def __init__(
+        self,
+        cache_config: CacheConfig,
+        parallel_config: ParallelConfig,
+        rank: int,
+        distributed_init_method: str,
+        num_layers: int = 2,
+        block_numel: int = 16,
+        is_driver_worker: bool = False,
+        is_sp_worker: bool = False,
+    ) -> None:
+        self.cache_config = cache_config
+        self.parallel_config = parallel_config
+        self.rank = rank
+        self.distributed_init_method = distributed_init_method
+        self.num_layers = num_layers
+        self.block_numel = block_numel
+        self.is_driver_worker = is_driver_worker
+        self.is_sp_worker = is_sp_worker
+        if self.is_driver_worker:
+            assert self.rank == 0, "The driver worker must have rank 0."
+        self.device = torch.device("cpu")
+        # Initialized by initialize_cache.
+        self.cache_engine: SimulatedCacheEngine
+        self.kv_migrator: KVMigrator
+
+    def init_device(self) -> None:
+        init_distributed_environment(self.parallel_config.world_size,
+                                     self.rank,
+                                     self.distributed_init_method,
+                                     self.rank,
+                                     backend="gloo")
+        ensure_model_parallel_initialized(
+            self.parallel_config.tensor_parallel_size,
+            self.parallel_config.pipeline_parallel_size,
+            self.parallel_config.sequence_parallel_size,
+            backend="gloo")
+
+    def initialize_cache(self, num_gpu_blocks: int, num_cpu_blocks: int,
+                         num_remote_gpu_blocks: int,
+                         num_remote_cpu_blocks: int) -> None:
+        """Allocates the KV caches. Like on `Worker`, SP workers hold
+        `num_remote_gpu_blocks` blocks, and a CPU swap space of
+        `num_remote_cpu_blocks` blocks for every master worker."""
+        self.cache_config.num_gpu_blocks = num_gpu_blocks
+        self.cache_config.num_cpu_blocks = num_cpu_blocks
+        self.cache_config.num_remote_gpu_blocks = num_remote_gpu_blocks
+        self.cache_config.num_remote_cpu_blocks = num_remote_cpu_blocks
+        if self.is_sp_worker:
+            num_masters = (self.parallel_config.pipeline_parallel_size *
+                           self.parallel_config.tensor_parallel_size)
+            self.cache_config.num_gpu_blocks = num_remote_gpu_blocks
+            self.cache_config.num_cpu_blocks = (num_remote_cpu_blocks *
+                                                num_masters)
+
+        self.cache_engine = SimulatedCacheEngine(
+            self.num_layers, self.cache_config.num_gpu_blocks,
+            self.cache_config.num_cpu_blocks, self.block_numel)
+        self.kv_migrator = KVMigrator(self.cache_engine, self.cache_config,
+                                      self.parallel_config, self.num_layers,
+                                      self.rank, self.is_sp_worker,
+                                      self.device)
+
+    @property
+    def do_metadata_broadcast(self) -> bool:
+        return self.parallel_config.tensor_parallel_size > 1
+
+    @property
+    def do_metadata_sp_broadcast(self) -> bool:
+        return self.parallel_config.sequence_parallel_size > 1
+
+    def execute_model(
+        self,
+        execute_model_req: Optional[ExecuteModelRequest] = None
+    ) -> Optional[List]:
+        """Runs the cache operations of one step. Returns None once the
+        driver signals there are no more steps."""
+        if self.is_driver_worker:
+            if execute_model_req is None:
+                if self.do_metadata_broadcast:
+                    broadcast_tensor_dict({}, src=0)
+                if self.do_metadata_sp_broadcast:
+                    broadcast_sp_tensor_dict({}, src=0)
+                return None
+            worker_input = WorkerInput.from_execute_model_request(
+                execute_model_req, self.device)
+            if self.do_metadata_broadcast:
+                broadcast_tensor_dict(
+                    worker_input.as_broadcastable_tensor_dict(), src=0)
+            if self.do_metadata_sp_broadcast:
+                broadcast_sp_tensor_dict(
+                    worker_input.as_broadcastable_sp_tensor_dict(), src=0)
+        elif self.is_sp_worker:
+            broadcast_data = broadcast_sp_tensor_dict(src=0)
+            if not broadcast_data:
+                return None
+            worker_input = WorkerInput.from_broadcasted_sp_tensor_dict(
+                broadcast_data)
+        else:
+            broadcast_data = broadcast_tensor_dict(src=0)
+            if not broadcast_data:
+                return None
+            worker_input = WorkerInput.from_broadcasted_tensor_dict(
+                broadcast_data)
+
+        self.execute_worker(worker_input)
+        return []
+
+    def execute_worker(self, worker_input: WorkerInput) -> None:
+        self.kv_migrator.wait()
+        # The swap outs go first, as in Worker.execute_worker.
+        if (worker_input.blocks_to_swap_out is not None
+                and worker_input.blocks_to_swap_out.numel() > 0):
+            self.cache_engine.swap_out(worker_input.blocks_to_swap_out)
+        if (worker_input.blocks_to_swap_in is not None
+                and worker_input.blocks_to_swap_in.numel() > 0):
+            self.cache_engine.swap_in(worker_input.blocks_to_swap_in)
+        if (worker_input.blocks_to_copy is not None
+                and worker_input.blocks_to_copy.numel() > 0):
+            self.cache_engine.copy(worker_input.blocks_to_copy)
+        self.kv_migrator.execute(worker_input)
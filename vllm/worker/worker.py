@@ -10,14 +10,17 @@ from vllm.config import (CacheConfig, DeviceConfig, LoadConfig, LoRAConfig,
                          ModelConfig, ParallelConfig, SchedulerConfig,
                          SpeculativeConfig, VisionLanguageConfig)
 from vllm.distributed import (ensure_model_parallel_initialized,
-                              init_distributed_environment, recv_sp_tensor,
-                              send_sp_tensor, set_custom_all_reduce)
+                              init_distributed_environment,
+                              set_custom_all_reduce)
 from vllm.lora.request import LoRARequest
 from vllm.model_executor import set_random_seed
 from vllm.model_executor.model_loader.tensorizer import TensorizerConfig
 from vllm.sequence import ExecuteModelRequest
 from vllm.worker.cache_engine import CacheEngine
+from vllm.worker.disk_kv_cache import (DiskKVCache, get_disk_prefix_cache_path,
+                                       get_num_disk_blocks)
 from vllm.worker.embedding_model_runner import EmbeddingModelRunner
+from vllm.worker.kv_migration import KVMigrator
 from vllm.worker.model_runner import GPUModelRunnerBase, ModelRunner
 from vllm.worker.worker_base import LocalOrDistributedWorkerBase, WorkerInput
 
@@ -106,18 +109,9 @@ class Worker(LocalOrDistributedWorkerBase):
         self.cache_engine: CacheEngine
         # Initialize gpu_cache as embedding models don't initialize kv_caches
         self.gpu_cache: Optional[List[torch.tensor]] = None
-        # initialize CUDA stream for KV migration
-        # SP worker only rx KV cache and master workers just tx KV cache
-        # Note the scheduler should call kv_send_stream.synchronize() before
-        # the next round, but it is not safe [TODO].
-        if is_sp_worker:
-            tp_pp_world = self.parallel_config.pipeline_parallel_size \
-                * self.parallel_config.tensor_parallel_size
-            self.kv_recv_streams = [
-                torch.cuda.Stream() for _ in range(tp_pp_world)
-            ]
-        else:
-            self.kv_send_stream = torch.cuda.Stream()
+        # Moves the KV superblocks to and from the SP workers, initialized
+        # with the cache engine.
+        self.kv_migrator: KVMigrator
 
     def init_device(self) -> None:
         if self.device_config.device.type == "cuda":
@@ -234,8 +228,12 @@ class Worker(LocalOrDistributedWorkerBase):
         self.cache_config.num_cpu_blocks = num_cpu_blocks
         self.cache_config.num_remote_gpu_blocks = num_remote_gpu_blocks
         if self.is_sp_worker:
+            # The SP workers keep their own CPU swap space for the remote
+            # blocks of the preempted sequences.
             self.cache_config.num_gpu_blocks = num_remote_gpu_blocks
-            self.cache_config.num_cpu_blocks = 0
+            self.cache_config.num_cpu_blocks = int(
+                self.cache_config.swap_space_bytes //
+                self.get_cache_block_size_bytes())
 
         self._init_cache_engine()
         self._warm_up_model()
@@ -246,6 +244,22 @@ class Worker(LocalOrDistributedWorkerBase):
                                         self.parallel_config,
                                         self.device_config, self.is_sp_worker)
         self.gpu_cache = self.cache_engine.gpu_cache
+        # The KV of the disk tier of prefix caching. The SP workers hold no
+        # prefix cache.
+        self.disk_kv_cache: Optional[DiskKVCache] = None
+        if (self.cache_config.disk_prefix_cache_dir is not None
+                and not self.is_sp_worker):
+            self.disk_kv_cache = DiskKVCache(
+                get_disk_prefix_cache_path(self.cache_config,
+                                           self.model_config,
+                                           self.parallel_config),
+                get_num_disk_blocks(self.cache_config, self.model_config,
+                                    self.parallel_config), self.rank,
+                self.cache_engine.cpu_cache)
+        self.kv_migrator = KVMigrator(
+            self.cache_engine, self.cache_config, self.parallel_config,
+            self.model_config.get_num_layers(self.parallel_config), self.rank,
+            self.is_sp_worker, self.device)
 
     def _warm_up_model(self) -> None:
         if _ALAILABLE_GRAPH and not self.model_config.enforce_eager:
@@ -266,112 +280,42 @@ class Worker(LocalOrDistributedWorkerBase):
     def kv_cache(self) -> Optional[List[torch.Tensor]]:
         return self.gpu_cache
 
-    @torch.inference_mode()
-    def send_chunk(self, sp_group: int = 0, dst: int = 0) -> None:
-        # dst is the local sp rank
-        chunk_size = self.cache_config.chunk_size
-        block_idx = self.cache_config.num_gpu_blocks - chunk_size
-
-        # Use a send stream to do KV migration
-        with torch.cuda.stream(self.kv_send_stream[sp_group]):
-            for i in self.model_config.get_num_layers(self.parallel_config):
-                chunk = self.cache_engine.get_blocks(layer=i,
-                                                     start=block_idx,
-                                                     step=chunk_size)
-                send_sp_tensor(chunk, sp_group, dst)
-
-    @torch.inference_mode()
-    def recv_chunk(self, sp_group: int, chunk_idx: int) -> None:
-        chunk_size = self.cache_config.chunk_size
-        pp_size = self.parallel_config.pipeline_parallel_size
-        tp_size = self.parallel_config.tensor_parallel_size
-        paralled_blocks = int(self.cache_config.num_gpu_blocks /
-                              (pp_size * tp_size))
-        block_idx = sp_group * paralled_blocks + chunk_size * chunk_idx
-
-        # Use a recv stream to do KV migration
-        with torch.cuda.stream(self.kv_recv_streams[sp_group]):
-            for i in self.model_config.get_num_layers(self.parallel_config):
-                chunk = self.cache_engine.get_blocks(layer=i,
-                                                     start=block_idx,
-                                                     step=chunk_size)
-                recv_sp_tensor(chunk, sp_group, src=0)
-
-    @torch.inference_mode()
-    def migrate_chunk(self, dst_chunk: int, dst_rank: int) -> None:
-        """
-        Migrate a KV chunk. Note that dst_rank is a local rank in the SP group
-        """
-        # Temporary method to get the rank in sp group.
-        pp_size = self.parallel_config.pipeline_parallel_size
-        tp_size = self.parallel_config.tensor_parallel_size
-        dst_global_rank = dst_rank + pp_size * tp_size - 1
-
-        # Only the master workers or the target sp workers
-        # involves in the KV cache migration.
-        for src_global_rank in range(pp_size * tp_size):
-            if self.rank == src_global_rank:
-                self.send_chunk(sp_group=src_global_rank, dst=dst_rank)
-            elif self.rank == dst_global_rank:
-                self.recv_chunk(sp_group=src_global_rank, chunk_idx=dst_chunk)
-
     @torch.inference_mode()
     def prepare_worker_input(
             self, execute_model_req: ExecuteModelRequest) -> WorkerInput:
-        num_seq_groups = len(execute_model_req.seq_group_metadata_list)
-        # `blocks_to_swap_in` and `blocks_to_swap_out` are cpu tensors.
-        # they contain parameters to launch cudamemcpyasync.
-        blocks_to_swap_in = torch.tensor(execute_model_req.blocks_to_swap_in,
-                                         device="cpu",
-                                         dtype=torch.int64).view(-1, 2)
-        blocks_to_swap_out = torch.tensor(execute_model_req.blocks_to_swap_out,
-                                          device="cpu",
-                                          dtype=torch.int64).view(-1, 2)
-        # `blocks_to_copy` is a gpu tensor. The src and tgt of
-        # blocks to copy are in the same device, and `blocks_to_copy`
-        # can be used directly within cuda kernels.
-        blocks_to_copy = torch.tensor(execute_model_req.blocks_to_copy,
-                                      device=self.device,
-                                      dtype=torch.int64).view(-1, 2)
-
-        # # `blocks_to_migrate` is a gpu tensor. The src blocks are in the local
-        # # GPU cache, while the tgt blocks are in the GPU chunk.
-        # blocks_to_migrate = torch.tensor(execute_model_req.blocks_to_migrate,
-        #                               device=self.device,
-        #                               dtype=torch.int64).view(-1, 2)
-        # `superblock_to_migrate` is a gpu tensor which records the dest chunk
-        # in a remote SP GPU worker
-        superblock_to_migrate = torch.tensor(
-            execute_model_req.superblock_to_migrate,
-            device=self.device,
-            dtype=torch.int64).view(-1)
-
-        return WorkerInput(num_seq_groups=num_seq_groups,
-                           blocks_to_swap_in=blocks_to_swap_in,
-                           blocks_to_swap_out=blocks_to_swap_out,
-                           blocks_to_copy=blocks_to_copy,
-                           superblock_to_migrate=superblock_to_migrate)
+        return WorkerInput.from_execute_model_request(execute_model_req,
+                                                      self.device)
 
     @torch.inference_mode()
     def execute_worker(self, worker_input: WorkerInput) -> None:
-        # Issue cache operations.
-        if (worker_input.blocks_to_swap_in is not None
-                and worker_input.blocks_to_swap_in.numel() > 0):
-            self.cache_engine.swap_in(worker_input.blocks_to_swap_in)
+        # The staging area is reused and the block tables may point to the
+        # superblocks migrated in the previous step.
+        self.kv_migrator.wait()
+        # Issue cache operations. The swap outs go first: the GPU blocks
+        # demoted to the CPU tier of prefix caching may be swapped in to in
+        # the same step. The disk tier of prefix caching spills the demoted
+        # blocks and loads the blocks to swap in in between.
         if (worker_input.blocks_to_swap_out is not None
                 and worker_input.blocks_to_swap_out.numel() > 0):
             self.cache_engine.swap_out(worker_input.blocks_to_swap_out)
+        if self.disk_kv_cache is not None:
+            if (worker_input.blocks_to_spill is not None
+                    and worker_input.blocks_to_spill.numel() > 0):
+                # The swap outs copy to the CPU cache asynchronously, the
+                # blocks demoted in this step are spilled once they landed.
+                torch.cuda.current_stream().synchronize()
+                self.disk_kv_cache.spill(worker_input.blocks_to_spill)
+            if (worker_input.blocks_to_load is not None
+                    and worker_input.blocks_to_load.numel() > 0):
+                self.disk_kv_cache.load(worker_input.blocks_to_load)
+        if (worker_input.blocks_to_swap_in is not None
+                and worker_input.blocks_to_swap_in.numel() > 0):
+            self.cache_engine.swap_in(worker_input.blocks_to_swap_in)
         if (worker_input.blocks_to_copy is not None
                 and worker_input.blocks_to_copy.numel() > 0):
             self.cache_engine.copy(worker_input.blocks_to_copy)
-        # Note sequence parallel requires master workers (in sp and tp)
-        # to first copy blocks their chunk memories, and then migrate
-        # the chunk to the tgt sp worker
-        if (worker_input.superblock_to_migrate is not None
-                and worker_input.superblock_to_migrate.numel() > 0):
-            chunk_to_migrate = worker_input.superblock_to_migrate.tolist()
-            self.migrate_chunk(dst_chunk=chunk_to_migrate[0],
-                               dst_rank=chunk_to_migrate[1])
+        # The remote swaps, migrations and recalls with the SP workers.
+        self.kv_migrator.execute(worker_input)
 
     def add_lora(self, lora_request: LoRARequest) -> bool:
         return self.model_runner.add_lora(lora_request)
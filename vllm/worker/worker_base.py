@@ -124,8 +124,94 @@ class WorkerInput:
     blocks_to_swap_in: Optional[torch.Tensor] = None
     blocks_to_swap_out: Optional[torch.Tensor] = None
     blocks_to_copy: Optional[torch.Tensor] = None
+    blocks_to_spill: Optional[torch.Tensor] = None
+    blocks_to_load: Optional[torch.Tensor] = None
     # blocks_to_migrate: Optional[torch.Tensor] = None
-    superblock_to_migrate: Optional[torch.Tensor] = None
+    superblocks_to_migrate: Optional[torch.Tensor] = None
+    superblocks_to_recall: Optional[torch.Tensor] = None
+    blocks_to_recall: Optional[torch.Tensor] = None
+    remote_blocks_to_swap_in: Optional[torch.Tensor] = None
+    remote_blocks_to_swap_out: Optional[torch.Tensor] = None
+
+    @classmethod
+    def from_execute_model_request(
+        cls: Type["WorkerInput"],
+        execute_model_req: ExecuteModelRequest,
+        device: torch.device,
+    ) -> "WorkerInput":
+        """
+        Build the cache operations of `execute_model_req` for a worker whose
+        KV cache lives on `device`.
+        """
+        num_seq_groups = len(execute_model_req.seq_group_metadata_list)
+        # `blocks_to_swap_in` and `blocks_to_swap_out` are cpu tensors.
+        # they contain parameters to launch cudamemcpyasync.
+        blocks_to_swap_in = torch.tensor(execute_model_req.blocks_to_swap_in,
+                                         device="cpu",
+                                         dtype=torch.int64).view(-1, 2)
+        blocks_to_swap_out = torch.tensor(execute_model_req.blocks_to_swap_out,
+                                          device="cpu",
+                                          dtype=torch.int64).view(-1, 2)
+        # `blocks_to_copy` is a gpu tensor. The src and tgt of
+        # blocks to copy are in the same device, and `blocks_to_copy`
+        # can be used directly within cuda kernels.
+        blocks_to_copy = torch.tensor(execute_model_req.blocks_to_copy,
+                                      device=device,
+                                      dtype=torch.int64).view(-1, 2)
+        # `blocks_to_spill` and `blocks_to_load` are cpu tensors. They map
+        # the CPU blocks to the slots of the disk tier of prefix caching.
+        blocks_to_spill = torch.tensor(execute_model_req.blocks_to_spill,
+                                       device="cpu",
+                                       dtype=torch.int64).view(-1, 2)
+        blocks_to_load = torch.tensor(execute_model_req.blocks_to_load,
+                                      device="cpu",
+                                      dtype=torch.int64).view(-1, 2)
+
+        # # `blocks_to_migrate` is a gpu tensor. The src blocks are in the local
+        # # GPU cache, while the tgt blocks are in the GPU chunk.
+        # blocks_to_migrate = torch.tensor(execute_model_req.blocks_to_migrate,
+        #                               device=device,
+        #                               dtype=torch.int64).view(-1, 2)
+        # `superblocks_to_migrate` is a cpu tensor which records the dest
+        # chunk and rank of every superblock migrated to a remote SP GPU
+        # worker.
+        superblocks_to_migrate = torch.tensor(
+            execute_model_req.superblocks_to_migrate,
+            device="cpu",
+            dtype=torch.int64).view(-1, 2)
+        # `superblocks_to_recall` and `blocks_to_recall` are cpu tensors
+        # which record the src chunk and rank of every superblock recalled
+        # from a remote SP GPU worker, and the local blocks it lands in.
+        superblocks_to_recall = torch.tensor(
+            execute_model_req.superblocks_to_recall,
+            device="cpu",
+            dtype=torch.int64).view(-1, 2)
+        blocks_to_recall = torch.tensor(execute_model_req.blocks_to_recall,
+                                        device="cpu",
+                                        dtype=torch.int64)
+        # `remote_blocks_to_swap_in` and `remote_blocks_to_swap_out` are cpu
+        # tensors which record the rank, src and dst block of every remote
+        # block swapped on its SP GPU worker.
+        remote_blocks_to_swap_in = torch.tensor(
+            execute_model_req.remote_blocks_to_swap_in,
+            device="cpu",
+            dtype=torch.int64).view(-1, 3)
+        remote_blocks_to_swap_out = torch.tensor(
+            execute_model_req.remote_blocks_to_swap_out,
+            device="cpu",
+            dtype=torch.int64).view(-1, 3)
+
+        return cls(num_seq_groups=num_seq_groups,
+                   blocks_to_swap_in=blocks_to_swap_in,
+                   blocks_to_swap_out=blocks_to_swap_out,
+                   blocks_to_copy=blocks_to_copy,
+                   blocks_to_spill=blocks_to_spill,
+                   blocks_to_load=blocks_to_load,
+                   superblocks_to_migrate=superblocks_to_migrate,
+                   superblocks_to_recall=superblocks_to_recall,
+                   blocks_to_recall=blocks_to_recall,
+                   remote_blocks_to_swap_in=remote_blocks_to_swap_in,
+                   remote_blocks_to_swap_out=remote_blocks_to_swap_out)
 
     @classmethod
     def from_broadcasted_tensor_dict(
@@ -141,8 +227,12 @@ class WorkerInput:
             blocks_to_swap_in=tensor_dict.pop("blocks_to_swap_in"),
             blocks_to_swap_out=tensor_dict.pop("blocks_to_swap_out"),
             blocks_to_copy=tensor_dict.pop("blocks_to_copy"),
+            blocks_to_spill=tensor_dict.pop("blocks_to_spill"),
+            blocks_to_load=tensor_dict.pop("blocks_to_load"),
             # blocks_to_migrate=tensor_dict.pop("blocks_to_migrate"),
-            superblock_to_migrate=tensor_dict.pop("superblock_to_migrate"),
+            superblocks_to_migrate=tensor_dict.pop("superblocks_to_migrate"),
+            superblocks_to_recall=tensor_dict.pop("superblocks_to_recall"),
+            blocks_to_recall=tensor_dict.pop("blocks_to_recall"),
         )
 
     def as_broadcastable_tensor_dict(
@@ -155,7 +245,11 @@ class WorkerInput:
             "blocks_to_swap_in": self.blocks_to_swap_in,
             "blocks_to_swap_out": self.blocks_to_swap_out,
             "blocks_to_copy": self.blocks_to_copy,
-            "superblock_to_migrate": self.superblock_to_migrate,
+            "blocks_to_spill": self.blocks_to_spill,
+            "blocks_to_load": self.blocks_to_load,
+            "superblocks_to_migrate": self.superblocks_to_migrate,
+            "superblocks_to_recall": self.superblocks_to_recall,
+            "blocks_to_recall": self.blocks_to_recall,
         }
 
         return tensor_dict
@@ -170,7 +264,13 @@ class WorkerInput:
         WorkerInput.
         """
         return cls(
-            superblock_to_migrate=tensor_dict.pop("superblock_to_migrate"), )
+            superblocks_to_migrate=tensor_dict.pop("superblocks_to_migrate"),
+            superblocks_to_recall=tensor_dict.pop("superblocks_to_recall"),
+            remote_blocks_to_swap_in=tensor_dict.pop(
+                "remote_blocks_to_swap_in"),
+            remote_blocks_to_swap_out=tensor_dict.pop(
+                "remote_blocks_to_swap_out"),
+        )
 
     def as_broadcastable_sp_tensor_dict(
             self) -> Dict[str, Union[int, torch.Tensor]]:
@@ -178,7 +278,10 @@ class WorkerInput:
         Extract broadcastable fields.
         """
         tensor_dict = {
-            "superblock_to_migrate": self.superblock_to_migrate,
+            "superblocks_to_migrate": self.superblocks_to_migrate,
+            "superblocks_to_recall": self.superblocks_to_recall,
+            "remote_blocks_to_swap_in": self.remote_blocks_to_swap_in,
+            "remote_blocks_to_swap_out": self.remote_blocks_to_swap_out,
         }
 
         return tensor_dict